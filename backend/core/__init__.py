@@ -11,11 +11,72 @@ from .logging import (
     request_context,
     JSONFormatter
 )
+from .cache import Cache, LRUCache, RedisTier
+from .rate_limit import RateLimiter, RateLimitMiddleware, RateLimitResult
+from .redis_client import get_redis, close_redis
+from .social_graph import SocialGraph, Adjacency
+from .timelines import FeedTimelines, FeedPage
+from .loaders import BatchLoader, Loaders, user_summary
+from .conversations import ConversationSummaries
+from .realtime import ChatConnectionManager, MemoryBroker, RedisBroker
+from .presence import PresenceStore
+from .backup import ArchiveReader, BackupExporter, BackupError, BackupRestorer
+from .backup_jobs import BackupJobs
+from .media import MediaStore, StoredBlob, UploadTooLarge
+from .images import ImageDerivatives
+from .storage import LocalStorage, S3Storage, storage_from_env
+from .media_acl import MediaACL
+from .search import SearchIndex
+from .typeahead import PeopleTypeahead
+from .message_search import MessageSearchIndex, MessageSearchPage
+from .workers import WorkerPools
+from .loop_monitor import LoopLagMonitor
+from .one_time import run_once
 
 __all__ = [
     'setup_logging',
     'get_logger',
     'ContextLogger',
     'request_context',
-    'JSONFormatter'
+    'JSONFormatter',
+    'Cache',
+    'LRUCache',
+    'RedisTier',
+    'RateLimiter',
+    'RateLimitMiddleware',
+    'RateLimitResult',
+    'get_redis',
+    'close_redis',
+    'SocialGraph',
+    'Adjacency',
+    'FeedTimelines',
+    'FeedPage',
+    'BatchLoader',
+    'Loaders',
+    'user_summary',
+    'ConversationSummaries',
+    'ChatConnectionManager',
+    'MemoryBroker',
+    'RedisBroker',
+    'PresenceStore',
+    'ArchiveReader',
+    'BackupExporter',
+    'BackupError',
+    'BackupRestorer',
+    'BackupJobs',
+    'MediaStore',
+    'StoredBlob',
+    'UploadTooLarge',
+    'ImageDerivatives',
+    'LocalStorage',
+    'S3Storage',
+    'storage_from_env',
+    'MediaACL',
+    'SearchIndex',
+    'PeopleTypeahead',
+    'MessageSearchIndex',
+    'MessageSearchPage',
+    'WorkerPools',
+    'LoopLagMonitor',
+    'run_once'
 ]
@@ -0,0 +1,798 @@
+"""
+Database Backup for ZION.CITY API
+=================================
+Streaming, constant-memory export and restore of the database.
+
+Documents are read from cursors in batches, serialized one record at a time
+and compressed incrementally, so memory stays flat however large the
+database is. The same stream can go to an HTTP StreamingResponse or a file.
+
+Archive format (one record per line for NDJSON, one BSON document each for BSON):
+    {"$backup": {version, database_name, created_at, format, ...}}     header
+    {"$collection": "users"}                                           collection start
+    {...}                                                              documents (Extended JSON for NDJSON)
+    {"$end": "users", "count": 1234, "sha256": "..."}                 collection end
+    {"$manifest": {"collections": {...}, "document_count": ...}}       trailer
+
+The per-collection sha256 covers the serialized document records of that
+collection, so a restore can verify every collection independently.
+
+Incremental backups hold only documents whose updated_at / created_at is
+at or after the previous backup's start (its watermark), and only for the
+collections in INCREMENTAL_COLLECTIONS: those that are append-only or whose
+every write path sets updated_at (including the hot ones: message status
+and reads, post counters, notification reads, last_seen). Many other
+update_one / update_many calls do not touch updated_at (likes, RSVPs, ...),
+so every other collection is copied in full in each increment and flagged
+"incremental": false in the manifest. A chain is a full base plus
+increments, each naming its base_id and parent_id; restoring replays them in
+order. Deletions since the base are not captured.
+
+Derived collections (search and typeahead indexes, feed timelines, inbox
+summaries, message search terms, the media access index) are left out of
+every backup: they are rebuilt from the restored data, which is cheaper
+than storing and restoring them.
+
+Limitation: a collection may only be added to INCREMENTAL_COLLECTIONS after
+checking that every insert sets created_at and every update sets updated_at
+(server.py, eric_agent.py and core/); otherwise a base + increment restore
+silently loses the updates made between the two.
+
+Compression: gzip (default), zstd (requires the optional `zstandard`
+package) or none.
+
+Restore parses the archive incrementally (codec and format are detected
+from the content) and writes unordered bulk_write batches, several in
+flight at once. Types come from the Extended JSON tags, not from guessing;
+version 1.0 JSON backups are still accepted.
+
+Usage:
+    from core.backup import BackupExporter
+
+    exporter = BackupExporter(db, fmt="ndjson", compression="gzip")
+    return StreamingResponse(exporter.stream(), media_type=exporter.media_type)
+    ...
+    exporter.manifest      # counts and checksums once the stream is done
+
+    manifest = await BackupExporter(db).to_file("/var/backups/zion.ndjson.gz")
+
+    exporter = BackupExporter(db, **await incremental_from_last(db))
+
+    reader = ArchiveReader(read_files(chunk_paths), total_bytes=size)
+    results = await BackupRestorer(db, mode="merge").run(reader)
+"""
+
+import asyncio
+import hashlib
+import uuid
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKUP_VERSION = "2.0"
+
+FORMATS = ("ndjson", "bson")
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+FULL = "full"
+INCREMENTAL = "incremental"
+
+# admin_backups types that describe a backup (and can be the parent of an increment)
+BACKUP_TYPES = ("backup", "backup_chunked")
+
+# Fields compared against the watermark, most specific first
+WATERMARK_FIELDS = ("updated_at", "created_at")
+
+# Collections whose watermark fields are reliable: append-only collections
+# (inserted with created_at, never updated) and collections whose every
+# update sets updated_at. Everything else is copied in full in an increment.
+INCREMENTAL_COLLECTIONS = frozenset({
+    # every write sets updated_at
+    "academic_events", "chat_groups", "chat_messages", "direct_chats", "notifications", "posts",
+    "scheduled_actions", "users",
+    # append-only
+    "affiliations", "announcement_reactions", "chat_group_members", "class_schedules",
+    "comment_likes", "department_members", "dividend_payouts", "emissions", "event_chat",
+    "event_favorites", "event_photos", "event_reminders", "event_reviews",
+    "family_subscriptions", "family_unit_members", "family_unit_posts", "group_members",
+    "journal_comment_likes", "journal_post_likes", "marketplace_favorites",
+    "media_collections", "news_comment_likes", "news_post_likes", "organization_follows",
+    "post_likes", "student_grades", "user_affiliations", "user_follows", "user_friendships",
+    "work_post_comments", "work_post_likes", "work_teams",
+})
+
+# Rebuilt from the source collections after a restore (with their lazy-build state)
+DERIVED_COLLECTIONS = (
+    "chat_message_terms", "chat_search_state", "conversation_summaries", "conversation_summary_state",
+    "media_acl", "news_timeline_state", "news_timelines", "search_index", "user_typeahead",
+)
+
+# Backup bookkeeping and derived collections are never part of a backup
+EXCLUDED_COLLECTIONS = ("admin_backups", "backup_jobs", "chunked_upload_sessions") + DERIVED_COLLECTIONS
+
+_EXTENSIONS = {"ndjson": ".ndjson", "bson": ".bson"}
+_COMPRESSED_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+
+class BackupError(ValueError):
+    """Raised for unsupported options or malformed archives."""
+
+
+# ============================================================
+# COMPRESSION
+# ============================================================
+
+class _Identity:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    decompress = compress
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def compressor(compression: str) -> Any:
+    """Incremental compressor with compress(bytes) / flush() for the given codec."""
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise BackupError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if compression == "none":
+        return _Identity()
+    raise BackupError(f"Unknown compression: {compression}")
+
+
+# ============================================================
+# RECORD ENCODING
+# ============================================================
+
+def _json_options():
+    from bson import json_util
+
+    # Relaxed Extended JSON: dates become {"$date": "..."}, ObjectIds {"$oid": "..."}
+    return json_util.RELAXED_JSON_OPTIONS
+
+
+def encode_json_record(doc: Any, json_options: Any) -> bytes:
+    from bson import json_util
+
+    return (json_util.dumps(doc, json_options=json_options, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def encode_bson_record(doc: Any) -> bytes:
+    import bson
+
+    return bson.encode(doc)
+
+
+def decode_json_record(line: bytes, json_options: Any) -> Dict[str, Any]:
+    from bson import json_util
+
+    return json_util.loads(line, json_options=json_options)
+
+
+def decode_bson_record(raw: bytes) -> Dict[str, Any]:
+    import bson
+
+    return bson.decode(raw)
+
+
+CONTROL_KEYS = ("$backup", "$collection", "$end", "$manifest")
+
+
+def since_query(since: datetime) -> Dict[str, Any]:
+    """Documents changed at or after `since`; timestamps are stored as dates or ISO strings."""
+    clauses = []
+    for field in WATERMARK_FIELDS:
+        clauses.append({field: {"$gte": since}})
+        clauses.append({field: {"$gte": since.isoformat()}})
+    return {"$or": clauses}
+
+
+async def incremental_from_last(db, parent_id: Optional[str] = None) -> Dict[str, Any]:
+    """BackupExporter arguments for an increment on top of the latest (or given) backup."""
+    query: Dict[str, Any] = {"type": {"$in": list(BACKUP_TYPES)}, "backup_id": {"$exists": True}}
+    if parent_id:
+        query["backup_id"] = parent_id
+    parent = await db.admin_backups.find_one(query, sort=[("created_at", -1)])
+    if parent is None:
+        raise BackupError("No previous backup to build an increment on")
+    since = parent["watermark"]
+    if isinstance(since, str):
+        since = datetime.fromisoformat(since)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return {
+        "since": since,
+        "metadata": {"base_id": parent.get("base_id") or parent["backup_id"], "parent_id": parent["backup_id"]},
+    }
+
+
+def chunk_name(index: int) -> str:
+    return f"chunk_{index:06d}"
+
+
+class ChunkWriter:
+    """Splits a byte stream into fixed-size chunk files, hashing each one."""
+
+    def __init__(self, directory: str, chunk_size: int):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.chunks: List[Dict[str, Any]] = []
+        self._file: Any = None
+        self._digest: Any = None
+        self._size = 0
+
+    async def write(self, data: bytes) -> None:
+        import aiofiles
+
+        view = memoryview(data)
+        while view:
+            if self._file is None:
+                self._file = await aiofiles.open(os.path.join(self.directory, chunk_name(len(self.chunks))), "wb")
+                self._digest = hashlib.sha256()
+                self._size = 0
+            part = view[:self.chunk_size - self._size]
+            await self._file.write(part)
+            self._digest.update(part)
+            self._size += len(part)
+            view = view[len(part):]
+            if self._size >= self.chunk_size:
+                await self._finish_chunk()
+
+    async def _finish_chunk(self) -> None:
+        await self._file.close()
+        self._file = None
+        self.chunks.append({"index": len(self.chunks), "size": self._size, "sha256": self._digest.hexdigest()})
+
+    async def close(self) -> List[Dict[str, Any]]:
+        if self._file is not None:
+            await self._finish_chunk()
+        return self.chunks
+
+
+class BackupExporter:
+    """
+    Streams a database (or selected collections) as a compressed archive.
+
+    `queries` optionally maps a collection name to the filter used for it.
+    With `since`, the archive is an increment: collections in
+    `incremental_collections` are filtered by the watermark fields (unless
+    they have none of them); all others are copied in full.
+    """
+
+    def __init__(
+        self,
+        db,
+        collections: Optional[Iterable[str]] = None,
+        fmt: str = "ndjson",
+        compression: str = "gzip",
+        batch_size: int = 1000,
+        exclude: Iterable[str] = EXCLUDED_COLLECTIONS,
+        queries: Optional[Dict[str, Dict[str, Any]]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        since: Optional[datetime] = None,
+        incremental_collections: Iterable[str] = INCREMENTAL_COLLECTIONS,
+    ):
+        if fmt not in FORMATS:
+            raise BackupError(f"Unknown format: {fmt}")
+        if compression not in COMPRESSIONS:
+            raise BackupError(f"Unknown compression: {compression}")
+        self.db = db
+        self.collections = list(collections) if collections is not None else None
+        self.fmt = fmt
+        self.compression = compression
+        self.batch_size = batch_size
+        self.exclude = set(exclude)
+        self.queries = queries or {}
+        self.metadata = metadata or {}
+        self.since = since
+        self.incremental_collections = set(incremental_collections)
+        self.kind = INCREMENTAL if since is not None else FULL
+        self.backup_id = str(uuid.uuid4())
+        self.created_at = datetime.now(timezone.utc)
+        self.manifest: Optional[Dict[str, Any]] = None
+        self.size_bytes = 0
+        self.sha256: Optional[str] = None
+        self.documents = 0
+        self._json_options = None
+        # Validate the codec up front so a bad option fails before streaming starts
+        compressor(compression)
+
+    @property
+    def media_type(self) -> str:
+        if self.compression == "gzip":
+            return "application/gzip"
+        if self.compression == "zstd":
+            return "application/zstd"
+        return "application/x-ndjson" if self.fmt == "ndjson" else "application/octet-stream"
+
+    @property
+    def filename(self) -> str:
+        stamp = self.created_at.strftime("%Y%m%d_%H%M%S")
+        prefix = "zion_city_backup_incr" if self.kind == INCREMENTAL else "zion_city_backup"
+        return f"{prefix}_{stamp}{_EXTENSIONS[self.fmt]}{_COMPRESSED_EXTENSIONS[self.compression]}"
+
+    async def collection_names(self) -> List[str]:
+        names = self.collections if self.collections is not None else await self.db.list_collection_names()
+        return sorted(n for n in names if not n.startswith("system.") and n not in self.exclude)
+
+    def _encode(self, doc: Any) -> bytes:
+        if self.fmt == "bson":
+            return encode_bson_record(doc)
+        return encode_json_record(doc, self._json_options)
+
+    def _cursor(self, name: str, query: Dict[str, Any]):
+        collection = self.db[name]
+        if self.fmt == "bson":
+            # Raw BSON documents are written as-is without decoding them
+            from bson.codec_options import CodecOptions
+            from bson.raw_bson import RawBSONDocument
+
+            collection = collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+        return collection.find(query).batch_size(self.batch_size)
+
+    async def _query(self, name: str) -> Tuple[Dict[str, Any], bool]:
+        """(filter, incremental) for a collection."""
+        if name in self.queries or self.since is None:
+            return self.queries.get(name, {}), False
+        if name not in self.incremental_collections:
+            # updated_at is not maintained on every write path: copy in full
+            return {}, False
+        has_watermark = await self.db[name].find_one(
+            {"$or": [{field: {"$exists": True}} for field in WATERMARK_FIELDS]}, {"_id": 1}
+        )
+        if has_watermark is None:
+            return {}, False
+        return since_query(self.since), True
+
+    async def records(self) -> AsyncIterator[bytes]:
+        """Uncompressed archive bytes, one batch of records at a time."""
+        self._json_options = _json_options() if self.fmt == "ndjson" else None
+        names = await self.collection_names()
+        header = {
+            "version": BACKUP_VERSION,
+            "backup_id": self.backup_id,
+            "kind": self.kind,
+            "database_name": self.db.name,
+            "created_at": self.created_at.isoformat(),
+            "since": self.since.isoformat() if self.since is not None else None,
+            "format": self.fmt,
+            "collections": names,
+            **self.metadata,
+        }
+        yield self._encode({"$backup": header})
+
+        collections: Dict[str, Dict[str, Any]] = {}
+        for name in names:
+            digest = hashlib.sha256()
+            count = 0
+            incremental = False
+            yield self._encode({"$collection": name})
+            batch: List[bytes] = []
+            try:
+                query, incremental = await self._query(name)
+                async for doc in self._cursor(name, query):
+                    record = doc.raw if self.fmt == "bson" else self._encode(doc)
+                    digest.update(record)
+                    batch.append(record)
+                    count += 1
+                    self.documents += 1
+                    if len(batch) >= self.batch_size:
+                        yield b"".join(batch)
+                        batch = []
+            except Exception as e:
+                # One unreadable collection should not abort the whole backup
+                logger.error(f"Error backing up collection {name}: {e}")
+                collections[name] = {"count": count, "sha256": None, "error": str(e)}
+            if batch:
+                yield b"".join(batch)
+            collections.setdefault(name, {"count": count, "sha256": digest.hexdigest()})
+            if self.since is not None:
+                collections[name]["incremental"] = incremental
+            yield self._encode({"$end": name, **collections[name]})
+
+        self.manifest = {
+            **header,
+            "collections": collections,
+            "collections_count": len(collections),
+            "document_count": sum(c["count"] for c in collections.values()),
+        }
+        yield self._encode({"$manifest": self.manifest})
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Compressed archive bytes; `manifest`, `size_bytes` and `sha256` are set when it ends."""
+        codec = compressor(self.compression)
+        digest = hashlib.sha256()
+        self.size_bytes = 0
+        async for data in self.records():
+            out = codec.compress(data)
+            if out:
+                digest.update(out)
+                self.size_bytes += len(out)
+                yield out
+        out = codec.flush()
+        if out:
+            digest.update(out)
+            self.size_bytes += len(out)
+            yield out
+        self.sha256 = digest.hexdigest()
+
+    async def to_file(self, path: str) -> Dict[str, Any]:
+        """Write the archive to path and return the manifest."""
+        import aiofiles
+
+        async with aiofiles.open(path, "wb") as f:
+            async for data in self.stream():
+                await f.write(data)
+        return self.manifest
+
+    async def to_chunks(self, directory: str, chunk_size: int) -> List[Dict[str, Any]]:
+        """Write the archive as fixed-size chunk files in directory; returns [{index, size, sha256}]."""
+        writer = ChunkWriter(directory, chunk_size)
+        try:
+            async for data in self.stream():
+                await writer.write(data)
+        finally:
+            chunks = await writer.close()
+        return chunks
+
+    def summary(self) -> Dict[str, Any]:
+        """admin_backups fields describing the finished archive."""
+        manifest = self.manifest or {}
+        return {
+            "backup_id": self.backup_id,
+            "kind": self.kind,
+            "base_id": self.metadata.get("base_id"),
+            "parent_id": self.metadata.get("parent_id"),
+            "since": self.since,
+            "watermark": self.created_at,
+            "format": self.fmt,
+            "compression": self.compression,
+            "version": BACKUP_VERSION,
+            "size_bytes": self.size_bytes,
+            "sha256": self.sha256,
+            "collections_count": manifest.get("collections_count", 0),
+            "document_count": manifest.get("document_count", 0),
+            "collections": manifest.get("collections", {}),
+            "filename": self.filename,
+        }
+
+
+# ============================================================
+# RESTORE
+# ============================================================
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def decompressor(head: bytes) -> Any:
+    """Incremental decompressor chosen from the first bytes of an archive."""
+    if head.startswith(_GZIP_MAGIC):
+        return zlib.decompressobj(47)
+    if head.startswith(_ZSTD_MAGIC):
+        try:
+            import zstandard
+        except ImportError:
+            raise BackupError("zstd archives require the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return _Identity()
+
+
+async def read_files(paths: Iterable[str], block_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Bytes of several files read back to back (the chunks of an uploaded archive)."""
+    import aiofiles
+
+    for path in paths:
+        async with aiofiles.open(path, "rb") as f:
+            while True:
+                block = await f.read(block_size)
+                if not block:
+                    break
+                yield block
+
+
+def _legacy_dates(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Version 1.0 backups stored datetimes as plain ISO strings without type tags
+    for key, value in doc.items():
+        if isinstance(value, str) and len(value) > 18 and "T" in value and ("+" in value or "Z" in value or value.count(":") >= 2):
+            try:
+                doc[key] = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                pass
+    return doc
+
+
+def legacy_records(backup_data: Dict[str, Any]) -> Iterable[Tuple[Dict[str, Any], Optional[bytes]]]:
+    """Record stream for a version 1.0 backup ({"metadata": ..., "collections": ...})."""
+    if "metadata" not in backup_data or "collections" not in backup_data:
+        raise BackupError("Invalid backup format")
+    yield {"$backup": backup_data["metadata"]}, None
+    for name, data in backup_data["collections"].items():
+        yield {"$collection": name}, None
+        for doc in data.get("documents", []):
+            yield _legacy_dates(doc), None
+        yield {"$end": name}, None
+
+
+class ArchiveReader:
+    """
+    Parses an archive incrementally into (record, raw bytes) pairs.
+
+    The codec and format are detected from the content: gzip/zstd/plain,
+    NDJSON or BSON. Version 1.0 JSON backups are still accepted; they were
+    single JSON documents and are parsed whole.
+    """
+
+    def __init__(self, source: AsyncIterator[bytes], total_bytes: Optional[int] = None):
+        self.source = source
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+
+    async def _decompressed(self) -> AsyncIterator[bytes]:
+        codec = None
+        async for block in self.source:
+            self.bytes_read += len(block)
+            if codec is None:
+                codec = decompressor(block)
+            data = codec.decompress(block)
+            if data:
+                yield data
+        if codec is not None and hasattr(codec, "flush"):
+            data = codec.flush()
+            if data:
+                yield data
+
+    async def records(self) -> AsyncIterator[Tuple[Any, bytes]]:
+        buffer = b""
+        fmt = None
+        stream = self._decompressed()
+        async for data in stream:
+            buffer += data
+            if fmt is None:
+                if len(buffer) < 12:
+                    continue
+                head = buffer.lstrip()
+                if buffer[4:12] == b"\x03$backup":
+                    fmt = "bson"
+                elif head.startswith(b'{"$backup"'):
+                    fmt = "ndjson"
+                    json_options = _json_options()
+                elif head.startswith(b"{"):
+                    # Version 1.0 backup: one JSON document
+                    parts = [buffer]
+                    async for rest in stream:
+                        parts.append(rest)
+                    for item in legacy_records(json.loads(b"".join(parts))):
+                        yield item
+                    return
+                else:
+                    raise BackupError("Unrecognized backup format")
+            if fmt == "ndjson":
+                lines = buffer.split(b"\n")
+                buffer = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        yield decode_json_record(line, json_options), line + b"\n"
+            else:
+                offset = 0
+                while len(buffer) - offset >= 4:
+                    size = int.from_bytes(buffer[offset:offset + 4], "little")
+                    if len(buffer) - offset < size:
+                        break
+                    raw = buffer[offset:offset + size]
+                    yield decode_bson_record(raw), raw
+                    offset += size
+                buffer = buffer[offset:]
+        if fmt is None and buffer.strip():
+            raise BackupError("Unrecognized backup format")
+        if buffer.strip():
+            if fmt == "ndjson":
+                yield decode_json_record(buffer, _json_options()), buffer
+            else:
+                raise BackupError("Archive is truncated")
+
+
+class BackupRestorer:
+    """
+    Restores a record stream with batched, unordered bulk writes.
+
+    Up to `concurrency` batch writes are in flight at once, across
+    collections, so consecutive collections restore in parallel while memory
+    stays bounded at a few batches. Mode "replace" empties each collection
+    before inserting; "merge" upserts on `id`, or on `_id` for documents
+    without one. Increments are always merged.
+    """
+
+    def __init__(
+        self,
+        db,
+        mode: str = "merge",
+        batch_size: int = 1000,
+        concurrency: int = 4,
+        exclude: Iterable[str] = EXCLUDED_COLLECTIONS,
+        on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    ):
+        if mode not in ("merge", "replace"):
+            raise BackupError(f"Unknown restore mode: {mode}")
+        self.db = db
+        self.mode = mode
+        self.batch_size = batch_size
+        self.exclude = set(exclude)
+        self.on_progress = on_progress
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self.metadata: Dict[str, Any] = {}
+        self.collections: Dict[str, Dict[str, Any]] = {}
+        self.errors: List[Dict[str, Any]] = []
+        self.documents = 0
+        self.reader: Optional[ArchiveReader] = None
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "documents_restored": self.documents,
+            "collections_started": len(self.collections),
+            "bytes_read": self.reader.bytes_read if self.reader else None,
+            "total_bytes": self.reader.total_bytes if self.reader else None,
+        }
+
+    async def _write(self, name: str, docs: List[Dict[str, Any]]) -> None:
+        from pymongo import InsertOne, UpdateOne
+        from pymongo.errors import BulkWriteError
+
+        stats = self.collections[name]
+        if self.mode == "replace":
+            ops = [InsertOne(doc) for doc in docs]
+        else:
+            ops = []
+            for doc in docs:
+                if "id" not in doc and "_id" not in doc:
+                    ops.append(InsertOne(doc))
+                    continue
+                # _id is immutable: keep it only when the upsert creates the document
+                _id = doc.pop("_id", None)
+                update = {"$set": doc}
+                if "id" not in doc:
+                    # No application id: the document is identified by its _id
+                    ops.append(UpdateOne({"_id": _id}, update, upsert=True))
+                    continue
+                if _id is not None:
+                    update["$setOnInsert"] = {"_id": _id}
+                ops.append(UpdateOne({"id": doc["id"]}, update, upsert=True))
+        try:
+            result = await self.db[name].bulk_write(ops, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            stats["write_errors"] += len(details.get("writeErrors", []))
+        except Exception as e:
+            logger.error(f"Error restoring batch into {name}: {e}")
+            stats["write_errors"] += len(docs)
+            self.errors.append({"collection": name, "error": str(e)})
+            return
+        stats["documents_inserted"] += details.get("nInserted", 0) + details.get("nUpserted", 0)
+        stats["documents_updated"] += details.get("nModified", 0)
+        self.documents += len(docs)
+
+    async def _submit(self, name: str, docs: List[Dict[str, Any]]) -> None:
+        await self._slots.acquire()
+
+        async def run():
+            try:
+                await self._write(name, docs)
+            finally:
+                self._slots.release()
+            if self.on_progress is not None:
+                try:
+                    await self.on_progress(self.progress())
+                except Exception as e:
+                    logger.warning(f"Restore progress callback failed: {e}")
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _start_collection(self, name: str) -> None:
+        self.collections[name] = {
+            "name": name,
+            "mode": "replaced" if self.mode == "replace" else "merged",
+            "documents_inserted": 0,
+            "documents_updated": 0,
+            "write_errors": 0,
+        }
+        if self.mode == "replace":
+            await self.db[name].delete_many({})
+
+    def _verify(self, name: str, end: Dict[str, Any], count: int, digest: Any) -> None:
+        if end.get("sha256") is None:
+            return
+        if end.get("count") != count or end["sha256"] != digest.hexdigest():
+            self.errors.append({
+                "collection": name,
+                "error": f"integrity check failed: expected {end.get('count')} documents with sha256 {end['sha256'][:12]}…, read {count}",
+            })
+
+    async def run(self, records: Any) -> Dict[str, Any]:
+        """Restore from an ArchiveReader or an iterable of (record, raw) pairs; returns the results."""
+        if isinstance(records, ArchiveReader):
+            self.reader = records
+            records = records.records()
+        if not hasattr(records, "__aiter__"):
+            records = _aiter(records)
+
+        name: Optional[str] = None
+        skip = False
+        batch: List[Dict[str, Any]] = []
+        count = 0
+        digest = hashlib.sha256()
+        try:
+            async for record, raw in records:
+                key = next(iter(record), None)
+                if key not in CONTROL_KEYS:
+                    if name is not None and not skip:
+                        if raw is not None:
+                            digest.update(raw)
+                        count += 1
+                        batch.append(record)
+                        if len(batch) >= self.batch_size:
+                            await self._submit(name, batch)
+                            batch = []
+                elif key == "$backup":
+                    self.metadata = record["$backup"]
+                    if self.metadata.get("kind") == INCREMENTAL and self.mode == "replace":
+                        # An increment only holds changed documents; replacing would drop the rest
+                        self.mode = "merge"
+                elif key == "$collection":
+                    name = record["$collection"]
+                    skip = name in self.exclude or name.startswith("system.")
+                    count, digest = 0, hashlib.sha256()
+                    if not skip:
+                        try:
+                            await self._start_collection(name)
+                        except Exception as e:
+                            logger.error(f"Error preparing collection {name} for restore: {e}")
+                            self.errors.append({"collection": name, "error": str(e)})
+                            skip = True
+                elif key == "$end":
+                    if name is not None and not skip:
+                        if batch:
+                            await self._submit(name, batch)
+                            batch = []
+                        self._verify(name, record, count, digest)
+                    name, skip = None, False
+            if name is not None and not skip and batch:
+                await self._submit(name, batch)
+        finally:
+            if self._tasks:
+                await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        return self.results()
+
+    def results(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "backup_date": self.metadata.get("created_at"),
+            "backup_version": self.metadata.get("version"),
+            "backup_id": self.metadata.get("backup_id"),
+            "backup_kind": self.metadata.get("kind", FULL),
+            "base_id": self.metadata.get("base_id"),
+            "parent_id": self.metadata.get("parent_id"),
+            "collections_restored": list(self.collections.values()),
+            "errors": self.errors,
+            "total_documents_restored": self.documents,
+        }
+
+
+async def _aiter(items: Iterable[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
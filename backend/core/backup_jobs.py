@@ -0,0 +1,307 @@
+"""
+Background Backup Jobs for ZION.CITY API
+========================================
+Chunked database backups built outside the request, with job state in MongoDB.
+
+- Creating a job returns at once; the export runs as a task on the worker
+  that accepted it and the client polls the job status
+- Chunks are written under BACKUP_DIR with a SHA-256 per chunk in the job
+  manifest, so any worker can serve any chunk and clients can verify and
+  re-download single chunks. Workers on several hosts need BACKUP_DIR on a
+  shared volume
+- Running jobs and restores of uploaded archives heartbeat; one whose
+  worker stopped is marked failed
+- cleanup() removes expired jobs, orphaned chunk directories and abandoned
+  restore uploads (chunked_upload_sessions). Directories are removed in the
+  shared thread pool (core/workers.py, task kind "files"), not on the loop
+
+Collections:
+    backup_jobs: {backup_id, admin, status, chunks: [{index, size, sha256}],
+                  progress, created_at, updated_at, expires_at, ...}
+
+Usage:
+    from core.backup_jobs import BackupJobs
+
+    backup_jobs = BackupJobs.from_env(db, worker_pools)
+    job = await backup_jobs.create(admin, chunk_size=5 * 1024 * 1024)
+    job = await backup_jobs.get(backup_id)            # status / manifest
+    path = backup_jobs.chunk_path(job, 3)
+    heartbeat = asyncio.create_task(backup_jobs.restore_heartbeat(upload_id))
+    await backup_jobs.cleanup()                       # periodic
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from .backup import BackupExporter, chunk_name, incremental_from_last
+from .workers import FILES, WorkerPools
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+RESTORING = "restoring"  # chunked_upload_sessions status while a restore runs
+
+
+class BackupJobs:
+    """Background chunked backups shared by every worker through MongoDB."""
+
+    def __init__(
+        self,
+        db,
+        pools: WorkerPools,
+        directory: str = "/tmp/zion_backups",
+        retention_hours: float = 24.0,
+        heartbeat_interval: float = 10.0,
+        stale_after: float = 120.0,
+    ):
+        self.db = db
+        self.pools = pools
+        self.directory = directory
+        self.retention = timedelta(hours=retention_hours)
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+        self.cleaned = 0
+
+    @classmethod
+    def from_env(cls, db, pools: WorkerPools) -> "BackupJobs":
+        return cls(
+            db,
+            pools,
+            directory=os.environ.get("BACKUP_DIR", "/tmp/zion_backups"),
+            retention_hours=float(os.environ.get("BACKUP_RETENTION_HOURS", 24)),
+        )
+
+    def chunk_path(self, job: Dict[str, Any], index: int) -> str:
+        return os.path.join(job["chunks_dir"], chunk_name(index))
+
+    # ---- jobs ----
+
+    async def create(
+        self,
+        admin: str,
+        chunk_size: int,
+        fmt: str = "ndjson",
+        compression: str = "gzip",
+        incremental: bool = False,
+        parent_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Register a job and start the export; raises BackupError for bad options or a missing parent."""
+        chain = await incremental_from_last(self.db, parent_id) if incremental else {"metadata": {}}
+        exporter = BackupExporter(
+            self.db, fmt=fmt, compression=compression,
+            since=chain.get("since"),
+            metadata={"created_by": admin, "backup_type": "chunked", **chain["metadata"]},
+        )
+        backup_id = exporter.backup_id
+        now = datetime.now(timezone.utc)
+        job = {
+            "backup_id": backup_id,
+            "admin": admin,
+            "status": RUNNING,
+            "kind": exporter.kind,
+            "format": fmt,
+            "compression": compression,
+            "filename": exporter.filename,
+            "chunk_size": chunk_size,
+            "chunks_dir": os.path.join(self.directory, backup_id),
+            "chunks": [],
+            "total_chunks": 0,
+            "total_size": 0,
+            "progress": {"documents": 0, "bytes": 0},
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + self.retention,
+        }
+        await self.db.backup_jobs.insert_one(dict(job))
+        self._tasks[backup_id] = asyncio.create_task(self._run(job, exporter))
+        return job
+
+    async def get(self, backup_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.backup_jobs.find_one({"backup_id": backup_id}, {"_id": 0})
+
+    async def list(self, admin: str, limit: int = 50) -> List[Dict[str, Any]]:
+        cursor = self.db.backup_jobs.find({"admin": admin}, {"_id": 0, "chunks": 0}).sort("created_at", -1)
+        return await cursor.to_list(length=limit)
+
+    async def delete(self, backup_id: str) -> bool:
+        job = await self.get(backup_id)
+        if job is None:
+            return False
+        task = self._tasks.pop(backup_id, None)
+        if task is not None:
+            task.cancel()
+        await self._remove_dir(job["chunks_dir"])
+        await self.db.backup_jobs.delete_one({"backup_id": backup_id})
+        return True
+
+    # ---- export task ----
+
+    async def _heartbeat(self, backup_id: str, exporter: BackupExporter) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.db.backup_jobs.update_one(
+                    {"backup_id": backup_id, "status": RUNNING},
+                    {"$set": {
+                        "updated_at": datetime.now(timezone.utc),
+                        "progress": {"documents": exporter.documents, "bytes": exporter.size_bytes},
+                    }},
+                )
+            except Exception as e:
+                # A missed beat is retried; only stale_after without one fails the job
+                logger.warning(f"Backup {backup_id} heartbeat failed: {e}")
+
+    async def _run(self, job: Dict[str, Any], exporter: BackupExporter) -> None:
+        backup_id = job["backup_id"]
+        heartbeat = asyncio.create_task(self._heartbeat(backup_id, exporter))
+        try:
+            os.makedirs(job["chunks_dir"], exist_ok=True)
+            chunks = await exporter.to_chunks(job["chunks_dir"], job["chunk_size"])
+            summary = exporter.summary()
+            # A job that cleanup() already failed (or that was deleted) stays that way
+            updated = await self.db.backup_jobs.update_one(
+                {"backup_id": backup_id, "status": RUNNING},
+                {"$set": {
+                    "status": READY,
+                    "updated_at": datetime.now(timezone.utc),
+                    "chunks": chunks,
+                    "total_chunks": len(chunks),
+                    "total_size": exporter.size_bytes,
+                    "sha256": exporter.sha256,
+                    "collections_count": summary["collections_count"],
+                    "document_count": summary["document_count"],
+                    "progress": {"documents": exporter.documents, "bytes": exporter.size_bytes},
+                }},
+            )
+            if not updated.matched_count:
+                # Its chunks are removed by cleanup() with the other orphaned directories
+                logger.warning(f"Chunked backup {backup_id} finished after it was failed or deleted")
+                return
+            await self.db.admin_backups.insert_one({
+                "id": str(uuid.uuid4()),
+                "type": "backup_chunked",
+                "created_at": datetime.now(timezone.utc),
+                "admin": job["admin"],
+                **summary,
+            })
+            self.completed += 1
+            logger.info(f"Chunked backup {backup_id} ready: {exporter.size_bytes} bytes, {len(chunks)} chunks")
+        except asyncio.CancelledError:
+            await self._fail(job, "interrupted")
+            raise
+        except Exception as e:
+            logger.error(f"Chunked backup {backup_id} failed: {e}")
+            await self._fail(job, str(e))
+        finally:
+            heartbeat.cancel()
+            self._tasks.pop(backup_id, None)
+
+    async def _fail(self, job: Dict[str, Any], error: str) -> None:
+        self.failed += 1
+        await self._remove_dir(job["chunks_dir"])
+        try:
+            await self.db.backup_jobs.update_one(
+                {"backup_id": job["backup_id"]},
+                {"$set": {"status": FAILED, "error": error, "updated_at": datetime.now(timezone.utc)}},
+            )
+        except Exception as e:
+            logger.warning(f"Failed to record backup {job['backup_id']} failure: {e}")
+
+    async def _remove_dir(self, path: str) -> None:
+        try:
+            await self.pools.io(FILES, shutil.rmtree, path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to cleanup backup chunks directory {path}: {e}")
+
+    # ---- restores ----
+
+    async def restore_heartbeat(self, upload_id: str) -> None:
+        """Keep a restoring upload session alive until cancelled; cleanup() fails sessions that stop."""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.db.chunked_upload_sessions.update_one(
+                    {"upload_id": upload_id, "status": RESTORING},
+                    {"$set": {"restore_heartbeat_at": datetime.now(timezone.utc)}},
+                )
+            except Exception as e:
+                logger.warning(f"Restore {upload_id} heartbeat failed: {e}")
+
+    # ---- lifecycle ----
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def cleanup(self) -> int:
+        """Drop expired jobs, jobs and restores whose worker died, orphaned directories and abandoned restore uploads."""
+        now = datetime.now(timezone.utc)
+        stale = now - timedelta(seconds=self.stale_after)
+        removed = 0
+
+        await self.db.backup_jobs.update_many(
+            {"status": RUNNING, "updated_at": {"$lt": stale}},
+            {"$set": {"status": FAILED, "error": "worker stopped", "updated_at": now}},
+        )
+        # Sessions claimed before restores heartbeat have no restore_heartbeat_at and are failed too
+        await self.db.chunked_upload_sessions.update_many(
+            {"status": RESTORING, "restore_heartbeat_at": {"$not": {"$gte": stale}}},
+            {"$set": {"status": FAILED, "error": "worker stopped"}},
+        )
+
+        async for job in self.db.backup_jobs.find({"expires_at": {"$lt": now}}, {"_id": 0, "backup_id": 1, "chunks_dir": 1}):
+            await self._remove_dir(job["chunks_dir"])
+            await self.db.backup_jobs.delete_one({"backup_id": job["backup_id"]})
+            removed += 1
+
+        # Chunk directories without a live job (failed, deleted, or from a crashed worker)
+        if os.path.isdir(self.directory):
+            names = os.listdir(self.directory)
+            live = {
+                job["backup_id"]
+                async for job in self.db.backup_jobs.find(
+                    {"backup_id": {"$in": names}, "status": {"$ne": FAILED}}, {"_id": 0, "backup_id": 1}
+                )
+            }
+            cutoff = time.time() - self.stale_after
+            for name in names:
+                path = os.path.join(self.directory, name)
+                if name not in live and os.path.getmtime(path) < cutoff:
+                    await self._remove_dir(path)
+                    removed += 1
+
+        async for session in self.db.chunked_upload_sessions.find(
+            {"created_at": {"$lt": now - self.retention}, "status": {"$ne": RESTORING}},
+            {"_id": 0, "upload_id": 1, "chunks_dir": 1},
+        ):
+            await self._remove_dir(session["chunks_dir"])
+            await self.db.chunked_upload_sessions.delete_one({"upload_id": session["upload_id"]})
+            removed += 1
+
+        self.cleaned += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cleaned": self.cleaned,
+            "directory": self.directory,
+        }
@@ -0,0 +1,434 @@
+"""
+Two-Tier Cache for ZION.CITY API
+================================
+Bounded in-process LRU tier in front of an optional shared Redis tier.
+
+- LRU tier: max entries / max bytes, per-key TTL, tag index, hit/miss counters
+- Redis tier: shared by all gunicorn workers, tag sets for group invalidation
+- Invalidations are published over Redis pub/sub so every worker drops its
+  local copy, not only the one that performed the write
+- clear() empties both tiers on every worker, for writes that bypass the
+  cached paths (database restores)
+
+Values are stored pickled, so every read returns a private copy that handlers
+may mutate freely. Only trusted data should ever be written to the Redis tier.
+
+Usage:
+    from core.cache import Cache
+
+    cache = Cache.from_env()
+    await cache.start()          # in lifespan, starts the invalidation listener
+
+    org = await cache.get_or_load(f"org:{org_id}", load_org, ttl=600, tags=[f"org:{org_id}"])
+    await cache.invalidate_tag(f"org:{org_id}")
+"""
+
+import asyncio
+import json
+import logging
+import os
+import pickle
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _dumps(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class LRUCache:
+    """
+    In-process LRU cache with per-key TTL and tag-based invalidation.
+
+    Not thread-safe by design: it is only touched from the event loop, so no
+    lock is needed and reads never wait on each other.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, default_ttl: int = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._key_tags: Dict[str, Tuple[str, ...]] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the pickled payload for key, or None if missing/expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        payload, expires_at = entry
+        if expires_at <= time.monotonic():
+            self.remove(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def set(self, key: str, payload: bytes, ttl: Optional[float] = None, tags: Iterable[str] = ()) -> None:
+        """Store a pickled payload, evicting least-recently-used entries as needed."""
+        self.remove(key)
+        if len(payload) > self.max_bytes:
+            return
+        self._data[key] = (payload, time.monotonic() + (ttl or self.default_ttl))
+        self.bytes += len(payload)
+        tags = tuple(tags)
+        if tags:
+            self._key_tags[key] = tags
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+        while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self.remove(oldest)
+            self.evictions += 1
+
+    def remove(self, key: str) -> bool:
+        """Remove a key. Returns True if it was present."""
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= len(entry[0])
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Remove every key carrying tag. Returns number of keys removed."""
+        keys = self._tags.pop(tag, set())
+        for key in list(keys):
+            self.remove(key)
+        return len(keys)
+
+    def clear_expired(self) -> int:
+        """Drop expired entries. Returns number of keys removed."""
+        now = time.monotonic()
+        expired = [k for k, (_, expires_at) in self._data.items() if expires_at <= now]
+        for key in expired:
+            self.remove(key)
+        return len(expired)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._tags.clear()
+        self._key_tags.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "default_ttl": self.default_ttl,
+            "tags": len(self._tags),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class RedisTier:
+    """Shared cache tier stored in Redis. Tag membership is kept in Redis sets."""
+
+    def __init__(self, client: Any, prefix: str = "zion:cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}k:{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}t:{tag}"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self._key(key))
+
+    async def set(self, key: str, payload: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        ttl_ms = max(1, int(ttl * 1000))
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(self._key(key), payload, px=ttl_ms)
+            for tag in tags:
+                tag_key = self._tag(tag)
+                pipe.sadd(tag_key, key)
+                # NX sets a TTL on a fresh tag set, GT extends it (Redis 7+)
+                pipe.pexpire(tag_key, ttl_ms, nx=True)
+                pipe.pexpire(tag_key, ttl_ms, gt=True)
+            await pipe.execute()
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        redis_keys = [self._key(k) for k in keys]
+        if redis_keys:
+            await self.client.delete(*redis_keys)
+
+    async def invalidate_tag(self, tag: str) -> List[str]:
+        tag_key = self._tag(tag)
+        members = await self.client.smembers(tag_key)
+        keys = [m.decode() if isinstance(m, bytes) else m for m in members]
+        await self.client.delete(tag_key, *[self._key(k) for k in keys])
+        return keys
+
+    async def clear(self) -> int:
+        """Delete every cache key and tag set. Returns number of Redis keys removed."""
+        removed = 0
+        batch = []
+        async for key in self.client.scan_iter(match=f"{self.prefix}*", count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                removed += await self.client.delete(*batch)
+                batch = []
+        if batch:
+            removed += await self.client.delete(*batch)
+        return removed
+
+
+class Cache:
+    """
+    Cache facade used by the API: local LRU tier first, then Redis, then loader.
+
+    Redis failures never fail a request; the cache degrades to local-only and
+    counts the error in stats().
+    """
+
+    INVALIDATION_CHANNEL = "zion:cache:invalidate"
+
+    def __init__(self, local: LRUCache, redis_client: Any = None, local_ttl_cap: float = 60):
+        self.local = local
+        self.remote = RedisTier(redis_client) if redis_client is not None else None
+        self._redis = redis_client
+        # With a shared tier, local copies are kept short so that a missed
+        # invalidation message can only cause bounded staleness.
+        self.local_ttl_cap = local_ttl_cap if redis_client is not None else None
+        self._node_id = uuid.uuid4().hex
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self.remote_hits = 0
+        self.remote_misses = 0
+        self.remote_errors = 0
+
+    @classmethod
+    def from_env(cls) -> "Cache":
+        """Build the cache from CACHE_* environment variables and REDIS_URL."""
+        local = LRUCache(
+            max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", 10000)),
+            max_bytes=int(os.environ.get("CACHE_MAX_MB", 64)) * 1024 * 1024,
+            default_ttl=int(os.environ.get("CACHE_DEFAULT_TTL", 300)),
+        )
+        return cls(local, get_redis(), local_ttl_cap=float(os.environ.get("CACHE_LOCAL_TTL_CAP", 60)))
+
+    @property
+    def default_ttl(self) -> int:
+        return self.local.default_ttl
+
+    def _local_ttl(self, ttl: float) -> float:
+        return min(ttl, self.local_ttl_cap) if self.local_ttl_cap else ttl
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        """Get a cached value, or default if absent."""
+        payload = self.local.get(key)
+        if payload is None and self.remote is not None:
+            try:
+                payload = await self.remote.get(key)
+            except Exception as e:
+                self.remote_errors += 1
+                logger.warning(f"Cache remote get failed for {key}: {e}")
+            if payload is not None:
+                self.remote_hits += 1
+                self.local.set(key, payload, self._local_ttl(self.local.default_ttl))
+            else:
+                self.remote_misses += 1
+        if payload is None:
+            return default
+        return pickle.loads(payload)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None, tags: Iterable[str] = ()) -> None:
+        """Store value under key for ttl seconds (default_ttl if omitted)."""
+        await self._store(key, _dumps(value), ttl or self.local.default_ttl, tuple(tags))
+
+    async def _store(self, key: str, payload: bytes, ttl: float, tags: Tuple[str, ...]) -> None:
+        self.local.set(key, payload, self._local_ttl(ttl), tags)
+        if self.remote is not None:
+            try:
+                await self.remote.set(key, payload, ttl, tags)
+            except Exception as e:
+                self.remote_errors += 1
+                logger.warning(f"Cache remote set failed for {key}: {e}")
+
+    async def delete(self, *keys: str) -> None:
+        """Delete keys on every tier and every worker."""
+        for key in keys:
+            self.local.remove(key)
+        if self.remote is not None and keys:
+            try:
+                await self.remote.delete(keys)
+            except Exception as e:
+                self.remote_errors += 1
+                logger.warning(f"Cache remote delete failed: {e}")
+            await self._publish({"keys": list(keys)})
+
+    async def invalidate_tag(self, *tags: str) -> int:
+        """Drop every entry carrying any of tags. Returns local keys removed."""
+        removed = 0
+        for tag in tags:
+            removed += self.local.invalidate_tag(tag)
+        if self.remote is not None and tags:
+            for tag in tags:
+                try:
+                    await self.remote.invalidate_tag(tag)
+                except Exception as e:
+                    self.remote_errors += 1
+                    logger.warning(f"Cache remote tag invalidation failed for {tag}: {e}")
+            await self._publish({"tags": list(tags)})
+        return removed
+
+    async def clear(self) -> None:
+        """Empty both tiers on every worker."""
+        self.local.clear()
+        if self.remote is not None:
+            try:
+                await self.remote.clear()
+            except Exception as e:
+                self.remote_errors += 1
+                logger.warning(f"Cache remote clear failed: {e}")
+            await self._publish({"clear": True})
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        tags: Iterable[str] = (),
+    ) -> Any:
+        """
+        Return the cached value for key, calling loader() on a miss.
+
+        Concurrent misses for the same key share a single loader call.
+        None results are returned but not cached.
+        """
+        value = await self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            payload = await asyncio.shield(pending)
+            return pickle.loads(payload) if payload is not None else None
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            payload = None
+            if value is not None:
+                payload = _dumps(value)
+                await self._store(key, payload, ttl or self.local.default_ttl, tuple(tags))
+            future.set_result(payload)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    async def clear_expired(self) -> int:
+        """Drop expired local entries (Redis expires its own keys)."""
+        return self.local.clear_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "local": self.local.stats(),
+            "remote": {
+                "enabled": self.remote is not None,
+                "hits": self.remote_hits,
+                "misses": self.remote_misses,
+                "errors": self.remote_errors,
+            },
+            "inflight_loads": len(self._inflight),
+        }
+
+    # ---- cross-worker invalidation ----
+
+    async def _publish(self, message: Dict[str, Any]) -> None:
+        try:
+            message["node"] = self._node_id
+            await self._redis.publish(self.INVALIDATION_CHANNEL, json.dumps(message))
+        except Exception as e:
+            self.remote_errors += 1
+            logger.warning(f"Cache invalidation publish failed: {e}")
+
+    def _apply_invalidation(self, raw: Any) -> None:
+        try:
+            message = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        if message.get("node") == self._node_id:
+            return
+        if message.get("clear"):
+            self.local.clear()
+            return
+        for key in message.get("keys", ()):
+            self.local.remove(key)
+        for tag in message.get("tags", ()):
+            self.local.invalidate_tag(tag)
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.INVALIDATION_CHANNEL)
+                while True:
+                    # Poll below the client's socket_timeout: an idle channel is not an error
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message.get("type") == "message":
+                        self._apply_invalidation(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error, resubscribing: {e}")
+                # Anything published while disconnected is lost; drop local copies
+                self.local.clear()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def start(self) -> None:
+        """Start the cross-worker invalidation listener (no-op without Redis)."""
+        if self._redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
@@ -0,0 +1,366 @@
+"""
+Conversation Summaries for ZION.CITY API
+========================================
+Denormalized inbox rows, one per (user, chat), behind /direct-chats and
+/chat-groups.
+
+- Each row holds the chat snapshot, the peer's display data (direct chats)
+  or member count (groups), the last message snapshot and the unread counter
+- Rows are updated with atomic update_many/$inc writes when messages are
+  sent, read, edited or deleted, so an inbox is one indexed query sorted by
+  last activity instead of 3 queries per chat
+- Rows are built lazily per user from direct_chats / chat_group_members the
+  first time the user opens an inbox
+
+Collections:
+    conversation_summaries      {user_id, chat_type, chat_id, chat, peer, role, joined_at, member_count,
+                                 last_message, unread_count, last_activity_at, last_read_at}
+    conversation_summary_state  {user_id, built_at}
+
+Usage:
+    from core.conversations import ConversationSummaries
+
+    conversations = ConversationSummaries(db)
+    await conversations.on_message(message_dict)              # after insert
+    await conversations.mark_read("direct", chat_id, user_id)
+    rows = await conversations.inbox(user_id, "direct")
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DIRECT = "direct"
+GROUP = "group"
+
+PEER_FIELDS = ("id", "first_name", "last_name", "profile_picture")
+
+# Message fields that are not needed to render an inbox row
+_SNAPSHOT_EXCLUDE = ("_id", "reactions", "user_reactions")
+
+
+def chat_key(message: Dict[str, Any]):
+    """(chat_type, chat_id) of a chat_messages document."""
+    if message.get("direct_chat_id"):
+        return DIRECT, message["direct_chat_id"]
+    return GROUP, message.get("group_id")
+
+
+def message_snapshot(message: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if message is None:
+        return None
+    return {k: v for k, v in message.items() if k not in _SNAPSHOT_EXCLUDE}
+
+
+def peer_snapshot(user: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if user is None:
+        return None
+    return {f: user.get(f) for f in PEER_FIELDS}
+
+
+class ConversationSummaries:
+    """
+    Per-user inbox rows stored in MongoDB.
+
+    chat_messages stays the source of truth; every write here is a
+    best-effort projection, so failures are logged and counted instead of
+    failing the request that sent or read the message.
+    """
+
+    def __init__(self, db, inbox_limit: int = 100):
+        self.db = db
+        self.inbox_limit = inbox_limit
+        self.rebuilds = 0
+        self.errors = 0
+
+    def _failed(self, action: str, chat_id: Any, e: Exception) -> None:
+        self.errors += 1
+        logger.error(f"Conversation summary {action} failed for chat {chat_id}: {e}")
+
+    # ---- chats and members ----
+
+    async def add_direct_chat(self, chat: Dict[str, Any], users: Dict[str, Dict[str, Any]]) -> None:
+        """Create rows for both participants of a new direct chat."""
+        chat = {k: v for k, v in chat.items() if k != "_id"}
+        try:
+            for user_id in chat["participant_ids"]:
+                peer_id = next((uid for uid in chat["participant_ids"] if uid != user_id), None)
+                await self._upsert(
+                    user_id, DIRECT, chat["id"],
+                    {"chat": chat, "peer": peer_snapshot(users.get(peer_id))},
+                    chat.get("created_at"),
+                )
+        except Exception as e:
+            self._failed("create", chat.get("id"), e)
+
+    async def add_group_members(self, group: Dict[str, Any], memberships: Iterable[Dict[str, Any]]) -> None:
+        """Create rows for new group members and refresh the group's member count."""
+        group = {k: v for k, v in group.items() if k != "_id"}
+        try:
+            member_count = await self.db.chat_group_members.count_documents({"group_id": group["id"], "is_active": True})
+            for membership in memberships:
+                await self._upsert(
+                    membership["user_id"], GROUP, group["id"],
+                    {"chat": group, "role": membership.get("role"), "joined_at": membership.get("joined_at")},
+                    group.get("created_at"),
+                )
+            await self.db.conversation_summaries.update_many(
+                {"chat_type": GROUP, "chat_id": group["id"]},
+                {"$set": {"member_count": member_count}},
+            )
+        except Exception as e:
+            self._failed("membership", group.get("id"), e)
+
+    async def _upsert(self, user_id: str, chat_type: str, chat_id: str, fields: Dict[str, Any], created_at: Any) -> None:
+        await self.db.conversation_summaries.update_one(
+            {"user_id": user_id, "chat_type": chat_type, "chat_id": chat_id},
+            {
+                "$set": fields,
+                "$setOnInsert": {
+                    "last_message": None,
+                    "unread_count": 0,
+                    "last_activity_at": created_at or datetime.now(timezone.utc),
+                },
+            },
+            upsert=True,
+        )
+
+    async def refresh_user(self, user_id: str) -> None:
+        """Copy a user's current name and picture into the rows where they are the peer."""
+        try:
+            user = await self.db.users.find_one({"id": user_id}, {"_id": 0, **{f: 1 for f in PEER_FIELDS}})
+            if user is None:
+                return
+            await self.db.conversation_summaries.update_many(
+                {"peer.id": user_id},
+                {"$set": {"peer": peer_snapshot(user)}},
+            )
+        except Exception as e:
+            self._failed("peer refresh", user_id, e)
+
+    # ---- messages ----
+
+    async def on_message(self, message: Dict[str, Any]) -> None:
+        """Record a newly inserted message as the chat's last message."""
+        chat_type, chat_id = chat_key(message)
+        created_at = message["created_at"]
+        try:
+            # $lte keeps a slower concurrent write from replacing a newer snapshot
+            await self.db.conversation_summaries.update_many(
+                {"chat_type": chat_type, "chat_id": chat_id, "last_activity_at": {"$lte": created_at}},
+                {"$set": {
+                    "last_message": message_snapshot(message),
+                    "last_activity_at": created_at,
+                    "chat.updated_at": created_at,
+                }},
+            )
+            await self.db.conversation_summaries.update_many(
+                {"chat_type": chat_type, "chat_id": chat_id, "user_id": {"$ne": message["user_id"]}},
+                {"$inc": {"unread_count": 1}},
+            )
+        except Exception as e:
+            self._failed("message", chat_id, e)
+
+    async def on_edit(self, message: Dict[str, Any]) -> None:
+        """Refresh the snapshot if the edited message is the chat's last message."""
+        chat_type, chat_id = chat_key(message)
+        try:
+            await self.db.conversation_summaries.update_many(
+                {"chat_type": chat_type, "chat_id": chat_id, "last_message.id": message["id"]},
+                {"$set": {"last_message": message_snapshot(message)}},
+            )
+        except Exception as e:
+            self._failed("edit", chat_id, e)
+
+    async def on_delete(self, message: Dict[str, Any]) -> None:
+        """Drop a deleted message from unread counters and last message snapshots."""
+        chat_type, chat_id = chat_key(message)
+        try:
+            unread_filter: Dict[str, Any] = {
+                "chat_type": chat_type,
+                "chat_id": chat_id,
+                "user_id": {"$ne": message["user_id"]},
+                "unread_count": {"$gt": 0},
+            }
+            if chat_type == GROUP:
+                unread_filter["$or"] = [
+                    {"last_read_at": None},
+                    {"last_read_at": {"$lt": message["created_at"]}},
+                ]
+            if chat_type == GROUP or message.get("status") != "read":
+                await self.db.conversation_summaries.update_many(unread_filter, {"$inc": {"unread_count": -1}})
+
+            latest = await self._latest_message(chat_type, chat_id)
+            await self.db.conversation_summaries.update_many(
+                {"chat_type": chat_type, "chat_id": chat_id, "last_message.id": message["id"]},
+                {"$set": {"last_message": message_snapshot(latest)}},
+            )
+        except Exception as e:
+            self._failed("delete", chat_id, e)
+
+    async def mark_read(self, chat_type: str, chat_id: str, user_id: str) -> None:
+        """The user has read everything in the chat."""
+        try:
+            await self.db.conversation_summaries.update_one(
+                {"user_id": user_id, "chat_type": chat_type, "chat_id": chat_id},
+                {"$set": {"unread_count": 0, "last_read_at": datetime.now(timezone.utc)}},
+            )
+            if chat_type == DIRECT:
+                # The sender sees the read receipt on their own row
+                await self.db.conversation_summaries.update_many(
+                    {
+                        "chat_type": DIRECT,
+                        "chat_id": chat_id,
+                        "last_message.user_id": {"$ne": user_id},
+                        "last_message.status": {"$ne": "read"},
+                    },
+                    {"$set": {"last_message.status": "read"}},
+                )
+        except Exception as e:
+            self._failed("read", chat_id, e)
+
+    async def on_status(self, message: Dict[str, Any], reader_id: str, status: str) -> None:
+        """A single message was marked delivered/read by its recipient."""
+        chat_type, chat_id = chat_key(message)
+        try:
+            if status == "read" and message.get("status") != "read" and not message.get("is_deleted"):
+                await self.db.conversation_summaries.update_one(
+                    {"user_id": reader_id, "chat_type": chat_type, "chat_id": chat_id, "unread_count": {"$gt": 0}},
+                    {"$inc": {"unread_count": -1}},
+                )
+            await self.db.conversation_summaries.update_many(
+                {"chat_type": chat_type, "chat_id": chat_id, "last_message.id": message["id"]},
+                {"$set": {"last_message.status": status}},
+            )
+        except Exception as e:
+            self._failed("status", chat_id, e)
+
+    async def _latest_message(self, chat_type: str, chat_id: str) -> Optional[Dict[str, Any]]:
+        field = "direct_chat_id" if chat_type == DIRECT else "group_id"
+        return await self.db.chat_messages.find_one(
+            {field: chat_id, "is_deleted": False},
+            {"_id": 0},
+            sort=[("created_at", -1)],
+        )
+
+    # ---- lazy build ----
+
+    async def rebuild(self) -> int:
+        """Drop every row and build-state row; inboxes are rebuilt when their owner next opens them."""
+        await self.db.conversation_summaries.delete_many({})
+        result = await self.db.conversation_summary_state.delete_many({})
+        return result.deleted_count
+
+    async def _is_built(self, user_id: str) -> bool:
+        state = await self.db.conversation_summary_state.find_one({"user_id": user_id}, {"_id": 1})
+        return state is not None
+
+    async def _ensure_built(self, user_id: str) -> None:
+        """Build a user's rows from the chat collections the first time they open an inbox."""
+        if await self._is_built(user_id):
+            return
+        rows: List[Dict[str, Any]] = []
+
+        chats = await self.db.direct_chats.find(
+            {"participant_ids": user_id, "is_active": True}, {"_id": 0}
+        ).to_list(None)
+        peer_ids = {uid for chat in chats for uid in chat["participant_ids"] if uid != user_id}
+        peers = {}
+        if peer_ids:
+            async for user in self.db.users.find({"id": {"$in": list(peer_ids)}}, {"_id": 0, **{f: 1 for f in PEER_FIELDS}}):
+                peers[user["id"]] = user
+        latest = await self._latest_by_chat("direct_chat_id", [c["id"] for c in chats], user_id)
+        for chat in chats:
+            peer_id = next((uid for uid in chat["participant_ids"] if uid != user_id), None)
+            rows.append(self._row(user_id, DIRECT, chat, latest.get(chat["id"]), peer=peer_snapshot(peers.get(peer_id))))
+
+        memberships = await self.db.chat_group_members.find(
+            {"user_id": user_id, "is_active": True}, {"_id": 0}
+        ).to_list(None)
+        group_ids = [m["group_id"] for m in memberships]
+        if group_ids:
+            groups = {
+                g["id"]: g for g in await self.db.chat_groups.find(
+                    {"id": {"$in": group_ids}, "is_active": True}, {"_id": 0}
+                ).to_list(None)
+            }
+            counts = {
+                doc["_id"]: doc["count"] async for doc in self.db.chat_group_members.aggregate([
+                    {"$match": {"group_id": {"$in": list(groups)}, "is_active": True}},
+                    {"$group": {"_id": "$group_id", "count": {"$sum": 1}}},
+                ])
+            }
+            latest = await self._latest_by_chat("group_id", list(groups), user_id)
+            for membership in memberships:
+                group = groups.get(membership["group_id"])
+                if group:
+                    rows.append(self._row(
+                        user_id, GROUP, group, latest.get(group["id"]),
+                        role=membership.get("role"),
+                        joined_at=membership.get("joined_at"),
+                        member_count=counts.get(group["id"], 0),
+                    ))
+
+        if rows:
+            from pymongo import UpdateOne
+
+            await self.db.conversation_summaries.bulk_write([
+                UpdateOne(
+                    {"user_id": user_id, "chat_type": row["chat_type"], "chat_id": row["chat_id"]},
+                    {"$set": row},
+                    upsert=True,
+                )
+                for row in rows
+            ], ordered=False)
+        await self.db.conversation_summary_state.update_one(
+            {"user_id": user_id},
+            {"$set": {"built_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        self.rebuilds += 1
+
+    async def _latest_by_chat(self, field: str, chat_ids: List[str], user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Last message and unread count per chat, in one aggregation."""
+        if not chat_ids:
+            return {}
+        pipeline = [
+            {"$match": {field: {"$in": chat_ids}, "is_deleted": False}},
+            {"$sort": {"created_at": -1}},
+            {"$group": {
+                "_id": f"${field}",
+                "last_message": {"$first": "$$ROOT"},
+                "unread_count": {"$sum": {"$cond": [
+                    {"$and": [{"$ne": ["$user_id", user_id]}, {"$ne": ["$status", "read"]}]}, 1, 0
+                ]}},
+            }},
+        ]
+        return {doc["_id"]: doc async for doc in self.db.chat_messages.aggregate(pipeline, allowDiskUse=True)}
+
+    @staticmethod
+    def _row(user_id: str, chat_type: str, chat: Dict[str, Any], latest: Optional[Dict[str, Any]], **fields) -> Dict[str, Any]:
+        last_message = message_snapshot(latest["last_message"]) if latest else None
+        return {
+            "user_id": user_id,
+            "chat_type": chat_type,
+            "chat_id": chat["id"],
+            "chat": chat,
+            "last_message": last_message,
+            "unread_count": latest["unread_count"] if latest else 0,
+            "last_activity_at": last_message["created_at"] if last_message else chat.get("created_at"),
+            **fields,
+        }
+
+    # ---- reads ----
+
+    async def inbox(self, user_id: str, chat_type: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """A user's rows of one chat type, most recently active first."""
+        await self._ensure_built(user_id)
+        limit = limit or self.inbox_limit
+        return await self.db.conversation_summaries.find(
+            {"user_id": user_id, "chat_type": chat_type}, {"_id": 0}
+        ).sort("last_activity_at", -1).limit(limit).to_list(limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rebuilds": self.rebuilds, "errors": self.errors}
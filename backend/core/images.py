@@ -0,0 +1,303 @@
+"""
+Image Derivatives for ZION.CITY API
+===================================
+Thumbnails, WebP/AVIF variants, dimensions and a blurhash for uploaded images.
+
+- Decoding and resizing run in the shared process pool (core/workers.py,
+  task kind "images"), never on the event loop; uploads return at once and
+  the record is filled in when done
+- Variants are keyed by the blob hash and stored next to the blob
+  (<key>.variants/<size>.<format>, in whichever storage backend holds it),
+  so deduplicated uploads reuse them and MediaStore.release() deletes them
+  with the blob. Remote blobs are downloaded to a temp file for rendering
+- Results are cached on media_blobs.image and copied to every media_files
+  row of that blob as metadata.{width, height, blurhash, variants}
+- A blob that cannot be rendered (corrupt or unsupported file) gets
+  media_blobs.image = {error, failed_at} and metadata.image_error on its
+  rows; it is served as the original and not retried
+- Sizes larger than the original are not upscaled; they point at the
+  largest variant instead, so every size name is always servable
+
+Usage:
+    from core.images import ImageDerivatives
+
+    image_derivatives = ImageDerivatives.from_env(db, media_store, worker_pools, cache)
+    image_derivatives.schedule(media_file.sha256)
+    key, mime = image_derivatives.variant(media_file_doc, "small", accept_header)
+    await image_derivatives.stop()                         # in lifespan
+"""
+
+import asyncio
+import io
+import logging
+import math
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .media import MediaStore
+from .storage import blob_key, variant_prefix
+from .workers import IMAGES, WorkerPools
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels per size name
+VARIANT_SIZES = {"thumb": 160, "small": 480, "medium": 960, "large": 1600}
+MIME_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+
+def available_formats() -> List[str]:
+    """WebP always; AVIF when this Pillow build can encode it."""
+    from PIL import features
+
+    return ["avif", "webp"] if features.check("avif") else ["webp"]
+
+
+# ---- blurhash (https://blurha.sh), encoder only ----
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    return int(v * 12.92 * 255 + 0.5) if v <= 0.0031308 else int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exp: float) -> float:
+    return math.copysign(abs(value) ** exp, value)
+
+
+def blurhash(image, x_components: int = 4, y_components: int = 3) -> str:
+    """Encode a (small) RGB PIL image; callers downscale to ~32px first."""
+    width, height = image.size
+    pixels = [tuple(_to_linear(c) for c in px) for px in image.getdata()]
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            norm = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                cy = math.cos(math.pi * j * y / height)
+                row = y * width
+                for x in range(width):
+                    basis = cy * math.cos(math.pi * i * x / width)
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = norm / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(c) for f in ac for c in f)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+    result += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+    for f in ac:
+        q = [max(0, min(18, int(math.floor(_sign_pow(c / max_value, 0.5) * 9 + 9.5)))) for c in f]
+        result += _base83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return result
+
+
+# ---- worker process ----
+
+def render_variants(
+    source_path: str,
+    out_dir: str,
+    sizes: Dict[str, int],
+    formats: List[str],
+    quality: int = 80,
+) -> Dict[str, Any]:
+    """Decode once, write every size/format and return the image metadata (runs in the pool)."""
+    from PIL import Image, ImageOps
+
+    os.makedirs(out_dir, exist_ok=True)
+    with Image.open(source_path) as opened:
+        image = ImageOps.exif_transpose(opened)
+        width, height = image.size
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    variants: Dict[str, Dict[str, Any]] = {}
+    written: Dict[Tuple[int, int], str] = {}
+    for name, edge in sorted(sizes.items(), key=lambda item: item[1]):
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        if resized.size in written:
+            # Original smaller than this size: reuse the variant already at full resolution
+            variants[name] = variants[written[resized.size]]
+            continue
+        files = {}
+        for fmt in formats:
+            path = os.path.join(out_dir, f"{name}.{fmt}")
+            resized.save(path, fmt.upper(), quality=quality)
+            files[fmt] = {"file": os.path.basename(path), "size": os.path.getsize(path)}
+        variants[name] = {"width": resized.width, "height": resized.height, "formats": files}
+        written[resized.size] = name
+
+    preview = image.convert("RGB")
+    preview.thumbnail((32, 32))
+    components_x, components_y = (4, 3) if width >= height else (3, 4)
+    return {
+        "width": width,
+        "height": height,
+        "blurhash": blurhash(preview, components_x, components_y),
+        "variants": variants,
+    }
+
+
+def qr_code_png(data: str, box_size: int = 10, border: int = 4) -> bytes:
+    """PNG bytes of a QR code for data (runs in the pool)."""
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageDerivatives:
+    """Schedules derivative generation in a process pool and resolves variants for serving."""
+
+    def __init__(
+        self,
+        db,
+        store: MediaStore,
+        pools: WorkerPools,
+        sizes: Optional[Dict[str, int]] = None,
+        quality: int = 80,
+        cache: Any = None,
+    ):
+        self.db = db
+        self.store = store
+        self.cache = cache
+        self.pools = pools
+        self.sizes = dict(sizes or VARIANT_SIZES)
+        self.quality = quality
+        self._formats: Optional[List[str]] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.generated = 0
+        self.reused = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls, db, store: MediaStore, pools: WorkerPools, cache: Any = None) -> "ImageDerivatives":
+        return cls(
+            db,
+            store,
+            pools,
+            quality=int(os.environ.get("IMAGE_QUALITY", 80)),
+            cache=cache,
+        )
+
+    @property
+    def formats(self) -> List[str]:
+        if self._formats is None:
+            self._formats = available_formats()
+        return self._formats
+
+    def schedule(self, sha256: Optional[str]) -> Optional[asyncio.Task]:
+        """Start (or join) generation for a blob; returns the task."""
+        if not sha256:
+            return None
+        task = self._inflight.get(sha256)
+        if task is None:
+            task = asyncio.create_task(self.process(sha256))
+            self._inflight[sha256] = task
+            task.add_done_callback(lambda _: self._inflight.pop(sha256, None))
+        return task
+
+    async def process(self, sha256: str) -> Optional[Dict[str, Any]]:
+        blob = await self.db.media_blobs.find_one({"sha256": sha256}, {"_id": 0, "image": 1})
+        info = blob.get("image") if blob else None
+        if info is not None:
+            self.reused += 1
+            if "error" in info:
+                return None
+        else:
+            try:
+                async with self.store.local_copy(blob_key(sha256)) as source, \
+                        self.store.variant_workdir(sha256) as out_dir:
+                    info = await self.pools.cpu(
+                        IMAGES, render_variants,
+                        str(source), str(out_dir), self.sizes, self.formats, self.quality,
+                    )
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Image derivatives failed for {sha256}: {e}")
+                await self._record_failure(sha256, e)
+                return None
+            await self.db.media_blobs.update_one({"sha256": sha256}, {"$set": {"image": info}})
+            self.generated += 1
+
+        await self.db.media_files.update_many(
+            {"sha256": sha256, "metadata.variants": {"$exists": False}},
+            {"$set": {f"metadata.{key}": value for key, value in info.items()}},
+        )
+        await self._invalidate(sha256)
+        return info
+
+    async def _record_failure(self, sha256: str, error: Exception) -> None:
+        """
+        Remember a failed render on the blob and its media_files rows, so
+        serving the file does not schedule it again on every request.
+        Unset media_blobs.image and metadata.image_error to retry.
+        """
+        failure = {"error": str(error) or type(error).__name__, "failed_at": datetime.now(timezone.utc)}
+        try:
+            await self.db.media_blobs.update_one({"sha256": sha256}, {"$set": {"image": failure}})
+            await self.db.media_files.update_many(
+                {"sha256": sha256, "metadata.variants": {"$exists": False}},
+                {"$set": {"metadata.image_error": failure["error"]}},
+            )
+            await self._invalidate(sha256)
+        except Exception as e:
+            logger.error(f"Could not record image derivative failure for {sha256}: {e}")
+
+    async def _invalidate(self, sha256: str) -> None:
+        if self.cache is not None:
+            # Cached media_files rows (tagged by blob) were loaded without variants
+            await self.cache.invalidate_tag(f"media-blob:{sha256}")
+
+    def variant(self, media_file: Dict[str, Any], size: str, accept: str = "") -> Optional[Tuple[str, str]]:
+        """(storage key, mime type) of the best variant the client accepts, or None to serve the original."""
+        variant = (media_file.get("metadata") or {}).get("variants", {}).get(size)
+        if not variant or not media_file.get("sha256"):
+            return None
+        formats = variant["formats"]
+        fmt = "avif" if "avif" in formats and "image/avif" in accept else "webp"
+        if fmt not in formats:
+            return None
+        return f"{variant_prefix(media_file['sha256'])}/{formats[fmt]['file']}", MIME_TYPES[fmt]
+
+    async def stop(self) -> None:
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "generated": self.generated,
+            "reused": self.reused,
+            "failed": self.failed,
+        }
@@ -0,0 +1,510 @@
+"""
+Declarative MongoDB Index Manifest for ZION.CITY
+================================================
+INDEX_MANIFEST lists every index the API relies on, per collection.
+The runner diffs it against listIndexes, builds whatever is missing and
+reports indexes that exist but are not declared, or are never used
+($indexStats).
+
+Run before deploy (from backend/):
+    python -m core.indexes plan            # show missing / changed / undeclared indexes
+    python -m core.indexes apply           # build missing indexes, rebuild changed ones
+    python -m core.indexes apply --drop-undeclared
+    python -m core.indexes unused          # indexes with zero ops since mongod start
+
+Or from code:
+    from core.indexes import apply_indexes
+    report = await apply_indexes(db)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+IndexKey = Tuple[str, Union[int, str]]
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """One index: key pattern plus the options that change its semantics."""
+    keys: Tuple[IndexKey, ...]
+    unique: bool = False
+    sparse: bool = False
+    expire_after_seconds: Optional[int] = None
+    partial_filter: Optional[Dict[str, Any]] = field(default=None, hash=False, compare=False)
+
+    @property
+    def name(self) -> str:
+        # Same naming scheme MongoDB uses by default
+        return "_".join(f"{k}_{v}" for k, v in self.keys)
+
+    @property
+    def signature(self) -> Tuple[IndexKey, ...]:
+        return _normalize_keys(self.keys)
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        """Options as listIndexes reports them, for detecting a changed index."""
+        return {
+            "unique": self.unique,
+            "sparse": self.sparse,
+            "expireAfterSeconds": self.expire_after_seconds,
+            "partialFilterExpression": self.partial_filter or None,
+        }
+
+    def to_index_model(self):
+        from pymongo import IndexModel
+
+        kwargs: Dict[str, Any] = {"name": self.name}
+        if self.unique:
+            kwargs["unique"] = True
+        if self.sparse:
+            kwargs["sparse"] = True
+        if self.expire_after_seconds is not None:
+            kwargs["expireAfterSeconds"] = self.expire_after_seconds
+        if self.partial_filter:
+            kwargs["partialFilterExpression"] = self.partial_filter
+        return IndexModel(list(self.keys), **kwargs)
+
+    def describe(self) -> Dict[str, Any]:
+        info: Dict[str, Any] = {"name": self.name, "keys": dict(self.keys)}
+        if self.unique:
+            info["unique"] = True
+        if self.sparse:
+            info["sparse"] = True
+        if self.expire_after_seconds is not None:
+            info["expire_after_seconds"] = self.expire_after_seconds
+        return info
+
+
+def idx(*keys: Union[str, IndexKey], **options) -> IndexSpec:
+    """Shorthand: idx("user_id", ("created_at", -1), unique=True)."""
+    return IndexSpec(keys=tuple(k if isinstance(k, tuple) else (k, 1) for k in keys), **options)
+
+
+def _normalize_keys(keys: Sequence[IndexKey]) -> Tuple[IndexKey, ...]:
+    """Normalize a key pattern so declared and server-reported indexes compare equal."""
+    normalized = []
+    text_fields = []
+    for name, direction in keys:
+        if direction == "text":
+            text_fields.append(name)
+        elif isinstance(direction, (int, float)):
+            normalized.append((name, int(direction)))
+        else:
+            normalized.append((name, direction))
+    if text_fields:
+        normalized.append(("$text", ",".join(sorted(text_fields))))
+    return tuple(normalized)
+
+
+def _server_signature(index: Dict[str, Any]) -> Tuple[IndexKey, ...]:
+    """Signature for an index document returned by listIndexes."""
+    keys = [(k, v) for k, v in index["key"].items() if k not in ("_fts", "_ftsx")]
+    if "_fts" in index["key"]:
+        keys.extend((name, "text") for name in index.get("weights", {}))
+    return _normalize_keys(keys)
+
+
+def _server_options(index: Dict[str, Any]) -> Dict[str, Any]:
+    """Options of an index document returned by listIndexes, shaped like IndexSpec.options."""
+    return {
+        "unique": bool(index.get("unique", False)),
+        "sparse": bool(index.get("sparse", False)),
+        "expireAfterSeconds": index.get("expireAfterSeconds"),
+        "partialFilterExpression": index.get("partialFilterExpression") or None,
+    }
+
+
+# ============================================================
+# MANIFEST
+# ============================================================
+
+INDEX_MANIFEST: Dict[str, List[IndexSpec]] = {
+    # --- Identity & auth ---
+    "users": [
+        idx("id", unique=True),
+        idx("email", unique=True),
+        idx(("created_at", -1)),
+    ],
+    "agent_conversations": [
+        idx("user_id", ("updated_at", -1)),
+    ],
+    "notifications": [
+        idx("id"),
+        idx("user_id", "is_read", ("created_at", -1)),
+    ],
+
+    # --- Social graph ---
+    "user_friendships": [
+        idx("user1_id", "user2_id"),
+        idx("user2_id"),
+    ],
+    "user_follows": [
+        idx("follower_id", "target_id"),
+        idx("target_id"),
+    ],
+    "friend_requests": [
+        idx("id"),
+        idx("receiver_id", "status"),
+        idx("sender_id", "status"),
+    ],
+    "channel_subscriptions": [
+        idx("subscriber_id", "channel_id"),
+        idx("channel_id"),
+    ],
+
+    # --- Family ---
+    "family_profiles": [
+        idx("id", unique=True),
+        idx("creator_id"),
+    ],
+    "family_members": [
+        idx("family_id", "user_id", unique=True),
+        idx("user_id", "is_active"),
+        idx("family_id", "is_active"),
+    ],
+    "posts": [
+        idx("id", unique=True),
+        idx(("created_at", -1)),
+        idx("user_id", ("created_at", -1)),
+        idx("family_id", ("created_at", -1)),
+        idx("source_module", ("created_at", -1)),
+        idx("visibility"),
+    ],
+    "post_likes": [
+        idx("post_id", "user_id"),
+    ],
+
+    # --- Chat ---
+    "chat_messages": [
+        idx("id"),
+        idx("direct_chat_id", ("created_at", -1)),
+        idx("group_id", ("created_at", -1)),
+    ],
+    "direct_chats": [
+        idx("id"),
+        idx("participant_ids", "is_active"),
+    ],
+    "chat_groups": [
+        idx("id", unique=True),
+    ],
+    "chat_group_members": [
+        idx("group_id", "user_id"),
+        idx("user_id", "is_active"),
+    ],
+    "conversation_summaries": [
+        idx("user_id", "chat_type", ("last_activity_at", -1)),
+        idx("user_id", "chat_type", "chat_id", unique=True),
+        idx("chat_type", "chat_id"),
+        idx("peer.id", sparse=True),
+    ],
+    "conversation_summary_state": [
+        idx("user_id", unique=True),
+    ],
+    "chat_message_terms": [
+        idx("message_id", unique=True),
+        idx("chat_id", "terms", ("created_at", -1)),
+        idx("chat_id", ("created_at", -1), ("message_id", -1)),
+    ],
+    "chat_search_state": [
+        idx("chat_id", unique=True),
+    ],
+
+    # --- Work ---
+    "work_organizations": [
+        idx("id"),
+        idx("organization_id", sparse=True),
+    ],
+    "work_members": [
+        idx("organization_id", "user_id"),
+        idx("user_id", "status"),
+        idx("organization_id", "status"),
+    ],
+    "work_posts": [
+        idx("id"),
+        idx("organization_id", ("created_at", -1)),
+    ],
+
+    # --- News ---
+    "news_channels": [
+        idx("id"),
+        idx("owner_id"),
+    ],
+    "news_posts": [
+        idx("id"),
+        idx("user_id", ("created_at", -1)),
+        idx("channel_id", ("created_at", -1)),
+        idx("is_active", ("created_at", -1)),
+    ],
+    "news_post_likes": [
+        idx("post_id", "user_id"),
+    ],
+    "news_events": [
+        idx("id"),
+    ],
+    "news_timelines": [
+        idx("owner_id", ("created_at", -1), ("post_id", -1)),
+        idx("owner_id", "post_id", unique=True),
+        idx("post_id"),
+    ],
+    "news_timeline_state": [
+        idx("user_id", unique=True),
+    ],
+    "news_feed_pull_sources": [
+        idx("kind", "source_id", unique=True),
+    ],
+
+    # --- Finance ---
+    "wallets": [
+        idx("id"),
+        idx("user_id"),
+        idx("organization_id", "is_corporate"),
+        idx("is_treasury"),
+    ],
+    "transactions": [
+        idx("id"),
+        idx(("created_at", -1)),
+        idx("from_user_id", ("created_at", -1)),
+        idx("to_user_id", ("created_at", -1)),
+        idx("from_wallet_id", ("created_at", -1)),
+        idx("to_wallet_id", ("created_at", -1)),
+    ],
+
+    # --- Services, marketplace, events ---
+    "service_listings": [
+        idx("id", unique=True),
+        idx("owner_user_id"),
+        idx("organization_id"),
+        idx("status", "category_id", ("rating", -1)),
+        idx("status", "city"),
+    ],
+    "service_bookings": [
+        idx("id"),
+        idx("service_id", "booking_date"),
+        idx("service_id", "status"),
+    ],
+    "marketplace_products": [
+        idx("id", unique=True),
+        idx("seller_id"),
+        idx("status", ("created_at", -1)),
+    ],
+    "goodwill_events": [
+        idx("id", unique=True),
+        idx("organizer_profile_id"),
+        idx("start_date"),
+        idx("status", "visibility", "start_date"),
+    ],
+
+    # --- Media & admin ---
+    "media_files": [
+        idx("id"),
+        idx("uploaded_by"),
+        idx("stored_filename"),
+        idx("sha256", sparse=True),
+    ],
+    "media_blobs": [
+        idx("sha256", unique=True),
+        idx("backend"),
+    ],
+    "media_uploads": [
+        idx("upload_id", unique=True),
+        idx("expires_at", expire_after_seconds=0),
+    ],
+    "media_acl": [
+        idx("media_id", unique=True),
+        idx("contexts.kind", "contexts.id"),
+    ],
+
+    # --- Search ---
+    "search_index": [
+        idx("kind", "entity_id", unique=True),
+        idx("kind", "terms"),
+        idx("kind", "forms"),
+        idx("kind", "updated_at"),
+    ],
+    "user_typeahead": [
+        idx("user_id", unique=True),
+        idx("prefixes"),
+        idx("updated_at"),
+    ],
+    "chunked_upload_sessions": [
+        idx("upload_id"),
+        idx("created_at"),
+    ],
+    "backup_jobs": [
+        idx("backup_id", unique=True),
+        idx("admin", ("created_at", -1)),
+        idx("status", "updated_at"),
+        idx("expires_at"),
+    ],
+    "admin_backups": [
+        idx(("created_at", -1)),
+        idx("type", ("created_at", -1)),
+        idx("backup_id", sparse=True),
+        idx("base_id", sparse=True),
+    ],
+}
+
+
+# ============================================================
+# RUNNER
+# ============================================================
+
+async def _list_indexes(collection) -> List[Dict[str, Any]]:
+    return [index async for index in collection.list_indexes()]
+
+
+async def plan_indexes(db, manifest: Optional[Dict[str, List[IndexSpec]]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Diff the manifest against the database.
+
+    Returns:
+        {collection: {"missing": [IndexSpec], "changed": [(IndexSpec, index name)],
+                      "undeclared": [index names]}}
+        for every collection with differences. "changed" are indexes whose
+        keys match a declared spec but whose options (unique, sparse, TTL,
+        partial filter) differ.
+    """
+    manifest = manifest or INDEX_MANIFEST
+    plan: Dict[str, Dict[str, Any]] = {}
+    for collection_name, specs in manifest.items():
+        existing = await _list_indexes(db[collection_name])
+        existing_by_signature = {_server_signature(ix): ix for ix in existing}
+        declared = {spec.signature for spec in specs}
+
+        missing = []
+        changed = []
+        for spec in specs:
+            index = existing_by_signature.get(spec.signature)
+            if index is None:
+                missing.append(spec)
+            elif index["name"] != "_id_" and _server_options(index) != spec.options:
+                changed.append((spec, index["name"]))
+        undeclared = [
+            ix["name"] for signature, ix in existing_by_signature.items()
+            if ix["name"] != "_id_" and signature not in declared
+        ]
+        if missing or changed or undeclared:
+            plan[collection_name] = {"missing": missing, "changed": changed, "undeclared": undeclared}
+    return plan
+
+
+async def apply_indexes(
+    db,
+    manifest: Optional[Dict[str, List[IndexSpec]]] = None,
+    drop_undeclared: bool = False,
+) -> Dict[str, Any]:
+    """
+    Build missing indexes, rebuild indexes whose options changed (and
+    optionally drop undeclared ones).
+
+    MongoDB cannot alter unique / sparse / partial options in place, so a
+    changed index is dropped and recreated. A failing index (e.g. unique over
+    duplicated data) is reported and does not stop the remaining builds.
+    """
+    plan = await plan_indexes(db, manifest)
+    report: Dict[str, Any] = {"created": [], "rebuilt": [], "dropped": [], "errors": []}
+    for collection_name, diff in plan.items():
+        collection = db[collection_name]
+        for spec, name in diff["changed"]:
+            try:
+                await collection.drop_index(name)
+                await collection.create_indexes([spec.to_index_model()])
+                report["rebuilt"].append(f"{collection_name}.{spec.name}")
+            except Exception as e:
+                report["errors"].append({"index": f"{collection_name}.{spec.name}", "error": str(e)})
+        for spec in diff["missing"]:
+            try:
+                await collection.create_indexes([spec.to_index_model()])
+                report["created"].append(f"{collection_name}.{spec.name}")
+            except Exception as e:
+                report["errors"].append({"index": f"{collection_name}.{spec.name}", "error": str(e)})
+        if drop_undeclared:
+            for name in diff["undeclared"]:
+                try:
+                    await collection.drop_index(name)
+                    report["dropped"].append(f"{collection_name}.{name}")
+                except Exception as e:
+                    report["errors"].append({"index": f"{collection_name}.{name}", "error": str(e)})
+    return report
+
+
+async def unused_indexes(db, collections: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Indexes with zero accesses according to $indexStats.
+
+    Counters reset when mongod restarts, so only trust this on a server
+    that has been up through a representative period of traffic.
+    """
+    names = collections or await db.list_collection_names()
+    unused = []
+    for collection_name in sorted(names):
+        try:
+            stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+        except Exception as e:
+            logger.warning(f"$indexStats failed for {collection_name}: {e}")
+            continue
+        for stat in stats:
+            if stat["name"] != "_id_" and stat.get("accesses", {}).get("ops", 0) == 0:
+                unused.append({
+                    "collection": collection_name,
+                    "index": stat["name"],
+                    "since": stat.get("accesses", {}).get("since"),
+                })
+    return unused
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _print(data: Any) -> None:
+    print(json.dumps(data, indent=2, default=str, ensure_ascii=False))
+
+
+async def _main(argv: Optional[Sequence[str]] = None) -> int:
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(prog="python -m core.indexes", description=__doc__.split("\n")[1])
+    parser.add_argument("command", choices=["plan", "apply", "unused"])
+    parser.add_argument("--drop-undeclared", action="store_true", help="drop indexes not in the manifest")
+    args = parser.parse_args(argv)
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ.get("DB_NAME", "zion_city")]
+    try:
+        if args.command == "plan":
+            plan = await plan_indexes(db)
+            _print({
+                name: {
+                    "missing": [s.describe() for s in diff["missing"]],
+                    "changed": [{**s.describe(), "existing": existing} for s, existing in diff["changed"]],
+                    "undeclared": diff["undeclared"],
+                }
+                for name, diff in plan.items()
+            })
+            return 0
+        if args.command == "apply":
+            report = await apply_indexes(db, drop_undeclared=args.drop_undeclared)
+            _print(report)
+            return 1 if report["errors"] else 0
+        _print(await unused_indexes(db))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
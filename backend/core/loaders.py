@@ -0,0 +1,188 @@
+"""
+Request-Scoped Batch Loaders for ZION.CITY API
+==============================================
+DataLoader-style batching: every key requested from a loader during the
+same event loop tick is resolved with a single `{key: {"$in": [...]}}`
+query, and each key is fetched at most once per request.
+
+Use load_many() when the keys are known up front, or gather() over load()
+calls from concurrent coroutines - both end up in one query per collection.
+
+Usage:
+    from core.loaders import Loaders
+
+    loaders = Loaders(db, cache)               # one per request (see get_loaders)
+    authors = await loaders.users.load_many(p["user_id"] for p in posts)
+    for post in posts:
+        post["author"] = user_summary(authors.get(post["user_id"]))
+
+    sender = await loaders.users.load(message["user_id"])   # None if missing
+"""
+
+import asyncio
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+# Never hand credentials to response enrichment
+USER_PROJECTION = {"_id": 0, "password_hash": 0}
+
+USER_SUMMARY_FIELDS = ("id", "first_name", "last_name", "profile_picture")
+
+
+def user_summary(user: Optional[Dict[str, Any]], fields: Iterable[str] = USER_SUMMARY_FIELDS) -> Optional[Dict[str, Any]]:
+    """Author/sender block embedded in posts, comments and messages."""
+    if user is None:
+        return None
+    return {f: user.get(f) for f in fields}
+
+
+class BatchLoader:
+    """Batches and memoizes lookups of documents by one field."""
+
+    def __init__(
+        self,
+        collection,
+        key_field: str = "id",
+        projection: Optional[Dict[str, Any]] = None,
+        max_batch: int = 1000,
+        cache: Any = None,
+        cache_prefix: Optional[str] = None,
+        cache_ttl: Optional[float] = None,
+    ):
+        self.collection = collection
+        self.key_field = key_field
+        self.projection = projection or {"_id": 0}
+        self.max_batch = max_batch
+        # Optional read-through to the shared Cache, using the same
+        # "<prefix>:<key>" entries and tags as the single-document helpers
+        self.cache = cache
+        self.cache_prefix = cache_prefix
+        self.cache_ttl = cache_ttl
+        self._results: Dict[Hashable, "asyncio.Future[Optional[Dict[str, Any]]]"] = {}
+        self._queue: List[Hashable] = []
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.queries = 0
+
+    def load(self, key: Hashable) -> "asyncio.Future[Optional[Dict[str, Any]]]":
+        """Future resolving to the document for key, or None."""
+        future = self._results.get(key)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._results[key] = future
+        if key is None:
+            future.set_result(None)
+            return future
+        self._queue.append(key)
+        if len(self._queue) == 1:
+            # Dispatch after every coroutine scheduled this tick had a chance to add keys
+            loop.call_soon(self._schedule)
+        return future
+
+    def _schedule(self) -> None:
+        self._task = asyncio.ensure_future(self._dispatch())
+
+    async def load_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Dict[str, Any]]:
+        """Map of key -> document for the keys that exist."""
+        futures = {key: self.load(key) for key in dict.fromkeys(keys) if key is not None}
+        if not futures:
+            return {}
+        docs = await asyncio.gather(*futures.values())
+        return {key: doc for key, doc in zip(futures, docs) if doc is not None}
+
+    def prime(self, doc: Dict[str, Any]) -> None:
+        """Seed the loader with a document the handler already has."""
+        key = doc.get(self.key_field)
+        if key is None or key in self._results:
+            return
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(doc)
+        self._results[key] = future
+
+    async def _fetch(self, keys: List[Hashable]) -> Dict[Hashable, Dict[str, Any]]:
+        found: Dict[Hashable, Dict[str, Any]] = {}
+        if self.cache is not None:
+            for key in keys:
+                doc = await self.cache.get(f"{self.cache_prefix}:{key}")
+                if doc is not None:
+                    found[key] = doc
+            keys = [key for key in keys if key not in found]
+
+        for start in range(0, len(keys), self.max_batch):
+            chunk = keys[start:start + self.max_batch]
+            self.queries += 1
+            async for doc in self.collection.find({self.key_field: {"$in": chunk}}, self.projection):
+                key = doc.get(self.key_field)
+                if key in found:
+                    continue
+                found[key] = doc
+                if self.cache is not None:
+                    cache_key = f"{self.cache_prefix}:{key}"
+                    await self.cache.set(cache_key, doc, ttl=self.cache_ttl, tags=[cache_key])
+        return found
+
+    async def _dispatch(self) -> None:
+        keys, self._queue = self._queue, []
+        try:
+            found = await self._fetch(keys)
+        except Exception as e:
+            for key in keys:
+                future = self._results.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key in keys:
+            future = self._results[key]
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+class Loaders:
+    """
+    Loaders for one request. Attributes are created on first use so a
+    handler only pays for the collections it touches.
+    """
+
+    def __init__(self, db, cache: Any = None, cache_ttls: Optional[Dict[str, float]] = None):
+        self.db = db
+        self.cache = cache
+        self.cache_ttls = cache_ttls or {}
+        self._loaders: Dict[str, BatchLoader] = {}
+
+    def _get(self, name: str, collection: str, **options) -> BatchLoader:
+        loader = self._loaders.get(name)
+        if loader is None:
+            loader = self._loaders[name] = BatchLoader(self.db[collection], **options)
+        return loader
+
+    @property
+    def users(self) -> BatchLoader:
+        return self._get("users", "users", projection=USER_PROJECTION)
+
+    def _cached(self, name: str, collection: str, prefix: str) -> BatchLoader:
+        if self.cache is None:
+            return self._get(name, collection)
+        return self._get(name, collection, cache=self.cache, cache_prefix=prefix, cache_ttl=self.cache_ttls.get(prefix))
+
+    @property
+    def organizations(self) -> BatchLoader:
+        return self._cached("organizations", "work_organizations", "org")
+
+    @property
+    def channels(self) -> BatchLoader:
+        return self._cached("channels", "news_channels", "channel")
+
+    @property
+    def media(self) -> BatchLoader:
+        return self._get("media", "media_files")
+
+    @property
+    def messages(self) -> BatchLoader:
+        return self._get("messages", "chat_messages")
+
+    def collection(self, name: str, key_field: str = "id") -> BatchLoader:
+        """Loader for any other collection keyed by `key_field`."""
+        return self._get(f"{name}.{key_field}", name, key_field=key_field)
+
+    def stats(self) -> Dict[str, int]:
+        return {name: loader.queries for name, loader in self._loaders.items()}
@@ -0,0 +1,255 @@
+"""
+Event Loop Lag Monitor for ZION.CITY API
+========================================
+Finds code that blocks the asyncio loop, without attaching a profiler.
+
+- A heartbeat task sleeps `interval` seconds and measures how late it wakes
+  up; every delay goes into a histogram (milliseconds, cumulative buckets
+  like Prometheus "le") with count / sum / max
+- A watchdog thread checks the heartbeat. When it is overdue by more than
+  `threshold` seconds the loop is blocked, and the watchdog captures the
+  loop thread's stack while the blocking call is still running
+- Each capture records the stall length when seen, the full stack and the
+  innermost frame in our own code (server.py, core/, eric_agent.py) as the
+  culprit. Captures are also grouped by culprit so repeat offenders rank
+  first. One capture per stall; the heartbeat that ends the stall records
+  its final length on the capture
+- Everything is in-process and per worker; counters reset on restart.
+  Reports carry the worker's pid, so reads that land on different workers
+  can be told apart
+
+Configuration:
+    LOOP_MONITOR_INTERVAL_MS=100     # heartbeat period
+    LOOP_MONITOR_THRESHOLD_MS=100    # lag that counts as a stall and triggers a stack capture
+    LOOP_MONITOR_ENABLED=true
+
+Usage:
+    from core.loop_monitor import LoopLagMonitor
+
+    loop_monitor = LoopLagMonitor.from_env()
+    await loop_monitor.start()                              # in lifespan
+    report = loop_monitor.report(samples=20)                # histogram, stalls, culprits
+    await loop_monitor.stop()
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+MAX_FRAMES = 40
+
+# Frames under this directory are "our" code when picking the culprit
+_APP_ROOT = str(Path(__file__).resolve().parent.parent)
+
+
+def _is_app_frame(filename: str) -> bool:
+    return filename.startswith(_APP_ROOT) and "site-packages" not in filename
+
+
+def _location(frame: traceback.FrameSummary) -> str:
+    filename = os.path.relpath(frame.filename, _APP_ROOT) if _is_app_frame(frame.filename) else frame.filename
+    return f"{filename}:{frame.lineno} {frame.name}"
+
+
+def _format(frame: traceback.FrameSummary) -> str:
+    line = f"{frame.filename}:{frame.lineno} in {frame.name}"
+    return f"{line}: {frame.line}" if frame.line else line
+
+
+class LoopLagMonitor:
+    """Heartbeat lag histogram plus a watchdog thread that samples the loop's stack during stalls."""
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, max_samples: int = 50, enabled: bool = True):
+        self.interval = interval
+        self.threshold = threshold
+        self.enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._last_beat = 0.0
+        self._beat_number = 0
+        self._captured_beat = -1
+        self._lock = threading.Lock()
+        self._samples_lock = threading.Lock()
+
+        self.beats = 0
+        self.lag_sum_ms = 0.0
+        self.lag_max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.stalls = 0
+        self.captures = 0
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=max_samples)
+        self.culprits: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_env(cls) -> "LoopLagMonitor":
+        return cls(
+            interval=int(os.environ.get("LOOP_MONITOR_INTERVAL_MS", 100)) / 1000,
+            threshold=int(os.environ.get("LOOP_MONITOR_THRESHOLD_MS", 100)) / 1000,
+            enabled=os.environ.get("LOOP_MONITOR_ENABLED", "true").lower() in ("1", "true", "yes"),
+        )
+
+    # ---- lifecycle ----
+
+    async def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    # ---- heartbeat (event loop) ----
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                beat = self._beat_number
+                self._last_beat = now
+                self._beat_number += 1
+            lag_ms = max(0.0, now - expected) * 1000
+            self.observe(lag_ms)
+            if beat == self._captured_beat:
+                self._settle(lag_ms)
+
+    def observe(self, lag_ms: float) -> None:
+        """Add one scheduling delay to the histogram."""
+        self.beats += 1
+        self.lag_sum_ms += lag_ms
+        self.lag_max_ms = max(self.lag_max_ms, lag_ms)
+        for i, bound in enumerate(BUCKETS_MS):
+            if lag_ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        if lag_ms >= self.threshold * 1000:
+            self.stalls += 1
+
+    # ---- watchdog (own thread) ----
+
+    def _watch(self) -> None:
+        period = min(self.interval, self.threshold) / 2
+        while not self._stopping.wait(period):
+            with self._lock:
+                overdue = time.monotonic() - self._last_beat - self.interval
+                beat = self._beat_number
+            if overdue < self.threshold or beat == self._captured_beat:
+                continue
+            try:
+                self._capture(overdue, beat)
+            except Exception as e:
+                logger.debug(f"Loop lag stack capture failed: {e}")
+
+    def _capture(self, overdue: float, beat: int) -> None:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)[-MAX_FRAMES:]
+        # Innermost frame of our own code; library frames below it are what it called
+        culprit = next((f for f in reversed(stack) if _is_app_frame(f.filename)), stack[-1])
+        where = _location(culprit)
+        lag_ms = round(overdue * 1000, 1)
+
+        with self._samples_lock:
+            self._captured_beat = beat
+            self.captures += 1
+            self.samples.append({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "lag_ms": lag_ms,
+                "culprit": where,
+                "stack": [_format(f) for f in stack],
+            })
+            entry = self.culprits.setdefault(where, {"culprit": where, "count": 0, "max_lag_ms": 0.0})
+            entry["count"] += 1
+            entry["max_lag_ms"] = max(entry["max_lag_ms"], lag_ms)
+        logger.warning(f"Event loop blocked for at least {lag_ms}ms at {where}")
+
+    def _settle(self, lag_ms: float) -> None:
+        """Replace the lag seen at capture time with the stall's final length."""
+        lag_ms = round(lag_ms, 1)
+        with self._samples_lock:
+            if not self.samples:
+                return
+            sample = self.samples[-1]
+            sample["lag_ms"] = max(sample["lag_ms"], lag_ms)
+            entry = self.culprits.get(sample["culprit"])
+            if entry is not None:
+                entry["max_lag_ms"] = max(entry["max_lag_ms"], lag_ms)
+
+    # ---- reporting ----
+
+    def histogram(self) -> Dict[str, int]:
+        """Cumulative counts per upper bound (ms), plus "+Inf"."""
+        result: Dict[str, int] = {}
+        total = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            total += count
+            result[str(bound)] = total
+        result["+Inf"] = total + self.buckets[-1]
+        return result
+
+    def report(self, samples: int = 20) -> Dict[str, Any]:
+        """stats() plus the most recent stack captures and culprits ranked by stall count."""
+        with self._samples_lock:
+            culprits: List[Dict[str, Any]] = [dict(c) for c in self.culprits.values()]
+            recent = [dict(s) for s in self.samples][-samples:] if samples > 0 else []
+        culprits.sort(key=lambda c: (-c["count"], -c["max_lag_ms"]))
+        return {**self.stats(), "histogram_ms": self.histogram(), "culprits": culprits, "samples": recent[::-1]}
+
+    def reset(self) -> None:
+        self.beats = 0
+        self.lag_sum_ms = 0.0
+        self.lag_max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.stalls = 0
+        with self._samples_lock:
+            self.captures = 0
+            self.samples.clear()
+            self.culprits.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "enabled": self.enabled,
+            "running": self._task is not None,
+            "interval_ms": round(self.interval * 1000),
+            "threshold_ms": round(self.threshold * 1000),
+            "beats": self.beats,
+            "lag_ms_avg": round(self.lag_sum_ms / self.beats, 2) if self.beats else 0.0,
+            "lag_ms_max": round(self.lag_max_ms, 1),
+            "stalls": self.stalls,
+            "captures": self.captures,
+        }
@@ -0,0 +1,504 @@
+"""
+Media Storage for ZION.CITY API
+===============================
+One upload pipeline for every endpoint that stores files.
+
+- Uploads are streamed to a temp file in fixed-size chunks with async I/O
+  and hashed (SHA-256) on the way; a file is never held whole in memory
+- Size limits are enforced while streaming, before the file is complete
+- Content is stored once, under the key blobs/<aa>/<bb>/<sha256> of the
+  configured storage backend (local disk or S3, see core/storage.py);
+  identical uploads share the blob and media_blobs.ref_count counts the
+  media_files rows that point at it. release() drops a reference and
+  deletes the blob with the last one, along with its derived files
+- New media_blobs rows are keyed _id = sha256, so concurrent first uploads
+  of the same content cannot create two rows even where the unique sha256
+  index was never applied
+- release() marks the row `deleting` before removing the bytes and deletes
+  the row only if it is still unreferenced (one find_one_and_delete). A
+  save that references the blob meanwhile waits for the deletion to end
+  and then writes the bytes again, so it never keeps a reference to a
+  blob whose file was just removed
+- Direct uploads: presign_upload() gives the client a URL to PUT the bytes
+  straight into S3, to a staging key of that upload and pinned to their
+  SHA-256; complete_upload() reads the store's verified checksum back,
+  copies the object to its blob key and counts the reference. A blob is
+  never granted on a claimed hash alone: the caller must have uploaded the
+  bytes
+- serve() answers If-None-Match with 304, honours single byte ranges (206)
+  and, when MEDIA_ACCEL_REDIRECT is set, hands the byte transfer to nginx
+  via X-Accel-Redirect to an internal location aliased to the upload root.
+  serve_key() does the same for a storage key, or redirects to a presigned
+  URL when the bytes are in S3
+
+Collections:
+    media_blobs: {_id: sha256, sha256, key, backend, size, ref_count, created_at, deleting}
+    media_files: per-upload rows (owner, name, privacy) with sha256,
+                 storage_key and file_path (location) of the shared blob
+
+Usage:
+    from core.media import MediaStore, UploadTooLarge
+
+    media_store = MediaStore.from_env(db, UPLOAD_DIR)
+    blob = await media_store.save(upload_file, max_size=10 * 1024 * 1024)
+    blob.sha256, blob.key, blob.size
+    await media_store.release(blob.sha256)
+
+    return await media_store.serve_key(request, blob.key, "image/png", etag=f'"{blob.sha256}"',
+                                       cache_control=IMMUTABLE)
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+from urllib.parse import quote
+
+from .storage import LocalStorage, blob_key, storage_from_env, upload_key, variant_prefix
+
+logger = logging.getLogger(__name__)
+
+# A media id / stored filename always maps to the same bytes
+IMMUTABLE = "public, max-age=31536000, immutable"
+PRIVATE_IMMUTABLE = "private, max-age=31536000, immutable"
+# Redirects to presigned URLs must not outlive the signature
+REDIRECT_CACHE = "private, max-age=300"
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds its size limit while streaming."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File too large. Max size: {max_size // (1024 * 1024)}MB")
+        self.max_size = max_size
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match / If-Range comparison (weak comparison, as RFC 9110 requires for If-None-Match)."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single byte range; None to ignore the header (e.g. multipart ranges)."""
+    match = _RANGE.fullmatch(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    else:
+        suffix = int(match.group(2))
+        if suffix == 0:
+            raise RangeNotSatisfiable(header)
+        start, end = max(0, size - suffix), size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+@dataclass
+class StoredBlob:
+    """A stored upload: content hash, storage key, location (path or s3:// URL) and size."""
+    sha256: str
+    key: str
+    path: str
+    size: int
+    deduplicated: bool = False
+
+
+class MediaStore:
+    """Content-addressed file storage with streaming writes and reference counts."""
+
+    def __init__(
+        self,
+        db,
+        root: Union[str, Path],
+        chunk_size: int = 1024 * 1024,
+        accel_prefix: Optional[str] = None,
+        storage: Any = None,
+        release_wait: float = 10.0,
+    ):
+        self.db = db
+        self.release_wait = release_wait
+        self.root = Path(root)
+        self.storage = storage or LocalStorage(self.root)
+        self.tmp_dir = self.root / "tmp"
+        self.chunk_size = chunk_size
+        self.accel_prefix = accel_prefix.rstrip("/") + "/" if accel_prefix else None
+        self.uploads = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+        self.bytes_deduplicated = 0
+        self.released = 0
+        self.served = 0
+        self.not_modified = 0
+        self.partial = 0
+        self.accelerated = 0
+        self.redirected = 0
+
+    @classmethod
+    def from_env(cls, db, root: Union[str, Path]) -> "MediaStore":
+        return cls(
+            db,
+            root,
+            accel_prefix=os.environ.get("MEDIA_ACCEL_REDIRECT") or None,
+            storage=storage_from_env(root),
+        )
+
+    @staticmethod
+    def key_for(media_file: Dict[str, Any]) -> Optional[str]:
+        """Storage key of a media_files row; None for legacy rows that only have file_path."""
+        if media_file.get("storage_key"):
+            return media_file["storage_key"]
+        return blob_key(media_file["sha256"]) if media_file.get("sha256") else None
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        """A local path with the object's bytes (downloaded to a temp file for remote backends)."""
+        path = self.storage.local_path(key)
+        if path is not None:
+            yield path
+            return
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.tmp_dir / str(uuid.uuid4())
+        try:
+            await self.storage.download(key, tmp_path)
+            yield tmp_path
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    @asynccontextmanager
+    async def variant_workdir(self, sha256: str) -> AsyncIterator[Path]:
+        """Directory to render variants into; uploaded to the backend afterwards when it is remote."""
+        prefix = variant_prefix(sha256)
+        path = self.storage.local_path(prefix)
+        if path is not None:
+            yield path
+            return
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        workdir = Path(tempfile.mkdtemp(dir=self.tmp_dir))
+        try:
+            yield workdir
+            for item in workdir.iterdir():
+                await self.storage.put_file(item, f"{prefix}/{item.name}", mimetypes.guess_type(item.name)[0])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    async def _chunks(self, source: Any) -> AsyncIterator[bytes]:
+        if isinstance(source, (bytes, bytearray)):
+            for start in range(0, len(source), self.chunk_size):
+                yield bytes(source[start:start + self.chunk_size])
+            return
+        while True:
+            chunk = await source.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    async def _stream_to_temp(self, source: Any, max_size: Optional[int]):
+        import aiofiles
+
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.tmp_dir / str(uuid.uuid4())
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in self._chunks(source):
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise UploadTooLarge(max_size)
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    async def save(self, source: Any, max_size: Optional[int] = None, content_type: Optional[str] = None) -> StoredBlob:
+        """
+        Store an UploadFile (or anything with async read(n)) or bytes.
+
+        Adds one reference to the blob; every media_files row created from
+        the result should be paired with a release() when it is deleted.
+        """
+        tmp_path, sha256, size = await self._stream_to_temp(source, max_size)
+        try:
+            blob = await self.store_file(tmp_path, sha256, size, content_type, move=True)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self.uploads += 1
+        return blob
+
+    async def store_file(
+        self, path: Path, sha256: str, size: int, content_type: Optional[str] = None, move: bool = False
+    ) -> StoredBlob:
+        """
+        Add one reference to the blob of a local file whose hash is known,
+        writing its bytes unless they are stored already. With move, the file
+        is moved into place, or removed when the blob exists.
+        """
+        key = blob_key(sha256)
+        deduplicated = await self._reference(sha256, size)
+        if deduplicated:
+            self.deduplicated += 1
+            self.bytes_deduplicated += size
+            if move:
+                Path(path).unlink(missing_ok=True)
+        else:
+            await self.storage.put_file(path, key, content_type, move=move)
+            self.bytes_written += size
+        return StoredBlob(sha256, key, self.storage.location(key), size, deduplicated)
+
+    async def _add_reference(self, sha256: str, size: int) -> Optional[Dict[str, Any]]:
+        from pymongo.errors import DuplicateKeyError
+
+        update = {
+            "$inc": {"ref_count": 1},
+            "$setOnInsert": {
+                # The _id index is always there: two concurrent inserts of one hash collide on it
+                "_id": sha256,
+                "sha256": sha256,
+                "key": blob_key(sha256),
+                "backend": self.storage.name,
+                "size": size,
+                "created_at": datetime.now(timezone.utc),
+            },
+        }
+        try:
+            return await self.db.media_blobs.find_one_and_update({"sha256": sha256}, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost the insert race; the row exists now
+            return await self.db.media_blobs.find_one_and_update({"sha256": sha256}, update, upsert=True)
+
+    async def _reference(self, sha256: str, size: int) -> bool:
+        """
+        Count a reference and report whether the blob's bytes are already
+        stored (deduplicated) or must be written by the caller.
+        """
+        previous = await self._add_reference(sha256, size)
+        if previous is None:
+            return False
+        if previous.get("deleting"):
+            # release() is removing the bytes; write them again once it is done
+            await self._wait_for_release(sha256)
+            return False
+        # Checked after counting the reference, so a release() of the last one cannot delete it from here on
+        return await self.storage.exists(blob_key(sha256))
+
+    async def _wait_for_release(self, sha256: str) -> None:
+        deadline = asyncio.get_running_loop().time() + self.release_wait
+        while await self.db.media_blobs.find_one({"sha256": sha256, "deleting": {"$exists": True}}, {"_id": 1}):
+            if asyncio.get_running_loop().time() > deadline:
+                # The releasing worker died mid-delete; take the row over
+                logger.warning(f"Media blob {sha256} stuck in deletion; clearing the mark")
+                await self.db.media_blobs.update_one({"sha256": sha256}, {"$unset": {"deleting": "", "image": ""}})
+                return
+            await asyncio.sleep(0.05)
+
+    async def presign_upload(self, upload_id: str, sha256: str, size: int, content_type: str) -> Optional[Dict[str, Any]]:
+        """PUT instructions for a direct upload, or None when the backend cannot take one."""
+        return await self.storage.presigned_put(
+            upload_key(upload_id), content_type=content_type, size=size, sha256=sha256
+        )
+
+    async def complete_upload(self, upload_id: str, sha256: str, size: int) -> Optional[StoredBlob]:
+        """
+        Count a reference to a finished direct upload. The staging object's
+        size and store-verified SHA-256 must match what the client announced;
+        None (and the staging object is dropped) otherwise.
+        """
+        staging = upload_key(upload_id)
+        verified = await self.storage.checksum(staging)
+        if verified != (size, sha256):
+            if verified is not None:
+                await self.storage.delete(staging)
+            return None
+        key = blob_key(sha256)
+        deduplicated = await self._reference(sha256, size)
+        if not deduplicated:
+            await self.storage.copy(staging, key)
+        await self.storage.delete(staging)
+        if deduplicated:
+            self.deduplicated += 1
+            self.bytes_deduplicated += size
+        self.uploads += 1
+        return StoredBlob(sha256, key, self.storage.location(key), size, deduplicated)
+
+    async def release(self, sha256: Optional[str]) -> bool:
+        """Drop one reference; returns True if the blob itself was deleted."""
+        if not sha256:
+            return False
+        from pymongo import ReturnDocument
+
+        blob = await self.db.media_blobs.find_one_and_update(
+            {"sha256": sha256},
+            {"$inc": {"ref_count": -1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if blob is None or blob["ref_count"] > 0:
+            return False
+        # Claim the deletion; a save() that references the blob from now on waits for it
+        claimed = await self.db.media_blobs.find_one_and_update(
+            {"sha256": sha256, "ref_count": {"$lte": 0}, "deleting": {"$exists": False}},
+            {"$set": {"deleting": datetime.now(timezone.utc)}},
+        )
+        if claimed is None:
+            return False
+        try:
+            await self.storage.delete(blob_key(sha256))
+            await self.storage.delete_prefix(variant_prefix(sha256))
+        except Exception as e:
+            logger.warning(f"Failed to delete media blob {sha256}: {e}")
+        deleted = await self.db.media_blobs.find_one_and_delete({"sha256": sha256, "ref_count": {"$lte": 0}})
+        if deleted is None:
+            # Referenced again meanwhile: its saver rewrites the bytes; derived files must be rebuilt too
+            await self.db.media_blobs.update_one({"sha256": sha256}, {"$unset": {"deleting": "", "image": ""}})
+            return False
+        self.released += 1
+        return True
+
+    # ---- serving ----
+
+    def _accel_path(self, path: Path) -> Optional[str]:
+        if self.accel_prefix is None:
+            return None
+        try:
+            relative = path.resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return None
+        return self.accel_prefix + quote(relative.as_posix())
+
+    async def _read_range(self, path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+        import aiofiles
+
+        remaining = end - start + 1
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(start)
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def serve(
+        self,
+        request: Any,
+        path: Union[str, Path],
+        media_type: str,
+        etag: str,
+        cache_control: str,
+        filename: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Response for an authorized file: 304 on a matching If-None-Match,
+        X-Accel-Redirect when nginx serves the bytes, else 200/206 from here.
+        """
+        from starlette.responses import FileResponse, Response, StreamingResponse
+
+        path = Path(path)
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes", **(headers or {})}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        self.served += 1
+
+        accel = self._accel_path(path)
+        if accel is not None:
+            # nginx answers Range itself; the internal location re-emits our ETag
+            self.accelerated += 1
+            if filename:
+                headers["Content-Disposition"] = content_disposition(filename)
+            return Response(media_type=media_type, headers={**headers, "X-Accel-Redirect": accel})
+
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and (not if_range or if_range.strip() == etag):
+            size = path.stat().st_size
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+            if byte_range is not None:
+                start, end = byte_range
+                self.partial += 1
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+                headers["Content-Length"] = str(end - start + 1)
+                if filename:
+                    headers["Content-Disposition"] = content_disposition(filename)
+                return StreamingResponse(
+                    self._read_range(path, start, end), status_code=206, media_type=media_type, headers=headers
+                )
+
+        return FileResponse(path=path, media_type=media_type, filename=filename, headers=headers)
+
+    async def serve_key(
+        self,
+        request: Any,
+        key: str,
+        media_type: str,
+        etag: str,
+        cache_control: str,
+        filename: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """serve() for a storage key; remote objects get a 307 to a presigned URL. None if missing."""
+        path = self.storage.local_path(key)
+        if path is not None:
+            if not path.exists():
+                return None
+            return self.serve(request, path, media_type, etag, cache_control, filename, headers)
+
+        from starlette.responses import RedirectResponse, Response
+
+        headers = {"ETag": etag, "Cache-Control": REDIRECT_CACHE, **(headers or {})}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        url = await self.storage.presigned_get(key, filename=filename, content_type=media_type)
+        self.redirected += 1
+        return RedirectResponse(url, status_code=307, headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+            "bytes_written": self.bytes_written,
+            "bytes_deduplicated": self.bytes_deduplicated,
+            "released": self.released,
+            "served": self.served,
+            "not_modified": self.not_modified,
+            "partial": self.partial,
+            "accelerated": self.accelerated,
+            "redirected": self.redirected,
+            "storage": self.storage.stats(),
+        }
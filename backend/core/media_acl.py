@@ -0,0 +1,222 @@
+"""
+Media Access Index for ZION.CITY API
+====================================
+Which contexts reference each media file, and whether any of them makes it public.
+
+- Maintained by the endpoints that attach media: organization logo / banner,
+  posts, news posts, chat attachments, profile pictures. Each reference is a context
+  {kind, id, public}; a file is public while any public context holds it
+- Authorization reads one document per media id through the shared cache
+  (in-process LRU tier, Redis tier and cross-worker invalidation), instead of
+  searching the collections that might reference the file
+- Deleting a context (a post, a user's posts) calls revoke_contexts(); a
+  visibility change re-grants the context with its new public flag
+- backfill() builds entries for references created before the index existed;
+  it runs once per database through core/one_time.py. rebuild() drops every
+  entry and backfills again (after a database restore)
+
+Collections:
+    media_acl: {media_id, public, contexts: [{kind, id, public}], updated_at}
+
+Usage:
+    from core.media_acl import MediaACL, media_ids_in
+
+    media_acl = MediaACL(db, cache)
+    await media_acl.grant(media_ids_in(org["logo_url"]), "org_logo", org_id, public=True)
+    await media_acl.revoke([media_id], "post", post_id)
+    await media_acl.revoke_contexts("post", deleted_post_ids)
+    entry = await media_acl.get(media_id)        # {"public": bool, "contexts": [...]}
+"""
+
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ORG_LOGO = "org_logo"
+ORG_BANNER = "org_banner"
+POST = "post"
+NEWS_POST = "news_post"
+CHAT = "chat"
+PROFILE = "profile"
+
+_MEDIA_URL = re.compile(r"/api/media/([0-9a-fA-F-]{36})")
+
+
+def media_ids_in(*values: Optional[str]) -> List[str]:
+    """Media ids referenced by /api/media/{id} URLs (relative or absolute)."""
+    ids: List[str] = []
+    for value in values:
+        if isinstance(value, str):
+            ids.extend(_MEDIA_URL.findall(value))
+    return list(dict.fromkeys(ids))
+
+
+class MediaACL:
+    """Per-media context list with a derived public flag, read through the cache."""
+
+    def __init__(self, db, cache: Any, ttl: float = 600):
+        self.db = db
+        self.cache = cache
+        self.ttl = ttl
+        self.lookups = 0
+        self.grants = 0
+        self.revokes = 0
+
+    @staticmethod
+    def _key(media_id: str) -> str:
+        return f"media-acl:{media_id}"
+
+    async def _load(self, media_id: str) -> Dict[str, Any]:
+        entry = await self.db.media_acl.find_one({"media_id": media_id}, {"_id": 0, "public": 1, "contexts": 1})
+        # Cache misses too: most private files never get an entry
+        return entry or {"public": False, "contexts": []}
+
+    async def get(self, media_id: str) -> Dict[str, Any]:
+        self.lookups += 1
+        key = self._key(media_id)
+        return await self.cache.get_or_load(key, lambda: self._load(media_id), ttl=self.ttl, tags=[key])
+
+    async def is_public(self, media_id: str) -> bool:
+        return bool((await self.get(media_id)).get("public"))
+
+    async def grant(self, media_ids: Iterable[str], kind: str, context_id: str, public: bool = False) -> None:
+        """Record that context (kind, context_id) references media_ids."""
+        from pymongo import UpdateOne
+
+        media_ids = list(dict.fromkeys(m for m in media_ids if m))
+        if not media_ids:
+            return
+        now = datetime.now(timezone.utc)
+        context = {"kind": kind, "id": context_id, "public": public}
+        await self.db.media_acl.bulk_write([
+            UpdateOne({"media_id": media_id}, {"$pull": {"contexts": {"kind": kind, "id": context_id}}})
+            for media_id in media_ids
+        ] + [
+            UpdateOne(
+                {"media_id": media_id},
+                {
+                    "$push": {"contexts": context},
+                    "$max": {"public": public},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"media_id": media_id},
+                },
+                upsert=True,
+            )
+            for media_id in media_ids
+        ], ordered=True)
+        if not public:
+            # The same context may have been public before (e.g. a post made private)
+            await self._recompute(media_ids)
+        self.grants += len(media_ids)
+        await self._invalidate(media_ids)
+
+    async def revoke(self, media_ids: Iterable[str], kind: str, context_id: str) -> None:
+        """Drop context (kind, context_id) from media_ids and recompute their public flag."""
+        from pymongo import UpdateOne
+
+        media_ids = list(dict.fromkeys(m for m in media_ids if m))
+        if not media_ids:
+            return
+        await self.db.media_acl.bulk_write([
+            UpdateOne({"media_id": media_id}, {"$pull": {"contexts": {"kind": kind, "id": context_id}}})
+            for media_id in media_ids
+        ], ordered=False)
+        await self._recompute(media_ids)
+        self.revokes += len(media_ids)
+        await self._invalidate(media_ids)
+
+    async def revoke_contexts(self, kind: str, context_ids: Iterable[str]) -> int:
+        """Drop contexts that no longer exist (e.g. deleted posts) from every media file they referenced."""
+        context_ids = list(dict.fromkeys(c for c in context_ids if c))
+        if not context_ids:
+            return 0
+        media_ids = await self.db.media_acl.distinct(
+            "media_id", {"contexts": {"$elemMatch": {"kind": kind, "id": {"$in": context_ids}}}}
+        )
+        if not media_ids:
+            return 0
+        await self.db.media_acl.update_many(
+            {"media_id": {"$in": media_ids}},
+            {"$pull": {"contexts": {"kind": kind, "id": {"$in": context_ids}}}},
+        )
+        await self._recompute(media_ids)
+        self.revokes += len(media_ids)
+        await self._invalidate(media_ids)
+        return len(media_ids)
+
+    async def _recompute(self, media_ids: List[str]) -> None:
+        """Clear public where no public context is left."""
+        await self.db.media_acl.update_many(
+            {"media_id": {"$in": media_ids}, "public": True, "contexts.public": {"$ne": True}},
+            {"$set": {"public": False, "updated_at": datetime.now(timezone.utc)}},
+        )
+
+    async def replace(
+        self, old_ids: Iterable[str], new_ids: Iterable[str], kind: str, context_id: str, public: bool = False
+    ) -> None:
+        """Move a context from old_ids to new_ids (e.g. an organization changed its logo)."""
+        new_ids = list(new_ids)
+        await self.revoke([m for m in old_ids if m not in new_ids], kind, context_id)
+        await self.grant(new_ids, kind, context_id, public=public)
+
+    async def remove(self, media_id: str) -> None:
+        """Forget a deleted media file."""
+        await self.db.media_acl.delete_one({"media_id": media_id})
+        await self._invalidate([media_id])
+
+    async def _invalidate(self, media_ids: List[str]) -> None:
+        if media_ids:
+            await self.cache.invalidate_tag(*(self._key(m) for m in media_ids))
+
+    async def rebuild(self) -> int:
+        """Index every reference from scratch; files are private until their entry is back. Cached entries are the caller's to clear."""
+        await self.db.media_acl.delete_many({})
+        return await self.backfill()
+
+    async def backfill(self) -> int:
+        """Index references that predate media_acl: organization images, profile pictures, post media, chat attachments."""
+        count = 0
+        async for org in self.db.work_organizations.find(
+            {"$or": [{"logo_url": {"$regex": "/api/media/"}}, {"banner_url": {"$regex": "/api/media/"}}]},
+            {"_id": 0, "id": 1, "logo_url": 1, "banner_url": 1},
+        ):
+            for kind, field in ((ORG_LOGO, "logo_url"), (ORG_BANNER, "banner_url")):
+                ids = media_ids_in(org.get(field))
+                await self.grant(ids, kind, org["id"], public=True)
+                count += len(ids)
+        async for user in self.db.users.find(
+            {"profile_picture_media_id": {"$type": "string"}}, {"_id": 0, "id": 1, "profile_picture_media_id": 1}
+        ):
+            await self.grant([user["profile_picture_media_id"]], PROFILE, user["id"], public=True)
+            count += 1
+        async for post in self.db.posts.find(
+            {"media_files.0": {"$exists": True}}, {"_id": 0, "id": 1, "media_files": 1, "visibility": 1}
+        ):
+            ids = [m for m in post["media_files"] if isinstance(m, str)]
+            await self.grant(ids, POST, post["id"], public=post.get("visibility") == "PUBLIC")
+            count += len(ids)
+        async for post in self.db.news_posts.find(
+            {"media_files.0": {"$exists": True}, "is_active": {"$ne": False}},
+            {"_id": 0, "id": 1, "user_id": 1, "media_files": 1, "visibility": 1},
+        ):
+            ids = await self.db.media_files.distinct(
+                "id", {"id": {"$in": [m for m in post["media_files"] if isinstance(m, str)]}, "uploaded_by": post["user_id"]}
+            )
+            await self.grant(ids, NEWS_POST, post["id"], public=post.get("visibility") == "PUBLIC")
+            count += len(ids)
+        async for message in self.db.chat_messages.find(
+            {"$or": [{"attachment.media_id": {"$exists": True}}, {"voice.media_id": {"$exists": True}}]},
+            {"_id": 0, "direct_chat_id": 1, "group_id": 1, "attachment.media_id": 1, "voice.media_id": 1},
+        ):
+            chat_id = message.get("direct_chat_id") or message.get("group_id")
+            ids = [(message.get(k) or {}).get("media_id") for k in ("attachment", "voice")]
+            await self.grant([m for m in ids if m], CHAT, chat_id)
+            count += len([m for m in ids if m])
+        logger.info(f"Media ACL backfill indexed {count} references")
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        return {"lookups": self.lookups, "grants": self.grants, "revokes": self.revokes}
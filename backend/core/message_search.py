@@ -0,0 +1,332 @@
+"""
+Chat Message Search for ZION.CITY API
+=====================================
+Per-chat inverted index behind the direct chat and group chat message search.
+
+- Each message has one entry {chat_id, message_id, created_at, terms}: the
+  Snowball stems of its text and attachment file name (same tokenizer as
+  core/search.py), written when the message is sent or edited and removed
+  when it is deleted
+- A query matches entries of one chat holding every query stem; the last
+  word also matches as a prefix. The (chat_id, terms, created_at) index
+  answers it without reading the chat's messages, and user input is never
+  interpreted as a regular expression
+- Results are newest first with cursor pagination over (created_at,
+  message_id); the total is a capped count, reported as an estimate when
+  the cap is reached
+- Every hit carries a snippet of the message text with highlight offsets
+  for the matched words, so clients do not re-implement the stemming
+- A chat's older messages are indexed lazily the first time it is searched
+
+Collections:
+    chat_message_terms  {chat_id, message_id, user_id, created_at, terms}
+    chat_search_state   {chat_id, built_at}
+
+Usage:
+    from core.message_search import MessageSearchIndex
+
+    message_search = MessageSearchIndex(db)
+    await message_search.on_message(message_dict)                # after insert / edit
+    await message_search.on_delete(message_dict)
+    page = await message_search.search("direct", chat_id, "привет", limit=20, cursor=cursor)
+
+Rebuild (from backend/):
+    python -m core.message_search rebuild [--chat CHAT_ID]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .conversations import DIRECT, GROUP, chat_key
+from .search import stem, word_spans, words
+from .timelines import decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+SNIPPET_CHARS = 160
+
+_BATCH = 500
+
+
+# ============================================================
+# TEXT
+# ============================================================
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Searchable text of a chat_messages document: content plus the attachment file name."""
+    parts = [message.get("content") or ""]
+    attachment = message.get("attachment")
+    if isinstance(attachment, dict) and isinstance(attachment.get("filename"), str):
+        parts.append(attachment["filename"])
+    return "\n".join(p for p in parts if isinstance(p, str))
+
+
+def message_terms(message: Dict[str, Any]) -> List[str]:
+    return list(dict.fromkeys(stem(w) for w in words(message_text(message))))
+
+
+def split_query(text: str) -> Tuple[List[str], Optional[str]]:
+    """(whole terms, prefix term) of a search string; the last word is a prefix unless it is one letter."""
+    terms = list(dict.fromkeys(stem(w) for w in words(text)))
+    if terms and len(terms[-1]) > 1:
+        return terms[:-1], terms[-1]
+    return terms, None
+
+
+def snippet(text: str, whole: Sequence[str], prefix: Optional[str] = None, width: int = SNIPPET_CHARS) -> Dict[str, Any]:
+    """
+    Excerpt of text around the first matched word, with [start, end]
+    offsets of every matched word inside the excerpt.
+    """
+    whole = set(whole)
+    spans = []
+    for start, end, word in word_spans(text):
+        term = stem(word)
+        if term in whole or (prefix and (term.startswith(prefix) or word.startswith(prefix))):
+            spans.append((start, end))
+
+    begin, finish = 0, len(text)
+    if len(text) > width:
+        anchor = spans[0][0] if spans else 0
+        begin = max(0, anchor - width // 4)
+        # Start the excerpt at a word boundary
+        space = text.rfind(" ", 0, begin)
+        if begin and space != -1 and begin - space < 20:
+            begin = space + 1
+        finish = min(len(text), begin + width)
+        space = text.rfind(" ", begin, finish)
+        if finish < len(text) and space > begin:
+            finish = space
+
+    lead = "…" if begin > 0 else ""
+    tail = "…" if finish < len(text) else ""
+    shift = len(lead) - begin
+    highlights = [[s + shift, e + shift] for s, e in spans if s >= begin and e <= finish]
+    return {"text": f"{lead}{text[begin:finish]}{tail}", "highlights": highlights}
+
+
+# ============================================================
+# INDEX
+# ============================================================
+
+@dataclass
+class MessageSearchPage:
+    """One page of message search hits, newest first."""
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+    total: int = 0
+    total_is_estimate: bool = False
+
+
+class MessageSearchIndex:
+    """
+    Stemmed term entries per chat message, kept current by the send / edit /
+    delete endpoints.
+
+    chat_messages stays the source of truth: hooks log and count failures
+    instead of failing the request, and hits are re-read from chat_messages
+    so a missed delete never surfaces a deleted message.
+    """
+
+    def __init__(self, db, count_limit: int = 1000):
+        self.db = db
+        self.count_limit = count_limit
+        self.queries = 0
+        self.indexed = 0
+        self.builds = 0
+        self.errors = 0
+
+    def _failed(self, action: str, message_id: Any, e: Exception) -> None:
+        self.errors += 1
+        logger.error(f"Message search {action} failed for message {message_id}: {e}")
+
+    @staticmethod
+    def _entry(message: Dict[str, Any], terms: List[str]) -> Dict[str, Any]:
+        return {
+            "chat_id": chat_key(message)[1],
+            "message_id": message["id"],
+            "user_id": message.get("user_id"),
+            "created_at": message["created_at"],
+            "terms": terms,
+        }
+
+    # ---- write hooks ----
+
+    async def on_message(self, message: Dict[str, Any]) -> None:
+        """Index a sent or edited message. Never raises."""
+        try:
+            terms = message_terms(message)
+            if not terms or message.get("is_deleted"):
+                await self.db.chat_message_terms.delete_one({"message_id": message["id"]})
+                return
+            await self.db.chat_message_terms.replace_one(
+                {"message_id": message["id"]}, self._entry(message, terms), upsert=True
+            )
+            self.indexed += 1
+        except Exception as e:
+            self._failed("index", message.get("id"), e)
+
+    on_edit = on_message
+
+    async def on_delete(self, message: Dict[str, Any]) -> None:
+        try:
+            await self.db.chat_message_terms.delete_one({"message_id": message["id"]})
+        except Exception as e:
+            self._failed("delete", message.get("id"), e)
+
+    # ---- lazy build ----
+
+    async def _ensure_built(self, chat_type: str, chat_id: str) -> None:
+        """Index a chat's existing messages the first time it is searched."""
+        if await self.db.chat_search_state.find_one({"chat_id": chat_id}, {"_id": 1}):
+            return
+        await self.build(chat_type, chat_id)
+
+    async def build(self, chat_type: str, chat_id: str) -> int:
+        """(Re)index every message of one chat."""
+        from pymongo import ReplaceOne
+
+        field_name = "direct_chat_id" if chat_type == DIRECT else "group_id"
+        batch: List[Any] = []
+        count = 0
+        async for message in self.db.chat_messages.find(
+            {field_name: chat_id, "is_deleted": False},
+            {"_id": 0, "id": 1, "direct_chat_id": 1, "group_id": 1, "user_id": 1,
+             "created_at": 1, "content": 1, "attachment.filename": 1},
+        ):
+            terms = message_terms(message)
+            if not terms:
+                continue
+            batch.append(ReplaceOne({"message_id": message["id"]}, self._entry(message, terms), upsert=True))
+            count += 1
+            if len(batch) >= _BATCH:
+                await self.db.chat_message_terms.bulk_write(batch, ordered=False)
+                batch = []
+        if batch:
+            await self.db.chat_message_terms.bulk_write(batch, ordered=False)
+        await self.db.chat_search_state.update_one(
+            {"chat_id": chat_id},
+            {"$set": {"built_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        self.builds += 1
+        return count
+
+    async def rebuild(self) -> int:
+        """Drop every entry and build-state row; chats are re-indexed on their next search."""
+        await self.db.chat_message_terms.delete_many({})
+        result = await self.db.chat_search_state.delete_many({})
+        return result.deleted_count
+
+    # ---- queries ----
+
+    async def search(
+        self,
+        chat_type: str,
+        chat_id: str,
+        text: str,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+    ) -> MessageSearchPage:
+        """
+        Messages of one chat matching text, newest first. Pass the returned
+        next_cursor as cursor for the next page; offset is for older clients.
+        Raises InvalidCursor for a malformed cursor.
+        """
+        self.queries += 1
+        after = decode_cursor(cursor) if cursor else None
+        whole, prefix = split_query(text)
+        if not whole and not prefix:
+            return MessageSearchPage()
+        await self._ensure_built(chat_type, chat_id)
+
+        match: Dict[str, Any] = {"chat_id": chat_id}
+        if whole:
+            match["terms"] = {"$all": whole}
+        clauses: List[Dict[str, Any]] = []
+        if prefix:
+            clauses.append({"terms": {"$regex": f"^{re.escape(prefix)}"}})
+        if clauses:
+            match["$and"] = clauses
+
+        page = MessageSearchPage()
+        page.total = await self.db.chat_message_terms.count_documents(match, limit=self.count_limit)
+        page.total_is_estimate = page.total >= self.count_limit
+
+        if after is not None:
+            match["$and"] = clauses + [{"$or": [
+                {"created_at": {"$lt": after[0]}},
+                {"created_at": after[0], "message_id": {"$lt": after[1]}},
+            ]}]
+        entries = await self.db.chat_message_terms.find(
+            match, {"_id": 0, "message_id": 1, "created_at": 1}
+        ).sort([("created_at", -1), ("message_id", -1)]).skip(0 if after else offset).limit(limit + 1).to_list(limit + 1)
+        page.has_more = len(entries) > limit
+        entries = entries[:limit]
+        if not entries:
+            return page
+
+        ids = [e["message_id"] for e in entries]
+        found = {
+            m["id"]: m for m in await self.db.chat_messages.find(
+                {"id": {"$in": ids}, "is_deleted": False}, {"_id": 0}
+            ).to_list(len(ids))
+        }
+        stale = [i for i in ids if i not in found]
+        if stale:
+            # A delete hook was missed; repair the index on the way
+            await self.db.chat_message_terms.delete_many({"message_id": {"$in": stale}})
+        for message_id in ids:
+            message = found.get(message_id)
+            if message is not None:
+                message["snippet"] = snippet(message_text(message), whole, prefix)
+                page.messages.append(message)
+
+        if page.has_more:
+            last = entries[-1]
+            page.next_cursor = encode_cursor(last["created_at"], last["message_id"])
+        return page
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queries": self.queries, "indexed": self.indexed, "builds": self.builds, "errors": self.errors}
+
+
+async def _main(argv: Optional[Sequence[str]] = None) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(prog="python -m core.message_search", description=__doc__.split("\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="re-index chats (all chats lazily, or one chat now)")
+    rebuild.add_argument("--chat", help="index this direct chat / group id now")
+    args = parser.parse_args(argv)
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ.get("DB_NAME", "zion_city")]
+    index = MessageSearchIndex(db)
+    try:
+        if args.chat:
+            is_direct = await db.direct_chats.find_one({"id": args.chat}, {"_id": 1})
+            result: Any = {"chat_id": args.chat, "indexed": await index.build(DIRECT if is_direct else GROUP, args.chat)}
+        else:
+            result = {"chats_reset": await index.rebuild()}
+        print(json.dumps(result, indent=2))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
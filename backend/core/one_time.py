@@ -0,0 +1,153 @@
+"""
+One-Time Jobs for ZION.CITY API
+===============================
+Backfills that must run once per database, not once per gunicorn worker.
+
+- Every worker calls run_once() at startup; a lease document in
+  maintenance_runs lets exactly one of them run the job while the others
+  return at once
+- The lease is renewed while the job runs. A worker that dies mid-run stops
+  renewing it, so the next worker to start takes the job over
+- The job is marked done only after it returns. A job that raises or is
+  interrupted releases its lease and runs again on the next start, so jobs
+  must be idempotent (upserts, not inserts)
+- reset(name) makes a job run again, e.g. after changing what it indexes
+
+Collections:
+    maintenance_runs: {_id: name, state: running|done|failed, owner,
+                       expires_at, started_at, completed_at, result, error}
+
+Usage:
+    from core.one_time import run_once
+
+    asyncio.create_task(run_once(db, "media_acl_backfill", media_acl.backfill))
+
+Reset (from backend/):
+    python -m core.one_time reset media_acl_backfill
+    python -m core.one_time list
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def _acquire(db, name: str, lease: float) -> bool:
+    from pymongo.errors import DuplicateKeyError
+
+    now = datetime.now(timezone.utc)
+    try:
+        # Matches a failed run or an abandoned lease; otherwise the upsert collides on _id
+        await db.maintenance_runs.find_one_and_update(
+            {"_id": name, "state": {"$ne": DONE}, "expires_at": {"$lt": now}},
+            {"$set": {
+                "state": RUNNING,
+                "owner": _OWNER,
+                "started_at": now,
+                "expires_at": now + timedelta(seconds=lease),
+            }},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def _renew(db, name: str, lease: float) -> None:
+    while True:
+        await asyncio.sleep(lease / 3)
+        await db.maintenance_runs.update_one(
+            {"_id": name, "owner": _OWNER},
+            {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=lease)}},
+        )
+
+
+async def run_once(db, name: str, job: Callable[[], Awaitable[Any]], lease: float = 120) -> Optional[Any]:
+    """
+    Run job unless it is done or another worker holds its lease.
+
+    Returns the job's result, or None when it was skipped. Errors are logged,
+    never raised: this runs as a fire-and-forget startup task.
+    """
+    try:
+        if not await _acquire(db, name, lease):
+            return None
+    except Exception as e:
+        logger.warning(f"Could not claim one-time job {name}: {e}")
+        return None
+
+    renewer = asyncio.create_task(_renew(db, name, lease))
+    state, fields = FAILED, {}
+    try:
+        logger.info(f"Running one-time job {name}")
+        result = await job()
+        state, fields = DONE, {"completed_at": datetime.now(timezone.utc), "result": result}
+        return result
+    except asyncio.CancelledError:
+        fields = {"error": "interrupted"}
+        raise
+    except Exception as e:
+        fields = {"error": str(e)}
+        logger.warning(f"One-time job {name} failed: {e}")
+        return None
+    finally:
+        renewer.cancel()
+        try:
+            # A released lease (expires_at = now) lets the next start retry a failed run
+            await db.maintenance_runs.update_one(
+                {"_id": name, "owner": _OWNER},
+                {"$set": {"state": state, "expires_at": datetime.now(timezone.utc), **fields}},
+            )
+        except Exception as e:
+            logger.warning(f"Could not record one-time job {name}: {e}")
+
+
+async def reset(db, name: str) -> bool:
+    """Forget a job's completion so the next start runs it again."""
+    result = await db.maintenance_runs.delete_one({"_id": name})
+    return result.deleted_count > 0
+
+
+async def _main(argv: Optional[Sequence[str]] = None) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(prog="python -m core.one_time", description=__doc__.split("\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="show every job's state")
+    reset_parser = sub.add_parser("reset", help="run a job again on the next start")
+    reset_parser.add_argument("name")
+    args = parser.parse_args(argv)
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ.get("DB_NAME", "zion_city")]
+    try:
+        if args.command == "reset":
+            result: Any = {"name": args.name, "reset": await reset(db, args.name)}
+        else:
+            result = await db.maintenance_runs.find({}).to_list(None)
+        print(json.dumps(result, indent=2, default=str))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
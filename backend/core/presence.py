@@ -0,0 +1,293 @@
+"""
+Presence and Typing for ZION.CITY API
+=====================================
+Ephemeral online / typing state kept out of MongoDB.
+
+- Online: one timestamp per user ("last activity"); a user is online while
+  it is younger than `online_ttl`. Heartbeats, chat reads and WebSocket
+  connects only touch this store
+- Typing: per-chat entries that expire after `typing_ttl`, written by the
+  WebSocket `typing` event and POST /chats/{chat_id}/typing
+- Durable users.last_seen is written by a background flush every
+  `flush_interval` seconds, one bulk write for every user seen since the
+  previous flush, so hot user documents are not rewritten on every poll
+
+- Redis backend: shared by every worker (sorted sets scored by timestamp)
+- In-process backend: used when Redis is not configured or unreachable
+
+Usage:
+    from core.presence import PresenceStore
+
+    presence = PresenceStore.from_env(db)
+    await presence.start()                                  # in lifespan
+
+    await presence.touch(user_id)
+    await presence.set_typing("direct", chat_id, user_id, True)
+    online, last_seen = await presence.status(user_id)
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def _to_datetime(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+class LocalPresenceBackend:
+    """In-process state: user -> last activity, chat -> {user: typing expiry}."""
+
+    def __init__(self):
+        self._online: Dict[str, float] = {}
+        self._typing: Dict[str, Dict[str, float]] = {}
+
+    async def touch(self, user_id: str, now: float) -> None:
+        self._online[user_id] = now
+
+    async def remove(self, user_id: str) -> None:
+        self._online.pop(user_id, None)
+
+    async def last_active(self, user_ids: List[str]) -> Dict[str, float]:
+        return {uid: self._online[uid] for uid in user_ids if uid in self._online}
+
+    async def count_since(self, since: float) -> int:
+        return sum(1 for ts in self._online.values() if ts >= since)
+
+    async def set_typing(self, key: str, user_id: str, expires: Optional[float]) -> None:
+        if expires is None:
+            users = self._typing.get(key)
+            if users is not None:
+                users.pop(user_id, None)
+                if not users:
+                    del self._typing[key]
+            return
+        self._typing.setdefault(key, {})[user_id] = expires
+
+    async def typing(self, key: str, now: float) -> Dict[str, float]:
+        return {uid: exp for uid, exp in self._typing.get(key, {}).items() if exp > now}
+
+    def cleanup(self, online_before: float, now: float) -> int:
+        stale = [uid for uid, ts in self._online.items() if ts < online_before]
+        for uid in stale:
+            del self._online[uid]
+        for key in list(self._typing):
+            users = {uid: exp for uid, exp in self._typing[key].items() if exp > now}
+            if users:
+                self._typing[key] = users
+            else:
+                del self._typing[key]
+        return len(stale)
+
+
+class RedisPresenceBackend:
+    """Shared state in Redis: one sorted set of last activity, one per chat for typing."""
+
+    def __init__(self, client: Any, prefix: str = "zion:presence:"):
+        self.client = client
+        self.prefix = prefix
+        self.online_key = prefix + "online"
+
+    async def touch(self, user_id: str, now: float) -> None:
+        await self.client.zadd(self.online_key, {user_id: now})
+
+    async def remove(self, user_id: str) -> None:
+        await self.client.zrem(self.online_key, user_id)
+
+    async def last_active(self, user_ids: List[str]) -> Dict[str, float]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for uid in user_ids:
+                pipe.zscore(self.online_key, uid)
+            scores = await pipe.execute()
+        return {uid: float(score) for uid, score in zip(user_ids, scores) if score is not None}
+
+    async def count_since(self, since: float) -> int:
+        return int(await self.client.zcount(self.online_key, since, "+inf"))
+
+    async def set_typing(self, key: str, user_id: str, expires: Optional[float]) -> None:
+        redis_key = self.prefix + "typing:" + key
+        if expires is None:
+            await self.client.zrem(redis_key, user_id)
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zadd(redis_key, {user_id: expires})
+            pipe.expireat(redis_key, int(expires) + 1)
+            await pipe.execute()
+
+    async def typing(self, key: str, now: float) -> Dict[str, float]:
+        entries = await self.client.zrangebyscore(self.prefix + "typing:" + key, now, "+inf", withscores=True)
+        return {(uid.decode("utf-8") if isinstance(uid, bytes) else uid): float(exp) for uid, exp in entries}
+
+    async def trim(self, online_before: float) -> int:
+        return int(await self.client.zremrangebyscore(self.online_key, "-inf", online_before))
+
+
+class PresenceStore:
+    """
+    Online / typing state with a coalesced last_seen flush to MongoDB.
+
+    Falls back to the in-process backend if Redis errors, so a Redis outage
+    degrades to per-worker presence rather than failing requests.
+    """
+
+    def __init__(
+        self,
+        db,
+        redis_client: Any = None,
+        online_ttl: float = 120.0,
+        typing_ttl: float = 5.0,
+        flush_interval: float = 5.0,
+    ):
+        self.db = db
+        self.local = LocalPresenceBackend()
+        self.remote = RedisPresenceBackend(redis_client) if redis_client is not None else None
+        self.online_ttl = online_ttl
+        self.typing_ttl = typing_ttl
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, float] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_users = 0
+        self.remote_errors = 0
+
+    @classmethod
+    def from_env(cls, db) -> "PresenceStore":
+        return cls(db, get_redis())
+
+    async def _call(self, method: str, *args) -> Any:
+        if self.remote is not None:
+            try:
+                return await getattr(self.remote, method)(*args)
+            except Exception as e:
+                self.remote_errors += 1
+                logger.warning(f"Presence Redis error, using local fallback: {e}")
+        return await getattr(self.local, method)(*args)
+
+    # ---- online ----
+
+    async def touch(self, user_id: str) -> None:
+        """Record activity: the user is online now and last_seen is queued for the next flush."""
+        now = time.time()
+        self._pending[user_id] = now
+        await self._call("touch", user_id, now)
+
+    async def set_offline(self, user_id: str) -> None:
+        """Explicit sign-off (last WebSocket closed); last_seen still records the moment."""
+        self._pending[user_id] = time.time()
+        await self._call("remove", user_id)
+
+    async def online_many(self, user_ids: Iterable[str]) -> Dict[str, bool]:
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+        since = time.time() - self.online_ttl
+        active = await self._call("last_active", user_ids)
+        return {uid: active.get(uid, 0) >= since for uid in user_ids}
+
+    async def status(self, user_id: str) -> Tuple[bool, Optional[datetime]]:
+        """(is_online, last_seen), falling back to the durable users.last_seen."""
+        active = (await self._call("last_active", [user_id])).get(user_id)
+        if active is not None:
+            return active >= time.time() - self.online_ttl, _to_datetime(active)
+        user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "last_seen": 1})
+        last_seen = user.get("last_seen") if user else None
+        if isinstance(last_seen, str):
+            last_seen = datetime.fromisoformat(last_seen.replace("Z", "+00:00"))
+        if isinstance(last_seen, datetime) and last_seen.tzinfo is None:
+            last_seen = last_seen.replace(tzinfo=timezone.utc)
+        return False, last_seen
+
+    async def online_count(self, within: Optional[float] = None) -> int:
+        return await self._call("count_since", time.time() - (within or self.online_ttl))
+
+    # ---- typing ----
+
+    async def set_typing(self, chat_type: str, chat_id: str, user_id: str, is_typing: bool) -> None:
+        expires = time.time() + self.typing_ttl if is_typing else None
+        await self._call("set_typing", f"{chat_type}:{chat_id}", user_id, expires)
+
+    async def typing_users(self, chat_type: str, chat_id: str, exclude_user: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Users typing in a chat, same shape as the old typing_status documents."""
+        entries = await self._call("typing", f"{chat_type}:{chat_id}", time.time())
+        return [
+            {
+                "chat_id": chat_id,
+                "chat_type": chat_type,
+                "user_id": uid,
+                "is_typing": True,
+                "updated_at": _to_datetime(expires - self.typing_ttl),
+            }
+            for uid, expires in entries.items()
+            if uid != exclude_user
+        ]
+
+    # ---- durable last_seen ----
+
+    async def flush(self) -> int:
+        """Write queued last_seen values to MongoDB in one bulk write."""
+        if not self._pending:
+            return 0
+        from pymongo import UpdateOne
+
+        pending, self._pending = self._pending, {}
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.users.bulk_write([
+                UpdateOne({"id": uid}, {"$max": {"last_seen": _to_datetime(ts)}, "$set": {"updated_at": now}})
+                for uid, ts in pending.items()
+            ], ordered=False)
+        except Exception as e:
+            # Keep the newest value for the next attempt
+            for uid, ts in pending.items():
+                self._pending[uid] = max(ts, self._pending.get(uid, 0))
+            logger.warning(f"Presence last_seen flush failed: {e}")
+            return 0
+        self.flushes += 1
+        self.flushed_users += len(pending)
+        return len(pending)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def cleanup(self) -> int:
+        """Drop expired local entries and trim the shared online set."""
+        now = time.time()
+        removed = self.local.cleanup(now - self.online_ttl, now)
+        if self.remote is not None:
+            try:
+                removed += await self.remote.trim(now - self.online_ttl)
+            except Exception as e:
+                self.remote_errors += 1
+                logger.warning(f"Presence Redis trim failed: {e}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis" if self.remote is not None else "local",
+            "pending_last_seen": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_users": self.flushed_users,
+            "remote_errors": self.remote_errors,
+        }
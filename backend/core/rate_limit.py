@@ -0,0 +1,259 @@
+"""
+Distributed Rate Limiting for ZION.CITY API
+===========================================
+GCRA (Generic Cell Rate Algorithm) limiter with O(1) state per key:
+a single "theoretical arrival time" instead of a list of timestamps.
+
+- Redis backend: one atomic Lua script per check, shared by every gunicorn
+  worker and host, so a 20/min limit is 20/min for the whole deployment
+- In-process backend: used when Redis is not configured or unreachable
+- RateLimitMiddleware: applies limits per route group without touching handlers
+- Anonymous callers are keyed by IP. X-Real-IP is only honoured when the
+  connection comes from a trusted proxy (the local nginx); anyone else
+  could send a new value with every request to dodge the limit
+
+Configuration:
+    TRUSTED_PROXIES=127.0.0.1,::1   # peers whose X-Real-IP header is believed
+
+Usage:
+    from core.rate_limit import RateLimiter, RateLimitMiddleware
+
+    rate_limiter = RateLimiter.from_env()
+    result = await rate_limiter.hit("ai_chat:user-1", max_requests=20, window_seconds=60)
+    if not result.allowed:
+        ...  # retry after result.retry_after seconds
+
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, rules=[...], limits=RATE_LIMITS)
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+TRUSTED_PROXIES = frozenset(
+    p.strip() for p in os.environ.get("TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if p.strip()
+)
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of a single rate limit check."""
+    allowed: bool
+    retry_after: float = 0.0
+
+
+# KEYS[1] = limiter key; ARGV = emission interval, burst window (seconds)
+_GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - window
+if now < allow_at then
+    return {0, tostring(allow_at - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, '0'}
+"""
+
+
+class LocalGCRABackend:
+    """In-process GCRA state: one float per key."""
+
+    def __init__(self):
+        self._tat: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def hit(self, key: str, interval: float, window: float) -> RateLimitResult:
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+        new_tat = tat + interval
+        allow_at = new_tat - window
+        if now < allow_at:
+            return RateLimitResult(False, allow_at - now)
+        self._tat[key] = new_tat
+        return RateLimitResult(True)
+
+    def cleanup(self) -> int:
+        """Drop keys whose bucket has fully drained."""
+        now = time.monotonic()
+        stale = [k for k, tat in self._tat.items() if tat <= now]
+        for key in stale:
+            del self._tat[key]
+        return len(stale)
+
+
+class RedisGCRABackend:
+    """Shared GCRA state in Redis, evaluated atomically server-side."""
+
+    def __init__(self, client: Any, prefix: str = "zion:rl:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_GCRA_SCRIPT)
+
+    async def hit(self, key: str, interval: float, window: float) -> RateLimitResult:
+        allowed, retry_after = await self._script(keys=[self.prefix + key], args=[interval, window])
+        return RateLimitResult(bool(int(allowed)), float(retry_after))
+
+
+class RateLimiter:
+    """
+    GCRA rate limiter. Allows bursts of up to max_requests and then one
+    request every window_seconds / max_requests.
+
+    Falls back to the in-process backend if Redis errors, so a Redis outage
+    degrades to per-worker limits rather than failing requests.
+    """
+
+    def __init__(self, redis_client: Any = None):
+        self.local = LocalGCRABackend()
+        self.remote = RedisGCRABackend(redis_client) if redis_client is not None else None
+        self.allowed_count = 0
+        self.limited_count = 0
+        self.remote_errors = 0
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        return cls(get_redis())
+
+    async def hit(self, key: str, max_requests: int, window_seconds: float) -> RateLimitResult:
+        """Record a request for key and report whether it is allowed."""
+        interval = window_seconds / max(1, max_requests)
+        result = None
+        if self.remote is not None:
+            try:
+                result = await self.remote.hit(key, interval, window_seconds)
+            except Exception as e:
+                self.remote_errors += 1
+                logger.warning(f"Rate limiter Redis error, using local fallback: {e}")
+        if result is None:
+            result = self.local.hit(key, interval, window_seconds)
+        if result.allowed:
+            self.allowed_count += 1
+        else:
+            self.limited_count += 1
+        return result
+
+    async def is_allowed(self, key: str, max_requests: int, window_seconds: float) -> bool:
+        """Check if request is allowed within rate limit"""
+        return (await self.hit(key, max_requests, window_seconds)).allowed
+
+    async def cleanup(self) -> int:
+        """Clean up drained local entries (Redis keys expire on their own)."""
+        return self.local.cleanup()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis" if self.remote is not None else "local",
+            "tracked_local_keys": len(self.local),
+            "allowed": self.allowed_count,
+            "limited": self.limited_count,
+            "remote_errors": self.remote_errors,
+        }
+
+
+RateLimitRule = Tuple[Optional[str], str, str]  # (HTTP method or None, path regex, limit type)
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying RATE_LIMITS to route groups.
+
+    rules: list of (method, path_regex, limit_type); the first match wins and
+    unmatched requests pass through untouched.
+    key_func: maps the ASGI scope to a client identity (user id or IP).
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        limiter: RateLimiter,
+        rules: Iterable[RateLimitRule],
+        limits: Dict[str, Dict[str, Any]],
+        key_func: Optional[Callable[[Dict[str, Any]], str]] = None,
+        detail: str = "Too many requests",
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.limits = limits
+        self.key_func = key_func or client_ip
+        self.detail = detail
+        self.rules: List[Tuple[Optional[str], Pattern[str], str]] = [
+            (method.upper() if method else None, re.compile(pattern), limit_type)
+            for method, pattern, limit_type in rules
+        ]
+
+    def _match(self, method: str, path: str) -> Optional[str]:
+        for rule_method, pattern, limit_type in self.rules:
+            if (rule_method is None or rule_method == method) and pattern.search(path):
+                return limit_type
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit_type = self._match(scope["method"], scope["path"])
+        if limit_type is None:
+            await self.app(scope, receive, send)
+            return
+
+        config = self.limits.get(limit_type, self.limits["default"])
+        key = f"{limit_type}:{self.key_func(scope)}"
+        result = await self.limiter.hit(key, config["max_requests"], config["window_seconds"])
+        if result.allowed:
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": self.detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(result.retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_ip(scope: Dict[str, Any]) -> str:
+    """Client IP: X-Real-IP when the request came through a trusted proxy, else the peer address."""
+    client = scope.get("client")
+    peer = client[0] if client else None
+    if peer in TRUSTED_PROXIES:
+        real_ip = _header(scope, b"x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+    return peer or "unknown"
+
+
+def bearer_token(scope: Dict[str, Any]) -> Optional[str]:
+    """Extract the bearer token from the Authorization header, if any."""
+    auth = _header(scope, b"authorization")
+    if auth and auth[:7].lower() == "bearer ":
+        return auth[7:].strip()
+    return None
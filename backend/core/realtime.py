@@ -0,0 +1,537 @@
+"""
+Real-Time Fan-Out for ZION.CITY API
+===================================
+WebSocket connection manager that works across gunicorn workers and hosts.
+
+- Every worker keeps its own sockets; events for a chat or a user are
+  delivered to the local sockets directly and published on the broker, and
+  every other worker with sockets in that chat / for that user delivers them
+- Redis broker: per-chat and per-user pub/sub channels (zion:ws:chat:<id>,
+  zion:ws:user:<id>); a worker subscribes only while it has sockets there
+- Memory broker: in-process stand-in with the same interface, used without
+  REDIS_URL and in tests (several managers sharing one broker act as nodes)
+- Presence: each socket is registered under its user and chats with an
+  expiry that the owning worker refreshes, so sockets of a crashed worker
+  stop counting as online after `presence_ttl` seconds
+- A user may have any number of sockets (tabs, devices)
+- Backpressure: events are encoded once and queued per socket; a writer
+  task per socket sends with a timeout, so one slow client never delays
+  the rest of a room (WS_MAX_QUEUE, WS_SEND_TIMEOUT, WS_SLOW_CONSUMER_POLICY)
+
+Usage:
+    from core.realtime import ChatConnectionManager
+
+    chat_manager = ChatConnectionManager.from_env()
+    await chat_manager.start()                     # in lifespan
+
+    await chat_manager.connect(websocket, user_id, chat_id)
+    await chat_manager.broadcast_to_chat(chat_id, {"type": "message", ...})
+    await chat_manager.send_to_user(user_id, {"type": "notification", ...})
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+
+# ============================================================
+# BROKERS
+# ============================================================
+
+class MemoryBroker:
+    """
+    In-process broker. Managers sharing one instance behave like separate
+    nodes; a single manager with its own instance is a single-worker setup.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Set[MessageHandler]] = {}
+        self._presence: Dict[str, Dict[str, float]] = {}
+        self.published = 0
+
+    async def start(self, handler: MessageHandler) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        self._handlers.setdefault(channel, set()).add(handler)
+
+    async def unsubscribe(self, channel: str, handler: MessageHandler) -> None:
+        handlers = self._handlers.get(channel)
+        if handlers is not None:
+            handlers.discard(handler)
+            if not handlers:
+                del self._handlers[channel]
+
+    async def publish(self, channel: str, data: str) -> None:
+        self.published += 1
+        for handler in list(self._handlers.get(channel, ())):
+            await handler(channel, data)
+
+    async def register(self, keys: Iterable[str], conn_id: str, ttl: float) -> None:
+        expires = time.time() + ttl
+        for key in keys:
+            self._presence.setdefault(key, {})[conn_id] = expires
+
+    async def unregister(self, keys: Iterable[str], conn_id: str) -> None:
+        for key in keys:
+            members = self._presence.get(key)
+            if members is not None:
+                members.pop(conn_id, None)
+                if not members:
+                    del self._presence[key]
+
+    async def count(self, key: str) -> int:
+        now = time.time()
+        return sum(1 for expires in self._presence.get(key, {}).values() if expires > now)
+
+
+class RedisBroker:
+    """Redis pub/sub channels plus presence sorted sets (member = connection, score = expiry)."""
+
+    def __init__(self, client: Any, prefix: str = "zion:ws:"):
+        self.client = client
+        self.prefix = prefix
+        self._channels: Set[str] = set()
+        self._handler: Optional[MessageHandler] = None
+        self._pubsub: Any = None
+        self._listener: Optional[asyncio.Task] = None
+        self.published = 0
+        self.errors = 0
+
+    async def start(self, handler: MessageHandler) -> None:
+        self._handler = handler
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+
+    async def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        # One handler per node: the manager passed to start()
+        self._channels.add(channel)
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.subscribe(self.prefix + channel)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"WebSocket broker subscribe failed for {channel}: {e}")
+
+    async def unsubscribe(self, channel: str, handler: MessageHandler) -> None:
+        self._channels.discard(channel)
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self.prefix + channel)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"WebSocket broker unsubscribe failed for {channel}: {e}")
+
+    async def publish(self, channel: str, data: str) -> None:
+        try:
+            await self.client.publish(self.prefix + channel, data)
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"WebSocket broker publish failed for {channel}: {e}")
+
+    async def _listen(self) -> None:
+        while True:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                if self._channels:
+                    await self._pubsub.subscribe(*[self.prefix + c for c in self._channels])
+                while True:
+                    if not self._pubsub.subscribed:
+                        # Nothing to read until the first socket joins
+                        await asyncio.sleep(0.1)
+                        continue
+                    message = await self._pubsub.get_message(timeout=1.0)
+                    if message is None or message.get("type") != "message":
+                        continue
+                    channel = message["channel"]
+                    data = message["data"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    if isinstance(data, bytes):
+                        data = data.decode("utf-8")
+                    await self._handler(channel[len(self.prefix):], data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Events published while disconnected are lost; clients resync over REST
+                self.errors += 1
+                logger.warning(f"WebSocket broker listener error, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                pubsub, self._pubsub = self._pubsub, None
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def register(self, keys: Iterable[str], conn_id: str, ttl: float) -> None:
+        expires = time.time() + ttl
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.zadd(self.prefix + key, {conn_id: expires})
+                    pipe.expire(self.prefix + key, int(ttl * 2))
+                await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"WebSocket presence update failed: {e}")
+
+    async def unregister(self, keys: Iterable[str], conn_id: str) -> None:
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.zrem(self.prefix + key, conn_id)
+                await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"WebSocket presence update failed: {e}")
+
+    async def count(self, key: str) -> int:
+        try:
+            return int(await self.client.zcount(self.prefix + key, time.time(), "+inf"))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"WebSocket presence read failed: {e}")
+            return 0
+
+
+# ============================================================
+# CONNECTION MANAGER
+# ============================================================
+
+DROP = "drop"              # slow consumer: discard new events for that socket
+DISCONNECT = "disconnect"  # slow consumer: close the socket, the client reconnects and resyncs
+
+
+def _chat_channel(chat_id: str) -> str:
+    return f"chat:{chat_id}"
+
+
+def _user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def encode(message: Any) -> str:
+    """JSON text of an event, encoded once per broadcast (same format as WebSocket.send_json)."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class Connection:
+    """One accepted socket with its bounded outbound queue and writer task."""
+
+    def __init__(self, websocket: Any, user_id: str, conn_id: str, max_queue: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.conn_id = conn_id
+        self.chats: Set[str] = set()
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_queue)
+        self.writer: Optional[asyncio.Task] = None
+        self.closing = False
+
+
+class ChatConnectionManager:
+    """
+    Manages WebSocket connections for real-time chat features.
+
+    Broadcasts never await a socket: each event is encoded once and put on
+    every target connection's bounded queue, and a writer task per
+    connection sends it with a timeout. A slow client only fills its own
+    queue; `slow_consumer_policy` then drops its events or disconnects it.
+    """
+
+    def __init__(
+        self,
+        broker: Any = None,
+        presence_ttl: float = 60.0,
+        max_queue: int = 256,
+        send_timeout: float = 5.0,
+        slow_consumer_policy: str = DISCONNECT,
+    ):
+        self.broker = broker if broker is not None else MemoryBroker()
+        self.presence_ttl = presence_ttl
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.node_id = uuid.uuid4().hex
+        # chat_id -> local sockets in that chat
+        self.chat_connections: Dict[str, Set[Any]] = {}
+        # user_id -> local sockets of that user (one per tab / device)
+        self.user_connections: Dict[str, Set[Any]] = {}
+        self._connections: Dict[Any, Connection] = {}
+        self._lock = asyncio.Lock()
+        self._heartbeat: Optional[asyncio.Task] = None
+        # Slow-consumer closes in flight; the loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.send_errors = 0
+        self.remote_events = 0
+        self._send_time_total = 0.0
+        self._send_time_max = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ChatConnectionManager":
+        redis = get_redis()
+        return cls(
+            RedisBroker(redis) if redis is not None else None,
+            max_queue=int(os.environ.get("WS_MAX_QUEUE", 256)),
+            send_timeout=float(os.environ.get("WS_SEND_TIMEOUT", 5.0)),
+            slow_consumer_policy=os.environ.get("WS_SLOW_CONSUMER_POLICY", DISCONNECT),
+        )
+
+    async def start(self) -> None:
+        """Start the broker listener and the presence heartbeat."""
+        await self.broker.start(self._on_broker_message)
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._refresh_presence())
+
+    async def stop(self) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._heartbeat = None
+        for conn in list(self._connections.values()):
+            if conn.writer is not None:
+                conn.writer.cancel()
+        await self.broker.stop()
+
+    # ---- membership ----
+
+    def _presence_keys(self, user_id: str, chats: Iterable[str]) -> List[str]:
+        return [f"online:user:{user_id}"] + [f"online:chat:{chat_id}" for chat_id in chats]
+
+    async def connect(self, websocket: Any, user_id: str, chat_id: str = None):
+        """Connect a user to WebSocket"""
+        await websocket.accept()
+        conn = Connection(websocket, user_id, f"{self.node_id}:{uuid.uuid4().hex}", self.max_queue)
+        conn.writer = asyncio.create_task(self._write(conn))
+        async with self._lock:
+            self._connections[websocket] = conn
+            sockets = self.user_connections.setdefault(user_id, set())
+            sockets.add(websocket)
+            if len(sockets) == 1:
+                await self.broker.subscribe(_user_channel(user_id), self._on_broker_message)
+        await self.broker.register(self._presence_keys(user_id, ()), conn.conn_id, self.presence_ttl)
+        if chat_id:
+            await self.join_chat(websocket, chat_id)
+
+        logger.info(f"WebSocket connected: user={user_id}, chat={chat_id}")
+
+    async def disconnect(self, websocket: Any, user_id: str = None, chat_id: str = None):
+        """Disconnect a socket and remove it from every chat it joined"""
+        async with self._lock:
+            conn = self._connections.pop(websocket, None)
+            if conn is None:
+                return
+            sockets = self.user_connections.get(conn.user_id)
+            if sockets is not None:
+                sockets.discard(websocket)
+                if not sockets:
+                    del self.user_connections[conn.user_id]
+                    await self.broker.unsubscribe(_user_channel(conn.user_id), self._on_broker_message)
+            for joined in conn.chats:
+                await self._remove_from_chat(websocket, joined)
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        await self.broker.unregister(self._presence_keys(conn.user_id, conn.chats), conn.conn_id)
+
+        logger.info(f"WebSocket disconnected: user={conn.user_id}")
+
+    async def join_chat(self, websocket: Any, chat_id: str):
+        """Join a specific chat room"""
+        async with self._lock:
+            conn = self._connections.get(websocket)
+            if conn is None or chat_id in conn.chats:
+                return
+            conn.chats.add(chat_id)
+            sockets = self.chat_connections.setdefault(chat_id, set())
+            sockets.add(websocket)
+            if len(sockets) == 1:
+                await self.broker.subscribe(_chat_channel(chat_id), self._on_broker_message)
+        await self.broker.register([f"online:chat:{chat_id}"], conn.conn_id, self.presence_ttl)
+
+    async def leave_chat(self, websocket: Any, chat_id: str):
+        """Leave a specific chat room"""
+        async with self._lock:
+            conn = self._connections.get(websocket)
+            if conn is None or chat_id not in conn.chats:
+                return
+            conn.chats.discard(chat_id)
+            await self._remove_from_chat(websocket, chat_id)
+        await self.broker.unregister([f"online:chat:{chat_id}"], conn.conn_id)
+
+    async def _remove_from_chat(self, websocket: Any, chat_id: str) -> None:
+        sockets = self.chat_connections.get(chat_id)
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self.chat_connections[chat_id]
+            await self.broker.unsubscribe(_chat_channel(chat_id), self._on_broker_message)
+
+    async def _refresh_presence(self) -> None:
+        """Keep this node's presence entries alive while its sockets are open."""
+        while True:
+            await asyncio.sleep(self.presence_ttl / 3)
+            for conn in list(self._connections.values()):
+                try:
+                    await self.broker.register(
+                        self._presence_keys(conn.user_id, conn.chats), conn.conn_id, self.presence_ttl
+                    )
+                except Exception as e:
+                    logger.warning(f"WebSocket presence refresh failed: {e}")
+
+    # ---- delivery ----
+
+    async def broadcast_to_chat(self, chat_id: str, message: dict, exclude_user: str = None):
+        """Broadcast a message to all users in a chat, on every node"""
+        text = encode(message)
+        self._enqueue(self.chat_connections.get(chat_id, ()), text, exclude_user)
+        await self._publish(_chat_channel(chat_id), text, exclude_user)
+
+    async def send_to_user(self, user_id: str, message: dict) -> bool:
+        """Send a message to every socket of a user, on every node"""
+        text = encode(message)
+        queued = self._enqueue(self.user_connections.get(user_id, ()), text)
+        await self._publish(_user_channel(user_id), text)
+        return queued > 0 or await self.is_user_online(user_id)
+
+    async def send(self, websocket: Any, message: dict) -> None:
+        """Reply on one socket through its queue, so replies never interleave with broadcasts."""
+        self._enqueue((websocket,), encode(message))
+
+    async def _publish(self, channel: str, text: str, exclude_user: str = None) -> None:
+        # The event stays pre-encoded inside the envelope, so receiving nodes never re-encode it
+        envelope = {"node": self.node_id, "payload": text}
+        if exclude_user:
+            envelope["exclude_user"] = exclude_user
+        await self.broker.publish(channel, json.dumps(envelope))
+
+    async def _on_broker_message(self, channel: str, data: str) -> None:
+        try:
+            envelope = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if envelope.get("node") == self.node_id or "payload" not in envelope:
+            return
+        self.remote_events += 1
+        kind, _, target = channel.partition(":")
+        sockets = self.chat_connections.get(target, ()) if kind == "chat" else self.user_connections.get(target, ())
+        self._enqueue(sockets, envelope["payload"], envelope.get("exclude_user"))
+
+    def _enqueue(self, sockets: Iterable[Any], text: str, exclude_user: str = None) -> int:
+        queued = 0
+        for websocket in list(sockets):
+            conn = self._connections.get(websocket)
+            if conn is None or conn.closing or (exclude_user and conn.user_id == exclude_user):
+                continue
+            try:
+                conn.queue.put_nowait(text)
+                queued += 1
+            except asyncio.QueueFull:
+                self._slow_consumer(conn)
+        self.enqueued += queued
+        return queued
+
+    def _slow_consumer(self, conn: Connection) -> None:
+        if self.slow_consumer_policy == DROP:
+            self.dropped += 1
+            return
+        conn.closing = True
+        self.slow_disconnects += 1
+        logger.warning(f"WebSocket slow consumer disconnected: user={conn.user_id}, queued={conn.queue.qsize()}")
+        task = asyncio.create_task(self._close(conn, 1013))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _close(self, conn: Connection, code: int) -> None:
+        await self.disconnect(conn.websocket)
+        try:
+            # The endpoint's receive loop ends and runs its own cleanup
+            await asyncio.wait_for(conn.websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _write(self, conn: Connection) -> None:
+        """Per-socket writer: sends queued events in order, one at a time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            text = await conn.queue.get()
+            started = loop.time()
+            try:
+                await asyncio.wait_for(conn.websocket.send_text(text), self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.send_errors += 1
+                logger.warning(f"WebSocket send failed for user {conn.user_id}: {e!r}")
+                conn.closing = True
+                await self._close(conn, 1011)
+                return
+            elapsed = loop.time() - started
+            self.sent += 1
+            self._send_time_total += elapsed
+            self._send_time_max = max(self._send_time_max, elapsed)
+
+    # ---- presence ----
+
+    async def is_user_online(self, user_id: str) -> bool:
+        """Check if a user has an active WebSocket connection on any node"""
+        if user_id in self.user_connections:
+            return True
+        return await self.broker.count(f"online:user:{user_id}") > 0
+
+    async def get_online_users_in_chat(self, chat_id: str) -> int:
+        """Number of sockets connected to a chat across all nodes"""
+        return await self.broker.count(f"online:chat:{chat_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        depths = [conn.queue.qsize() for conn in self._connections.values()]
+        return {
+            "broker": "redis" if isinstance(self.broker, RedisBroker) else "memory",
+            "node_id": self.node_id,
+            "local_sockets": len(self._connections),
+            "local_users": len(self.user_connections),
+            "local_chats": len(self.chat_connections),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "max_queue": self.max_queue,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "send_errors": self.send_errors,
+            "send_latency_avg_ms": round(self._send_time_total / self.sent * 1000, 2) if self.sent else 0.0,
+            "send_latency_max_ms": round(self._send_time_max * 1000, 2),
+            "remote_events": self.remote_events,
+            "published": self.broker.published,
+        }
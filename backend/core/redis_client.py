@@ -0,0 +1,69 @@
+"""
+Shared Redis Client for ZION.CITY API
+=====================================
+Lazily creates a single asyncio Redis client per worker process from REDIS_URL.
+Redis is optional: when REDIS_URL is unset or the `redis` package is missing,
+get_redis() returns None and callers fall back to their in-process backends.
+
+Usage:
+    from core.redis_client import get_redis
+
+    redis = get_redis()
+    if redis is not None:
+        await redis.incr("counter")
+"""
+
+import logging
+import os
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[Any] = None
+_initialized = False
+
+
+def get_redis() -> Optional[Any]:
+    """
+    Get the process-wide Redis client.
+
+    Returns:
+        redis.asyncio.Redis instance, or None if Redis is not configured
+    """
+    global _client, _initialized
+    if _initialized:
+        return _client
+    _initialized = True
+
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        return None
+
+    try:
+        import redis.asyncio as redis_asyncio
+    except ImportError:
+        logger.warning("REDIS_URL is set but the 'redis' package is not installed; using in-process backends")
+        return None
+
+    # Connections are opened lazily, so creating the client before gunicorn
+    # forks (preload_app=True) does not share sockets between workers.
+    _client = redis_asyncio.from_url(
+        url,
+        max_connections=int(os.environ.get("REDIS_MAX_CONNECTIONS", 50)),
+        socket_timeout=float(os.environ.get("REDIS_SOCKET_TIMEOUT", 2.0)),
+        socket_connect_timeout=float(os.environ.get("REDIS_CONNECT_TIMEOUT", 2.0)),
+        health_check_interval=30,
+    )
+    logger.info("Redis client configured")
+    return _client
+
+
+async def close_redis() -> None:
+    """Close the process-wide Redis client, if any."""
+    global _client
+    if _client is not None:
+        try:
+            await _client.aclose()
+        except AttributeError:
+            await _client.close()
+        _client = None
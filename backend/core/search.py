@@ -0,0 +1,430 @@
+"""
+Full-Text Search Index for ZION.CITY API
+========================================
+One inverted index for people, organizations, services, products, events,
+channels and interest groups, with Russian / English stemming and ranking.
+
+- Every searchable document has one entry {kind, entity_id, title_terms,
+  terms, forms}: the Snowball stems of its text fields (Cyrillic words
+  through the Russian stemmer, Latin words through the English one, "ё"
+  folded to "е") plus exact terms for identifiers such as email;
+  forms are the words whose stem differs from the word itself
+- Phone numbers are indexed under their own kind, user_phones, which only
+  the admin user search queries; people search by other users cannot find
+  someone by phone number
+- A query matches entries holding every query stem; the last word also
+  matches as a prefix of a stem or of an unstemmed word, so partly typed
+  words still find results ("organi" finds "organization", stemmed
+  "organ"). Lookups use the multikey (kind, terms) / (kind, forms) indexes
+  instead of scanning the source collection, and user input is never
+  interpreted as a regular expression
+- search(..., where=query) returns only ids whose source document matches
+  query (the endpoint's own filters). Ranked candidates are read in pages
+  and checked against the source collection until `limit` of them match, so
+  filters apply before the candidate cap instead of after it
+- Ranking: matches in the title (name / title fields) weigh more than
+  matches in the body; ties go to the most recently indexed entry
+- Writes call refresh(kind, id) after changing a source document; the entry
+  is rebuilt from the stored document (or removed when it is gone).
+  rebuild() reindexes a whole kind and drops stale entries
+
+Collections:
+    search_index: {kind, entity_id, title_terms, terms, updated_at}
+
+Usage:
+    from core.search import PRODUCTS, SearchIndex
+
+    search_index = SearchIndex(db)
+    ids = await search_index.search(PRODUCTS, "велосипед горный")   # ranked entity ids
+    ids = await search_index.search(PRODUCTS, text, where={"status": "ACTIVE", "city": city})
+    await search_index.refresh(PRODUCTS, product_id)                 # after insert / update / delete
+
+Rebuild (from backend/):
+    python -m core.search rebuild [--kind products]
+    python -m core.search query products "велосипед"
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+USERS = "users"
+USER_PHONES = "user_phones"  # admin only
+ORGANIZATIONS = "organizations"
+SERVICES = "services"
+PRODUCTS = "products"
+EVENTS = "events"
+CHANNELS = "channels"
+INTEREST_GROUPS = "interest_groups"
+
+TITLE_WEIGHT = 3
+
+_BATCH = 500
+
+
+@dataclass(frozen=True)
+class SearchSource:
+    """A collection feeding the index: title fields rank above body fields; exact fields are not stemmed."""
+    collection: str
+    title: Tuple[str, ...]
+    body: Tuple[str, ...] = ()
+    exact: Tuple[str, ...] = ()
+    id_fields: Tuple[str, ...] = ("id",)
+
+    @property
+    def projection(self) -> Dict[str, int]:
+        return {"_id": 0, **{f: 1 for f in self.id_fields + self.title + self.body + self.exact}}
+
+    def entity_id(self, doc: Dict[str, Any]) -> Optional[str]:
+        return next((doc[f] for f in self.id_fields if doc.get(f)), None)
+
+
+SOURCES: Dict[str, SearchSource] = {
+    USERS: SearchSource(
+        "users",
+        title=("first_name", "last_name", "middle_name", "name", "surname"),
+        body=("bio",),
+        exact=("email",),
+    ),
+    USER_PHONES: SearchSource("users", title=(), exact=("phone",)),
+    ORGANIZATIONS: SearchSource(
+        "work_organizations",
+        title=("name",),
+        body=("description", "industry", "address_city"),
+        id_fields=("id", "organization_id"),
+    ),
+    SERVICES: SearchSource(
+        "service_listings",
+        title=("name",),
+        body=("description", "tags", "city", "category_id", "subcategory_id"),
+    ),
+    PRODUCTS: SearchSource(
+        "marketplace_products",
+        title=("title",),
+        body=("description", "tags", "category", "subcategory", "city"),
+    ),
+    EVENTS: SearchSource("goodwill_events", title=("title",), body=("description", "city")),
+    CHANNELS: SearchSource("news_channels", title=("name",), body=("description",)),
+    INTEREST_GROUPS: SearchSource("interest_groups", title=("name",), body=("description",)),
+}
+
+
+# ============================================================
+# TEXT
+# ============================================================
+
+_WORD = re.compile(r"[^\W_]+")
+_CYRILLIC = re.compile(r"[а-я]")
+_LATIN = re.compile(r"[a-z]")
+_PHONE = re.compile(r"^\+?[\d\s().-]{5,}$")
+
+
+@lru_cache(maxsize=None)
+def _stemmer(language: str):
+    import snowballstemmer
+
+    return snowballstemmer.stemmer(language)
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Snowball stem of a lowercased word; numbers and mixed tokens are kept as they are."""
+    if _CYRILLIC.search(word):
+        if _LATIN.search(word):
+            return word
+        return _stemmer("russian").stemWord(word)
+    if _LATIN.search(word) and word.isalpha():
+        return _stemmer("english").stemWord(word)
+    return word
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall(text.lower().replace("ё", "е"))
+
+
+def word_spans(text: str) -> Iterable[Tuple[int, int, str]]:
+    """(start, end, normalized word) for each word of text, offsets into the original string."""
+    for match in _WORD.finditer(text):
+        yield match.start(), match.end(), match.group().lower().replace("ё", "е")
+
+
+def exact_term(value: str) -> str:
+    """Normalized identifier: phone numbers as digits only, everything else lowercased."""
+    value = value.strip().lower()
+    if _PHONE.match(value):
+        return re.sub(r"\D", "", value)
+    return value
+
+
+def _strings(value: Any) -> Iterable[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            if isinstance(item, str):
+                yield item
+
+
+def _stems(doc: Dict[str, Any], fields: Sequence[str]) -> List[str]:
+    return [stem(w) for f in fields for value in _strings(doc.get(f)) for w in words(value)]
+
+
+def document_terms(source: SearchSource, doc: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """(title terms, all terms) of a source document."""
+    title = list(dict.fromkeys(_stems(doc, source.title)))
+    terms = title + _stems(doc, source.body)
+    for f in source.exact:
+        for value in _strings(doc.get(f)):
+            terms.append(exact_term(value))
+            terms.extend(stem(w) for w in words(value))
+    return title, list(dict.fromkeys(t for t in terms if t))
+
+
+def document_forms(source: SearchSource, doc: Dict[str, Any]) -> List[str]:
+    """Words of a source document that stemming changed, for raw prefix matches."""
+    forms = (
+        w for f in source.title + source.body
+        for value in _strings(doc.get(f)) for w in words(value)
+    )
+    return list(dict.fromkeys(w for w in forms if stem(w) != w))
+
+
+def query_terms(text: str) -> List[str]:
+    """Stems of a search string; an email / phone number is looked up as one exact term."""
+    text = text.strip()
+    if "@" in text or _PHONE.match(text):
+        return [exact_term(text)]
+    return list(dict.fromkeys(stem(w) for w in words(text)))
+
+
+def order_by(ids: Sequence[str], docs: Iterable[Dict[str, Any]], key: str = "id") -> List[Dict[str, Any]]:
+    """Put documents fetched with {"id": {"$in": ids}} back into ranked order."""
+    rank = {entity_id: i for i, entity_id in enumerate(ids)}
+    return sorted(docs, key=lambda d: rank.get(d.get(key), len(rank)))
+
+
+# ============================================================
+# INDEX
+# ============================================================
+
+class SearchIndex:
+    """Ranked term lookups over search_index, kept current by refresh() on writes."""
+
+    def __init__(self, db, max_candidates: int = 1000, max_scan: int = 20000):
+        self.db = db
+        self.max_candidates = max_candidates
+        self.max_scan = max_scan
+        self.queries = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    @staticmethod
+    def _source(kind: str) -> SearchSource:
+        try:
+            return SOURCES[kind]
+        except KeyError:
+            raise ValueError(f"Unknown search kind: {kind}") from None
+
+    def _entry(self, kind: str, entity_id: str, doc: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        source = self._source(kind)
+        title, terms = document_terms(source, doc)
+        return {
+            "kind": kind,
+            "entity_id": entity_id,
+            "title_terms": title,
+            "terms": terms,
+            "forms": document_forms(source, doc),
+            "updated_at": now,
+        }
+
+    async def search(
+        self,
+        kind: str,
+        text: str,
+        limit: Optional[int] = None,
+        match_any: bool = False,
+        prefix: bool = True,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
+        """
+        Entity ids matching text, best first (at most max_candidates).
+        match_any: any query term suffices instead of all of them.
+        prefix: the last word may also be the start of a term.
+        where: a query on the source collection; only ids of documents
+        matching it are returned.
+        """
+        source = self._source(kind)
+        self.queries += 1
+        terms = query_terms(text)
+        if not terms:
+            return []
+        limit = min(limit or self.max_candidates, self.max_candidates)
+        whole, last = (terms[:-1], terms[-1]) if prefix and len(terms[-1]) > 1 else (terms, None)
+        prefix_match: Dict[str, Any] = {}
+        if last:
+            # The typed word itself, unless the query was an exact term (email / phone)
+            typed = words(text)[-1:]
+            prefixes = [last] + [w for w in typed if stem(w) == last]
+            patterns = list(dict.fromkeys(f"^{re.escape(p)}" for p in prefixes))
+            prefix_match = {"$or": [
+                {field: {"$regex": pattern}} for pattern in patterns for field in ("terms", "forms")
+            ]}
+
+        if match_any:
+            clauses = [{"terms": {"$in": whole}}] if whole else []
+            if last:
+                clauses.extend(prefix_match["$or"])
+            match = {"kind": kind, "$or": clauses}
+        else:
+            match = {"kind": kind}
+            if whole:
+                match["terms"] = {"$all": whole}
+            if last:
+                match["$and"] = [prefix_match]
+
+        score = [
+            {"$multiply": [TITLE_WEIGHT, {"$size": {"$setIntersection": ["$title_terms", whole]}}]},
+            {"$size": {"$setIntersection": ["$terms", whole]}},
+        ]
+        if last:
+            score.append({"$multiply": [TITLE_WEIGHT, {"$size": {"$filter": {
+                "input": "$title_terms",
+                "cond": {"$eq": [{"$indexOfCP": ["$$this", last]}, 0]},
+            }}}]})
+        ranked = [
+            {"$match": match},
+            {"$addFields": {"score": {"$add": score}}},
+            {"$sort": {"score": -1, "updated_at": -1, "entity_id": 1}},
+        ]
+        if where is None:
+            return await self._ids(ranked, 0, limit)
+
+        # Page through ranked candidates, keeping those whose document passes the caller's filters
+        found: List[str] = []
+        scanned = 0
+        while scanned < self.max_scan and len(found) < limit:
+            ids = await self._ids(ranked, scanned, self.max_candidates)
+            scanned += len(ids)
+            if ids:
+                matching = set()
+                async for doc in self.db[source.collection].find(
+                    {"$and": [where, {"$or": [{f: {"$in": ids}} for f in source.id_fields]}]},
+                    {"_id": 0, **{f: 1 for f in source.id_fields}},
+                ):
+                    matching.update(doc.get(f) for f in source.id_fields)
+                found.extend(i for i in ids if i in matching)
+            if len(ids) < self.max_candidates:
+                break
+        return found[:limit]
+
+    async def _ids(self, ranked: List[Dict[str, Any]], skip: int, limit: int) -> List[str]:
+        pipeline = ranked + [{"$skip": skip}, {"$limit": limit}, {"$project": {"_id": 0, "entity_id": 1}}]
+        return [entry["entity_id"] async for entry in self.db.search_index.aggregate(pipeline)]
+
+    async def refresh(self, kind: str, entity_id: Optional[str]) -> None:
+        """Re-index one document from its collection (removes the entry if the document is gone). Never raises."""
+        if not entity_id:
+            return
+        source = self._source(kind)
+        try:
+            doc = await self.db[source.collection].find_one(
+                {"$or": [{f: entity_id} for f in source.id_fields]}, source.projection
+            )
+            entry = None
+            if doc is not None:
+                # Index under the canonical id even when the caller used an alias (organization_id)
+                entity_id = source.entity_id(doc) or entity_id
+                entry = self._entry(kind, entity_id, doc, datetime.now(timezone.utc))
+            if entry is None or not entry["terms"]:
+                await self.db.search_index.delete_one({"kind": kind, "entity_id": entity_id})
+            else:
+                await self.db.search_index.replace_one({"kind": kind, "entity_id": entity_id}, entry, upsert=True)
+            self.refreshes += 1
+        except Exception as e:
+            # The source write already succeeded; a missed refresh is repaired by the next rebuild
+            self.errors += 1
+            logger.warning(f"Search index refresh failed for {kind}/{entity_id}: {e}")
+
+    async def remove(self, kind: str, entity_id: Optional[str]) -> None:
+        if entity_id:
+            await self.db.search_index.delete_one({"kind": kind, "entity_id": entity_id})
+
+    async def rebuild(self, kinds: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Re-index whole collections and drop entries whose document no longer exists."""
+        from pymongo import ReplaceOne
+
+        report: Dict[str, int] = {}
+        for kind in kinds or SOURCES:
+            source = self._source(kind)
+            started = datetime.now(timezone.utc)
+            batch: List[Any] = []
+            count = 0
+            async for doc in self.db[source.collection].find({}, source.projection):
+                entity_id = source.entity_id(doc)
+                if not entity_id:
+                    continue
+                entry = self._entry(kind, entity_id, doc, datetime.now(timezone.utc))
+                if not entry["terms"]:
+                    # Nothing to match (e.g. a user without a phone number)
+                    continue
+                batch.append(ReplaceOne({"kind": kind, "entity_id": entity_id}, entry, upsert=True))
+                count += 1
+                if len(batch) >= _BATCH:
+                    await self.db.search_index.bulk_write(batch, ordered=False)
+                    batch = []
+            if batch:
+                await self.db.search_index.bulk_write(batch, ordered=False)
+            await self.db.search_index.delete_many({"kind": kind, "updated_at": {"$lt": started}})
+            report[kind] = count
+            logger.info(f"Search index rebuilt {kind}: {count} documents")
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queries": self.queries, "refreshes": self.refreshes, "errors": self.errors}
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+async def _main(argv: Optional[Sequence[str]] = None) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(prog="python -m core.search", description=__doc__.split("\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="re-index source collections")
+    rebuild.add_argument("--kind", action="append", choices=sorted(SOURCES), help="only this kind (repeatable)")
+    query = sub.add_parser("query", help="run a search and print the ranked ids")
+    query.add_argument("kind", choices=sorted(SOURCES))
+    query.add_argument("text")
+    query.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    index = SearchIndex(client[os.environ.get("DB_NAME", "zion_city")])
+    try:
+        if args.command == "rebuild":
+            result: Any = await index.rebuild(args.kind)
+        else:
+            result = {"terms": query_terms(args.text), "ids": await index.search(args.kind, args.text, limit=args.limit)}
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
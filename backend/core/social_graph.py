@@ -0,0 +1,441 @@
+"""
+Social Graph Service for ZION.CITY API
+======================================
+Keeps each user's adjacency sets precomputed so feed, suggestions and search
+do not rebuild them from user_friendships / user_follows / friend_requests /
+channel_subscriptions on every call.
+
+- Loaded lazily per user from MongoDB (no to_list caps, full cursors)
+- Updated incrementally by the write endpoints (follow, friend, subscribe...)
+- Stored in Redis when configured, as sets of 16-byte packed UUIDs so every
+  worker shares one copy; otherwise in a bounded per-process LRU
+- Every update bumps a per-user version. A load records the versions before
+  reading MongoDB and is only stored for users not written to meanwhile, so
+  a write racing a load cannot leave a stale adjacency behind
+
+Usage:
+    from core.social_graph import SocialGraph
+
+    social_graph = SocialGraph(db, get_redis())
+    adj = await social_graph.get(user_id)
+    adj.friends, adj.following, adj.followers, adj.subscriptions
+
+    await social_graph.add_follow(follower_id, target_id)
+"""
+
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+RELATIONS = ("friends", "following", "followers", "subscriptions", "requests_sent", "requests_received")
+
+PENDING_STATUS = "PENDING"
+
+
+@dataclass
+class Adjacency:
+    """Relationship sets of one user."""
+    user_id: str
+    friends: Set[str] = field(default_factory=set)
+    following: Set[str] = field(default_factory=set)
+    followers: Set[str] = field(default_factory=set)
+    subscriptions: Set[str] = field(default_factory=set)  # channel ids
+    requests_sent: Set[str] = field(default_factory=set)  # pending, user ids
+    requests_received: Set[str] = field(default_factory=set)
+
+    @property
+    def network(self) -> Set[str]:
+        """Friends plus people this user follows."""
+        return self.friends | self.following
+
+    @property
+    def pending(self) -> Set[str]:
+        return self.requests_sent | self.requests_received
+
+    def relation(self, name: str) -> Set[str]:
+        return getattr(self, name)
+
+
+# ============================================================
+# COMPACT ID ENCODING
+# ============================================================
+
+def encode_id(value: str) -> bytes:
+    """Canonical UUID strings pack into 16 bytes; other ids are kept as '~' + utf-8."""
+    try:
+        parsed = uuid.UUID(value)
+        if str(parsed) == value:
+            return parsed.bytes
+    except (ValueError, AttributeError, TypeError):
+        pass
+    raw = b"~" + value.encode("utf-8")
+    # Never let a non-UUID id be exactly 16 bytes long (ids never contain NUL)
+    return raw + b"\x00" if len(raw) == 16 else raw
+
+
+def decode_id(raw: bytes) -> str:
+    if len(raw) == 16:
+        return str(uuid.UUID(bytes=raw))
+    body = raw[1:]
+    if body.endswith(b"\x00"):
+        body = body[:-1]
+    return body.decode("utf-8")
+
+
+# ============================================================
+# STORES
+# ============================================================
+
+class LocalGraphStore:
+    """Per-process LRU of adjacency sets."""
+
+    def __init__(self, max_users: int = 50000, ttl: float = 60):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Adjacency]]" = OrderedDict()
+        # Write sequence number per recently written user; older writes are at or below _floor
+        self._seq = 0
+        self._floor = 0
+        self._written: "OrderedDict[str, int]" = OrderedDict()
+
+    async def get_many(self, user_ids: Sequence[str]) -> Dict[str, Adjacency]:
+        now = time.monotonic()
+        found = {}
+        for user_id in user_ids:
+            entry = self._data.get(user_id)
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del self._data[user_id]
+                continue
+            self._data.move_to_end(user_id)
+            found[user_id] = entry[1]
+        return found
+
+    def _bump(self, user_ids: Iterable[str]) -> None:
+        for user_id in user_ids:
+            self._seq += 1
+            self._written[user_id] = self._seq
+            self._written.move_to_end(user_id)
+        while len(self._written) > self.max_users:
+            _, self._floor = self._written.popitem(last=False)
+
+    async def versions(self, user_ids: Sequence[str]) -> int:
+        return self._seq
+
+    async def put_many(self, adjacencies: Iterable[Adjacency], versions: int) -> None:
+        expires_at = time.monotonic() + self.ttl
+        for adj in adjacencies:
+            if self._written.get(adj.user_id, self._floor) > versions:
+                continue
+            self._data[adj.user_id] = (expires_at, adj)
+            self._data.move_to_end(adj.user_id)
+        while len(self._data) > self.max_users:
+            self._data.popitem(last=False)
+
+    async def update(self, user_id: str, relation: str, member: str, add: bool) -> None:
+        self._bump([user_id])
+        entry = self._data.get(user_id)
+        if entry is None:
+            return
+        members = entry[1].relation(relation)
+        if add:
+            members.add(member)
+        else:
+            members.discard(member)
+
+    async def invalidate(self, user_ids: Iterable[str]) -> None:
+        user_ids = list(user_ids)
+        self._bump(user_ids)
+        for user_id in user_ids:
+            self._data.pop(user_id, None)
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "local", "users": len(self._data), "max_users": self.max_users, "ttl": self.ttl}
+
+
+# KEYS[1] = marker key, KEYS[2] = relation set, KEYS[3] = version key;
+# ARGV[1] = SADD|SREM, ARGV[2] = member, ARGV[3] = version TTL in ms.
+# Always bumps the version; only touches users whose adjacency is loaded,
+# and new sets inherit the marker TTL.
+_UPDATE_SCRIPT = """
+redis.call('INCR', KEYS[3])
+redis.call('PEXPIRE', KEYS[3], ARGV[3])
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl <= 0 then return 0 end
+redis.call(ARGV[1], KEYS[2], ARGV[2])
+redis.call('PEXPIRE', KEYS[2], ttl)
+return 1
+"""
+
+
+class RedisGraphStore:
+    """Adjacency sets shared through Redis: one set per (user, relation)."""
+
+    def __init__(self, client: Any, ttl: float = 3600, prefix: str = "zion:sg:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._update = client.register_script(_UPDATE_SCRIPT)
+
+    def _marker(self, user_id: str) -> str:
+        return f"{self.prefix}{user_id}"
+
+    def _set(self, user_id: str, relation: str) -> str:
+        return f"{self.prefix}{user_id}:{relation}"
+
+    def _version(self, user_id: str) -> str:
+        return f"{self.prefix}{user_id}:v"
+
+    async def get_many(self, user_ids: Sequence[str]) -> Dict[str, Adjacency]:
+        if not user_ids:
+            return {}
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.exists(self._marker(user_id))
+                for relation in RELATIONS:
+                    pipe.smembers(self._set(user_id, relation))
+            results = await pipe.execute()
+
+        found = {}
+        width = 1 + len(RELATIONS)
+        for i, user_id in enumerate(user_ids):
+            row = results[i * width:(i + 1) * width]
+            if not row[0]:
+                continue
+            adj = Adjacency(user_id)
+            for relation, members in zip(RELATIONS, row[1:]):
+                adj.relation(relation).update(decode_id(m) for m in members)
+            found[user_id] = adj
+        return found
+
+    async def versions(self, user_ids: Sequence[str]) -> Dict[str, Any]:
+        if not user_ids:
+            return {}
+        return dict(zip(user_ids, await self.client.mget(*[self._version(u) for u in user_ids])))
+
+    async def put_many(self, adjacencies: Iterable[Adjacency], versions: Dict[str, Any]) -> None:
+        from redis.exceptions import WatchError
+
+        adjacencies = [adj for adj in adjacencies if adj.user_id in versions]
+        if not adjacencies:
+            return
+        version_keys = [self._version(adj.user_id) for adj in adjacencies]
+        ttl_ms = int(self.ttl * 1000)
+        async with self.client.pipeline(transaction=True) as pipe:
+            # WATCH aborts the transaction if a write bumps a version before EXEC
+            await pipe.watch(*version_keys)
+            current = await pipe.mget(*version_keys)
+            pipe.multi()
+            for adj, version in zip(adjacencies, current):
+                if version != versions[adj.user_id]:
+                    continue
+                for relation in RELATIONS:
+                    key = self._set(adj.user_id, relation)
+                    pipe.delete(key)
+                    members = adj.relation(relation)
+                    if members:
+                        pipe.sadd(key, *[encode_id(m) for m in members])
+                        pipe.pexpire(key, ttl_ms)
+                pipe.set(self._marker(adj.user_id), b"1", px=ttl_ms)
+            try:
+                await pipe.execute()
+            except WatchError:
+                # Written to while loading: the next read loads it again
+                pass
+
+    async def update(self, user_id: str, relation: str, member: str, add: bool) -> None:
+        await self._update(
+            keys=[self._marker(user_id), self._set(user_id, relation), self._version(user_id)],
+            args=["SADD" if add else "SREM", encode_id(member), int(self.ttl * 1000)],
+        )
+
+    async def invalidate(self, user_ids: Iterable[str]) -> None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        ttl_ms = int(self.ttl * 1000)
+        async with self.client.pipeline(transaction=True) as pipe:
+            for user_id in user_ids:
+                pipe.delete(self._marker(user_id), *[self._set(user_id, relation) for relation in RELATIONS])
+                pipe.incr(self._version(user_id))
+                pipe.pexpire(self._version(user_id), ttl_ms)
+            await pipe.execute()
+
+    async def clear(self) -> None:
+        batch = []
+        async for key in self.client.scan_iter(match=f"{self.prefix}*", count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                await self.client.delete(*batch)
+                batch = []
+        if batch:
+            await self.client.delete(*batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "ttl": self.ttl}
+
+
+# ============================================================
+# SERVICE
+# ============================================================
+
+class SocialGraph:
+    """
+    Read-through adjacency service.
+
+    Writes to MongoDB must happen before the matching add_*/remove_* call.
+    Only users whose adjacency is currently loaded are updated; everyone
+    else is rebuilt from MongoDB on next read, and loaded entries expire
+    after the store TTL as a bound on any missed update.
+    """
+
+    def __init__(self, db, redis_client: Any = None, ttl: float = 3600, local_ttl: float = 60):
+        self.db = db
+        self.store = RedisGraphStore(redis_client, ttl=ttl) if redis_client is not None else LocalGraphStore(ttl=local_ttl)
+        self.loads = 0
+        self.errors = 0
+
+    async def get(self, user_id: str) -> Adjacency:
+        return (await self.get_many([user_id]))[user_id]
+
+    async def get_many(self, user_ids: Iterable[str]) -> Dict[str, Adjacency]:
+        """Adjacency for every requested user; missing ones are loaded in one batch."""
+        user_ids = list(dict.fromkeys(u for u in user_ids if u))
+        try:
+            found = await self.store.get_many(user_ids)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Social graph store read failed, loading from MongoDB: {e}")
+            found = {}
+
+        missing = [u for u in user_ids if u not in found]
+        if missing:
+            # Versions before reading MongoDB: users written to during the load are not stored
+            try:
+                versions = await self.store.versions(missing)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Social graph store read failed: {e}")
+                versions = None
+            loaded = await self._load(missing)
+            self.loads += len(loaded)
+            if versions is not None:
+                try:
+                    await self.store.put_many(loaded.values(), versions)
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Social graph store write failed: {e}")
+            found.update(loaded)
+        return found
+
+    async def _load(self, user_ids: List[str]) -> Dict[str, Adjacency]:
+        adjacencies = {u: Adjacency(u) for u in user_ids}
+        wanted = set(user_ids)
+
+        async for f in self.db.user_friendships.find(
+            {"$or": [{"user1_id": {"$in": user_ids}}, {"user2_id": {"$in": user_ids}}]},
+            {"_id": 0, "user1_id": 1, "user2_id": 1}
+        ):
+            u1, u2 = f["user1_id"], f["user2_id"]
+            if u1 in wanted:
+                adjacencies[u1].friends.add(u2)
+            if u2 in wanted:
+                adjacencies[u2].friends.add(u1)
+
+        async for f in self.db.user_follows.find(
+            {"$or": [{"follower_id": {"$in": user_ids}}, {"target_id": {"$in": user_ids}}]},
+            {"_id": 0, "follower_id": 1, "target_id": 1}
+        ):
+            follower, target = f["follower_id"], f["target_id"]
+            if follower in wanted:
+                adjacencies[follower].following.add(target)
+            if target in wanted:
+                adjacencies[target].followers.add(follower)
+
+        async for s in self.db.channel_subscriptions.find(
+            {"subscriber_id": {"$in": user_ids}},
+            {"_id": 0, "subscriber_id": 1, "channel_id": 1}
+        ):
+            adjacencies[s["subscriber_id"]].subscriptions.add(s["channel_id"])
+
+        async for r in self.db.friend_requests.find(
+            {
+                "status": PENDING_STATUS,
+                "$or": [{"sender_id": {"$in": user_ids}}, {"receiver_id": {"$in": user_ids}}]
+            },
+            {"_id": 0, "sender_id": 1, "receiver_id": 1}
+        ):
+            sender, receiver = r["sender_id"], r["receiver_id"]
+            if sender in wanted:
+                adjacencies[sender].requests_sent.add(receiver)
+            if receiver in wanted:
+                adjacencies[receiver].requests_received.add(sender)
+
+        return adjacencies
+
+    async def _apply(self, changes: Sequence[Tuple[str, str, str]], add: bool) -> None:
+        for user_id, relation, member in changes:
+            try:
+                await self.store.update(user_id, relation, member, add)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Social graph update failed for {user_id}, invalidating: {e}")
+                await self.invalidate(user_id)
+
+    # ---- incremental updates ----
+
+    async def add_friendship(self, user_a: str, user_b: str) -> None:
+        await self._apply([(user_a, "friends", user_b), (user_b, "friends", user_a)], add=True)
+
+    async def remove_friendship(self, user_a: str, user_b: str) -> None:
+        await self._apply([(user_a, "friends", user_b), (user_b, "friends", user_a)], add=False)
+
+    async def add_follow(self, follower_id: str, target_id: str) -> None:
+        await self._apply([(follower_id, "following", target_id), (target_id, "followers", follower_id)], add=True)
+
+    async def remove_follow(self, follower_id: str, target_id: str) -> None:
+        await self._apply([(follower_id, "following", target_id), (target_id, "followers", follower_id)], add=False)
+
+    async def add_friend_request(self, sender_id: str, receiver_id: str) -> None:
+        await self._apply([(sender_id, "requests_sent", receiver_id), (receiver_id, "requests_received", sender_id)], add=True)
+
+    async def remove_friend_request(self, sender_id: str, receiver_id: str) -> None:
+        await self._apply([(sender_id, "requests_sent", receiver_id), (receiver_id, "requests_received", sender_id)], add=False)
+
+    async def add_subscription(self, user_id: str, channel_id: str) -> None:
+        await self._apply([(user_id, "subscriptions", channel_id)], add=True)
+
+    async def remove_subscription(self, user_id: str, channel_id: str) -> None:
+        await self._apply([(user_id, "subscriptions", channel_id)], add=False)
+
+    async def invalidate(self, *user_ids: str) -> None:
+        """Forget users entirely so they are reloaded from MongoDB on next read."""
+        try:
+            await self.store.invalidate(user_ids)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Social graph invalidation failed: {e}")
+
+    async def clear(self) -> None:
+        """
+        Forget every loaded adjacency, after writes that bypass the add_*/remove_*
+        hooks (database restores). Without Redis only this worker's copy is
+        cleared; the others expire theirs after local_ttl.
+        """
+        try:
+            await self.store.clear()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Social graph clear failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.store.stats(), "loads": self.loads, "errors": self.errors}
@@ -0,0 +1,463 @@
+"""
+Storage Backends for ZION.CITY API
+==================================
+Where media bytes live, behind one small interface used by MediaStore.
+
+- LocalStorage: files under the upload root. Content-addressed keys are
+  sharded (blobs/ab/cd/<sha256>) so no directory grows without bound;
+  bytes are served by the API or by nginx (X-Accel-Redirect)
+- S3Storage: any S3-compatible store (AWS S3, MinIO). boto3 is synchronous,
+  so calls run in a thread. Presigned URLs let clients download and upload
+  without passing bytes through the API workers. A presigned upload goes
+  to a per-upload staging key (uploads/<upload_id>) and is pinned to the
+  SHA-256 the client announced, so the store rejects any other body; the
+  object is copied to its content-addressed key only after the store's own
+  checksum was read back. Staging objects of abandoned uploads should be
+  expired by a bucket lifecycle rule on the uploads/ prefix
+- `python -m core.storage migrate` moves what predates this layout: legacy
+  flat files in UPLOAD_DIR (user directories, chat_* / voice_* files) into
+  content-addressed blobs, and local blobs to the configured backend
+
+Configuration:
+    STORAGE_BACKEND=local | s3
+    S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL (MinIO), S3_REGION,
+    S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY, S3_PRESIGN_EXPIRES
+
+Usage:
+    from core.storage import blob_key, storage_from_env
+
+    storage = storage_from_env(UPLOAD_DIR)
+    await storage.put_file(tmp_path, blob_key(sha256), "image/png", move=True)
+    url = await storage.presigned_get(key, filename="a.png", content_type="image/png")
+
+Migration (from backend/):
+    python -m core.storage migrate --dry-run
+    python -m core.storage migrate [--delete-source] [--limit N]
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+LOCAL = "local"
+S3 = "s3"
+
+
+def blob_key(sha256: str) -> str:
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def upload_key(upload_id: str) -> str:
+    """Staging key of a direct upload; never served, copied to blob_key once verified."""
+    return f"uploads/{upload_id}"
+
+
+def variant_prefix(sha256: str) -> str:
+    """Derived files (thumbnails, see core/images.py) live and die with the blob."""
+    return f"{blob_key(sha256)}.variants"
+
+
+def hash_file(path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LocalStorage:
+    """Files under a root directory; keys are relative paths."""
+
+    name = LOCAL
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.root / key
+
+    def location(self, key: str) -> str:
+        return str(self.root / key)
+
+    async def put_file(self, source: Union[str, Path], key: str, content_type: Optional[str] = None, move: bool = False) -> None:
+        target = self.root / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if move:
+            os.replace(source, target)
+        else:
+            await asyncio.to_thread(shutil.copyfile, source, target)
+
+    async def exists(self, key: str) -> bool:
+        return (self.root / key).exists()
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return (await asyncio.to_thread((self.root / key).stat)).st_size
+        except FileNotFoundError:
+            return None
+
+    async def download(self, key: str, target: Union[str, Path]) -> None:
+        await asyncio.to_thread(shutil.copyfile, self.root / key, target)
+
+    async def copy(self, source_key: str, target_key: str) -> None:
+        await self.put_file(self.root / source_key, target_key)
+
+    async def checksum(self, key: str) -> Optional[Tuple[int, str]]:
+        """(size, sha256 hex) of a stored object, or None if it is missing."""
+        path = self.root / key
+        if not path.exists():
+            return None
+        return path.stat().st_size, await asyncio.to_thread(hash_file, path)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread((self.root / key).unlink, missing_ok=True)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        await asyncio.to_thread(shutil.rmtree, self.root / prefix, ignore_errors=True)
+
+    async def presigned_get(self, key: str, **kwargs) -> Optional[str]:
+        return None
+
+    async def presigned_put(self, key: str, **kwargs) -> Optional[Dict[str, Any]]:
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "root": str(self.root)}
+
+
+class S3Storage:
+    """S3-compatible object store; keys are object names below an optional prefix."""
+
+    name = S3
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        presign_expires: int = 3600,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.presign_expires = presign_expires
+        self._client = None
+        self.uploads = 0
+        self.presigned = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            from botocore.config import Config
+
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                config=Config(
+                    signature_version="s3v4",
+                    # MinIO and most self-hosted stores only do path-style addressing
+                    s3={"addressing_style": "path" if self.endpoint_url else "auto"},
+                    request_checksum_calculation="when_required",
+                ),
+            )
+        return self._client
+
+    def _object(self, key: str) -> str:
+        return self.prefix + key
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self._object(key)}"
+
+    async def put_file(self, source: Union[str, Path], key: str, content_type: Optional[str] = None, move: bool = False) -> None:
+        extra = {"ContentType": content_type} if content_type else {}
+        await asyncio.to_thread(self.client.upload_file, str(source), self.bucket, self._object(key), ExtraArgs=extra)
+        self.uploads += 1
+        if move:
+            Path(source).unlink(missing_ok=True)
+
+    async def size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self._object(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+    async def exists(self, key: str) -> bool:
+        return await self.size(key) is not None
+
+    async def download(self, key: str, target: Union[str, Path]) -> None:
+        await asyncio.to_thread(self.client.download_file, self.bucket, self._object(key), str(target))
+
+    async def copy(self, source_key: str, target_key: str) -> None:
+        # Managed copy: server-side, multipart for large objects
+        await asyncio.to_thread(
+            self.client.copy,
+            {"Bucket": self.bucket, "Key": self._object(source_key)},
+            self.bucket,
+            self._object(target_key),
+        )
+
+    async def checksum(self, key: str) -> Optional[Tuple[int, str]]:
+        """
+        (size, sha256 hex) as verified by the store on upload, or None if the
+        object is missing or was stored without a SHA-256 checksum.
+        """
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await asyncio.to_thread(
+                self.client.head_object, Bucket=self.bucket, Key=self._object(key), ChecksumMode="ENABLED"
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        checksum = head.get("ChecksumSHA256")
+        if not checksum or "-" in checksum:
+            # Absent, or a checksum of multipart part checksums rather than of the content
+            return None
+        return head["ContentLength"], base64.b64decode(checksum).hex()
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self._object(key))
+
+    async def delete_prefix(self, prefix: str) -> None:
+        def _delete():
+            paginator = self.client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object(prefix) + "/"):
+                objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+                if objects:
+                    self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+
+        await asyncio.to_thread(_delete)
+
+    async def presigned_get(
+        self, key: str, filename: Optional[str] = None, content_type: Optional[str] = None, expires: Optional[int] = None
+    ) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": self._object(key)}
+        if content_type:
+            params["ResponseContentType"] = content_type
+        if filename:
+            params["ResponseContentDisposition"] = f"inline; filename*=utf-8''{quote(filename)}"
+        self.presigned += 1
+        return await asyncio.to_thread(
+            self.client.generate_presigned_url, "get_object", Params=params, ExpiresIn=expires or self.presign_expires
+        )
+
+    async def presigned_put(
+        self, key: str, content_type: str, size: int, sha256: str, expires: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """URL and headers for a direct PUT; the store verifies the body against sha256."""
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode("ascii")
+        params = {
+            "Bucket": self.bucket,
+            "Key": self._object(key),
+            "ContentType": content_type,
+            "ContentLength": size,
+            "ChecksumSHA256": checksum,
+        }
+        url = await asyncio.to_thread(
+            self.client.generate_presigned_url, "put_object", Params=params, ExpiresIn=expires or self.presign_expires
+        )
+        self.presigned += 1
+        return {
+            "method": "PUT",
+            "url": url,
+            "headers": {"Content-Type": content_type, "x-amz-checksum-sha256": checksum},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "bucket": self.bucket,
+            "uploads": self.uploads,
+            "presigned": self.presigned,
+        }
+
+
+def storage_from_env(root: Union[str, Path]) -> Union[LocalStorage, S3Storage]:
+    if os.environ.get("STORAGE_BACKEND", LOCAL).lower() == S3:
+        return S3Storage(
+            bucket=os.environ["S3_BUCKET"],
+            prefix=os.environ.get("S3_PREFIX", ""),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+            region=os.environ.get("S3_REGION") or None,
+            access_key=os.environ.get("S3_ACCESS_KEY_ID") or None,
+            secret_key=os.environ.get("S3_SECRET_ACCESS_KEY") or None,
+            presign_expires=int(os.environ.get("S3_PRESIGN_EXPIRES", 3600)),
+        )
+    return LocalStorage(root)
+
+
+# ============================================================
+# MIGRATION
+# ============================================================
+
+async def adopt_chat_files(db, root: Path, dry_run: bool = False, limit: int = 0) -> int:
+    """Create media_files rows for chat attachments / voice messages that were written as bare files."""
+    adopted = 0
+    for field in ("attachment", "voice"):
+        cursor = db.chat_messages.find(
+            {f"{field}.stored_filename": {"$exists": True}, f"{field}.media_id": {"$exists": False}},
+            {"_id": 0, "id": 1, "user_id": 1, "direct_chat_id": 1, "group_id": 1, "created_at": 1, field: 1},
+        )
+        async for message in cursor:
+            info = message[field]
+            path = root / info["stored_filename"]
+            if not path.is_file():
+                continue
+            adopted += 1
+            if dry_run:
+                continue
+            media_id = str(uuid.uuid4())
+            await db.media_files.insert_one({
+                "id": media_id,
+                "original_filename": info.get("filename") or info["stored_filename"],
+                "stored_filename": info["stored_filename"],
+                "file_path": str(path),
+                "file_type": "audio" if field == "voice" else ("image" if str(info.get("mime_type", "")).startswith("image/") else "document"),
+                "mime_type": info.get("mime_type") or mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+                "file_size": path.stat().st_size,
+                "uploaded_by": message.get("user_id"),
+                "source_module": "chat",
+                "privacy_level": "private",
+                "metadata": {"chat_id": message.get("direct_chat_id") or message.get("group_id")},
+                "created_at": message.get("created_at") or datetime.now(timezone.utc),
+            })
+            await db.chat_messages.update_one({"id": message["id"]}, {"$set": {f"{field}.media_id": media_id, "updated_at": datetime.now(timezone.utc)}})
+            if limit and adopted >= limit:
+                return adopted
+    return adopted
+
+
+async def migrate_legacy_files(db, store, dry_run: bool = False, delete_source: bool = False, limit: int = 0) -> Dict[str, int]:
+    """
+    Hash media_files rows that still point at a flat file and move them into
+    content-addressed blobs, counting references through store (a MediaStore).
+    """
+    report = {"migrated": 0, "missing": 0, "bytes": 0}
+    cursor = db.media_files.find({"sha256": None}, {"_id": 0, "id": 1, "file_path": 1, "mime_type": 1})
+    async for media in cursor:
+        source = Path(media.get("file_path") or "")
+        if not source.is_file():
+            report["missing"] += 1
+            continue
+        size = source.stat().st_size
+        report["migrated"] += 1
+        report["bytes"] += size
+        if dry_run:
+            continue
+        sha256 = await asyncio.to_thread(hash_file, source)
+        blob = await store.store_file(source, sha256, size, media.get("mime_type"), move=delete_source)
+        await db.media_files.update_one(
+            {"id": media["id"]},
+            {"$set": {"sha256": sha256, "storage_key": blob.key, "file_path": blob.path, "file_size": size}},
+        )
+        if limit and report["migrated"] >= limit:
+            break
+    return report
+
+
+async def migrate_blobs(db, source: LocalStorage, storage, dry_run: bool = False, delete_source: bool = False, limit: int = 0) -> Dict[str, int]:
+    """Copy local blobs (and their variants) to another backend, e.g. local disk -> S3."""
+    report = {"migrated": 0, "missing": 0, "bytes": 0}
+    if storage.name == LOCAL:
+        return report
+    cursor = db.media_blobs.find({"backend": {"$in": [LOCAL, None]}}, {"_id": 0, "sha256": 1, "size": 1})
+    async for blob in cursor:
+        sha256 = blob["sha256"]
+        key = blob_key(sha256)
+        path = source.local_path(key)
+        if not path.is_file():
+            report["missing"] += 1
+            continue
+        report["migrated"] += 1
+        report["bytes"] += blob.get("size", 0)
+        if dry_run:
+            continue
+        if not await storage.exists(key):
+            await storage.put_file(path, key)
+        variants = source.local_path(variant_prefix(sha256))
+        if variants.is_dir():
+            for item in variants.iterdir():
+                await storage.put_file(item, f"{variant_prefix(sha256)}/{item.name}", mimetypes.guess_type(item.name)[0])
+        await db.media_blobs.update_one({"sha256": sha256}, {"$set": {"backend": storage.name, "key": key}})
+        await db.media_files.update_many(
+            {"sha256": sha256}, {"$set": {"storage_key": key, "file_path": storage.location(key)}}
+        )
+        if delete_source:
+            await source.delete(key)
+            await source.delete_prefix(variant_prefix(sha256))
+        if limit and report["migrated"] >= limit:
+            break
+    return report
+
+
+async def _main(argv: Optional[Sequence[str]] = None) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from .media import MediaStore  # imports this module
+
+    parser = argparse.ArgumentParser(prog="python -m core.storage", description=__doc__.split("\n")[1])
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--root", default="uploads", help="upload directory (UPLOAD_DIR)")
+    parser.add_argument("--dry-run", action="store_true", help="count what would move")
+    parser.add_argument("--delete-source", action="store_true", help="remove files once they are migrated")
+    parser.add_argument("--limit", type=int, default=0, help="stop after N files per step")
+    args = parser.parse_args(argv)
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ.get("DB_NAME", "zion_city")]
+    root = Path(args.root)
+    storage = storage_from_env(root)
+    options = {"dry_run": args.dry_run, "limit": args.limit}
+    try:
+        report = {
+            "backend": storage.name,
+            "adopted_chat_files": await adopt_chat_files(db, root, **options),
+            "legacy_files": await migrate_legacy_files(
+                db, MediaStore(db, root, storage=storage), delete_source=args.delete_source, **options
+            ),
+            "blobs": await migrate_blobs(db, LocalStorage(root), storage, delete_source=args.delete_source, **options),
+        }
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
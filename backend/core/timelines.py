@@ -0,0 +1,432 @@
+"""
+News Feed Timelines for ZION.CITY API
+=====================================
+Fan-out-on-write timelines for /news/posts/feed.
+
+- POST /news/posts pushes the post id into the timeline of every user who
+  may see it (author, friends / followers by visibility, channel subscribers)
+- Authors and channels with more than `fanout_limit` followers/subscribers
+  become "pull sources": their posts are not copied, they are merged into
+  the feed at read time with a small indexed query (fan-out on read)
+- Timelines are capped per user and built lazily from news_posts the first
+  time a user opens the feed
+- Pages are addressed by opaque (created_at, post id) cursors, so page cost
+  does not depend on how deep the client has scrolled
+
+Collections:
+    news_timelines           {owner_id, post_id, author_id, channel_id, created_at}
+    news_timeline_state      {user_id, built_at}
+    news_feed_pull_sources   {kind: "user" | "channel", source_id, audience, created_at}
+
+Usage:
+    from core.timelines import FeedTimelines
+
+    timelines = FeedTimelines(db, social_graph, cache)
+    await timelines.fan_out(post_doc)                   # after insert
+    page = await timelines.read(adjacency, limit=20, cursor=cursor)
+    page.posts, page.next_cursor, page.has_more
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+NETWORK_VISIBILITIES = ("PUBLIC", "FRIENDS_AND_FOLLOWERS")  # visible to friends and followers
+FRIENDS_VISIBILITY = "FRIENDS_ONLY"
+
+PULL_SOURCES_CACHE_KEY = "feed:pull_sources"
+
+_INSERT_BATCH = 1000
+
+
+class InvalidCursor(ValueError):
+    """Raised when a feed cursor cannot be decoded."""
+
+
+# ============================================================
+# CURSORS
+# ============================================================
+
+def encode_cursor(created_at: datetime, post_id: str) -> str:
+    raw = json.dumps({"t": created_at.isoformat(), "id": post_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(data["t"]), str(data["id"])
+    except Exception as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def _before(created_at: datetime, post_id: str, id_field: str) -> Dict[str, Any]:
+    """Query clause for entries strictly after a cursor in (created_at desc, id desc) order."""
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, id_field: {"$lt": post_id}},
+    ]}
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Motor returns naive UTC datetimes; compare everything naive
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+# ============================================================
+# TIMELINES
+# ============================================================
+
+@dataclass
+class FeedPage:
+    """One page of a user's feed, newest first."""
+    posts: List[Dict[str, Any]] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+
+def is_visible(post: Dict[str, Any], adjacency: Any) -> bool:
+    """Same visibility rules as the feed query: own posts, network posts by visibility, subscribed channels."""
+    author_id = post.get("user_id")
+    if author_id == adjacency.user_id:
+        return True
+    if post.get("channel_id") and post["channel_id"] in adjacency.subscriptions:
+        return True
+    visibility = post.get("visibility")
+    if visibility == FRIENDS_VISIBILITY:
+        return author_id in adjacency.friends
+    if visibility in NETWORK_VISIBILITIES:
+        return author_id in adjacency.friends or author_id in adjacency.following
+    return False
+
+
+class FeedTimelines:
+    """
+    Per-user news timelines stored in MongoDB.
+
+    Timelines are a delivery index only: every page re-reads the posts
+    from news_posts and re-checks visibility against the current
+    adjacency, so deleted posts, edited visibility and unfollows take
+    effect immediately even though their timeline entries linger until
+    trimmed.
+    """
+
+    def __init__(
+        self,
+        db,
+        social_graph: Any,
+        cache: Any,
+        max_entries: int = 800,
+        fanout_limit: int = 5000,
+        backfill_size: int = 50,
+        trim_probability: float = 0.05,
+    ):
+        self.db = db
+        self.social_graph = social_graph
+        self.cache = cache
+        self.max_entries = max_entries
+        self.fanout_limit = fanout_limit
+        self.backfill_size = backfill_size
+        self.trim_probability = trim_probability
+        self.fanouts = 0
+        self.delivered = 0
+        self.rebuilds = 0
+        self.errors = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    # ---- pull sources ----
+
+    async def pull_sources(self) -> Dict[str, Set[str]]:
+        """Users and channels whose posts are merged at read time."""
+        async def load():
+            sources = {"user": [], "channel": []}
+            async for doc in self.db.news_feed_pull_sources.find({}, {"_id": 0, "kind": 1, "source_id": 1}):
+                sources.setdefault(doc["kind"], []).append(doc["source_id"])
+            return sources
+
+        sources = await self.cache.get_or_load(PULL_SOURCES_CACHE_KEY, load, ttl=60)
+        return {"user": set(sources.get("user", ())), "channel": set(sources.get("channel", ()))}
+
+    async def _register_pull_source(self, kind: str, source_id: str, audience: int) -> None:
+        await self.db.news_feed_pull_sources.update_one(
+            {"kind": kind, "source_id": source_id},
+            {
+                "$set": {"audience": audience},
+                "$setOnInsert": {"created_at": datetime.now(timezone.utc)},
+            },
+            upsert=True,
+        )
+        await self.cache.delete(PULL_SOURCES_CACHE_KEY)
+        logger.info(f"Feed: {kind} {source_id} switched to fan-out on read ({audience} recipients)")
+
+    # ---- writes ----
+
+    async def _insert(self, owner_ids: Iterable[str], post: Dict[str, Any]) -> int:
+        """Insert one post into many timelines; duplicates are ignored."""
+        from pymongo.errors import BulkWriteError
+
+        entry = {
+            "post_id": post["id"],
+            "author_id": post["user_id"],
+            "channel_id": post.get("channel_id"),
+            "created_at": post["created_at"],
+        }
+        owners = list(owner_ids)
+        inserted = 0
+        for start in range(0, len(owners), _INSERT_BATCH):
+            docs = [{"owner_id": owner_id, **entry} for owner_id in owners[start:start + _INSERT_BATCH]]
+            try:
+                result = await self.db.news_timelines.insert_many(docs, ordered=False)
+                inserted += len(result.inserted_ids)
+            except BulkWriteError as e:
+                inserted += e.details.get("nInserted", 0)
+        return inserted
+
+    async def _insert_posts(self, owner_id: str, posts: List[Dict[str, Any]]) -> None:
+        from pymongo.errors import BulkWriteError
+
+        docs = [
+            {
+                "owner_id": owner_id,
+                "post_id": p["id"],
+                "author_id": p["user_id"],
+                "channel_id": p.get("channel_id"),
+                "created_at": p["created_at"],
+            }
+            for p in posts
+        ]
+        if not docs:
+            return
+        try:
+            await self.db.news_timelines.insert_many(docs, ordered=False)
+        except BulkWriteError:
+            pass  # already present
+
+    async def fan_out(self, post: Dict[str, Any], background: bool = False) -> None:
+        """
+        Deliver a freshly inserted post. The author's own timeline is written
+        before returning; with background=True everyone else is delivered by
+        a task so the request does not wait on large audiences.
+        """
+        await self._insert([post["user_id"]], post)
+        if not background:
+            await self._deliver(post)
+            return
+        task = asyncio.create_task(self._deliver(post))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, post: Dict[str, Any]) -> None:
+        author_id = post["user_id"]
+        try:
+            sources = await self.pull_sources()
+            recipients: Set[str] = set()
+
+            if author_id not in sources["user"]:
+                adjacency = await self.social_graph.get(author_id)
+                if len(adjacency.followers) > self.fanout_limit:
+                    await self._register_pull_source("user", author_id, len(adjacency.followers))
+                elif post.get("visibility") == FRIENDS_VISIBILITY:
+                    recipients |= adjacency.friends
+                else:
+                    recipients |= adjacency.friends | adjacency.followers
+
+            channel_id = post.get("channel_id")
+            if channel_id and channel_id not in sources["channel"]:
+                subscribers = await self.db.channel_subscriptions.distinct("subscriber_id", {"channel_id": channel_id})
+                if len(subscribers) > self.fanout_limit:
+                    await self._register_pull_source("channel", channel_id, len(subscribers))
+                else:
+                    recipients.update(subscribers)
+
+            recipients.discard(author_id)
+            self.fanouts += 1
+            self.delivered += await self._insert(recipients, post) if recipients else 0
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Feed fan-out failed for post {post.get('id')}: {e}")
+
+    async def remove_post(self, post_id: str) -> None:
+        await self.db.news_timelines.delete_many({"post_id": post_id})
+
+    async def backfill_author(self, owner_id: str, author_id: str, friend: bool) -> None:
+        """Copy an author's recent posts into a timeline after a follow / new friendship."""
+        if not await self._is_built(owner_id) or author_id in (await self.pull_sources())["user"]:
+            return
+        query: Dict[str, Any] = {"user_id": author_id, "is_active": True}
+        if not friend:
+            query["visibility"] = {"$in": list(NETWORK_VISIBILITIES)}
+        posts = await self._recent(query, self.backfill_size)
+        await self._insert_posts(owner_id, posts)
+
+    async def backfill_channel(self, owner_id: str, channel_id: str) -> None:
+        """Copy a channel's recent posts into a timeline after subscribing."""
+        if not await self._is_built(owner_id) or channel_id in (await self.pull_sources())["channel"]:
+            return
+        posts = await self._recent({"channel_id": channel_id, "is_active": True}, self.backfill_size)
+        await self._insert_posts(owner_id, posts)
+
+    async def _recent(self, query: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        return await self.db.news_posts.find(
+            query,
+            {"_id": 0, "id": 1, "user_id": 1, "channel_id": 1, "created_at": 1}
+        ).sort([("created_at", -1), ("id", -1)]).limit(limit).to_list(limit)
+
+    # ---- lazy build ----
+
+    async def rebuild(self) -> int:
+        """Drop every timeline and build-state row; timelines are rebuilt on their owner's next feed read."""
+        await self.db.news_timelines.delete_many({})
+        result = await self.db.news_timeline_state.delete_many({})
+        return result.deleted_count
+
+    async def _is_built(self, user_id: str) -> bool:
+        state = await self.db.news_timeline_state.find_one({"user_id": user_id}, {"_id": 1})
+        return state is not None
+
+    async def _ensure_built(self, adjacency: Any) -> None:
+        """Build a timeline from news_posts the first time a user reads the feed."""
+        user_id = adjacency.user_id
+        if await self._is_built(user_id):
+            return
+        network = list(adjacency.network)
+        query = {
+            "is_active": True,
+            "$or": [
+                {"user_id": user_id},
+                {"visibility": {"$in": list(NETWORK_VISIBILITIES)}, "user_id": {"$in": network}},
+                {"visibility": FRIENDS_VISIBILITY, "user_id": {"$in": list(adjacency.friends)}},
+                {"channel_id": {"$in": list(adjacency.subscriptions)}},
+            ],
+        }
+        posts = await self._recent(query, self.max_entries)
+        await self._insert_posts(user_id, posts)
+        await self.db.news_timeline_state.update_one(
+            {"user_id": user_id},
+            {"$set": {"built_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        self.rebuilds += 1
+
+    async def _trim(self, user_id: str) -> None:
+        """Drop entries beyond max_entries (runs on a sample of first-page reads)."""
+        boundary = await self.db.news_timelines.find(
+            {"owner_id": user_id}, {"_id": 0, "created_at": 1, "post_id": 1}
+        ).sort([("created_at", -1), ("post_id", -1)]).skip(self.max_entries).limit(1).to_list(1)
+        if boundary:
+            await self.db.news_timelines.delete_many({
+                "owner_id": user_id,
+                "$or": [
+                    {"created_at": {"$lt": boundary[0]["created_at"]}},
+                    {"created_at": boundary[0]["created_at"], "post_id": {"$lte": boundary[0]["post_id"]}},
+                ],
+            })
+
+    # ---- reads ----
+
+    async def _candidates(
+        self,
+        adjacency: Any,
+        sources: Dict[str, Set[str]],
+        limit: int,
+        after: Optional[Tuple[datetime, str]],
+    ) -> List[Tuple[datetime, str]]:
+        """Next `limit` (created_at, post_id) keys from the timeline merged with pull sources."""
+        timeline_query: Dict[str, Any] = {"owner_id": adjacency.user_id}
+        if after:
+            timeline_query.update(_before(after[0], after[1], "post_id"))
+        entries = await self.db.news_timelines.find(
+            timeline_query, {"_id": 0, "created_at": 1, "post_id": 1}
+        ).sort([("created_at", -1), ("post_id", -1)]).limit(limit).to_list(limit)
+        keys = {e["post_id"]: _as_utc(e["created_at"]) for e in entries}
+
+        pull_friends = list(sources["user"] & adjacency.friends)
+        pull_following = list((sources["user"] & adjacency.following) - adjacency.friends)
+        pull_channels = list(sources["channel"] & adjacency.subscriptions)
+        branches = []
+        if pull_friends:
+            branches.append({"user_id": {"$in": pull_friends}})
+        if pull_following:
+            branches.append({"user_id": {"$in": pull_following}, "visibility": {"$in": list(NETWORK_VISIBILITIES)}})
+        if pull_channels:
+            branches.append({"channel_id": {"$in": pull_channels}})
+        if branches:
+            pull_query: Dict[str, Any] = {"is_active": True, "$or": branches}
+            if after:
+                pull_query = {"$and": [pull_query, _before(after[0], after[1], "id")]}
+            for p in await self._recent(pull_query, limit):
+                keys.setdefault(p["id"], _as_utc(p["created_at"]))
+
+        ordered = sorted(((t, pid) for pid, t in keys.items()), reverse=True)
+        return ordered[:limit]
+
+    async def read(
+        self,
+        adjacency: Any,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+    ) -> FeedPage:
+        """
+        One page of the feed for adjacency.user_id.
+
+        `offset` is supported for old clients only: it is resolved by walking
+        the timeline from the top, so prefer `cursor`.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        await self._ensure_built(adjacency)
+        if after is None and random.random() < self.trim_probability:
+            await self._trim(adjacency.user_id)
+
+        sources = await self.pull_sources()
+        if offset and after is None:
+            skipped = await self._candidates(adjacency, sources, offset, None)
+            if len(skipped) < offset:
+                return FeedPage()
+            after = skipped[-1]
+
+        page = FeedPage()
+        # Entries that are no longer visible are filtered out here, so keep
+        # reading until the page is full or the timeline runs out
+        for _ in range(5):
+            needed = limit - len(page.posts)
+            keys = await self._candidates(adjacency, sources, needed + 1, after)
+            page.has_more = len(keys) > needed
+            keys = keys[:needed]
+            if not keys:
+                break
+            posts = await self.db.news_posts.find(
+                {"id": {"$in": [pid for _, pid in keys]}, "is_active": True},
+                {"_id": 0}
+            ).to_list(len(keys))
+            by_id = {p["id"]: p for p in posts}
+            for key in keys:
+                post = by_id.get(key[1])
+                if post is not None and is_visible(post, adjacency):
+                    page.posts.append(post)
+            after = keys[-1]
+            if len(page.posts) >= limit or not page.has_more:
+                break
+
+        if page.has_more and after is not None:
+            page.next_cursor = encode_cursor(after[0], after[1])
+        return page
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fanouts": self.fanouts,
+            "delivered": self.delivered,
+            "rebuilds": self.rebuilds,
+            "errors": self.errors,
+            "pending_fanouts": len(self._tasks),
+            "max_entries": self.max_entries,
+            "fanout_limit": self.fanout_limit,
+        }
@@ -0,0 +1,295 @@
+"""
+People Typeahead for ZION.CITY API
+==================================
+Autocomplete for people and contact pickers, answered from one compact
+collection instead of regex scans over users.
+
+- Each user has one entry with the edge n-grams (prefixes up to
+  MAX_PREFIX characters) of their normalized name words and email, plus the
+  display fields pickers render, so a keystroke is a single indexed query
+  and no per-hit user lookups
+- Every query word must be the start of some name word ("ив пет" finds
+  Иван Петров); words longer than MAX_PREFIX are checked in full after the
+  indexed lookup
+- Results from the caller's circle come first: friends and family, then
+  colleagues (same organization), then people they follow / who follow
+  them. The circle is queried first, one small indexed query per
+  relationship rank; the rest of the directory fills the remaining slots
+- Relationship flags (is_friend, is_following, request_sent, is_family,
+  is_colleague) are attached from the social graph adjacency and a cached
+  family / colleague set per user
+- Writes call refresh(user_id) after changing a user's name, email or
+  picture; rebuild() indexes everyone. Family and organization membership
+  writes call invalidate_circles() so the cached circles of everyone in
+  that family / organization are reloaded
+
+Collections:
+    user_typeahead: {user_id, prefixes, words, first_name, last_name, ..., updated_at}
+
+Usage:
+    from core.typeahead import PeopleTypeahead
+
+    typeahead = PeopleTypeahead(db, social_graph, cache)
+    people = await typeahead.suggest(current_user.id, "ив пет", limit=10)
+    await typeahead.refresh(user_id)                       # after a profile write
+    await typeahead.invalidate_circles(family_ids=[family_id])   # after a membership write
+"""
+
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+MAX_PREFIX = 12
+
+NAME_FIELDS = ("first_name", "last_name", "middle_name", "name", "surname", "username")
+DISPLAY_FIELDS = (
+    "first_name", "last_name", "middle_name", "name", "surname", "username",
+    "email", "profile_picture", "avatar_url", "address_city",
+)
+
+# Rank of each relationship; the strongest one a person has wins
+FRIEND = 4
+FAMILY = 4
+COLLEAGUE = 3
+FOLLOWING = 2
+FOLLOWER = 1
+
+_WORD = re.compile(r"[^\W_]+")
+_BATCH = 500
+
+
+def normalize_words(text: str) -> List[str]:
+    return _WORD.findall(text.lower().replace("ё", "е"))
+
+
+def entry_words(user: Dict[str, Any]) -> List[str]:
+    """Name words and the email (whole, local part words) of a user document."""
+    words: List[str] = []
+    for field in NAME_FIELDS:
+        value = user.get(field)
+        if isinstance(value, str):
+            words.extend(normalize_words(value))
+    email = user.get("email")
+    if isinstance(email, str) and email:
+        words.append(email.strip().lower())
+        words.extend(normalize_words(email.split("@")[0]))
+    return list(dict.fromkeys(words))
+
+
+def edge_ngrams(words: Iterable[str]) -> List[str]:
+    prefixes: Set[str] = set()
+    for word in words:
+        for n in range(1, min(len(word), MAX_PREFIX) + 1):
+            prefixes.add(word[:n])
+    return sorted(prefixes)
+
+
+def query_keys(text: str) -> List[str]:
+    """Query words (an email is kept whole)."""
+    text = text.strip().lower()
+    if "@" in text:
+        return [text.replace("ё", "е")]
+    return list(dict.fromkeys(normalize_words(text)))
+
+
+class PeopleTypeahead:
+    """Prefix lookups over user_typeahead, ranked by the caller's relationships."""
+
+    def __init__(self, db, social_graph, cache: Any, circle_ttl: float = 300, circle_limit: int = 5000):
+        self.db = db
+        self.social_graph = social_graph
+        self.cache = cache
+        self.circle_ttl = circle_ttl
+        self.circle_limit = circle_limit
+        self.queries = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    # ---- index ----
+
+    @staticmethod
+    def _entry(user: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        words = entry_words(user)
+        entry = {f: user.get(f) for f in DISPLAY_FIELDS if user.get(f) is not None}
+        entry.update({"user_id": user["id"], "words": words, "prefixes": edge_ngrams(words), "updated_at": now})
+        return entry
+
+    async def refresh(self, user_id: Optional[str]) -> None:
+        """Re-index one user (removes the entry if the user is gone). Never raises."""
+        if not user_id:
+            return
+        try:
+            user = await self.db.users.find_one(
+                {"id": user_id}, {"_id": 0, "id": 1, **{f: 1 for f in DISPLAY_FIELDS}}
+            )
+            if user is None:
+                await self.db.user_typeahead.delete_one({"user_id": user_id})
+            else:
+                await self.db.user_typeahead.replace_one(
+                    {"user_id": user_id}, self._entry(user, datetime.now(timezone.utc)), upsert=True
+                )
+            self.refreshes += 1
+        except Exception as e:
+            # The profile write already succeeded; the next rebuild repairs a missed refresh
+            self.errors += 1
+            logger.warning(f"Typeahead refresh failed for {user_id}: {e}")
+
+    async def remove(self, user_id: Optional[str]) -> None:
+        if user_id:
+            await self.db.user_typeahead.delete_one({"user_id": user_id})
+
+    async def rebuild(self) -> int:
+        """Index every user and drop entries of deleted users."""
+        from pymongo import ReplaceOne
+
+        started = datetime.now(timezone.utc)
+        batch: List[Any] = []
+        count = 0
+        async for user in self.db.users.find({}, {"_id": 0, "id": 1, **{f: 1 for f in DISPLAY_FIELDS}}):
+            if not user.get("id"):
+                continue
+            batch.append(ReplaceOne({"user_id": user["id"]}, self._entry(user, datetime.now(timezone.utc)), upsert=True))
+            count += 1
+            if len(batch) >= _BATCH:
+                await self.db.user_typeahead.bulk_write(batch, ordered=False)
+                batch = []
+        if batch:
+            await self.db.user_typeahead.bulk_write(batch, ordered=False)
+        await self.db.user_typeahead.delete_many({"updated_at": {"$lt": started}})
+        logger.info(f"Typeahead rebuilt: {count} users")
+        return count
+
+    # ---- relationships ----
+
+    async def _load_circle(self, user_id: str) -> Dict[str, List[str]]:
+        family: Set[str] = set()
+        family_ids = await self.db.family_members.distinct(
+            "family_id", {"user_id": user_id, "is_active": True, "invitation_accepted": True}
+        )
+        if family_ids:
+            family.update(await self.db.family_members.distinct(
+                "user_id", {"family_id": {"$in": family_ids}, "is_active": True, "invitation_accepted": True}
+            ))
+        colleagues: List[str] = []
+        org_ids = await self.db.work_members.distinct("organization_id", {"user_id": user_id, "status": "ACTIVE"})
+        if org_ids:
+            cursor = self.db.work_members.find(
+                {"organization_id": {"$in": org_ids}, "status": "ACTIVE"}, {"_id": 0, "user_id": 1}
+            ).limit(self.circle_limit)
+            colleagues = list({m["user_id"] async for m in cursor})
+        family.discard(user_id)
+        return {"family": sorted(family), "colleagues": [c for c in colleagues if c != user_id]}
+
+    async def invalidate_circles(
+        self,
+        user_ids: Iterable[str] = (),
+        family_ids: Iterable[str] = (),
+        organization_ids: Iterable[str] = (),
+    ) -> None:
+        """
+        Drop cached circles of user_ids and of every member (current or
+        former) of family_ids / organization_ids. Call after the membership
+        write; a removed membership must still be in the collection or its
+        user passed in user_ids. Never raises.
+        """
+        users: Set[str] = {u for u in user_ids if u}
+        try:
+            family_ids = [f for f in family_ids if f]
+            if family_ids:
+                users.update(await self.db.family_members.distinct("user_id", {"family_id": {"$in": family_ids}}))
+            organization_ids = [o for o in organization_ids if o]
+            if organization_ids:
+                users.update(await self.db.work_members.distinct(
+                    "user_id", {"organization_id": {"$in": organization_ids}}
+                ))
+            users.discard(None)
+            if users:
+                await self.cache.invalidate_tag(*(f"typeahead-circle:{u}" for u in users))
+        except Exception as e:
+            # Stale circles only reorder suggestions, and expire after circle_ttl
+            self.errors += 1
+            logger.warning(f"Typeahead circle invalidation failed: {e}")
+
+    async def circle(self, user_id: str) -> Dict[str, List[str]]:
+        """Family members and colleagues of a user (cached for circle_ttl seconds)."""
+        key = f"typeahead-circle:{user_id}"
+        return await self.cache.get_or_load(key, lambda: self._load_circle(user_id), ttl=self.circle_ttl, tags=[key])
+
+    # ---- queries ----
+
+    async def _find(self, keys: List[str], user_filter: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        prefixes = [k[:MAX_PREFIX] for k in keys]
+        cursor = self.db.user_typeahead.find(
+            {"prefixes": {"$all": prefixes}, "user_id": user_filter},
+            {"_id": 0, "prefixes": 0, "updated_at": 0},
+        ).limit(limit)
+        found = []
+        async for entry in cursor:
+            # Indexed prefixes stop at MAX_PREFIX characters; check longer query words in full
+            if all(any(w.startswith(k) for w in entry["words"]) for k in keys if len(k) > MAX_PREFIX):
+                found.append(entry)
+        return found
+
+    async def suggest(self, user_id: str, text: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """People matching text for user_id, circle first, with relationship flags."""
+        self.queries += 1
+        keys = query_keys(text)
+        if not keys or limit <= 0:
+            return []
+
+        adjacency = await self.social_graph.get(user_id)
+        circle = await self.circle(user_id)
+        family, colleagues = set(circle["family"]), set(circle["colleagues"])
+        ranks: Dict[str, int] = {}
+        for ids, rank in (
+            (adjacency.followers, FOLLOWER),
+            (adjacency.following, FOLLOWING),
+            (colleagues, COLLEAGUE),
+            (family, FAMILY),
+            (adjacency.friends, FRIEND),
+        ):
+            for other in ids:
+                ranks[other] = max(rank, ranks.get(other, 0))
+        ranks.pop(user_id, None)
+
+        # Strongest relationships first, so a capped $in still holds the closest people
+        circle_ids = sorted(ranks, key=ranks.get, reverse=True)[:self.circle_limit]
+        # One query per rank, strongest first: a limited query over the whole circle
+        # could fill the page with followers and leave friends out
+        found: List[Dict[str, Any]] = []
+        for rank in sorted(set(ranks.values()), reverse=True):
+            if len(found) >= limit:
+                break
+            tier = [u for u in circle_ids if ranks[u] == rank]
+            if tier:
+                found.extend(await self._find(keys, {"$in": tier}, limit - len(found)))
+        if len(found) < limit:
+            seen = {e["user_id"] for e in found}
+            others = await self._find(keys, {"$nin": [user_id, *seen]}, limit - len(found))
+            found.extend(others)
+
+        def score(entry: Dict[str, Any]):
+            whole = sum(1 for k in keys if k in entry["words"])
+            name = f"{entry.get('first_name') or entry.get('name') or ''} {entry.get('last_name') or ''}".lower()
+            return (-ranks.get(entry["user_id"], 0), -whole, name)
+
+        people = []
+        for entry in sorted(found, key=score)[:limit]:
+            other = entry.pop("user_id")
+            entry.pop("words", None)
+            people.append({
+                "id": other,
+                **entry,
+                "is_friend": other in adjacency.friends,
+                "is_following": other in adjacency.following,
+                "request_sent": other in adjacency.requests_sent,
+                "is_family": other in family,
+                "is_colleague": other in colleagues,
+            })
+        return people
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queries": self.queries, "refreshes": self.refreshes, "errors": self.errors}
@@ -0,0 +1,226 @@
+"""
+Worker Pools for ZION.CITY API
+==============================
+Shared process and thread pools for work that must not run on the event loop.
+
+- cpu(kind, fn, *args) runs pure-Python CPU work (document parsing, QR
+  codes, image variants) in a spawn process pool; fn and its arguments must
+  be picklable, i.e. module-level functions in modules that are cheap to
+  import (not server.py)
+- io(kind, fn, *args) runs blocking calls in a thread pool: synchronous file
+  system calls and C code that releases the GIL (bcrypt)
+- Every task kind has a concurrency limit. Callers above it wait on an
+  asyncio semaphore instead of filling the pool, so a burst of one kind
+  (a login storm, a batch of photo uploads) cannot starve the others
+- Per kind: running / waiting / completed / failed counters, queue time
+  (submit to worker start, including the semaphore wait) and run time,
+  with averages, maxima and p95 over recent tasks
+- A worker process that dies (e.g. out of memory on a huge file) breaks the
+  process pool; the failing tasks raise and the next task starts a new pool
+- Pools and limits are per gunicorn worker: each of the 13 workers (see
+  gunicorn.conf.py) starts its own pools on first use, so the machine runs up
+  to 13 x CPU_WORKERS processes and 13 x limit tasks of a kind. Size them
+  for the whole host, not for one worker
+
+Configuration (per gunicorn worker):
+    CPU_WORKERS=2              # process pool size
+    IO_WORKERS=8               # thread pool size
+    WORKER_LIMIT_<KIND>=n      # concurrency limit of a kind (e.g. WORKER_LIMIT_PASSWORD=4)
+
+Usage:
+    from core.workers import DOCUMENTS, PASSWORD, WorkerPools
+
+    pools = WorkerPools.from_env()
+    ok = await pools.io(PASSWORD, pwd_context.verify, password, password_hash)
+    text = await pools.cpu(DOCUMENTS, extract_text_from_file, content, filename)
+    await pools.stop()                                    # in lifespan
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Task kinds
+PASSWORD = "password"
+QR_CODES = "qr_codes"
+DOCUMENTS = "documents"
+IMAGES = "images"
+FILES = "files"
+
+DEFAULT_LIMITS = {PASSWORD: 4, QR_CODES: 2, DOCUMENTS: 2, IMAGES: 2, FILES: 8}
+
+_SAMPLES = 512
+
+
+def _timed(fn: Callable, args: Tuple, kwargs: Dict[str, Any]) -> Tuple[float, float, Any]:
+    """Run fn in the worker and report (start, end) wall-clock times with its result."""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time(), result
+
+
+class _KindStats:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.queue_ms: Deque[float] = deque(maxlen=_SAMPLES)
+        self.run_ms: Deque[float] = deque(maxlen=_SAMPLES)
+        self.queue_ms_max = 0.0
+        self.run_ms_max = 0.0
+
+    def record(self, queued: float, ran: float) -> None:
+        self.queue_ms.append(queued)
+        self.run_ms.append(ran)
+        self.queue_ms_max = max(self.queue_ms_max, queued)
+        self.run_ms_max = max(self.run_ms_max, ran)
+
+    @staticmethod
+    def _summary(samples: Deque[float]) -> Tuple[float, float]:
+        if not samples:
+            return 0.0, 0.0
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return round(sum(ordered) / len(ordered), 2), round(p95, 2)
+
+    def snapshot(self) -> Dict[str, Any]:
+        queue_avg, queue_p95 = self._summary(self.queue_ms)
+        run_avg, run_p95 = self._summary(self.run_ms)
+        return {
+            "limit": self.limit,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "queue_ms_avg": queue_avg,
+            "queue_ms_p95": queue_p95,
+            "queue_ms_max": round(self.queue_ms_max, 2),
+            "run_ms_avg": run_avg,
+            "run_ms_p95": run_p95,
+            "run_ms_max": round(self.run_ms_max, 2),
+        }
+
+
+class WorkerPools:
+    """
+    A process pool and a thread pool behind per-kind semaphores, with
+    queue-time metrics. One instance per gunicorn worker process: the
+    limits do not coordinate across workers.
+    """
+
+    def __init__(self, processes: int = 2, threads: int = 8, limits: Optional[Dict[str, int]] = None):
+        self.processes = processes
+        self.threads = threads
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._kinds: Dict[str, _KindStats] = {}
+        self.restarts = 0
+
+    @classmethod
+    def from_env(cls) -> "WorkerPools":
+        limits = {}
+        for kind in DEFAULT_LIMITS:
+            value = os.environ.get(f"WORKER_LIMIT_{kind.upper()}")
+            if value:
+                limits[kind] = int(value)
+        if IMAGES not in limits and os.environ.get("IMAGE_WORKERS"):
+            # Older deployments sized the image pool with IMAGE_WORKERS
+            limits[IMAGES] = int(os.environ["IMAGE_WORKERS"])
+        return cls(
+            processes=int(os.environ.get("CPU_WORKERS", 2)),
+            threads=int(os.environ.get("IO_WORKERS", 8)),
+            limits=limits,
+        )
+
+    def _kind(self, kind: str) -> _KindStats:
+        stats = self._kinds.get(kind)
+        if stats is None:
+            stats = self._kinds[kind] = _KindStats(self.limits.get(kind, max(self.processes, self.threads)))
+        return stats
+
+    def _processes(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that runs Motor's threads is unsafe
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return self._process_pool
+
+    def _threads(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix="zion-io")
+        return self._thread_pool
+
+    async def _run(
+        self, executor: Callable[[], Executor], kind: str, fn: Callable, args: Tuple, kwargs: Dict[str, Any]
+    ) -> Any:
+        stats = self._kind(kind)
+        submitted = time.time()
+        stats.waiting += 1
+        try:
+            await stats.semaphore.acquire()
+        finally:
+            stats.waiting -= 1
+        stats.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            started, finished, result = await loop.run_in_executor(executor(), _timed, fn, args, kwargs)
+        except BaseException:
+            stats.failed += 1
+            raise
+        finally:
+            stats.running -= 1
+            stats.semaphore.release()
+        stats.completed += 1
+        stats.record((started - submitted) * 1000, (finished - started) * 1000)
+        return result
+
+    async def cpu(self, kind: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) in the process pool (fn and arguments must be picklable)."""
+        used = []
+
+        def executor() -> Executor:
+            # Resolved after the semaphore wait, so a pool replaced meanwhile is not reused
+            used.append(self._processes())
+            return used[0]
+
+        try:
+            return await self._run(executor, kind, fn, args, kwargs)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next task
+            pool = used[0] if used else None
+            if pool is not None and self._process_pool is pool:
+                self._process_pool = None
+                self.restarts += 1
+                logger.warning(f"Worker process pool broken during a {kind} task; restarting")
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    async def io(self, kind: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) in the thread pool."""
+        return await self._run(self._threads, kind, fn, args, kwargs)
+
+    async def stop(self) -> None:
+        for pool in (self._process_pool, self._thread_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._process_pool = None
+        self._thread_pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "threads": self.threads,
+            "process_pool_restarts": self.restarts,
+            "kinds": {kind: stats.snapshot() for kind, stats in sorted(self._kinds.items())},
+        }
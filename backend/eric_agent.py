@@ -17,6 +17,9 @@ from typing import List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
+from core.search import ORGANIZATIONS, PRODUCTS, SERVICES, USERS, order_by
+from core.workers import DOCUMENTS
+
 load_dotenv()
 
 # ===== FILE TYPE DETECTION AND TEXT EXTRACTION =====
@@ -356,8 +359,10 @@ ERIC_SYSTEM_PROMPT = """Ты ERIC (Enhanced Reasoning Intelligence Core) - пе
 class ERICAgent:
     """Main ERIC Agent class for handling conversations"""
     
-    def __init__(self, db):
+    def __init__(self, db, search_index, pools):
         self.db = db
+        self.search_index = search_index  # core.search.SearchIndex
+        self.pools = pools  # core.workers.WorkerPools
         self.model = "deepseek-chat"  # DeepSeek V3.2
     
     async def create_notification(self, user_id: str, notification_type: str, title: str, message: str, related_data: dict = None):
@@ -804,8 +809,10 @@ class ERICAgent:
             }
             return result
         
-        # Route to DeepSeek for documents
-        extracted_text, file_type_desc = extract_text_from_file(file_content, filename, mime_type)
+        # Route to DeepSeek for documents (parsing runs in the worker process pool)
+        extracted_text, file_type_desc = await self.pools.cpu(
+            DOCUMENTS, extract_text_from_file, file_content, filename, mime_type
+        )
         
         result = await self.analyze_document(
             user_id=user_id,
@@ -941,21 +948,20 @@ class ERICAgent:
             
             # Search Organizations/Businesses
             if search_type in ["all", "organizations"]:
-                # Build organization query
+                # Build organization query (name, description, industry, city)
+                org_ids = await self.search_index.search(ORGANIZATIONS, query, limit=limit * 2)
                 org_query_conditions = [
-                    {"name": {"$regex": query, "$options": "i"}},
-                    {"description": {"$regex": query, "$options": "i"}},
-                    {"industry": {"$regex": query, "$options": "i"}},
-                    {"address_city": {"$regex": query, "$options": "i"}}
+                    {"id": {"$in": org_ids}},
+                    {"organization_id": {"$in": org_ids}}
                 ]
                 
                 # If searching for education, also match by organization_type
                 if is_education_query:
                     org_query_conditions.append({"organization_type": "EDUCATIONAL"})
                 
-                orgs = await self.db.work_organizations.find({
+                orgs = order_by(org_ids, await self.db.work_organizations.find({
                     "$or": org_query_conditions
-                }).limit(limit).to_list(limit)
+                }).limit(limit).to_list(limit))
                 
                 for org in orgs:
                     # Skip private organizations
@@ -978,16 +984,13 @@ class ERICAgent:
             
             # Search Services (service_listings collection)
             if search_type in ["all", "services"]:
+                service_query = {"status": "ACTIVE"}
+                service_ids = await self.search_index.search(SERVICES, query, limit=limit, where=service_query)
                 services = await self.db.service_listings.find({
-                    "$or": [
-                        {"name": {"$regex": query, "$options": "i"}},
-                        {"description": {"$regex": query, "$options": "i"}},
-                        {"category_id": {"$regex": query, "$options": "i"}},
-                        {"subcategory_id": {"$regex": query, "$options": "i"}},
-                        {"city": {"$regex": query, "$options": "i"}}
-                    ],
-                    "status": "ACTIVE"
+                    **service_query,
+                    "id": {"$in": service_ids}
                 }).limit(limit).to_list(limit)
+                services = order_by(service_ids, services)
                 
                 for svc in services:
                     search_results.append({
@@ -1010,14 +1013,13 @@ class ERICAgent:
             
             # Search Products in Marketplace (marketplace_products collection)
             if search_type in ["all", "products"]:
+                product_query = {"status": {"$in": ["available", "AVAILABLE"]}}
+                product_ids = await self.search_index.search(PRODUCTS, query, limit=limit, where=product_query)
                 products = await self.db.marketplace_products.find({
-                    "$or": [
-                        {"title": {"$regex": query, "$options": "i"}},
-                        {"description": {"$regex": query, "$options": "i"}},
-                        {"category": {"$regex": query, "$options": "i"}}
-                    ],
-                    "status": {"$in": ["available", "AVAILABLE"]}
+                    **product_query,
+                    "id": {"$in": product_ids}
                 }).limit(limit).to_list(limit)
+                products = order_by(product_ids, products)
                 
                 for prod in products:
                     search_results.append({
@@ -1038,13 +1040,12 @@ class ERICAgent:
             
             # Search People (public profiles only)
             if search_type in ["all", "people"]:
-                users = await self.db.users.find({
-                    "$or": [
-                        {"first_name": {"$regex": query, "$options": "i"}},
-                        {"last_name": {"$regex": query, "$options": "i"}},
-                        {"bio": {"$regex": query, "$options": "i"}}
-                    ]
-                }, {"_id": 0, "password_hash": 0}).limit(limit).to_list(limit)
+                user_ids = await self.search_index.search(USERS, query, limit=limit * 2)
+                users = await self.db.users.find(
+                    {"id": {"$in": user_ids}},
+                    {"_id": 0, "password_hash": 0}
+                ).limit(limit).to_list(limit)
+                users = order_by(user_ids, users)
                 
                 for user in users:
                     # Check privacy settings
@@ -1220,11 +1221,8 @@ class ERICAgent:
                 "образование": ["education", "школа"]
             }
             search_terms = category_fields.get(category.lower(), [category])
-            query_filter["$or"] = [
-                {"industry": {"$regex": term, "$options": "i"}} for term in search_terms
-            ] + [
-                {"name": {"$regex": term, "$options": "i"}} for term in search_terms
-            ]
+            org_ids = await self.search_index.search(ORGANIZATIONS, " ".join(search_terms), match_any=True)
+            query_filter["$or"] = [{"id": {"$in": org_ids}}, {"organization_id": {"$in": org_ids}}]
         
         # Get organizations
         orgs = await self.db.work_organizations.find(
@@ -6,10 +6,9 @@ from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
-import aiofiles
 import re
-import json
 import shutil
+import mimetypes
 import random
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
@@ -20,13 +19,33 @@ from passlib.context import CryptContext
 import jwt
 from enum import Enum
 import asyncio
-import qrcode
-from io import BytesIO
 import base64
 from functools import lru_cache
 from contextlib import asynccontextmanager
 import time
 
+from core.backup import BACKUP_TYPES, INCREMENTAL, ArchiveReader, BackupError, BackupExporter, BackupRestorer, incremental_from_last, legacy_records, read_files
+from core.backup_jobs import READY, RESTORING, BackupJobs
+from core.cache import Cache
+from core.conversations import DIRECT, GROUP, ConversationSummaries
+from core.images import VARIANT_SIZES, ImageDerivatives, qr_code_png
+from core.indexes import apply_indexes
+from core.one_time import run_once
+from core.loaders import Loaders, user_summary
+from core.loop_monitor import LoopLagMonitor
+from core.media import IMMUTABLE, PRIVATE_IMMUTABLE, MediaStore, StoredBlob, UploadTooLarge
+from core.media_acl import CHAT, NEWS_POST, ORG_BANNER, ORG_LOGO, POST, PROFILE, MediaACL, media_ids_in
+from core.presence import PresenceStore
+from core.rate_limit import RateLimiter, RateLimitMiddleware, bearer_token, client_ip
+from core.realtime import ChatConnectionManager
+from core.redis_client import close_redis, get_redis
+from core.search import CHANNELS, EVENTS, INTEREST_GROUPS, ORGANIZATIONS, PRODUCTS, SERVICES, USER_PHONES, USERS, SearchIndex, order_by
+from core.social_graph import SocialGraph
+from core.typeahead import DISPLAY_FIELDS as TYPEAHEAD_DISPLAY_FIELDS, PeopleTypeahead
+from core.message_search import MessageSearchIndex
+from core.timelines import FeedTimelines, InvalidCursor
+from core.workers import FILES, PASSWORD, QR_CODES, WorkerPools
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -37,6 +56,9 @@ load_dotenv(ROOT_DIR / '.env')
 # Environment detection
 IS_PRODUCTION = os.environ.get('ENVIRONMENT', 'development') == 'production'
 
+# Apply the index manifest on startup (production runs the core.indexes CLI at deploy)
+AUTO_APPLY_INDEXES = os.environ.get('AUTO_APPLY_INDEXES', 'false' if IS_PRODUCTION else 'true').lower() == 'true'
+
 # MongoDB connection with optimized settings for Atlas/Production
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(
@@ -54,105 +76,122 @@ client = AsyncIOMotorClient(
 db = client[os.environ.get('DB_NAME', 'zion_city')]
 
 # ============================================================
-# IN-MEMORY CACHE (Simple LRU Cache for frequent queries)
+# CACHE (In-process LRU tier + optional shared Redis tier)
 # ============================================================
 
-class SimpleCache:
-    """Simple in-memory cache with TTL for frequent queries"""
-    def __init__(self, default_ttl: int = 300):  # 5 minutes default
-        self._cache: Dict[str, Any] = {}
-        self._timestamps: Dict[str, float] = {}
-        self.default_ttl = default_ttl
-        self._lock = asyncio.Lock()
-    
-    async def get(self, key: str) -> Optional[Any]:
-        """Get value from cache if not expired"""
-        async with self._lock:
-            if key in self._cache:
-                if time.time() - self._timestamps[key] < self.default_ttl:
-                    return self._cache[key]
-                else:
-                    # Expired, remove it
-                    del self._cache[key]
-                    del self._timestamps[key]
+# Sized via CACHE_MAX_ENTRIES / CACHE_MAX_MB / CACHE_DEFAULT_TTL; shared across
+# workers when REDIS_URL is set (see core/cache.py)
+cache = Cache.from_env()
+
+ORG_CACHE_TTL = 600      # Organization documents (names, logos) change rarely
+CHANNEL_CACHE_TTL = 120  # Channel documents carry subscriber/post counters
+
+def _project_doc(doc: Optional[dict], fields: Optional[List[str]]) -> Optional[dict]:
+    """Apply a simple inclusion projection to a cached document"""
+    if doc is None or not fields:
+        return doc
+    return {k: doc[k] for k in fields if k in doc}
+
+async def get_cached_organization(organization_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+    """Get a work organization by id through the shared cache (without _id)"""
+    if not organization_id:
         return None
-    
-    async def set(self, key: str, value: Any, ttl: int = None):
-        """Set value in cache with TTL"""
-        async with self._lock:
-            self._cache[key] = value
-            self._timestamps[key] = time.time()
-    
-    async def delete(self, key: str):
-        """Delete key from cache"""
-        async with self._lock:
-            self._cache.pop(key, None)
-            self._timestamps.pop(key, None)
-    
-    async def clear_expired(self):
-        """Clean up expired entries"""
-        async with self._lock:
-            current_time = time.time()
-            expired_keys = [
-                k for k, t in self._timestamps.items() 
-                if current_time - t >= self.default_ttl
-            ]
-            for key in expired_keys:
-                del self._cache[key]
-                del self._timestamps[key]
+    org = await cache.get_or_load(
+        f"org:{organization_id}",
+        lambda: db.work_organizations.find_one({"id": organization_id}, {"_id": 0}),
+        ttl=ORG_CACHE_TTL,
+        tags=[f"org:{organization_id}"]
+    )
+    return _project_doc(org, fields)
+
+async def get_cached_channel(channel_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+    """Get a news channel by id through the shared cache (without _id)"""
+    if not channel_id:
+        return None
+    channel = await cache.get_or_load(
+        f"channel:{channel_id}",
+        lambda: db.news_channels.find_one({"id": channel_id}, {"_id": 0}),
+        ttl=CHANNEL_CACHE_TTL,
+        tags=[f"channel:{channel_id}"]
+    )
+    return _project_doc(channel, fields)
 
-# Initialize cache
-cache = SimpleCache(default_ttl=300)  # 5 minutes TTL
+async def invalidate_organization_cache(organization_id: str):
+    """Evict a work organization after it was modified"""
+    if organization_id:
+        await cache.invalidate_tag(f"org:{organization_id}")
+
+async def invalidate_channel_cache(channel_id: str):
+    """Evict a news channel after it was modified"""
+    if channel_id:
+        await cache.invalidate_tag(f"channel:{channel_id}")
 
 # ============================================================
-# RATE LIMITING (In-memory, simple implementation)
+# SOCIAL GRAPH (friends / following / followers / subscriptions)
 # ============================================================
 
-class RateLimiter:
-    """Simple in-memory rate limiter"""
-    def __init__(self):
-        self._requests: Dict[str, List[float]] = {}
-        self._lock = asyncio.Lock()
-    
-    async def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> bool:
-        """Check if request is allowed within rate limit"""
-        async with self._lock:
-            current_time = time.time()
-            window_start = current_time - window_seconds
-            
-            # Clean old requests
-            if key in self._requests:
-                self._requests[key] = [t for t in self._requests[key] if t > window_start]
-            else:
-                self._requests[key] = []
-            
-            # Check limit
-            if len(self._requests[key]) >= max_requests:
-                return False
-            
-            # Add current request
-            self._requests[key].append(current_time)
-            return True
-    
-    async def cleanup(self):
-        """Clean up old entries"""
-        async with self._lock:
-            current_time = time.time()
-            # Remove entries older than 1 hour
-            for key in list(self._requests.keys()):
-                self._requests[key] = [t for t in self._requests[key] if current_time - t < 3600]
-                if not self._requests[key]:
-                    del self._requests[key]
+# Adjacency sets per user, updated by the friend/follow/subscribe endpoints
+# and shared across workers via Redis when configured (see core/social_graph.py)
+social_graph = SocialGraph(db, get_redis())
+
+# Per-user news timelines, filled on post creation (see core/timelines.py)
+feed_timelines = FeedTimelines(
+    db,
+    social_graph,
+    cache,
+    max_entries=int(os.environ.get("FEED_TIMELINE_MAX_ENTRIES", 800)),
+    fanout_limit=int(os.environ.get("FEED_FANOUT_LIMIT", 5000)),
+)
+
+# Per-user inbox rows for direct chats and groups (see core/conversations.py)
+conversations = ConversationSummaries(db)
+
+# Per-chat stemmed message index behind the chat search endpoints (see core/message_search.py)
+message_search = MessageSearchIndex(db, count_limit=int(os.environ.get("MESSAGE_SEARCH_COUNT_LIMIT", 1000)))
+
+# Stemmed full-text index for people, organizations, services, products, events,
+# channels and interest groups; writes call search_index.refresh (see core/search.py)
+search_index = SearchIndex(db, max_candidates=int(os.environ.get("SEARCH_MAX_CANDIDATES", 1000)))
+
+# Prefix index over display names for people / contact pickers (see core/typeahead.py)
+people_typeahead = PeopleTypeahead(db, social_graph, cache)
+
+async def reindex_user(user_id: str):
+    """Refresh a user's search and typeahead entries after a profile write"""
+    await search_index.refresh(USERS, user_id)
+    await search_index.refresh(USER_PHONES, user_id)
+    await people_typeahead.refresh(user_id)
+
+async def unindex_user(user_id: str):
+    """Drop a deleted user from the search and typeahead indexes"""
+    await search_index.remove(USERS, user_id)
+    await search_index.remove(USER_PHONES, user_id)
+    await people_typeahead.remove(user_id)
+
+# Online / typing state outside MongoDB; users.last_seen is flushed in batches (see core/presence.py)
+presence = PresenceStore.from_env(db)
+
+# Process / thread pools for CPU-bound and blocking work, kept off the event loop (see core/workers.py)
+worker_pools = WorkerPools.from_env()
+
+# Chunked backups run as background jobs with state in MongoDB (see core/backup_jobs.py)
+backup_jobs = BackupJobs.from_env(db, worker_pools)
+
+# ============================================================
+# RATE LIMITING (GCRA, shared across workers via Redis)
+# ============================================================
 
-# Initialize rate limiter
-rate_limiter = RateLimiter()
+# Initialize rate limiter (falls back to per-process state without REDIS_URL)
+rate_limiter = RateLimiter.from_env()
 
 # Rate limit configurations
 RATE_LIMITS = {
     "ai_chat": {"max_requests": 20, "window_seconds": 60},      # 20 AI requests/minute
     "ai_analysis": {"max_requests": 10, "window_seconds": 60},  # 10 file analyses/minute
     "search": {"max_requests": 30, "window_seconds": 60},       # 30 searches/minute
+    "typeahead": {"max_requests": 300, "window_seconds": 60},   # 300 keystroke lookups/minute
     "posts": {"max_requests": 10, "window_seconds": 60},        # 10 posts/minute
+    "auth": {"max_requests": 10, "window_seconds": 60},         # 10 login/register attempts/minute
     "default": {"max_requests": 100, "window_seconds": 60},     # 100 general requests/minute
 }
 
@@ -162,6 +201,30 @@ async def check_rate_limit(user_id: str, limit_type: str = "default") -> bool:
     key = f"{limit_type}:{user_id}"
     return await rate_limiter.is_allowed(key, config["max_requests"], config["window_seconds"])
 
+# Route groups limited by RateLimitMiddleware: (method, path regex, RATE_LIMITS key).
+# First match wins; routes not listed here are not rate limited.
+RATE_LIMIT_RULES = [
+    ("POST", r"^/api/agent/(chat|chat-with-search|chat-with-image|post-mention)$", "ai_chat"),
+    ("POST", r"^/api/agent/(analyze-image|analyze-file-upload|analyze-document)$", "ai_analysis"),
+    ("POST", r"^/api/agent/search$", "search"),
+    ("GET", r"^/api/users/(search|contacts)$", "typeahead"),
+    ("GET", r"^/api/.*/search(/|$)", "search"),
+    ("POST", r"^/api/(news/posts|posts|work/organizations/[^/]+/posts)$", "posts"),
+    ("POST", r"^/api/(auth/login|auth/register|admin/login)$", "auth"),
+]
+
+def rate_limit_key(scope: dict) -> str:
+    """Identify the caller for rate limiting: JWT subject if valid, else client IP"""
+    token = bearer_token(scope)
+    if token:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            if payload.get("sub"):
+                return f"user:{payload['sub']}"
+        except jwt.PyJWTError:
+            pass
+    return f"ip:{client_ip(scope)}"
+
 # ============================================================
 # PAGINATION VALIDATION
 # ============================================================
@@ -190,36 +253,84 @@ def validate_pagination(offset: int, limit: int) -> tuple[int, int]:
 # APP LIFECYCLE & BACKGROUND TASKS
 # ============================================================
 
+# Heartbeat lag histogram and stacks of calls that block the event loop (see core/loop_monitor.py)
+loop_monitor = LoopLagMonitor.from_env()
+
+async def unset_stored_online_flags() -> int:
+    """Remove users.is_online written before online status moved to the presence store."""
+    result = await db.users.update_many({"is_online": {"$exists": True}}, {"$unset": {"is_online": ""}, "$set": {"updated_at": datetime.now(timezone.utc)}})
+    return result.modified_count
+
+# Startup jobs (index builds, one-time migrations), cancelled at shutdown if still running
+startup_tasks: Set[asyncio.Task] = set()
+
+def start_startup_task(job) -> None:
+    task = asyncio.create_task(job)
+    startup_tasks.add(task)
+    task.add_done_callback(startup_tasks.discard)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager for startup/shutdown tasks"""
     # Startup
     logger.info("🚀 Starting ZION.CITY API server...")
     
-    # Create database indexes on startup (idempotent)
-    asyncio.create_task(ensure_indexes())
+    # Index builds normally run before deploy via `python -m core.indexes apply`;
+    # development servers apply the manifest on startup for convenience
+    if AUTO_APPLY_INDEXES:
+        start_startup_task(ensure_indexes())
+    
+    # Index media references that predate media_acl (once per database, one worker)
+    start_startup_task(run_once(db, "media_acl_backfill", media_acl.backfill))
+    
+    # Build the full-text search and typeahead indexes (once per database, one worker);
+    # a new job name re-runs the build after a change to what the entries hold
+    start_startup_task(run_once(db, "search_index_v3", search_index.rebuild))
+    start_startup_task(run_once(db, "user_typeahead", people_typeahead.rebuild))
+    
+    # Online status lives in the presence store; drop the flag older code persisted on users
+    start_startup_task(run_once(db, "users_unset_is_online", unset_stored_online_flags))
+    
+    # Start cross-worker cache invalidation listener (no-op without Redis)
+    await cache.start()
+    
+    # Start cross-worker WebSocket fan-out (in-process broker without Redis)
+    await chat_manager.start()
+    
+    # Start the coalesced last_seen flush
+    await presence.start()
     
     # Start background cleanup task
     cleanup_task = asyncio.create_task(periodic_cleanup())
     
+    # Start the event loop lag monitor
+    await loop_monitor.start()
+    
     yield
     
     # Shutdown
     logger.info("🛑 Shutting down ZION.CITY API server...")
     cleanup_task.cancel()
+    for task in list(startup_tasks):
+        task.cancel()
+    await asyncio.gather(*startup_tasks, return_exceptions=True)
+    await loop_monitor.stop()
+    await chat_manager.stop()
+    await presence.stop()
+    await backup_jobs.stop()
+    await image_derivatives.stop()
+    await worker_pools.stop()
+    await cache.stop()
+    await close_redis()
     client.close()
 
 async def ensure_indexes():
-    """Ensure all database indexes exist (runs on startup)"""
-    try:
-        # Key indexes for performance
-        await db.users.create_index("id", unique=True, background=True)
-        await db.users.create_index("email", unique=True, background=True)
-        await db.posts.create_index([("created_at", -1)], background=True)
-        await db.posts.create_index([("user_id", 1), ("created_at", -1)], background=True)
-        await db.notifications.create_index([("user_id", 1), ("is_read", 1), ("created_at", -1)], background=True)
-        await db.agent_conversations.create_index([("user_id", 1), ("updated_at", -1)], background=True)
-        logger.info("✅ Database indexes verified")
+    """Build any indexes from core.indexes.INDEX_MANIFEST that are missing"""
+    try:
+        report = await apply_indexes(db)
+        if report["errors"]:
+            logger.warning(f"Index creation warnings: {report['errors']}")
+        logger.info(f"✅ Database indexes verified ({len(report['created'])} created, {len(report['rebuilt'])} rebuilt)")
     except Exception as e:
         logger.warning(f"Index creation warning: {e}")
 
@@ -230,6 +341,8 @@ async def periodic_cleanup():
             await asyncio.sleep(300)  # Run every 5 minutes
             await cache.clear_expired()
             await rate_limiter.cleanup()
+            await presence.cleanup()
+            await backup_jobs.cleanup()
             logger.debug("🧹 Periodic cleanup completed")
         except asyncio.CancelledError:
             break
@@ -259,108 +372,12 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 if IS_PRODUCTION else 30  # Longer sessions in production
 
 # === WEBSOCKET CONNECTION MANAGER ===
-class ChatConnectionManager:
-    """Manages WebSocket connections for real-time chat features"""
-    
-    def __init__(self):
-        # Dictionary mapping chat_id to set of websocket connections
-        self.chat_connections: Dict[str, Set[WebSocket]] = {}
-        # Dictionary mapping user_id to websocket connection
-        self.user_connections: Dict[str, WebSocket] = {}
-        # Lock for thread safety
-        self._lock = asyncio.Lock()
-    
-    async def connect(self, websocket: WebSocket, user_id: str, chat_id: str = None):
-        """Connect a user to WebSocket"""
-        await websocket.accept()
-        async with self._lock:
-            # Store user connection
-            self.user_connections[user_id] = websocket
-            
-            # If chat_id provided, add to chat room
-            if chat_id:
-                if chat_id not in self.chat_connections:
-                    self.chat_connections[chat_id] = set()
-                self.chat_connections[chat_id].add(websocket)
-        
-        logger.info(f"WebSocket connected: user={user_id}, chat={chat_id}")
-    
-    async def disconnect(self, websocket: WebSocket, user_id: str, chat_id: str = None):
-        """Disconnect a user from WebSocket"""
-        async with self._lock:
-            # Remove from user connections
-            if user_id in self.user_connections:
-                del self.user_connections[user_id]
-            
-            # Remove from chat connections
-            if chat_id and chat_id in self.chat_connections:
-                self.chat_connections[chat_id].discard(websocket)
-                if not self.chat_connections[chat_id]:
-                    del self.chat_connections[chat_id]
-        
-        logger.info(f"WebSocket disconnected: user={user_id}")
-    
-    async def join_chat(self, websocket: WebSocket, chat_id: str):
-        """Join a specific chat room"""
-        async with self._lock:
-            if chat_id not in self.chat_connections:
-                self.chat_connections[chat_id] = set()
-            self.chat_connections[chat_id].add(websocket)
-    
-    async def leave_chat(self, websocket: WebSocket, chat_id: str):
-        """Leave a specific chat room"""
-        async with self._lock:
-            if chat_id in self.chat_connections:
-                self.chat_connections[chat_id].discard(websocket)
-    
-    async def broadcast_to_chat(self, chat_id: str, message: dict, exclude_user: str = None):
-        """Broadcast a message to all users in a chat"""
-        if chat_id not in self.chat_connections:
-            return
-        
-        disconnected = []
-        for websocket in self.chat_connections[chat_id]:
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to chat {chat_id}: {e}")
-                disconnected.append(websocket)
-        
-        # Clean up disconnected sockets
-        async with self._lock:
-            for ws in disconnected:
-                self.chat_connections[chat_id].discard(ws)
-    
-    async def send_to_user(self, user_id: str, message: dict):
-        """Send a message to a specific user"""
-        if user_id not in self.user_connections:
-            return False
-        
-        try:
-            await self.user_connections[user_id].send_json(message)
-            return True
-        except Exception as e:
-            logger.error(f"Error sending to user {user_id}: {e}")
-            async with self._lock:
-                if user_id in self.user_connections:
-                    del self.user_connections[user_id]
-            return False
-    
-    def is_user_online(self, user_id: str) -> bool:
-        """Check if a user has an active WebSocket connection"""
-        return user_id in self.user_connections
-    
-    def get_online_users_in_chat(self, chat_id: str) -> int:
-        """Get number of online users in a chat"""
-        if chat_id not in self.chat_connections:
-            return 0
-        return len(self.chat_connections[chat_id])
-
-# Initialize the connection manager
-chat_manager = ChatConnectionManager()
+# Sockets stay in the worker that accepted them; chat and user events are
+# fanned out to the other workers over Redis pub/sub (see core/realtime.py)
+chat_manager = ChatConnectionManager.from_env()
 
 # Helper function to broadcast new message via WebSocket (defined early for use in API routes)
-async def broadcast_new_message(chat_id: str, message_data: dict, sender_id: str):
+async def broadcast_new_message(chat_id: str, message_data: dict, sender_id: Optional[str] = None):
     """Broadcast a new message to all users in a chat via WebSocket"""
     await chat_manager.broadcast_to_chat(chat_id, {
         "type": "message",
@@ -369,7 +386,7 @@ async def broadcast_new_message(chat_id: str, message_data: dict, sender_id: str
     })
     
     # Also mark as delivered for all connected users
-    connected_count = chat_manager.get_online_users_in_chat(chat_id)
+    connected_count = await chat_manager.get_online_users_in_chat(chat_id)
     if connected_count > 1:  # More than just sender
         # Update message status to delivered
         await db.direct_chat_messages.update_one(
@@ -415,6 +432,8 @@ class MediaFile(BaseModel):
     source_module: str = "personal"  # "family", "work", "education", "health", "government", "business", "community", "personal"
     privacy_level: str = "private"  # "private", "module", "public"
     metadata: Dict[str, Any] = {}  # Additional metadata (dimensions, duration, etc.)
+    sha256: Optional[str] = None  # content hash; file_path is the shared blob (see core/media.py)
+    storage_key: Optional[str] = None  # key in the storage backend (see core/storage.py)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class MediaCollection(BaseModel):
@@ -611,7 +630,7 @@ class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: EmailStr
     phone: Optional[str] = None
-    password_hash: str
+    password_hash: Optional[str] = None  # Not loaded by get_user_by_id (cached users never carry it)
     first_name: str
     last_name: str
     middle_name: Optional[str] = None
@@ -626,8 +645,7 @@ class User(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     last_login: Optional[datetime] = None
-    last_seen: Optional[datetime] = None  # For online status tracking
-    is_online: bool = False  # Real-time online status
+    last_seen: Optional[datetime] = None  # Durable last activity; live online status comes from presence
     
     # NEW FAMILY SYSTEM FIELDS
     address_street: Optional[str] = None
@@ -3301,6 +3319,14 @@ class MediaUploadResponse(BaseModel):
     file_size: int
     file_url: str
 
+class DirectUploadRequest(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+    sha256: str = Field(..., pattern=r"^[0-9a-f]{64}$")
+    source_module: str = "personal"
+    privacy_level: str = "private"
+
 # === UTILITY FUNCTIONS ===
 
 # File upload settings
@@ -3309,6 +3335,7 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 MAX_FILE_SIZE = {
     "image": 10 * 1024 * 1024,  # 10MB
     "document": 50 * 1024 * 1024,  # 50MB
+    "audio": 20 * 1024 * 1024,  # 20MB
 }
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif"}
 ALLOWED_DOCUMENT_TYPES = {
@@ -3319,6 +3346,16 @@ ALLOWED_DOCUMENT_TYPES = {
     "application/vnd.openxmlformats-officedocument.presentationml.presentation"
 }
 
+# Content-addressed storage shared by every upload endpoint (see core/media.py)
+media_store = MediaStore.from_env(db, UPLOAD_DIR)
+MEDIA_CACHE_TTL = 600  # media_files rows only change when derivatives are added (tag invalidated then)
+
+# Contexts referencing each media file and its public flag (see core/media_acl.py)
+media_acl = MediaACL(db, cache, ttl=MEDIA_CACHE_TTL)
+
+# Thumbnails / WebP variants / dimensions built in a process pool (see core/images.py)
+image_derivatives = ImageDerivatives.from_env(db, media_store, worker_pools, cache)
+
 def extract_youtube_urls(text: str) -> List[str]:
     """Extract YouTube URLs from text content"""
     youtube_patterns = [
@@ -3373,35 +3410,144 @@ def validate_file(file: UploadFile) -> tuple[bool, str]:
     
     return True, "Valid file"
 
-async def save_uploaded_file(file: UploadFile, user_id: str) -> MediaFile:
-    """Save uploaded file to disk and create MediaFile record"""
-    # Create user-specific directory
-    user_dir = UPLOAD_DIR / user_id
-    user_dir.mkdir(exist_ok=True)
-    
-    # Generate unique filename
-    file_extension = Path(file.filename).suffix
-    stored_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = user_dir / stored_filename
-    
-    # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
-    
-    # Create MediaFile record
-    media_file = MediaFile(
-        original_filename=file.filename,
+async def store_media(
+    source,
+    user_id: str,
+    filename: str,
+    mime_type: str,
+    max_size: int,
+    stored_filename: Optional[str] = None,
+    file_type: Optional[str] = None,
+    source_module: str = "personal",
+    privacy_level: str = "private",
+    metadata: Optional[Dict[str, Any]] = None,
+) -> MediaFile:
+    """Stream an upload (UploadFile or bytes) into the media store and insert its MediaFile record"""
+    try:
+        blob = await media_store.save(source, max_size=max_size, content_type=mime_type)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await insert_media_file(
+        blob, user_id, filename, mime_type,
         stored_filename=stored_filename,
-        file_path=str(file_path),
-        file_type=get_file_type(file.content_type),
+        file_type=file_type,
+        source_module=source_module,
+        privacy_level=privacy_level,
+        metadata=metadata
+    )
+
+async def insert_media_file(
+    blob: StoredBlob,
+    user_id: str,
+    filename: str,
+    mime_type: str,
+    stored_filename: Optional[str] = None,
+    file_type: Optional[str] = None,
+    source_module: str = "personal",
+    privacy_level: str = "private",
+    metadata: Optional[Dict[str, Any]] = None,
+) -> MediaFile:
+    """Insert the MediaFile record for a blob reference; the reference is released if the insert fails"""
+    media_file = MediaFile(
+        original_filename=filename,
+        stored_filename=stored_filename or f"{uuid.uuid4()}{Path(filename).suffix}",
+        file_path=blob.path,
+        file_type=file_type or get_file_type(mime_type),
+        mime_type=mime_type,
+        file_size=blob.size,
+        uploaded_by=user_id,
+        source_module=source_module,
+        privacy_level=privacy_level,
+        metadata=metadata or {},
+        sha256=blob.sha256,
+        storage_key=blob.key
+    )
+    try:
+        await db.media_files.insert_one(media_file.dict())
+    except Exception:
+        await media_store.release(blob.sha256)
+        raise
+    if media_file.file_type == "image":
+        image_derivatives.schedule(blob.sha256)
+    return media_file
+
+async def save_uploaded_file(file: UploadFile, user_id: str, **fields) -> MediaFile:
+    """Save an uploaded image/document and create its MediaFile record"""
+    file_type = get_file_type(file.content_type)
+    return await store_media(
+        file,
+        user_id,
+        filename=file.filename,
         mime_type=file.content_type,
-        file_size=len(content),
-        uploaded_by=user_id
+        max_size=MAX_FILE_SIZE.get(file_type, 0),
+        file_type=file_type,
+        **fields
     )
-    
+
+async def get_cached_media_file(query: dict, key: str) -> Optional[dict]:
+    """Get a media_files row through the shared cache (without _id), tagged by id and blob"""
+    media_file = await cache.get(key)
+    if media_file is None:
+        media_file = await db.media_files.find_one(query, {"_id": 0})
+        if media_file:
+            await cache.set(key, media_file, ttl=MEDIA_CACHE_TTL, tags=[
+                f"media:{media_file['id']}",
+                f"media-blob:{media_file.get('sha256')}"
+            ])
     return media_file
 
+async def delete_media_file(media_id: Optional[str]) -> bool:
+    """Delete a MediaFile record and drop its reference to the stored blob"""
+    if not media_id:
+        return False
+    media_file = await db.media_files.find_one_and_delete({"id": media_id}, {"_id": 0, "sha256": 1})
+    if not media_file:
+        return False
+    await cache.invalidate_tag(f"media:{media_id}")
+    await media_acl.remove(media_id)
+    await media_store.release(media_file.get("sha256"))
+    return True
+
+async def serve_media_file(
+    request: Request,
+    media_file: dict,
+    etag: str,
+    cache_control: str,
+    filename: Optional[str] = None
+):
+    """Serve the bytes of a media_files row: from its storage key, or file_path for rows that predate keys"""
+    filename = filename or media_file["original_filename"]
+    key = media_store.key_for(media_file)
+    if key:
+        response = await media_store.serve_key(
+            request, key, media_file["mime_type"], etag, cache_control, filename=filename
+        )
+    elif Path(media_file["file_path"]).exists():
+        response = media_store.serve(
+            request, media_file["file_path"], media_file["mime_type"], etag, cache_control, filename=filename
+        )
+    else:
+        response = None
+    if response is None:
+        raise HTTPException(status_code=404, detail="File not found on disk")
+    return response
+
+def decode_data_url(data_url: str) -> Optional[tuple[str, bytes]]:
+    """Split a base64 data URL into (mime_type, bytes); None if it is not one"""
+    match = re.match(r"^data:([\w.+-]+/[\w.+-]+);base64,(.*)$", data_url, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return match.group(1), base64.b64decode(match.group(2), validate=True)
+    except (ValueError, TypeError):
+        return None
+
+def public_media_url(request: Request, media_id: str) -> str:
+    """Absolute URL for a media file, for fields the frontend uses directly as an <img> src"""
+    proto = request.headers.get("x-forwarded-proto", request.url.scheme)
+    host = request.headers.get("x-forwarded-host") or request.headers.get("host") or request.url.netloc
+    return f"{proto}://{host}/api/media/{media_id}"
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -3412,11 +3558,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    # bcrypt is deliberately slow; it releases the GIL, so a worker thread is enough
+    return await worker_pools.io(PASSWORD, pwd_context.verify, plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await worker_pools.io(PASSWORD, pwd_context.hash, password)
 
 async def get_user_by_email(email: str):
     user_data = await db.users.find_one({"email": email})
@@ -3424,21 +3571,48 @@ async def get_user_by_email(email: str):
         return User(**user_data)
     return None
 
+# Authenticated users are resolved through the shared cache for a short TTL.
+# Writes to the user document must call invalidate_user_cache().
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 30))
+
+async def _load_user(user_id: str) -> Optional[dict]:
+    # The cached copy is shared through Redis, so it never holds the password hash;
+    # authenticate_user reads the hash through get_user_by_email
+    return await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+
 async def get_user_by_id(user_id: str):
-    user_data = await db.users.find_one({"id": user_id})
+    if not user_id:
+        return None
+    user_data = await cache.get_or_load(
+        f"user-doc:{user_id}",
+        lambda: _load_user(user_id),
+        ttl=USER_CACHE_TTL,
+        tags=[f"user:{user_id}"]
+    )
     if user_data:
         return User(**user_data)
     return None
 
+async def invalidate_user_cache(user_id: str):
+    """Evict a user after their document was modified or deleted"""
+    if user_id:
+        await cache.invalidate_tag(f"user:{user_id}")
+        await conversations.refresh_user(user_id)
+
 async def authenticate_user(email: str, password: str):
     user = await get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    if not await verify_password(password, user.password_hash):
         return False
     return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # Resolved once per request and shared with every dependency and handler
+    cached_user = getattr(request.state, "current_user", None)
+    if cached_user is not None:
+        return cached_user
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -3455,8 +3629,18 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     user = await get_user_by_id(user_id)
     if user is None:
         raise credentials_exception
+    request.state.current_user = user
     return user
 
+def get_loaders(request: Request) -> Loaders:
+    """Request-scoped batch loaders (users, organizations, channels, media, messages)"""
+    loaders = getattr(request.state, "loaders", None)
+    if loaders is None:
+        loaders = request.state.loaders = Loaders(
+            db, cache, cache_ttls={"org": ORG_CACHE_TTL, "channel": CHANNEL_CACHE_TTL}
+        )
+    return loaders
+
 async def get_user_affiliations(user_id: str):
     """Get all affiliations for a user with detailed information"""
     user_affiliations = await db.user_affiliations.find({"user_id": user_id, "is_active": True}).to_list(100)
@@ -3517,6 +3701,7 @@ async def create_auto_family_groups(user_id: str):
         role="ADMIN"
     )
     await db.chat_group_members.insert_one(family_member.dict())
+    await conversations.add_group_members(family_group.dict(), [family_member.dict()])
     
     # Create Relatives group
     relatives_group = ChatGroup(
@@ -3535,6 +3720,7 @@ async def create_auto_family_groups(user_id: str):
         role="ADMIN"
     )
     await db.chat_group_members.insert_one(relatives_member.dict())
+    await conversations.add_group_members(relatives_group.dict(), [relatives_member.dict()])
     
     return [family_group.id, relatives_group.id]
 
@@ -3626,48 +3812,18 @@ async def get_module_connections(user_id: str, module: str) -> List[str]:
 
 async def get_user_chat_groups(user_id: str):
     """Get all chat groups where user is a member"""
-    memberships = await db.chat_group_members.find({"user_id": user_id, "is_active": True}).to_list(100)
-    
-    groups = []
-    for membership in memberships:
-        group = await db.chat_groups.find_one({"id": membership["group_id"], "is_active": True})
-        if group:
-            # Remove MongoDB _id
-            group.pop("_id", None)
-            membership.pop("_id", None)
-            
-            # Get member count
-            member_count = await db.chat_group_members.count_documents({
-                "group_id": group["id"], 
-                "is_active": True
-            })
-            
-            # Get latest message
-            latest_message = await db.chat_messages.find_one(
-                {"group_id": group["id"], "is_deleted": False},
-                sort=[("created_at", -1)]
-            )
-            if latest_message:
-                latest_message.pop("_id", None)
-            
-            # Get unread count (messages not from this user that haven't been read)
-            unread_count = await db.chat_messages.count_documents({
-                "group_id": group["id"],
-                "user_id": {"$ne": user_id},
-                "status": {"$ne": "read"},
-                "is_deleted": False
-            })
-            
-            groups.append({
-                "group": group,
-                "user_role": membership["role"],
-                "member_count": member_count,
-                "latest_message": latest_message,
-                "unread_count": unread_count,
-                "joined_at": membership["joined_at"]
-            })
-    
-    return groups
+    summaries = await conversations.inbox(user_id, GROUP)
+    return [
+        {
+            "group": summary["chat"],
+            "user_role": summary.get("role"),
+            "member_count": summary.get("member_count", 0),
+            "latest_message": summary.get("last_message"),
+            "unread_count": summary.get("unread_count", 0),
+            "joined_at": summary.get("joined_at")
+        }
+        for summary in summaries
+    ]
 
 # === NEW FAMILY SYSTEM HELPER FUNCTIONS ===
 
@@ -3677,10 +3833,10 @@ async def find_matching_family_units(address_street: str, address_city: str, add
     
     # Build query - must match address + last name
     query = {
-        "address_street": {"$regex": f".*{address_street}.*", "$options": "i"},
-        "address_city": {"$regex": f".*{address_city}.*", "$options": "i"},
-        "address_country": {"$regex": f".*{address_country}.*", "$options": "i"},
-        "family_surname": {"$regex": f".*{last_name}.*", "$options": "i"},
+        "address_street": {"$regex": re.escape(address_street), "$options": "i"},
+        "address_city": {"$regex": re.escape(address_city), "$options": "i"},
+        "address_country": {"$regex": re.escape(address_country), "$options": "i"},
+        "family_surname": {"$regex": re.escape(last_name), "$options": "i"},
         "is_active": True
     }
     
@@ -3768,7 +3924,7 @@ async def register_user(user_data: UserRegistration):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     new_user = User(
         email=user_data.email,
         password_hash=hashed_password,
@@ -3781,6 +3937,7 @@ async def register_user(user_data: UserRegistration):
     )
     
     await db.users.insert_one(new_user.dict())
+    await reindex_user(new_user.id)
     
     # Auto-create family groups for new user
     await create_auto_family_groups(new_user.id)
@@ -3822,7 +3979,7 @@ async def login_user(login_data: UserLogin):
     # Update last login
     await db.users.update_one(
         {"id": user.id},
-        {"$set": {"last_login": datetime.now(timezone.utc)}}
+        {"$set": {"last_login": datetime.now(timezone.utc), "updated_at": datetime.now(timezone.utc)}}
     )
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -3903,6 +4060,7 @@ async def update_user_gender(
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        await invalidate_user_cache(current_user.id)
         
         if result.modified_count == 0 and result.matched_count == 0:
             logger.error(f"User {current_user.id} not found in database for gender update")
@@ -3931,11 +4089,11 @@ async def change_password(
     
     # Verify current password
     user_doc = await db.users.find_one({"id": current_user.id})
-    if not user_doc or not verify_password(current_password, user_doc.get("hashed_password")):
+    if not user_doc or not await verify_password(current_password, user_doc.get("hashed_password")):
         raise HTTPException(status_code=400, detail="Неверный текущий пароль")
     
     # Hash and update new password
-    hashed_password = get_password_hash(new_password)
+    hashed_password = await get_password_hash(new_password)
     await db.users.update_one(
         {"id": current_user.id},
         {"$set": {
@@ -3943,12 +4101,14 @@ async def change_password(
             "updated_at": datetime.now(timezone.utc)
         }}
     )
+    await invalidate_user_cache(current_user.id)
     
     return {"message": "Пароль успешно изменен"}
 
 @api_router.delete("/auth/delete-account")
 async def delete_account(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Delete user account permanently"""
     
@@ -3968,8 +4128,9 @@ async def delete_account(
         
         # Filter adult members (you can adjust age logic as needed)
         adult_members = []
+        members_by_id = await loaders.users.load_many(m["user_id"] for m in family_members)
         for member in family_members:
-            user = await db.users.find_one({"id": member["user_id"]})
+            user = members_by_id.get(member["user_id"])
             if user:
                 # Consider anyone 18+ as adult
                 if user.get("date_of_birth"):
@@ -4020,6 +4181,7 @@ async def delete_account(
                 "is_deleted": False
             }
             await db.family_members.insert_one(new_member)
+            await people_typeahead.invalidate_circles(family_ids=[new_family_id])
             
             # TODO: Send notification to the user about new family profile
             # This would require a notification system to be implemented
@@ -4027,7 +4189,7 @@ async def delete_account(
     # Delete user's posts, comments, etc.
     await db.posts.update_many(
         {"author_id": current_user.id},
-        {"$set": {"is_deleted": True, "deleted_at": datetime.now(timezone.utc)}}
+        {"$set": {"is_deleted": True, "deleted_at": datetime.now(timezone.utc), "updated_at": datetime.now(timezone.utc)}}
     )
     
     # Remove user from all family memberships
@@ -4035,15 +4197,22 @@ async def delete_account(
         {"user_id": current_user.id},
         {"$set": {"is_deleted": True, "left_at": datetime.now(timezone.utc)}}
     )
+    await people_typeahead.invalidate_circles(
+        family_ids=await db.family_members.distinct("family_id", {"user_id": current_user.id}),
+        organization_ids=await db.work_members.distinct("organization_id", {"user_id": current_user.id})
+    )
     
     # Delete user account
     await db.users.delete_one({"id": current_user.id})
+    await unindex_user(current_user.id)
+    await invalidate_user_cache(current_user.id)
     
     return {"message": "Аккаунт успешно удален"}
 
 @api_router.put("/users/profile-picture")
 async def update_profile_picture(
     data: dict,
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """Update user profile picture"""
@@ -4052,14 +4221,40 @@ async def update_profile_picture(
     if not profile_picture:
         raise HTTPException(status_code=400, detail="Изображение не предоставлено")
     
+    # Data URLs from the client are stored as media files; the user document keeps only the URL
+    media_id = None
+    decoded = decode_data_url(profile_picture)
+    if decoded:
+        mime_type, content = decoded
+        if mime_type not in ALLOWED_IMAGE_TYPES:
+            raise HTTPException(status_code=400, detail="Неподдерживаемый формат изображения")
+        media_file = await store_media(
+            content,
+            current_user.id,
+            filename=f"profile{mimetypes.guess_extension(mime_type) or ''}",
+            mime_type=mime_type,
+            max_size=MAX_FILE_SIZE["image"],
+            source_module="profile",
+            privacy_level="public"
+        )
+        media_id = media_file.id
+        profile_picture = public_media_url(request, media_id)
+        await media_acl.grant([media_id], PROFILE, current_user.id, public=True)
+    
     # Update user's profile picture
-    await db.users.update_one(
+    previous = await db.users.find_one_and_update(
         {"id": current_user.id},
         {"$set": {
             "profile_picture": profile_picture,
+            "profile_picture_media_id": media_id,
             "updated_at": datetime.now(timezone.utc)
-        }}
+        }},
+        {"_id": 0, "profile_picture_media_id": 1}
     )
+    if previous:
+        await delete_media_file(previous.get("profile_picture_media_id"))
+    await invalidate_user_cache(current_user.id)
+    await people_typeahead.refresh(current_user.id)
     
     return {"message": "Фото профиля обновлено", "profile_picture": profile_picture}
 
@@ -4068,13 +4263,19 @@ async def delete_profile_picture(
     current_user: User = Depends(get_current_user)
 ):
     """Delete user profile picture"""
-    await db.users.update_one(
+    previous = await db.users.find_one_and_update(
         {"id": current_user.id},
         {"$set": {
             "profile_picture": None,
+            "profile_picture_media_id": None,
             "updated_at": datetime.now(timezone.utc)
-        }}
+        }},
+        {"_id": 0, "profile_picture_media_id": 1}
     )
+    if previous:
+        await delete_media_file(previous.get("profile_picture_media_id"))
+    await invalidate_user_cache(current_user.id)
+    await people_typeahead.refresh(current_user.id)
     
     return {"message": "Фото профиля удалено"}
 
@@ -4146,6 +4347,7 @@ async def complete_onboarding(
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        await invalidate_user_cache(current_user.id)
     
     return {
         "message": "Onboarding completed successfully",
@@ -4191,7 +4393,7 @@ async def get_user_affiliations_endpoint(current_user: User = Depends(get_curren
 # === DYNAMIC PROFILE API ENDPOINTS ===
 
 @api_router.get("/users/me/profile", response_model=DynamicProfileResponse)
-async def get_my_dynamic_profile(current_user: User = Depends(get_current_user)):
+async def get_my_dynamic_profile(current_user: User = Depends(get_current_user), loaders: Loaders = Depends(get_loaders)):
     """Get current user's own dynamic profile (full access to all data)"""
     
     # Get user's privacy settings (if exists)
@@ -4216,8 +4418,9 @@ async def get_my_dynamic_profile(current_user: User = Depends(get_current_user))
         # Find upcoming birthday
         today = datetime.now(timezone.utc).date()
         upcoming_birthdays = []
+        member_users = await loaders.users.load_many(m["user_id"] for m in family_members)
         for member in family_members:
-            user_doc = await db.users.find_one({"id": member["user_id"]})
+            user_doc = member_users.get(member["user_id"])
             if user_doc and user_doc.get("date_of_birth"):
                 birth_date = user_doc["date_of_birth"]
                 if isinstance(birth_date, datetime):
@@ -4253,8 +4456,10 @@ async def get_my_dynamic_profile(current_user: User = Depends(get_current_user))
         "status": "ACTIVE"
     }).to_list(1000)  # Safety limit to prevent memory exhaustion
     
+    member_orgs = await loaders.organizations.load_many(m["organization_id"] for m in org_members)
+    managers = await loaders.users.load_many(m.get("manager_id") for m in org_members)
     for member in org_members:
-        org = await db.work_organizations.find_one({"id": member["organization_id"]})
+        org = member_orgs.get(member["organization_id"])
         if org:
             # Get department info
             dept_name = None
@@ -4273,7 +4478,7 @@ async def get_my_dynamic_profile(current_user: User = Depends(get_current_user))
             # Get manager info
             manager_name = None
             if member.get("manager_id"):
-                manager = await db.users.find_one({"id": member["manager_id"]})
+                manager = managers.get(member["manager_id"])
                 if manager:
                     manager_name = f"{manager.get('first_name', '')} {manager.get('last_name', '')}"
             
@@ -4317,7 +4522,8 @@ async def get_my_dynamic_profile(current_user: User = Depends(get_current_user))
 @api_router.get("/users/{user_id}/dynamic-profile", response_model=DynamicProfileResponse)
 async def get_user_dynamic_profile(
     user_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get another user's dynamic profile with visibility rules applied"""
     
@@ -4354,8 +4560,9 @@ async def get_user_dynamic_profile(
     if shared_org_ids:
         viewer_relationship = "org_member"
         # Get shared organization details
+        shared_orgs = await loaders.organizations.load_many(shared_org_ids)
         for org_id in shared_org_ids:
-            org = await db.work_organizations.find_one({"id": org_id})
+            org = shared_orgs.get(org_id)
             if org:
                 shared_organizations.append(org_id)
     
@@ -4421,7 +4628,7 @@ async def get_user_dynamic_profile(
             })
             
             if member:
-                org = await db.work_organizations.find_one({"id": org_id})
+                org = await loaders.organizations.load(org_id)
                 if org:
                     org_data = {
                         "id": org["id"],
@@ -4448,7 +4655,7 @@ async def get_user_dynamic_profile(
                     
                     # Add manager if visible
                     if can_view_field(privacy_settings.manager_visibility) and member.get("manager_id"):
-                        manager = await db.users.find_one({"id": member["manager_id"]})
+                        manager = await loaders.users.load(member["manager_id"])
                         if manager:
                             org_data["manager"] = f"{manager.get('first_name', '')} {manager.get('last_name', '')}"
                     
@@ -4496,6 +4703,8 @@ async def update_my_profile(
             {"id": current_user.id},
             {"$set": update_fields}
         )
+        await invalidate_user_cache(current_user.id)
+        await reindex_user(current_user.id)
     
     return {"success": True, "message": "Profile updated successfully"}
 
@@ -4634,6 +4843,7 @@ async def create_family_profile(
         invitation_accepted=True  # Creator automatically accepts
     )
     await db.family_members.insert_one(family_member.dict())
+    await people_typeahead.invalidate_circles(family_ids=[new_family.id])
     
     # Return response with user membership info
     response_data = new_family.dict()
@@ -4731,6 +4941,7 @@ async def create_family_with_members(
                 family_member["date_of_birth"] = member.get("date_of_birth")
             
             await db.family_members.insert_one(family_member)
+        await people_typeahead.invalidate_circles(family_ids=[new_family["id"]])
         
         # Update member count to include creator
         await db.family_profiles.update_one(
@@ -4965,14 +5176,9 @@ async def search_users_basic(
         if len(query) < 2:
             return {"users": []}
         
-        # Search in users collection
-        users = await db.users.find({
-            "$or": [
-                {"name": {"$regex": query, "$options": "i"}},
-                {"surname": {"$regex": query, "$options": "i"}},
-                {"email": {"$regex": query, "$options": "i"}}
-            ]
-        }).limit(10).to_list(10)
+        # Ranked ids from the search index, then the user documents
+        ids = await search_index.search(USERS, query, limit=11)
+        users = order_by(ids, await db.users.find({"id": {"$in": ids}}).to_list(len(ids)))[:10]
         
         # Format user data
         user_results = []
@@ -5101,6 +5307,7 @@ async def add_family_member(
         }
         
         await db.family_members.insert_one(new_member)
+        await people_typeahead.invalidate_circles(family_ids=[family_id])
         
         # Update family member count
         await db.family_profiles.update_one(
@@ -5173,6 +5380,7 @@ async def remove_family_member(
             {"id": member_id, "family_id": family_id},
             {"$set": {"is_active": False}}
         )
+        await people_typeahead.invalidate_circles(family_ids=[family_id])
         
         if result.modified_count > 0:
             # Update family member count
@@ -5260,7 +5468,9 @@ async def delete_family(
         
         # Delete family and related data
         await db.family_profiles.delete_one({"id": family_id})
+        former_members = await db.family_members.distinct("user_id", {"family_id": family_id})
         await db.family_members.delete_many({"family_id": family_id})
+        await people_typeahead.invalidate_circles(user_ids=former_members)
         await db.family_posts.delete_many({"family_id": family_id})
         await db.family_invitations.delete_many({"family_id": family_id})
         
@@ -5341,7 +5551,7 @@ async def create_household(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @api_router.get("/household")
-async def get_user_household(current_user: User = Depends(get_current_user)):
+async def get_user_household(current_user: User = Depends(get_current_user), loaders: Loaders = Depends(get_loaders)):
     """Get user's household"""
     try:
         # Find household where user is a member
@@ -5365,6 +5575,7 @@ async def get_user_household(current_user: User = Depends(get_current_user)):
         }).to_list(100)
         
         # Enrich members with user data
+        member_users = await loaders.users.load_many(m.get("user_id") for m in members)
         enriched_members = []
         for member in members:
             member_data = {
@@ -5377,7 +5588,7 @@ async def get_user_household(current_user: User = Depends(get_current_user)):
             
             # If linked to user, get additional info
             if member.get("user_id"):
-                user = await db.users.find_one({"id": member["user_id"]})
+                user = member_users.get(member["user_id"])
                 if user:
                     member_data["email"] = user.get("email", "")
                     member_data["user_id"] = user["id"]
@@ -5580,7 +5791,8 @@ async def delete_household(
 @api_router.get("/family/{family_id}/public")
 async def get_public_family_profile(
     family_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get public view of family profile (privacy-aware)"""
     try:
@@ -5645,9 +5857,10 @@ async def get_public_family_profile(
         
         # Sanitize member data
         public_members = []
+        member_users = await loaders.users.load_many(m["user_id"] for m in members)
         for member in members:
             member.pop('_id', None)
-            user = await db.users.find_one({"id": member["user_id"]})
+            user = member_users.get(member["user_id"])
             if user:
                 user.pop('_id', None)
                 public_members.append({
@@ -5671,10 +5884,11 @@ async def get_public_family_profile(
             }).sort("created_at", -1).limit(10)
             family_posts = await posts_cursor.to_list(10)
             
+            post_authors = await loaders.users.load_many(p["user_id"] for p in family_posts)
             for post in family_posts:
                 post.pop('_id', None)
                 # Get author info
-                author = await db.users.find_one({"id": post["user_id"]})
+                author = post_authors.get(post["user_id"])
                 if author:
                     author.pop('_id', None)
                 
@@ -5887,6 +6101,7 @@ async def accept_family_invitation(
         invitation_accepted=True
     )
     await db.family_members.insert_one(family_member.dict())
+    await people_typeahead.invalidate_circles(family_ids=[invitation["family_id"]])
     
     # Update invitation status
     await db.family_invitations.update_one(
@@ -5946,7 +6161,8 @@ async def decline_family_invitation(
 
 @api_router.get("/family-invitations/received")
 async def get_received_invitations(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get invitations received by current user"""
     invitations = await db.family_invitations.find({
@@ -5955,15 +6171,17 @@ async def get_received_invitations(
     }).sort("sent_at", -1).to_list(50)
     
     # Enrich with family and sender information
+    families = await loaders.collection("family_profiles").load_many(i["family_id"] for i in invitations)
+    senders = await loaders.users.load_many(i["invited_by_user_id"] for i in invitations)
     enriched_invitations = []
     for invitation in invitations:
         # Remove MongoDB _id field
         invitation.pop("_id", None)
         
         # Get family info
-        family = await db.family_profiles.find_one({"id": invitation["family_id"]})
+        family = families.get(invitation["family_id"])
         # Get sender info
-        sender = await db.users.find_one({"id": invitation["invited_by_user_id"]})
+        sender = senders.get(invitation["invited_by_user_id"])
         
         if family and sender:
             # Remove MongoDB _id fields
@@ -5981,7 +6199,8 @@ async def get_received_invitations(
 
 @api_router.get("/family-invitations/sent")
 async def get_sent_invitations(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get invitations sent by current user"""
     invitations = await db.family_invitations.find({
@@ -5991,12 +6210,13 @@ async def get_sent_invitations(
     
     # Enrich with family information
     enriched_invitations = []
+    families = await loaders.collection("family_profiles").load_many(i["family_id"] for i in invitations)
     for invitation in invitations:
         # Remove MongoDB _id field
         invitation.pop("_id", None)
         
         # Get family info
-        family = await db.family_profiles.find_one({"id": invitation["family_id"]})
+        family = families.get(invitation["family_id"])
         
         if family:
             # Remove MongoDB _id field
@@ -6260,7 +6480,8 @@ async def subscribe_to_family(
 @api_router.get("/family-profiles/{family_id}/subscribers")
 async def get_family_subscribers(
     family_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get families subscribed to this family (admin only)"""
     # Check if user is admin
@@ -6282,8 +6503,9 @@ async def get_family_subscribers(
     }).to_list(100)
     
     subscribers = []
+    families = await loaders.collection("family_profiles").load_many(s["subscriber_family_id"] for s in subscriptions)
     for sub in subscriptions:
-        subscriber_family = await db.family_profiles.find_one({"id": sub["subscriber_family_id"]})
+        subscriber_family = families.get(sub["subscriber_family_id"])
         if subscriber_family:
             subscribers.append({
                 "family": subscriber_family,
@@ -6323,6 +6545,7 @@ async def create_chat_group(
         role="ADMIN"
     )
     await db.chat_group_members.insert_one(admin_member.dict())
+    memberships = [admin_member.dict()]
     
     # Add other members
     for member_id in group_data.member_ids:
@@ -6333,6 +6556,9 @@ async def create_chat_group(
                 role="MEMBER"
             )
             await db.chat_group_members.insert_one(member.dict())
+            memberships.append(member.dict())
+    
+    await conversations.add_group_members(new_group.dict(), memberships)
     
     return {"message": "Chat group created successfully", "group_id": new_group.id}
 
@@ -6341,7 +6567,8 @@ async def get_chat_messages(
     group_id: str,
     skip: int = 0,
     limit: int = 50,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get messages from a chat group"""
     # Verify user is member of the group
@@ -6358,17 +6585,18 @@ async def get_chat_messages(
         {"group_id": group_id, "is_deleted": False}
     ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     
+    # Opening the latest page reads the group for this member
+    if skip == 0:
+        await conversations.mark_read(GROUP, group_id, current_user.id)
+    
     # Remove MongoDB _id fields and get user info for each message
+    senders = await loaders.users.load_many(m["user_id"] for m in messages)
     for message in messages:
         message.pop("_id", None)
         # Get sender info
-        sender = await get_user_by_id(message["user_id"])
+        sender = senders.get(message["user_id"])
         if sender:
-            message["sender"] = {
-                "id": sender.id,
-                "first_name": sender.first_name,
-                "last_name": sender.last_name
-            }
+            message["sender"] = user_summary(sender, ("id", "first_name", "last_name"))
     
     # Reverse to show chronological order (oldest first)
     messages.reverse()
@@ -6401,6 +6629,8 @@ async def send_chat_message(
     )
     
     await db.chat_messages.insert_one(new_message.dict())
+    await conversations.on_message(new_message.dict())
+    await message_search.on_message(new_message.dict())
     
     return {"message": "Message sent successfully", "message_id": new_message.id}
 
@@ -6408,7 +6638,8 @@ async def send_chat_message(
 @api_router.get("/chat-groups/{group_id}/scheduled-actions")
 async def get_scheduled_actions(
     group_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get scheduled actions for a chat group"""
     # Verify user is member of the group
@@ -6426,15 +6657,12 @@ async def get_scheduled_actions(
     }).sort("scheduled_date", 1).to_list(100)
     
     # Remove MongoDB _id fields and get creator info
+    creators = await loaders.users.load_many(a["user_id"] for a in actions)
     for action in actions:
         action.pop("_id", None)
-        creator = await get_user_by_id(action["user_id"])
+        creator = creators.get(action["user_id"])
         if creator:
-            action["creator"] = {
-                "id": creator.id,
-                "first_name": creator.first_name,
-                "last_name": creator.last_name
-            }
+            action["creator"] = user_summary(creator, ("id", "first_name", "last_name"))
     
     return {"scheduled_actions": actions}
 
@@ -6505,51 +6733,23 @@ async def complete_scheduled_action(
 # ===== DIRECT MESSAGES (1:1 CHAT) ENDPOINTS =====
 
 @api_router.get("/direct-chats")
-async def get_user_direct_chats(current_user: User = Depends(get_current_user)):
+async def get_user_direct_chats(
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
+):
     """Get all direct chat conversations for the current user"""
-    direct_chats = await db.direct_chats.find({
-        "participant_ids": current_user.id,
-        "is_active": True
-    }).to_list(100)
-    
-    result = []
-    for chat in direct_chats:
-        chat.pop("_id", None)
-        
-        # Get the other participant
-        other_user_id = [uid for uid in chat["participant_ids"] if uid != current_user.id][0]
-        other_user = await get_user_by_id(other_user_id)
-        
-        # Get latest message
-        latest_message = await db.chat_messages.find_one(
-            {"direct_chat_id": chat["id"], "is_deleted": False},
-            sort=[("created_at", -1)]
-        )
-        if latest_message:
-            latest_message.pop("_id", None)
-        
-        # Get unread count
-        unread_count = await db.chat_messages.count_documents({
-            "direct_chat_id": chat["id"],
-            "user_id": {"$ne": current_user.id},
-            "status": {"$ne": "read"},
-            "is_deleted": False
-        })
-        
-        result.append({
-            "chat": chat,
-            "other_user": {
-                "id": other_user.id if other_user else other_user_id,
-                "first_name": other_user.first_name if other_user else "Unknown",
-                "last_name": other_user.last_name if other_user else "User",
-                "profile_picture": other_user.profile_picture if other_user else None
-            } if other_user else None,
-            "latest_message": latest_message,
-            "unread_count": unread_count
-        })
+    # One indexed read of the user's inbox rows, most recent activity first
+    summaries = await conversations.inbox(current_user.id, DIRECT)
     
-    # Sort by latest message time
-    result.sort(key=lambda x: x["latest_message"]["created_at"] if x["latest_message"] else x["chat"]["created_at"], reverse=True)
+    result = [
+        {
+            "chat": summary["chat"],
+            "other_user": summary.get("peer"),
+            "latest_message": summary.get("last_message"),
+            "unread_count": summary.get("unread_count", 0)
+        }
+        for summary in summaries
+    ]
     
     return {"direct_chats": result}
 
@@ -6584,6 +6784,10 @@ async def create_or_get_direct_chat(
     )
     
     await db.direct_chats.insert_one(new_chat.dict())
+    await conversations.add_direct_chat(new_chat.dict(), {
+        current_user.id: current_user.dict(),
+        recipient.id: recipient.dict()
+    })
     
     return {
         "message": "Direct chat created successfully",
@@ -6596,7 +6800,8 @@ async def get_direct_chat_messages(
     chat_id: str,
     skip: int = 0,
     limit: int = 50,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get messages from a direct chat"""
     # Verify user is participant
@@ -6610,10 +6815,7 @@ async def get_direct_chat_messages(
         raise HTTPException(status_code=403, detail="Not authorized to view this chat")
     
     # Update user's last seen
-    await db.users.update_one(
-        {"id": current_user.id},
-        {"$set": {"last_seen": datetime.now(timezone.utc), "is_online": True}}
-    )
+    await presence.touch(current_user.id)
     
     # Mark unread messages as read
     await db.chat_messages.update_many(
@@ -6624,9 +6826,11 @@ async def get_direct_chat_messages(
         },
         {"$set": {
             "status": "read",
-            "read_at": datetime.now(timezone.utc)
+            "read_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc)
         }}
     )
+    await conversations.mark_read(DIRECT, chat_id, current_user.id)
     
     messages = await db.chat_messages.find(
         {"direct_chat_id": chat_id, "is_deleted": False}
@@ -6635,27 +6839,26 @@ async def get_direct_chat_messages(
     # Get sender info and reply message for each message
     for message in messages:
         message.pop("_id", None)
-        sender = await get_user_by_id(message["user_id"])
+        loaders.messages.prime(message)
+    replies = await loaders.messages.load_many(m.get("reply_to") for m in messages)
+    senders = await loaders.users.load_many(
+        [m["user_id"] for m in messages] + [r["user_id"] for r in replies.values()]
+    )
+    
+    for message in messages:
+        sender = senders.get(message["user_id"])
         if sender:
-            message["sender"] = {
-                "id": sender.id,
-                "first_name": sender.first_name,
-                "last_name": sender.last_name,
-                "profile_picture": sender.profile_picture
-            }
+            message["sender"] = user_summary(sender)
         
         # Get reply message content if this is a reply
         if message.get("reply_to"):
-            reply_msg = await db.chat_messages.find_one(
-                {"id": message["reply_to"]},
-                {"_id": 0, "content": 1, "user_id": 1}
-            )
+            reply_msg = replies.get(message["reply_to"])
             if reply_msg:
-                reply_sender = await get_user_by_id(reply_msg["user_id"])
+                reply_sender = senders.get(reply_msg["user_id"])
                 message["reply_message"] = {
                     "content": reply_msg["content"],
                     "sender": {
-                        "first_name": reply_sender.first_name if reply_sender else "Unknown"
+                        "first_name": reply_sender.get("first_name") if reply_sender else "Unknown"
                     }
                 }
     
@@ -6691,6 +6894,8 @@ async def send_direct_message(
     )
     
     await db.chat_messages.insert_one(new_message.dict())
+    await conversations.on_message(new_message.dict())
+    await message_search.on_message(new_message.dict())
     
     # Update chat timestamp
     await db.direct_chats.update_one(
@@ -6738,11 +6943,13 @@ async def update_message_status(
         update_data["read_at"] = datetime.now(timezone.utc)
         if not message.get("delivered_at"):
             update_data["delivered_at"] = datetime.now(timezone.utc)
+    update_data["updated_at"] = datetime.now(timezone.utc)
     
     await db.chat_messages.update_one(
         {"id": message_id},
         {"$set": update_data}
     )
+    await conversations.on_status(message, current_user.id, status_data.status)
     
     return {"message": "Status updated successfully"}
 
@@ -6750,25 +6957,19 @@ async def update_message_status(
 async def get_typing_status(
     chat_id: str,
     chat_type: str = "direct",
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get typing status for a chat"""
-    # Get typing status that's recent (within last 5 seconds)
-    five_seconds_ago = datetime.now(timezone.utc) - timedelta(seconds=5)
-    
-    typing_users = await db.typing_status.find({
-        "chat_id": chat_id,
-        "chat_type": chat_type,
-        "user_id": {"$ne": current_user.id},
-        "is_typing": True,
-        "updated_at": {"$gte": five_seconds_ago}
-    }, {"_id": 0}).to_list(10)
+    # Entries expire on their own a few seconds after the last keystroke
+    typing_users = (await presence.typing_users(chat_type, chat_id, exclude_user=current_user.id))[:10]
     
     # Get user names for typing users
+    users = await loaders.users.load_many(t["user_id"] for t in typing_users)
     for typing_status in typing_users:
-        user = await get_user_by_id(typing_status["user_id"])
+        user = users.get(typing_status["user_id"])
         if user:
-            typing_status["user_name"] = f"{user.first_name} {user.last_name}"
+            typing_status["user_name"] = f"{user.get('first_name')} {user.get('last_name')}"
     
     return {"typing_users": typing_users}
 
@@ -6780,45 +6981,39 @@ async def set_typing_status(
     current_user: User = Depends(get_current_user)
 ):
     """Set typing status for current user in a chat"""
-    await db.typing_status.update_one(
-        {
-            "chat_id": chat_id,
-            "chat_type": chat_type,
-            "user_id": current_user.id
-        },
-        {
-            "$set": {
-                "is_typing": typing_data.is_typing,
-                "updated_at": datetime.now(timezone.utc)
-            },
-            "$setOnInsert": {
-                "chat_id": chat_id,
-                "chat_type": chat_type,
-                "user_id": current_user.id
-            }
-        },
-        upsert=True
-    )
+    await presence.set_typing(chat_type, chat_id, current_user.id, typing_data.is_typing)
     
     return {"message": "Typing status updated"}
 
+CONTACT_FIELDS = ("id", "first_name", "last_name", "email", "profile_picture")
+
+async def hydrate_people(people: list, loaders: Loaders, fields: Optional[tuple] = None) -> list:
+    """Public user documents (only `fields` of them if given) for typeahead hits, keeping their order and relationship flags"""
+    users = await loaders.users.load_many(p["id"] for p in people)
+    hydrated = []
+    for person in people:
+        user = users.get(person["id"])
+        if not user:
+            continue
+        if fields is not None:
+            user = {f: user[f] for f in fields if f in user}
+            person = {k: v for k, v in person.items() if k not in TYPEAHEAD_DISPLAY_FIELDS}
+        hydrated.append({**user, **person})
+    return hydrated
+
 @api_router.get("/users/contacts")
 async def get_user_contacts(
     search: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get list of users that can be contacted (for starting new chats)"""
-    query = {"id": {"$ne": current_user.id}}
-    
     if search:
-        search_regex = {"$regex": search, "$options": "i"}
-        query["$or"] = [
-            {"first_name": search_regex},
-            {"last_name": search_regex},
-            {"email": search_regex}
-        ]
+        # Typeahead: friends, family and colleagues first, relationship flags included
+        people = await people_typeahead.suggest(current_user.id, search, limit=50)
+        return {"contacts": await hydrate_people(people, loaders, fields=CONTACT_FIELDS)}
     
-    users = await db.users.find(query, {
+    users = await db.users.find({"id": {"$ne": current_user.id}}, {
         "_id": 0,
         "id": 1,
         "first_name": 1,
@@ -6834,13 +7029,7 @@ async def get_user_contacts(
 @api_router.post("/users/heartbeat")
 async def user_heartbeat(current_user: User = Depends(get_current_user)):
     """Update user's last_seen timestamp for online status tracking"""
-    await db.users.update_one(
-        {"id": current_user.id},
-        {"$set": {
-            "last_seen": datetime.now(timezone.utc),
-            "is_online": True
-        }}
-    )
+    await presence.touch(current_user.id)
     return {"status": "ok", "timestamp": datetime.now(timezone.utc).isoformat()}
 
 @api_router.get("/users/{user_id}/status")
@@ -6849,23 +7038,11 @@ async def get_user_status(
     current_user: User = Depends(get_current_user)
 ):
     """Get a user's online status and last seen time"""
-    user = await db.users.find_one(
-        {"id": user_id},
-        {"_id": 0, "last_seen": 1, "is_online": 1, "first_name": 1, "last_name": 1}
-    )
-    
-    if not user:
+    # Online while the last activity is within 2 minutes (presence.online_ttl)
+    is_online, last_seen = await presence.status(user_id)
+    if last_seen is None and not await get_user_by_id(user_id):
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Consider user online if last_seen within 2 minutes
-    last_seen = user.get("last_seen")
-    is_online = False
-    if last_seen:
-        if isinstance(last_seen, str):
-            last_seen = datetime.fromisoformat(last_seen.replace('Z', '+00:00'))
-        time_diff = datetime.now(timezone.utc) - last_seen
-        is_online = time_diff.total_seconds() < 120  # 2 minutes
-    
     return {
         "user_id": user_id,
         "is_online": is_online,
@@ -6878,9 +7055,17 @@ async def search_direct_chat_messages(
     query: str,
     skip: int = 0,
     limit: int = 20,
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    """Search messages in a direct chat"""
+    """Search messages in a direct chat
+
+    Served from the per-chat message index (core/message_search.py). Each hit
+    has a `snippet` with highlight offsets; pass `next_cursor` as `cursor` for
+    the next page (`skip` is kept for older clients). `total` is capped and
+    flagged by `total_is_estimate`.
+    """
     # Verify user is participant
     chat = await db.direct_chats.find_one({
         "id": chat_id,
@@ -6891,34 +7076,26 @@ async def search_direct_chat_messages(
     if not chat:
         raise HTTPException(status_code=403, detail="Not authorized to search this chat")
     
-    # Search messages
-    messages = await db.chat_messages.find({
-        "direct_chat_id": chat_id,
-        "content": {"$regex": query, "$options": "i"},
-        "is_deleted": False
-    }).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    limit = max(1, min(limit, 100))
+    try:
+        page = await message_search.search(DIRECT, chat_id, query, limit=limit, cursor=cursor, offset=max(0, skip))
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    messages = page.messages
     
     # Add sender info
+    senders = await loaders.users.load_many(m["user_id"] for m in messages)
     for message in messages:
-        message.pop("_id", None)
-        sender = await get_user_by_id(message["user_id"])
+        sender = senders.get(message["user_id"])
         if sender:
-            message["sender"] = {
-                "id": sender.id,
-                "first_name": sender.first_name,
-                "last_name": sender.last_name,
-                "profile_picture": sender.profile_picture
-            }
-    
-    total = await db.chat_messages.count_documents({
-        "direct_chat_id": chat_id,
-        "content": {"$regex": query, "$options": "i"},
-        "is_deleted": False
-    })
+            message["sender"] = user_summary(sender)
     
     return {
         "messages": messages,
-        "total": total,
+        "total": page.total,
+        "total_is_estimate": page.total_is_estimate,
+        "next_cursor": page.next_cursor,
+        "has_more": page.has_more,
         "query": query
     }
 
@@ -6928,9 +7105,17 @@ async def search_group_chat_messages(
     query: str,
     skip: int = 0,
     limit: int = 20,
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    """Search messages in a group chat"""
+    """Search messages in a group chat
+
+    Served from the per-chat message index (core/message_search.py). Each hit
+    has a `snippet` with highlight offsets; pass `next_cursor` as `cursor` for
+    the next page (`skip` is kept for older clients). `total` is capped and
+    flagged by `total_is_estimate`.
+    """
     # Verify user is member
     membership = await db.chat_group_members.find_one({
         "group_id": group_id,
@@ -6941,34 +7126,26 @@ async def search_group_chat_messages(
     if not membership:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
-    # Search messages
-    messages = await db.chat_messages.find({
-        "group_id": group_id,
-        "content": {"$regex": query, "$options": "i"},
-        "is_deleted": False
-    }).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    limit = max(1, min(limit, 100))
+    try:
+        page = await message_search.search(GROUP, group_id, query, limit=limit, cursor=cursor, offset=max(0, skip))
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    messages = page.messages
     
     # Add sender info
+    senders = await loaders.users.load_many(m["user_id"] for m in messages)
     for message in messages:
-        message.pop("_id", None)
-        sender = await get_user_by_id(message["user_id"])
+        sender = senders.get(message["user_id"])
         if sender:
-            message["sender"] = {
-                "id": sender.id,
-                "first_name": sender.first_name,
-                "last_name": sender.last_name,
-                "profile_picture": sender.profile_picture
-            }
-    
-    total = await db.chat_messages.count_documents({
-        "group_id": group_id,
-        "content": {"$regex": query, "$options": "i"},
-        "is_deleted": False
-    })
+            message["sender"] = user_summary(sender)
     
     return {
         "messages": messages,
-        "total": total,
+        "total": page.total,
+        "total_is_estimate": page.total_is_estimate,
+        "next_cursor": page.next_cursor,
+        "has_more": page.has_more,
         "query": query
     }
 
@@ -6996,18 +7173,19 @@ async def send_message_with_attachment(
     if not is_valid:
         raise HTTPException(status_code=400, detail=error)
     
-    # Generate unique filename
-    file_ext = os.path.splitext(file.filename)[1]
-    stored_filename = f"chat_{chat_id}_{str(uuid.uuid4())}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, stored_filename)
-    
     # Save file
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    file_ext = os.path.splitext(file.filename)[1]
+    content_type = file.content_type or ""
+    media_file = await save_uploaded_file(
+        file,
+        current_user.id,
+        stored_filename=f"chat_{chat_id}_{str(uuid.uuid4())}{file_ext}",
+        source_module="chat",
+        metadata={"chat_id": chat_id}
+    )
+    await media_acl.grant([media_file.id], CHAT, chat_id)
     
     # Determine message type
-    content_type = file.content_type or ""
     if content_type.startswith("image/"):
         message_type = "IMAGE"
     else:
@@ -7026,14 +7204,17 @@ async def send_message_with_attachment(
     # Store attachment info in message
     message_dict = new_message.dict()
     message_dict["attachment"] = {
+        "media_id": media_file.id,
         "filename": file.filename,
-        "stored_filename": stored_filename,
-        "file_path": f"/api/media/files/{stored_filename}",
+        "stored_filename": media_file.stored_filename,
+        "file_path": f"/api/media/files/{media_file.stored_filename}",
         "mime_type": content_type,
-        "file_size": os.path.getsize(file_path)
+        "file_size": media_file.file_size
     }
     
     await db.chat_messages.insert_one(message_dict)
+    await conversations.on_message(message_dict)
+    await message_search.on_message(message_dict)
     
     # Update chat timestamp
     await db.direct_chats.update_one(
@@ -7081,16 +7262,20 @@ async def send_voice_message(
         if not file.filename.endswith(('.webm', '.ogg', '.mp3', '.wav')):
             raise HTTPException(status_code=400, detail="Invalid audio file format")
     
-    # Generate unique filename
-    file_ext = os.path.splitext(file.filename)[1] or '.webm'
-    stored_filename = f"voice_{chat_id}_{str(uuid.uuid4())}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, stored_filename)
-    
     # Save file
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    file_content = await file.read()
-    with open(file_path, "wb") as buffer:
-        buffer.write(file_content)
+    file_ext = os.path.splitext(file.filename)[1] or '.webm'
+    media_file = await store_media(
+        file,
+        current_user.id,
+        filename=file.filename,
+        mime_type=content_type or "audio/webm",
+        max_size=MAX_FILE_SIZE["audio"],
+        stored_filename=f"voice_{chat_id}_{str(uuid.uuid4())}{file_ext}",
+        file_type="audio",
+        source_module="chat",
+        metadata={"chat_id": chat_id, "duration": duration}
+    )
+    await media_acl.grant([media_file.id], CHAT, chat_id)
     
     # Create voice message
     new_message = ChatMessage(
@@ -7105,15 +7290,18 @@ async def send_voice_message(
     # Store voice message info
     message_dict = new_message.dict()
     message_dict["voice"] = {
+        "media_id": media_file.id,
         "filename": file.filename,
-        "stored_filename": stored_filename,
-        "file_path": f"/api/media/files/{stored_filename}",
-        "mime_type": content_type or "audio/webm",
+        "stored_filename": media_file.stored_filename,
+        "file_path": f"/api/media/files/{media_file.stored_filename}",
+        "mime_type": media_file.mime_type,
         "duration": duration,
-        "file_size": len(file_content)
+        "file_size": media_file.file_size
     }
     
     await db.chat_messages.insert_one(message_dict)
+    await conversations.on_message(message_dict)
+    await message_search.on_message(message_dict)
     
     # Update chat timestamp
     await db.direct_chats.update_one(
@@ -7240,7 +7428,8 @@ async def react_to_message(
         {"id": message_id},
         {"$set": {
             "reactions": reactions,
-            "user_reactions": user_reactions
+            "user_reactions": user_reactions,
+            "updated_at": datetime.now(timezone.utc)
         }}
     )
     
@@ -7283,11 +7472,14 @@ async def edit_message(
         {"$set": {
             "content": new_content.strip(),
             "is_edited": True,
-            "edited_at": datetime.now(timezone.utc)
+            "edited_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc)
         }}
     )
     
     updated_message = await db.chat_messages.find_one({"id": message_id}, {"_id": 0})
+    await conversations.on_edit(updated_message)
+    await message_search.on_edit(updated_message)
     
     return {
         "message": "Message updated",
@@ -7314,9 +7506,12 @@ async def delete_message(
         {"$set": {
             "is_deleted": True,
             "deleted_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc),
             "content": ""  # Clear content for privacy
         }}
     )
+    await conversations.on_delete(message)
+    await message_search.on_delete(message)
     
     return {"message": "Message deleted"}
 
@@ -7396,6 +7591,8 @@ async def forward_message(
         message_dict["voice"] = original_message["voice"]
     
     await db.chat_messages.insert_one(message_dict)
+    await conversations.on_message(message_dict)
+    await message_search.on_message(message_dict)
     
     # Update target chat timestamp
     if chat_type == "direct":
@@ -7425,6 +7622,9 @@ async def forward_message(
 # ===== END DIRECT MESSAGES ENDPOINTS =====
 
 # Media Upload Endpoints
+MEDIA_MODULES = ["family", "work", "education", "health", "government", "business", "community", "personal"]
+MEDIA_PRIVACY_LEVELS = ["private", "module", "public"]
+
 @api_router.post("/media/upload", response_model=MediaUploadResponse)
 async def upload_media_file(
     file: UploadFile = File(...),
@@ -7439,35 +7639,26 @@ async def upload_media_file(
         raise HTTPException(status_code=400, detail=error_message)
     
     # Validate source_module
-    valid_modules = ["family", "work", "education", "health", "government", "business", "community", "personal"]
-    if source_module not in valid_modules:
+    if source_module not in MEDIA_MODULES:
         source_module = "personal"
     
     # Validate privacy_level
-    valid_privacy = ["private", "module", "public"]
-    if privacy_level not in valid_privacy:
+    if privacy_level not in MEDIA_PRIVACY_LEVELS:
         privacy_level = "private"
     
+    # Add metadata based on file type
+    file_type = get_file_type(file.content_type)
+    category = file_type if file_type in ("image", "document") else "other"
+    
     try:
-        # Save file and create record
-        media_file = await save_uploaded_file(file, current_user.id)
-        
-        # Update with module and privacy info
-        media_file.source_module = source_module
-        media_file.privacy_level = privacy_level
-        
-        # Add metadata based on file type
-        if media_file.file_type == "image":
-            # You could add image dimensions here using PIL
-            media_file.metadata = {"category": "image"}
-        elif media_file.file_type == "document":
-            media_file.metadata = {"category": "document"}
-        else:
-            media_file.metadata = {"category": "other"}
-        
-        # Store in database
-        media_dict = media_file.dict()
-        await db.media_files.insert_one(media_dict)
+        # Stream file to storage and create record
+        media_file = await save_uploaded_file(
+            file,
+            current_user.id,
+            source_module=source_module,
+            privacy_level=privacy_level,
+            metadata={"category": category}
+        )
         
         return MediaUploadResponse(
             id=media_file.id,
@@ -7477,9 +7668,85 @@ async def upload_media_file(
             file_url=f"/api/media/{media_file.id}"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
+DIRECT_UPLOAD_TTL = timedelta(hours=1)
+
+@api_router.post("/media/uploads/presign")
+async def presign_media_upload(
+    upload: DirectUploadRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Start a direct-to-storage upload: the client PUTs the bytes to the returned URL
+    (pinned to their SHA-256), then calls /media/uploads/{upload_id}/complete.
+    The bytes are always uploaded, even when the store already has the content:
+    an existing blob is never granted on a claimed hash.
+    """
+    file_type = get_file_type(upload.content_type)
+    if file_type == "unknown":
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    max_size = MAX_FILE_SIZE.get(file_type, 0)
+    if upload.size <= 0 or upload.size > max_size:
+        raise HTTPException(status_code=413, detail=f"File too large. Max size: {max_size // (1024*1024)}MB")
+
+    fields = {
+        "source_module": upload.source_module if upload.source_module in MEDIA_MODULES else "personal",
+        "privacy_level": upload.privacy_level if upload.privacy_level in MEDIA_PRIVACY_LEVELS else "private",
+    }
+    upload_id = str(uuid.uuid4())
+    instructions = await media_store.presign_upload(upload_id, upload.sha256, upload.size, upload.content_type)
+    if instructions is None:
+        raise HTTPException(status_code=400, detail="Direct uploads need an object storage backend; use /media/upload")
+    expires_at = datetime.now(timezone.utc) + DIRECT_UPLOAD_TTL
+    await db.media_uploads.insert_one({
+        "upload_id": upload_id,
+        "user_id": current_user.id,
+        "filename": upload.filename,
+        "content_type": upload.content_type,
+        "file_type": file_type,
+        "size": upload.size,
+        "sha256": upload.sha256,
+        **fields,
+        "expires_at": expires_at
+    })
+    return {"status": "pending", "upload_id": upload_id, "upload": instructions, "expires_at": expires_at}
+
+@api_router.post("/media/uploads/{upload_id}/complete", response_model=MediaUploadResponse)
+async def complete_media_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Attach a finished direct upload: verifies the uploaded object's checksum in the store and creates its MediaFile record"""
+    upload = await db.media_uploads.find_one_and_delete({
+        "upload_id": upload_id,
+        "user_id": current_user.id,
+        "expires_at": {"$gt": datetime.now(timezone.utc)}
+    })
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    blob = await media_store.complete_upload(upload_id, upload["sha256"], upload["size"])
+    if not blob:
+        raise HTTPException(status_code=409, detail="Uploaded object missing or checksum / size mismatch")
+
+    media_file = await insert_media_file(
+        blob, current_user.id, upload["filename"], upload["content_type"],
+        file_type=upload["file_type"],
+        source_module=upload["source_module"],
+        privacy_level=upload["privacy_level"],
+        metadata={"category": upload["file_type"]}
+    )
+    return MediaUploadResponse(
+        id=media_file.id,
+        original_filename=media_file.original_filename,
+        file_type=media_file.file_type,
+        file_size=media_file.file_size,
+        file_url=f"/api/media/{media_file.id}"
+    )
+
 @api_router.get("/media")
 async def get_user_media(
     media_type: Optional[str] = None,  # "image", "document", "video"
@@ -7545,19 +7812,18 @@ async def create_media_collection(
     source_module: str = Form(default="personal"),
     media_ids: List[str] = Form(default=[]),
     privacy_level: str = Form(default="private"),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Create a new media collection (album)"""
     
     # Validate media_ids belong to user
     valid_media_ids = []
     if media_ids:
+        owned = await loaders.media.load_many(media_ids)
         for media_id in media_ids:
-            media = await db.media_files.find_one({
-                "id": media_id,
-                "uploaded_by": current_user.id
-            })
-            if media:
+            media = owned.get(media_id)
+            if media and media.get("uploaded_by") == current_user.id:
                 valid_media_ids.append(media_id)
     
     # Create collection
@@ -7596,10 +7862,15 @@ async def get_user_collections(
 @api_router.get("/media/{file_id}")
 async def get_media_file(
     file_id: str,
+    request: Request,
+    size: Optional[str] = Query(None, description="Image variant: thumb, small, medium, large"),
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
 ):
-    """Serve uploaded media file with access control"""
-    media_file = await db.media_files.find_one({"id": file_id})
+    """Serve uploaded media file with access control; images can be served as a resized variant"""
+    if size is not None and size not in VARIANT_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown size. Use one of: {', '.join(VARIANT_SIZES)}")
+
+    media_file = await get_cached_media_file({"id": file_id}, f"media:{file_id}")
     if not media_file:
         raise HTTPException(status_code=404, detail="File not found")
 
@@ -7616,20 +7887,12 @@ async def get_media_file(
     is_public = media_file.get("is_public", False)
     is_profile_picture = media_file.get("source_module") == "profile"
     is_organization_media = media_file.get("source_module") == "work"  # Org logos/banners should be accessible
-    is_owner = current_user_id and media_file.get("user_id") == current_user_id
+    is_owner = current_user_id and media_file.get("uploaded_by") == current_user_id
 
-    # Check if media is used as organization logo/banner (should be publicly accessible)
+    # Public through a referencing context (org logo/banner, public post): one cached lookup
     is_org_logo_or_banner = False
     if not (is_public or is_profile_picture or is_organization_media or is_owner):
-        # Check if this file_id is used in any organization's logo_url or banner_url
-        media_url_pattern = f"/api/media/{file_id}"
-        org_using_media = await db.work_organizations.find_one({
-            "$or": [
-                {"logo_url": {"$regex": file_id}},
-                {"banner_url": {"$regex": file_id}}
-            ]
-        })
-        is_org_logo_or_banner = org_using_media is not None
+        is_org_logo_or_banner = await media_acl.is_public(file_id)
 
     # Allow access if: public, profile picture, organization media, org logo/banner, or owner
     if not (is_public or is_profile_picture or is_organization_media or is_org_logo_or_banner or is_owner):
@@ -7639,24 +7902,38 @@ async def get_media_file(
         # Check if user has access through context (e.g., same organization, family)
         # For now, allow authenticated users to access media in shared contexts
 
-    file_path = Path(media_file["file_path"])
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found on disk")
+    # Content behind a media id never changes: strong ETag from the content hash, cached for a year
+    etag = media_file.get("sha256") or file_id
+    shared = is_public or is_profile_picture or is_organization_media or is_org_logo_or_banner
+    cache_control = IMMUTABLE if shared else PRIVATE_IMMUTABLE
+
+    if size and media_file.get("file_type") == "image":
+        variant = image_derivatives.variant(media_file, size, request.headers.get("accept", ""))
+        if variant:
+            variant_key, variant_type = variant
+            response = await media_store.serve_key(
+                request, variant_key, variant_type,
+                etag=f'"{etag}-{size}-{variant_type.split("/")[1]}"',
+                cache_control=cache_control,
+                headers={"Vary": "Accept"}
+            )
+            if response is not None:
+                return response
+        # Uploaded before derivatives existed (or still rendering): build them, serve the original meanwhile
+        metadata = media_file.get("metadata") or {}
+        if "variants" not in metadata and "image_error" not in metadata:
+            image_derivatives.schedule(media_file.get("sha256"))
+        return await serve_media_file(request, media_file, f'"{etag}"', "private, no-cache")
 
-    from fastapi.responses import FileResponse
-    return FileResponse(
-        path=file_path,
-        filename=media_file["original_filename"],
-        media_type=media_file["mime_type"]
-    )
+    return await serve_media_file(request, media_file, f'"{etag}"', cache_control)
 
 @api_router.get("/media/files/{filename}")
 async def get_media_file_by_name(
     filename: str,
+    request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
 ):
     """Serve uploaded files (voice messages, chat attachments) by filename"""
-    from fastapi.responses import FileResponse
     from urllib.parse import unquote
 
     # Decode URL-encoded characters first (prevents %2e%2e bypass)
@@ -7667,7 +7944,20 @@ async def get_media_file_by_name(
     if ".." in decoded_filename or "/" in decoded_filename or "\\" in decoded_filename:
         raise HTTPException(status_code=400, detail="Invalid filename")
 
-    # 2. Resolve the full path and verify it's within UPLOAD_DIR
+    # Files stored through the media store live at their content-addressed path
+    media_file = await get_cached_media_file(
+        {"stored_filename": decoded_filename},
+        f"media-name:{decoded_filename}"
+    )
+    if media_file:
+        return await serve_media_file(
+            request, media_file,
+            etag=f'"{media_file.get("sha256") or media_file["id"]}"',
+            cache_control=PRIVATE_IMMUTABLE,
+            filename=decoded_filename
+        )
+
+    # 2. Legacy files: resolve the full path and verify it's within UPLOAD_DIR
     try:
         upload_dir_resolved = Path(UPLOAD_DIR).resolve()
         file_path = (UPLOAD_DIR / decoded_filename).resolve()
@@ -7696,10 +7986,12 @@ async def get_media_file_by_name(
     }
     mime_type = mime_types.get(ext, 'application/octet-stream')
     
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type=mime_type
+    stat = file_path.stat()
+    return media_store.serve(
+        request, file_path, mime_type,
+        etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        cache_control="private, max-age=86400",
+        filename=filename
     )
 
 # Helper function to check if user can see post based on visibility
@@ -7786,7 +8078,8 @@ async def get_posts(
     module: str = "family",  # Module to filter posts by
     family_id: str = None,  # Filter by specific family ID
     filter: str = None,  # 'subscribed' for subscribed families
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get posts feed filtered by module, family, and user connections - OPTIMIZED VERSION with pagination"""
     
@@ -7865,25 +8158,14 @@ async def get_posts(
     
     # ========== OPTIMIZED: Batch fetch all related data ==========
     post_ids = [p["id"] for p in visible_posts]
-    user_ids = list(set(p["user_id"] for p in visible_posts))
-    all_media_ids = []
-    for p in visible_posts:
-        all_media_ids.extend(p.get("media_files", []))
-    all_media_ids = list(set(all_media_ids))
     
     # Batch query 1: All authors at once
-    authors_list = await db.users.find(
-        {"id": {"$in": user_ids}},
-        {"_id": 0, "id": 1, "first_name": 1, "last_name": 1, "profile_picture": 1}
-    ).to_list(len(user_ids))
-    authors_map = {a["id"]: a for a in authors_list}
+    authors_map = await loaders.users.load_many(p["user_id"] for p in visible_posts)
     
     # Batch query 2: All media files at once
-    media_files_list = await db.media_files.find(
-        {"id": {"$in": all_media_ids}},
-        {"_id": 0}
-    ).to_list(len(all_media_ids)) if all_media_ids else []
-    media_files_map = {m["id"]: m for m in media_files_list}
+    media_files_map = await loaders.media.load_many(
+        media_id for p in visible_posts for media_id in p.get("media_files", [])
+    )
     
     # Batch query 3: All user likes at once
     user_likes_list = await db.post_likes.find(
@@ -7962,7 +8244,8 @@ async def create_post(
     youtube_video_id: str = Form(default=None),  # Explicit YouTube video ID
     link_url: str = Form(default=None),  # Link for preview
     link_domain: str = Form(default=None),  # Link domain for preview
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Create a new post with optional media attachments, YouTube embeds, link previews, and role-based visibility"""
     
@@ -7986,17 +8269,16 @@ async def create_post(
     # Validate media file IDs belong to current user and update their source_module
     valid_media_ids = []
     if media_file_ids:
+        owned = await loaders.media.load_many(media_file_ids)
         for media_id in media_file_ids:
-            media = await db.media_files.find_one({
-                "id": media_id,
-                "uploaded_by": current_user.id
-            })
-            if media:
+            media = owned.get(media_id)
+            if media and media.get("uploaded_by") == current_user.id:
                 # Update media file's source_module to match the post's context
                 await db.media_files.update_one(
                     {"id": media_id},
                     {"$set": {"source_module": source_module}}
                 )
+                await cache.invalidate_tag(f"media:{media_id}")
                 valid_media_ids.append(media_id)
     
     # Create post with module information and visibility
@@ -8015,6 +8297,7 @@ async def create_post(
     )
     
     await db.posts.insert_one(new_post.dict())
+    await media_acl.grant(valid_media_ids, POST, new_post.id, public=visibility_enum.value == "PUBLIC")
     
     # Check for @ERIC mention or ERIC_AI visibility and trigger AI response
     should_trigger_eric = '@eric' in content.lower() or '@ERIC' in content or visibility == 'ERIC_AI'
@@ -8036,10 +8319,9 @@ async def create_post(
     
     media_files = []
     for media_id in valid_media_ids:
-        media = await db.media_files.find_one({"id": media_id})
+        media = owned.get(media_id)
         if media:
-            media.pop("_id", None)
-            media["file_url"] = f"/api/media/{media_id}"
+            media = {**media, "source_module": source_module, "file_url": f"/api/media/{media_id}"}
             media_files.append(media)
     
     return PostResponse(
@@ -8095,7 +8377,7 @@ async def like_post(
         # Decrement likes count
         await db.posts.update_one(
             {"id": post_id},
-            {"$inc": {"likes_count": -1}}
+            {"$inc": {"likes_count": -1}, "$set": {"updated_at": datetime.now(timezone.utc)}}
         )
         
         # Create unlike notification (remove notification)
@@ -8118,7 +8400,7 @@ async def like_post(
         # Increment likes count
         await db.posts.update_one(
             {"id": post_id},
-            {"$inc": {"likes_count": 1}}
+            {"$inc": {"likes_count": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}}
         )
         
         # Create notification for post author (don't notify yourself)
@@ -8138,7 +8420,8 @@ async def like_post(
 @api_router.get("/posts/{post_id}/likes")
 async def get_post_likes(
     post_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get list of users who liked a post"""
     post = await db.posts.find_one({"id": post_id})
@@ -8148,17 +8431,14 @@ async def get_post_likes(
     likes = await db.post_likes.find({"post_id": post_id}).to_list(1000)  # Safety limit to prevent memory exhaustion
     
     # Get user info for each like
+    users = await loaders.users.load_many(like["user_id"] for like in likes)
     result = []
     for like in likes:
-        user = await get_user_by_id(like["user_id"])
+        user = users.get(like["user_id"])
         if user:
             result.append({
                 "id": like["id"],
-                "user": {
-                    "id": user.id,
-                    "first_name": user.first_name,
-                    "last_name": user.last_name
-                },
+                "user": user_summary(user, ("id", "first_name", "last_name")),
                 "created_at": like["created_at"]
             })
     
@@ -8168,7 +8448,8 @@ async def get_post_likes(
 @api_router.get("/posts/{post_id}/comments")
 async def get_post_comments(
     post_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get comments for a post"""
     post = await db.posts.find_one({"id": post_id})
@@ -8185,6 +8466,8 @@ async def get_post_comments(
     comments_dict = {}
     top_level_comments = []
     
+    authors = await loaders.users.load_many(c["user_id"] for c in comments if c["user_id"] != "eric-ai")
+    
     for comment in comments:
         comment.pop("_id", None)
         
@@ -8197,13 +8480,7 @@ async def get_post_comments(
                 "profile_picture": "/eric-avatar.jpg"
             }
         else:
-            author = await get_user_by_id(comment["user_id"])
-            comment["author"] = {
-                "id": author.id,
-                "first_name": author.first_name,
-                "last_name": author.last_name,
-                "profile_picture": author.profile_picture
-            } if author else {}
+            comment["author"] = user_summary(authors.get(comment["user_id"])) or {}
         
         comment["replies"] = []
         comments_dict[comment["id"]] = comment
@@ -8258,7 +8535,7 @@ async def create_comment(
         # Increment comments count on post
         await db.posts.update_one(
             {"id": post_id},
-            {"$inc": {"comments_count": 1}}
+            {"$inc": {"comments_count": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}}
         )
     
     # Create notification for post author or parent comment author
@@ -8363,7 +8640,7 @@ async def delete_comment(
         # Decrement comments count on post
         await db.posts.update_one(
             {"id": comment["post_id"]},
-            {"$inc": {"comments_count": -1}}
+            {"$inc": {"comments_count": -1}, "$set": {"updated_at": datetime.now(timezone.utc)}}
         )
     
     return {"message": "Comment deleted successfully"}
@@ -8479,7 +8756,8 @@ async def add_reaction(
 @api_router.get("/posts/{post_id}/reactions")
 async def get_post_reactions(
     post_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get emoji reactions for a post"""
     post = await db.posts.find_one({"id": post_id})
@@ -8489,6 +8767,7 @@ async def get_post_reactions(
     reactions = await db.post_reactions.find({"post_id": post_id}).to_list(1000)  # Safety limit to prevent memory exhaustion
     
     # Group reactions by emoji and get user info
+    users = await loaders.users.load_many(r["user_id"] for r in reactions)
     reaction_groups = {}
     for reaction in reactions:
         emoji = reaction["emoji"]
@@ -8501,13 +8780,9 @@ async def get_post_reactions(
         reaction_groups[emoji]["count"] += 1
         
         # Get user info
-        user = await get_user_by_id(reaction["user_id"])
+        user = users.get(reaction["user_id"])
         if user:
-            reaction_groups[emoji]["users"].append({
-                "id": user.id,
-                "first_name": user.first_name,
-                "last_name": user.last_name
-            })
+            reaction_groups[emoji]["users"].append(user_summary(user, ("id", "first_name", "last_name")))
     
     return list(reaction_groups.values())
 
@@ -8532,7 +8807,8 @@ async def remove_reaction(
 async def get_notifications(
     unread_only: bool = False,
     limit: int = 50,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get user notifications"""
     filter_query = {"user_id": current_user.id}
@@ -8545,17 +8821,14 @@ async def get_notifications(
         .to_list(limit)
     
     # Get sender info for each notification
+    senders = await loaders.users.load_many(n.get("sender_id") for n in notifications)
     result = []
     for notification in notifications:
         notification.pop("_id", None)
         
         # Get sender info
-        sender = await get_user_by_id(notification["sender_id"])
-        notification["sender"] = {
-            "id": sender.id,
-            "first_name": sender.first_name,
-            "last_name": sender.last_name
-        } if sender else {}
+        sender = senders.get(notification.get("sender_id"))
+        notification["sender"] = user_summary(sender, ("id", "first_name", "last_name")) if sender else {}
         
         result.append(notification)
     
@@ -8572,7 +8845,8 @@ async def mark_notification_read(
         {
             "$set": {
                 "is_read": True,
-                "read_at": datetime.now(timezone.utc)
+                "read_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
             }
         }
     )
@@ -8592,7 +8866,8 @@ async def mark_all_notifications_read(
         {
             "$set": {
                 "is_read": True,
-                "read_at": datetime.now(timezone.utc)
+                "read_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
             }
         }
     )
@@ -8651,6 +8926,7 @@ async def complete_user_profile(
         {"id": current_user.id},
         {"$set": update_data}
     )
+    await invalidate_user_cache(current_user.id)
     
     return {"message": "Profile completed successfully", "profile_completed": True}
 
@@ -8950,7 +9226,8 @@ async def vote_on_join_request(
 
 @api_router.get("/family-join-requests/pending")
 async def get_pending_join_requests(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all pending join requests for families where user is a head"""
     # Get user's family units where they are head
@@ -8969,17 +9246,19 @@ async def get_pending_join_requests(
     }).sort("created_at", -1).to_list(50)
     
     # Enrich with user and family info
+    requesting_users = await loaders.users.load_many(r["requesting_user_id"] for r in join_requests)
+    target_families = await loaders.collection("family_units").load_many(r["target_family_unit_id"] for r in join_requests)
     enriched_requests = []
     for request in join_requests:
         request.pop("_id", None)
         
         # Get requesting user info
-        requesting_user = await db.users.find_one({"id": request["requesting_user_id"]})
+        requesting_user = requesting_users.get(request["requesting_user_id"])
         if requesting_user:
             request["requesting_user_name"] = f"{requesting_user['first_name']} {requesting_user['last_name']}"
         
         # Get target family info
-        target_family = await db.family_units.find_one({"id": request["target_family_unit_id"]})
+        target_family = target_families.get(request["target_family_unit_id"])
         if target_family:
             request["target_family_name"] = target_family["family_name"]
         
@@ -9035,7 +9314,8 @@ async def get_family_unit_posts(
     family_unit_id: str,
     current_user: User = Depends(get_current_user),
     limit: int = 20,
-    offset: int = 0
+    offset: int = 0,
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get posts for a family unit"""
     # Check access permissions
@@ -9055,12 +9335,13 @@ async def get_family_unit_posts(
     }).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
     
     # Enrich with author and family info
+    authors = await loaders.users.load_many(p["posted_by_user_id"] for p in posts)
+    family_unit = await loaders.collection("family_units").load(family_unit_id)
     enriched_posts = []
     for post in posts:
         post.pop("_id", None)
         
-        author = await db.users.find_one({"id": post["posted_by_user_id"]})
-        family_unit = await db.family_units.find_one({"id": family_unit_id})
+        author = authors.get(post["posted_by_user_id"])
         
         if author and family_unit:
             enriched_posts.append({
@@ -9167,6 +9448,8 @@ async def update_my_info(
             {"id": current_user.id},
             {"$set": update_data}
         )
+        await invalidate_user_cache(current_user.id)
+        await reindex_user(current_user.id)
     
     # Fetch updated user
     updated_user = await get_user_by_id(current_user.id)
@@ -9337,13 +9620,13 @@ async def upload_document_scan(
     if not is_valid:
         raise HTTPException(status_code=400, detail=message)
     
-    # Save file using existing media system
-    media_file = await save_uploaded_file(file, current_user.id)
-    media_file.source_module = "my_documents"
-    media_file.privacy_level = "private"  # Documents are always private
-    
-    # Save to database
-    await db.media_files.insert_one(media_file.dict())
+    # Save file using existing media system (documents are always private)
+    media_file = await save_uploaded_file(
+        file,
+        current_user.id,
+        source_module="my_documents",
+        privacy_level="private"
+    )
     
     # Update document with scan reference
     await db.user_documents.update_one(
@@ -9356,10 +9639,14 @@ async def upload_document_scan(
         }
     )
     
+    # Replaced scan no longer references its blob
+    if existing_doc.get("scan_file_id"):
+        await delete_media_file(existing_doc["scan_file_id"])
+    
     return {
         "message": "Scan uploaded successfully",
         "scan_file_id": media_file.id,
-        "scan_url": f"/uploads/{current_user.id}/{media_file.stored_filename}"
+        "scan_url": f"/api/media/{media_file.id}"
     }
 
 # === END MY INFO MODULE API ENDPOINTS ===
@@ -9376,25 +9663,26 @@ async def search_work_organizations(
         # Build search query
         search_query = {"allow_public_discovery": True}
         
-        # Name search
-        if search_data.get("query"):
-            search_query["$or"] = [
-                {"name": {"$regex": search_data["query"], "$options": "i"}},
-                {"description": {"$regex": search_data["query"], "$options": "i"}}
-            ]
-        
         # Filters
         if search_data.get("industry"):
             search_query["industry"] = search_data["industry"]
         
         if search_data.get("city"):
-            search_query["address_city"] = {"$regex": search_data["city"], "$options": "i"}
+            search_query["address_city"] = {"$regex": re.escape(search_data["city"]), "$options": "i"}
         
         if search_data.get("organization_type"):
             search_query["organization_type"] = search_data["organization_type"]
         
+        # Name / description search (ranked by the search index, within the filters)
+        ids = None
+        if search_data.get("query"):
+            ids = await search_index.search(ORGANIZATIONS, search_data["query"], where=search_query)
+            search_query["$or"] = [{"id": {"$in": ids}}, {"organization_id": {"$in": ids}}]
+        
         # Find matching organizations
         organizations = await db.work_organizations.find(search_query).limit(50).to_list(50)
+        if ids is not None:
+            organizations = order_by(ids, organizations, key="id")
         
         results = []
         for org in organizations:
@@ -9485,6 +9773,7 @@ async def create_work_organization(
         # Insert organization
         org_dict = organization.model_dump(by_alias=False)
         await db.work_organizations.insert_one(org_dict)
+        await search_index.refresh(ORGANIZATIONS, org_dict.get("id"))
         
         # Add creator as first member with admin privileges
         member = WorkMember(
@@ -9501,6 +9790,7 @@ async def create_work_organization(
         
         member_dict = member.model_dump(by_alias=False)
         await db.work_members.insert_one(member_dict)
+        await people_typeahead.invalidate_circles(organization_ids=[organization.id])
         
         # Return response with user membership details
         response_data = org_dict.copy()
@@ -9523,7 +9813,8 @@ async def create_work_organization(
 @api_router.get("/work/organizations")
 async def get_user_work_organizations(
     type: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all work organizations where user is a member, optionally filtered by type"""
     try:
@@ -9533,23 +9824,18 @@ async def get_user_work_organizations(
             "is_active": True
         }).to_list(100)
         
+        # Try both id fields since model has alias
+        org_ids = [m["organization_id"] for m in memberships]
+        orgs = await loaders.organizations.load_many(org_ids)
+        legacy_org_ids = [org_id for org_id in org_ids if org_id not in orgs]
+        if legacy_org_ids:
+            orgs.update(await loaders.collection("work_organizations", "organization_id").load_many(legacy_org_ids))
+        
         organizations = []
         for membership in memberships:
-            # Build organization query
-            org_query = {
-                "$or": [
-                    {"id": membership["organization_id"]},
-                    {"organization_id": membership["organization_id"]}
-                ],
-                "is_active": True
-            }
-            
-            # Add type filter if provided
-            if type:
-                org_query["organization_type"] = type
-            
-            # Try both id fields since model has alias
-            org = await db.work_organizations.find_one(org_query)
+            org = orgs.get(membership["organization_id"])
+            if org and (not org.get("is_active") or (type and org.get("organization_type") != type)):
+                org = None
             
             if org:
                 org_response_data = org.copy()
@@ -9707,12 +9993,14 @@ async def add_work_member(
         
         member_dict = member.model_dump(by_alias=True)
         await db.work_members.insert_one(member_dict)
+        await people_typeahead.invalidate_circles(organization_ids=[organization_id])
         
         # Update organization member count
         await db.work_organizations.update_one(
             {"id": organization_id},
             {"$inc": {"member_count": 1}}
         )
+        await invalidate_organization_cache(organization_id)
         
         return {
             "message": "Member added successfully",
@@ -9728,7 +10016,8 @@ async def add_work_member(
 @api_router.get("/work/organizations/{organization_id}/members")
 async def get_work_organization_members(
     organization_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all members of a work organization"""
     try:
@@ -9765,9 +10054,10 @@ async def get_work_organization_members(
         }).to_list(1000)
         
         # Enrich with user details
+        member_users = await loaders.users.load_many(m["user_id"] for m in members)
         member_responses = []
         for member in members:
-            user = await db.users.find_one({"id": member["user_id"]})
+            user = member_users.get(member["user_id"])
             
             if user:
                 # Handle field mapping for member
@@ -9829,19 +10119,32 @@ async def update_work_organization(
         update_dict = {k: v for k, v in update_data.items() if v is not None}
         update_dict["updated_at"] = datetime.now(timezone.utc)
         
-        result = await db.work_organizations.update_one(
+        previous = await db.work_organizations.find_one_and_update(
             {
                 "$or": [
                     {"id": organization_id},
                     {"organization_id": organization_id}
                 ]
             },
-            {"$set": update_dict}
+            {"$set": update_dict},
+            {"_id": 0, "id": 1, "logo_url": 1, "banner_url": 1}
         )
         
-        if result.matched_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="Organization not found")
         
+        # Logo / banner media are public while the organization shows them
+        for kind, field in ((ORG_LOGO, "logo_url"), (ORG_BANNER, "banner_url")):
+            if field in update_dict and update_dict[field] != previous.get(field):
+                await media_acl.replace(
+                    media_ids_in(previous.get(field)),
+                    media_ids_in(update_dict[field]),
+                    kind, previous.get("id", organization_id), public=True
+                )
+        
+        await invalidate_organization_cache(organization_id)
+        await search_index.refresh(ORGANIZATIONS, organization_id)
+        
         return {"message": "Organization updated successfully"}
         
     except HTTPException:
@@ -9894,6 +10197,7 @@ async def leave_work_organization(
                 }
             }
         )
+        await people_typeahead.invalidate_circles(organization_ids=[organization_id])
         
         return {
             "message": "Successfully left the organization",
@@ -9973,12 +10277,14 @@ async def remove_work_organization_member(
                 }
             }
         )
+        await people_typeahead.invalidate_circles(organization_ids=[organization_id])
         
         # Update organization member count
         await db.work_organizations.update_one(
             {"$or": [{"id": organization_id}, {"organization_id": organization_id}]},
             {"$inc": {"member_count": -1}}
         )
+        await invalidate_organization_cache(organization_id)
         
         # Send notification to removed member
         removed_user = await db.users.find_one({"id": user_id})
@@ -10180,6 +10486,7 @@ async def transfer_organization_ownership(
                 }
             }
         )
+        await invalidate_organization_cache(org.get("id", organization_id))
         
         # Make new owner an admin if not already
         if not new_owner_membership.get("is_admin", False):
@@ -10286,6 +10593,7 @@ async def join_work_organization(
         }
         
         await db.work_members.insert_one(new_member)
+        await people_typeahead.invalidate_circles(organization_ids=[new_member["organization_id"]])
         
         return {
             "message": "Successfully joined organization",
@@ -10499,6 +10807,7 @@ async def approve_join_request(
         }
         
         await db.work_members.insert_one(new_member)
+        await people_typeahead.invalidate_circles(organization_ids=[new_member["organization_id"]])
         
         # Update request status
         await db.work_join_requests.update_one(
@@ -10647,7 +10956,8 @@ async def cancel_join_request(
 @api_router.get("/work/posts/feed")
 async def get_work_feed(
     limit: int = 50,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get posts feed from all organizations user is a member of"""
     try:
@@ -10667,17 +10977,25 @@ async def get_work_feed(
             "organization_id": {"$in": org_ids}
         }).sort("created_at", -1).limit(limit).to_list(length=limit)
         
+        # Batch organization, like and author lookups for the whole page
+        orgs = await loaders.organizations.load_many(p["organization_id"] for p in posts)
+        legacy_org_ids = [p["organization_id"] for p in posts if p["organization_id"] not in orgs]
+        if legacy_org_ids:
+            orgs.update(await loaders.collection("work_organizations", "organization_id").load_many(legacy_org_ids))
+        liked_ids = set(await db.work_post_likes.distinct(
+            "post_id",
+            {"post_id": {"$in": [p["id"] for p in posts]}, "user_id": current_user.id}
+        ))
+        authors = await loaders.users.load_many(
+            p.get("posted_by_user_id") or p.get("author_id") for p in posts if "author_name" not in p
+        )
+        
         # For each post, add organization info and check if user liked it
         for post in posts:
             post.pop("_id", None)
             
             # Get organization info
-            org = await db.work_organizations.find_one({
-                "$or": [
-                    {"id": post["organization_id"]},
-                    {"organization_id": post["organization_id"]}
-                ]
-            })
+            org = orgs.get(post["organization_id"])
             
             if org:
                 post["organization_name"] = org.get("name", "Unknown")
@@ -10687,11 +11005,7 @@ async def get_work_feed(
                 post["organization_logo"] = ""
             
             # Check if user liked this post
-            like = await db.work_post_likes.find_one({
-                "post_id": post["id"],
-                "user_id": current_user.id
-            })
-            post["user_has_liked"] = like is not None
+            post["user_has_liked"] = post["id"] in liked_ids
             
             # Ensure post_type is set (default to REGULAR for legacy posts)
             if "post_type" not in post:
@@ -10705,7 +11019,7 @@ async def get_work_feed(
             if "author_name" not in post:
                 author_id = post.get("posted_by_user_id") or post.get("author_id")
                 if author_id:
-                    author = await db.users.find_one({"id": author_id}, {"_id": 0})
+                    author = authors.get(author_id)
                     if author:
                         post["author_name"] = f"{author.get('first_name', '')} {author.get('last_name', '')}".strip()
                         post["author_id"] = author_id
@@ -11107,7 +11421,8 @@ async def create_department(
 @api_router.get("/organizations/{organization_id}/departments")
 async def list_departments(
     organization_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """List all departments in an organization."""
     try:
@@ -11127,6 +11442,7 @@ async def list_departments(
         
         # Enrich with head name and member count
         result = []
+        heads = await loaders.users.load_many(d.get("head_id") for d in departments)
         for dept in departments:
             # Remove MongoDB _id field
             if "_id" in dept:
@@ -11138,7 +11454,7 @@ async def list_departments(
             
             # Get head name if exists
             if dept.get("head_id"):
-                head_user = await db.users.find_one({"id": dept["head_id"]})
+                head_user = heads.get(dept["head_id"])
                 if head_user:
                     dept["head_name"] = f"{head_user.get('first_name', '')} {head_user.get('last_name', '')}"
             
@@ -11319,7 +11635,8 @@ async def add_department_member(
 async def list_department_members(
     organization_id: str,
     dept_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """List all members of a department."""
     try:
@@ -11339,12 +11656,13 @@ async def list_department_members(
         
         # Enrich with user details
         result = []
+        member_users = await loaders.users.load_many(m["user_id"] for m in members)
         for member in members:
             # Remove MongoDB _id field
             if "_id" in member:
                 del member["_id"]
                 
-            user = await db.users.find_one({"id": member["user_id"]})
+            user = member_users.get(member["user_id"])
             if user:
                 member["user_name"] = f"{user.get('first_name', '')} {user.get('last_name', '')}"
                 member["user_email"] = user.get("email", "")
@@ -11474,7 +11792,8 @@ async def list_announcements(
     pinned: Optional[bool] = None,
     limit: int = 50,
     offset: int = 0,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """List announcements in an organization."""
     try:
@@ -11518,16 +11837,18 @@ async def list_announcements(
         
         # Enrich with author and department details
         result = []
+        authors = await loaders.users.load_many(a["author_id"] for a in announcements)
+        departments = await loaders.collection("departments").load_many(a.get("department_id") for a in announcements)
         for ann in announcements:
             # Get author details
-            author = await db.users.find_one({"id": ann["author_id"]})
+            author = authors.get(ann["author_id"])
             if author:
                 ann["author_name"] = f"{author.get('first_name', '')} {author.get('last_name', '')}"
                 ann["author_avatar"] = author.get("avatar_url")
             
             # Get department details if exists
             if ann.get("department_id"):
-                dept = await db.departments.find_one({"id": ann["department_id"]})
+                dept = departments.get(ann["department_id"])
                 if dept:
                     ann["department_name"] = dept.get("name")
                     ann["department_color"] = dept.get("color")
@@ -11860,7 +12181,8 @@ async def get_follow_status(
 @api_router.get("/organizations/{organization_id}/followers")
 async def get_organization_followers(
     organization_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get list of followers for an organization."""
     try:
@@ -11875,8 +12197,9 @@ async def get_organization_followers(
         
         # Enrich with user details
         result = []
+        follower_users = await loaders.users.load_many(f["follower_id"] for f in followers)
         for follow in followers:
-            user = await db.users.find_one({"id": follow["follower_id"]})
+            user = follower_users.get(follow["follower_id"])
             if user:
                 result.append({
                     "user_id": user["id"],
@@ -12184,7 +12507,8 @@ async def get_organization_teachers(
     organization_id: str,
     grade: Optional[int] = None,
     subject: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all teachers in the organization with optional filters"""
     try:
@@ -12221,8 +12545,9 @@ async def get_organization_teachers(
         
         # Enrich with user details
         teacher_responses = []
+        teacher_users = await loaders.users.load_many(t["user_id"] for t in teachers)
         for teacher in teachers:
-            user = await db.users.find_one({"id": teacher["user_id"]})
+            user = teacher_users.get(teacher["user_id"])
             if user:
                 # Handle field mapping for teacher (similar to members endpoint)
                 teacher_data = teacher.copy()
@@ -12322,7 +12647,8 @@ async def get_school_constants():
 async def get_organization_classes(
     organization_id: str,
     grade: Optional[int] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get classes for an organization. 
     For teachers: returns classes they teach or supervise.
@@ -12416,10 +12742,13 @@ async def get_organization_classes(
         
         # Merge teacher info
         all_teachers = {}
+        class_teachers = await loaders.users.load_many(
+            t.get("user_id") for t in teachers_list + members_list if t.get("supervised_class")
+        )
         for t in teachers_list:
             supervised = t.get("supervised_class")
             if supervised:
-                user = await db.users.find_one({"id": t.get("user_id")})
+                user = class_teachers.get(t.get("user_id"))
                 if user:
                     all_teachers[supervised] = {
                         "id": t.get("user_id"),
@@ -12430,7 +12759,7 @@ async def get_organization_classes(
         for m in members_list:
             supervised = m.get("supervised_class")
             if supervised and supervised not in all_teachers:
-                user = await db.users.find_one({"id": m.get("user_id")})
+                user = class_teachers.get(m.get("user_id"))
                 if user:
                     all_teachers[supervised] = {
                         "id": m.get("user_id"),
@@ -12537,7 +12866,8 @@ async def get_organization_students(
     grade: Optional[int] = None,
     assigned_class: Optional[str] = None,
     academic_status: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all students in the organization with optional filters"""
     try:
@@ -12576,6 +12906,9 @@ async def get_organization_students(
         students = await students_cursor.to_list(1000)  # Safety limit to prevent memory exhaustion
         
         # Enrich with parent details
+        parents = await loaders.users.load_many(
+            parent_id for student in students for parent_id in student.get("parent_ids", [])
+        )
         student_responses = []
         for student in students:
             # Parse date_of_birth if it's a string
@@ -12592,7 +12925,7 @@ async def get_organization_students(
             # Get parent names
             parent_names = []
             for parent_id in student.get("parent_ids", []):
-                parent = await db.users.find_one({"id": parent_id})
+                parent = parents.get(parent_id)
                 if parent:
                     parent_names.append(f"{parent['first_name']} {parent['last_name']}")
             
@@ -12636,7 +12969,8 @@ async def get_organization_students(
 async def get_student_profile(
     organization_id: str,
     student_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get specific student's profile"""
     try:
@@ -12673,9 +13007,10 @@ async def get_student_profile(
             age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
         
         # Get parent names
+        parents = await loaders.users.load_many(student.get("parent_ids", []))
         parent_names = []
         for parent_id in student.get("parent_ids", []):
-            parent = await db.users.find_one({"id": parent_id})
+            parent = parents.get(parent_id)
             if parent:
                 parent_names.append(f"{parent['first_name']} {parent['last_name']}")
         
@@ -12818,7 +13153,8 @@ async def link_parent_to_student(
 
 @api_router.get("/users/me/children", response_model=List[StudentResponse])
 async def get_my_children(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all children for the current user (parent)"""
     try:
@@ -12830,6 +13166,9 @@ async def get_my_children(
         students = await students_cursor.to_list(1000)  # Safety limit to prevent memory exhaustion
         
         # Enrich with parent details
+        parents = await loaders.users.load_many(
+            parent_id for student in students for parent_id in student.get("parent_ids", [])
+        )
         student_responses = []
         for student in students:
             # Parse date_of_birth if it's a string
@@ -12846,7 +13185,7 @@ async def get_my_children(
             # Get parent names
             parent_names = []
             for parent_id in student.get("parent_ids", []):
-                parent = await db.users.find_one({"id": parent_id})
+                parent = parents.get(parent_id)
                 if parent:
                     parent_names.append(f"{parent['first_name']} {parent['last_name']}")
             
@@ -12946,7 +13285,8 @@ async def add_child_profile(
 
 @api_router.get("/users/me/school-roles")
 async def get_my_school_roles(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Get user's roles across all educational organizations
@@ -12984,8 +13324,9 @@ async def get_my_school_roles(
             org_ids = list(set([s["organization_id"] for s in students if s.get("organization_id")]))
             
             # Get organization details
+            parent_orgs = await loaders.collection("work_organizations", "organization_id").load_many(org_ids)
             for org_id in org_ids:
-                org = await db.work_organizations.find_one({"organization_id": org_id})
+                org = parent_orgs.get(org_id)
                 if org and org.get("organization_type") == "EDUCATIONAL":
                     # Count children in this school
                     children_in_school = [s for s in students if s.get("organization_id") == org_id]
@@ -13021,8 +13362,9 @@ async def get_my_school_roles(
                 if t.get("organization_id") and t["organization_id"] not in teacher_org_ids:
                     teacher_org_ids.append(t["organization_id"])
             
+            teacher_orgs = await loaders.collection("work_organizations", "organization_id").load_many(teacher_org_ids)
             for org_id in teacher_org_ids:
-                org = await db.work_organizations.find_one({"organization_id": org_id})
+                org = teacher_orgs.get(org_id)
                 if org:
                     # Get teacher details from work_members
                     member = next((m for m in teacher_memberships if m["organization_id"] == org_id), None)
@@ -13094,7 +13436,8 @@ async def create_enrollment_request(
 async def get_enrollment_requests(
     organization_id: str,
     status: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get enrollment requests for organization (admin only)"""
     try:
@@ -13125,8 +13468,9 @@ async def get_enrollment_requests(
         
         # Enrich with parent details
         request_responses = []
+        parents = await loaders.users.load_many(r["parent_user_id"] for r in requests)
         for req in requests:
-            parent = await db.users.find_one({"id": req["parent_user_id"]})
+            parent = parents.get(req["parent_user_id"])
             if parent:
                 # Parse date if it's a string
                 if isinstance(req.get('student_dob'), str):
@@ -13370,7 +13714,8 @@ async def get_schedules(
     grade: Optional[int] = None,
     assigned_class: Optional[str] = None,
     day_of_week: Optional[DayOfWeek] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get class schedules with optional filters"""
     try:
@@ -13410,8 +13755,9 @@ async def get_schedules(
         
         # Enrich with teacher names
         schedule_responses = []
+        teachers = await loaders.users.load_many(s["teacher_id"] for s in schedules)
         for schedule in schedules:
-            teacher = await db.users.find_one({"id": schedule["teacher_id"]})
+            teacher = teachers.get(schedule["teacher_id"])
             teacher_name = f"{teacher.get('first_name', '')} {teacher.get('last_name', '')}" if teacher else None
             
             schedule_responses.append(ScheduleResponse(
@@ -13524,7 +13870,8 @@ async def get_student_grades(
     student_id: str,
     subject: Optional[str] = None,
     academic_period: Optional[AcademicPeriod] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get grades for a specific student"""
     try:
@@ -13566,8 +13913,9 @@ async def get_student_grades(
         
         # Enrich with teacher and student names
         grade_responses = []
+        teachers = await loaders.users.load_many(g["teacher_id"] for g in grades)
         for grade in grades:
-            teacher = await db.users.find_one({"id": grade["teacher_id"]})
+            teacher = teachers.get(grade["teacher_id"])
             teacher_name = f"{teacher.get('first_name', '')} {teacher.get('last_name', '')}" if teacher else None
             student_name = f"{student.get('student_last_name', '')} {student.get('student_first_name', '')}"
             
@@ -13601,7 +13949,8 @@ async def get_class_grades(
     grade: int,
     assigned_class: str,
     subject: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all grades for a class (teacher only)"""
     try:
@@ -13663,8 +14012,9 @@ async def get_class_grades(
                     
                     # Enrich grades with teacher names
                     enriched_grades = []
+                    teachers = await loaders.users.load_many(g["teacher_id"] for g in student_grades)
                     for g in student_grades:
-                        teacher = await db.users.find_one({"id": g["teacher_id"]})
+                        teacher = teachers.get(g["teacher_id"])
                         teacher_name = f"{teacher.get('first_name', '')} {teacher.get('last_name', '')}" if teacher else None
                         
                         enriched_grades.append(GradeResponse(
@@ -13800,7 +14150,8 @@ async def create_journal_post(
 async def get_journal_posts(
     organization_id: str,
     audience_filter: Optional[JournalAudienceType] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get journal posts with audience filtering"""
     try:
@@ -13859,8 +14210,9 @@ async def get_journal_posts(
         post_responses = []
         org = await db.work_organizations.find_one({"organization_id": organization_id})
         
+        authors = await loaders.users.load_many(p["posted_by_user_id"] for p in posts)
         for post in posts:
-            author = await db.users.find_one({"id": post["posted_by_user_id"]})
+            author = authors.get(post["posted_by_user_id"])
             
             post_responses.append(JournalPostResponse(
                 post_id=post["post_id"],
@@ -14033,7 +14385,8 @@ async def get_academic_events(
     month: Optional[int] = None,
     year: Optional[int] = None,
     event_type: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get academic calendar events for an organization"""
     try:
@@ -14063,9 +14416,10 @@ async def get_academic_events(
         
         # Build responses
         responses = []
+        creators = await loaders.users.load_many(e.get("created_by_user_id") for e in events)
         for event in events:
             # Get creator info
-            creator = await db.users.find_one({"id": event.get("created_by_user_id")})
+            creator = creators.get(event.get("created_by_user_id"))
             
             # Get creator role and color
             creator_role = event.get("creator_role", "PARENT")
@@ -14634,7 +14988,8 @@ async def create_journal_comment(
 @api_router.get("/journal/posts/{post_id}/comments")
 async def get_journal_comments(
     post_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get comments for a journal post"""
     try:
@@ -14646,31 +15001,38 @@ async def get_journal_comments(
         
         comments = await comments_cursor.to_list(100)
         
+        # Replies of all comments in one query (up to 50 per comment)
+        replies_by_parent = {}
+        if comments:
+            async for reply in db.journal_post_comments.find({
+                "post_id": post_id,
+                "parent_comment_id": {"$in": [c["id"] for c in comments]}
+            }).sort("created_at", 1):
+                siblings = replies_by_parent.setdefault(reply["parent_comment_id"], [])
+                if len(siblings) < 50:
+                    siblings.append(reply)
+        all_comments = comments + [r for replies in replies_by_parent.values() for r in replies]
+        
+        authors = await loaders.users.load_many(c["author_id"] for c in all_comments)
+        liked_ids = set(await db.journal_comment_likes.distinct(
+            "comment_id",
+            {"comment_id": {"$in": [c["id"] for c in all_comments]}, "user_id": current_user.id}
+        ))
+        
         # Build response with nested replies
         result = []
         for comment in comments:
-            author = await db.users.find_one({"id": comment["author_id"]})
+            author = authors.get(comment["author_id"])
             
             # Check if current user liked this comment
-            user_liked = await db.journal_comment_likes.find_one({
-                "comment_id": comment["id"],
-                "user_id": current_user.id
-            }) is not None
+            user_liked = comment["id"] in liked_ids
             
-            # Get replies
-            replies_cursor = db.journal_post_comments.find({
-                "post_id": post_id,
-                "parent_comment_id": comment["id"]
-            }).sort("created_at", 1)
-            replies = await replies_cursor.to_list(50)
+            replies = replies_by_parent.get(comment["id"], [])
             
             replies_result = []
             for reply in replies:
-                reply_author = await db.users.find_one({"id": reply["author_id"]})
-                reply_user_liked = await db.journal_comment_likes.find_one({
-                    "comment_id": reply["id"],
-                    "user_id": current_user.id
-                }) is not None
+                reply_author = authors.get(reply["author_id"])
+                reply_user_liked = reply["id"] in liked_ids
                 
                 replies_result.append({
                     "id": reply["id"],
@@ -14763,7 +15125,8 @@ async def like_journal_comment(
 async def get_change_requests(
     organization_id: str,
     status: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all pending change requests for the organization (Admin only)"""
     try:
@@ -14790,8 +15153,9 @@ async def get_change_requests(
         
         # Enrich with user details
         enriched_requests = []
+        request_users = await loaders.users.load_many(r["user_id"] for r in requests)
         for req in requests:
-            user = await db.users.find_one({"id": req["user_id"]})
+            user = request_users.get(req["user_id"])
             if user:
                 enriched_requests.append(WorkChangeRequestResponse(
                     id=req["id"],
@@ -15022,7 +15386,8 @@ async def reject_change_request(
 async def get_user_notifications(
     current_user: User = Depends(get_current_user),
     unread_only: bool = False,
-    limit: int = 50
+    limit: int = 50,
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get notifications for the current user"""
     try:
@@ -15034,8 +15399,9 @@ async def get_user_notifications(
         
         # Enrich notifications with organization names
         notification_responses = []
+        orgs = await loaders.organizations.load_many(n["organization_id"] for n in notifications)
         for notif in notifications:
-            org = await db.work_organizations.find_one({"id": notif["organization_id"]})
+            org = orgs.get(notif["organization_id"])
             notification_responses.append(
                 WorkNotificationResponse(
                     **notif,
@@ -15192,7 +15558,8 @@ async def get_organization_events(
     upcoming_only: bool = True,
     event_type: Optional[str] = None,
     department_id: Optional[str] = None,
-    team_id: Optional[str] = None
+    team_id: Optional[str] = None,
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get organization events with filters"""
     try:
@@ -15236,9 +15603,10 @@ async def get_organization_events(
         
         # Enrich events with additional data
         event_responses = []
+        creators = await loaders.users.load_many(e["created_by_user_id"] for e in events)
         for event in events:
             # Get creator name
-            creator = await db.users.find_one({"id": event["created_by_user_id"]})
+            creator = creators.get(event["created_by_user_id"])
             creator_name = f"{creator['first_name']} {creator['last_name']}" if creator else "Неизвестно"
             
             # Get department/team names
@@ -16177,7 +16545,8 @@ async def get_tasks_for_calendar(
     status_filter: Optional[str] = None,  # ALL, ACTIVE, COMPLETED
     priority_filter: Optional[str] = None,  # ALL, URGENT, HIGH, MEDIUM, LOW
     assignment_filter: Optional[str] = None,  # ALL, MY, TEAM, CREATED
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all tasks for calendar view across user's organizations"""
     try:
@@ -16239,19 +16608,23 @@ async def get_tasks_for_calendar(
         
         # Build calendar task responses
         calendar_tasks = []
+        task_users = await loaders.users.load_many(
+            uid for t in tasks for uid in (t.get("created_by"), t.get("assigned_to") or t.get("accepted_by"))
+        )
+        task_orgs = await loaders.organizations.load_many(t["organization_id"] for t in tasks)
         for task in tasks:
             # Get creator info
-            creator = await db.users.find_one({"id": task["created_by"]}, {"_id": 0})
+            creator = task_users.get(task["created_by"])
             
             # Get assignee info if assigned
             assignee = None
             if task.get("assigned_to"):
-                assignee = await db.users.find_one({"id": task["assigned_to"]}, {"_id": 0})
+                assignee = task_users.get(task["assigned_to"])
             elif task.get("accepted_by"):
-                assignee = await db.users.find_one({"id": task["accepted_by"]}, {"_id": 0})
+                assignee = task_users.get(task["accepted_by"])
             
             # Get organization info
-            org = await db.work_organizations.find_one({"id": task["organization_id"]}, {"_id": 0})
+            org = task_orgs.get(task["organization_id"])
             
             # Check if task is overdue (handle both naive and aware datetimes)
             is_overdue = False
@@ -16782,7 +17155,8 @@ async def create_task_template(
 @api_router.get("/work/organizations/{organization_id}/task-templates")
 async def get_task_templates(
     organization_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all task templates for an organization"""
     try:
@@ -16792,8 +17166,9 @@ async def get_task_templates(
         }, {"_id": 0}).to_list(100)
         
         # Add creator names
+        creators = await loaders.users.load_many(t["created_by"] for t in templates)
         for template in templates:
-            creator = await db.users.find_one({"id": template["created_by"]}, {"_id": 0})
+            creator = creators.get(template["created_by"])
             template["created_by_name"] = f"{creator['first_name']} {creator['last_name']}" if creator else "Unknown"
         
         return {"templates": templates}
@@ -16961,10 +17336,7 @@ async def websocket_chat_endpoint(
     await chat_manager.connect(websocket, user_id, chat_id)
     
     # Update user online status
-    await db.users.update_one(
-        {"id": user_id},
-        {"$set": {"is_online": True, "last_seen": datetime.now(timezone.utc)}}
-    )
+    await presence.touch(user_id)
     
     # Notify others in chat that user is online
     await chat_manager.broadcast_to_chat(chat_id, {
@@ -16991,18 +17363,8 @@ async def websocket_chat_endpoint(
                     "chat_id": chat_id
                 })
                 
-                # Also update typing status in database for polling fallback
-                await db.typing_status.update_one(
-                    {"chat_id": chat_id, "user_id": user_id},
-                    {
-                        "$set": {
-                            "is_typing": is_typing,
-                            "updated_at": datetime.now(timezone.utc)
-                        },
-                        "$setOnInsert": {"chat_id": chat_id, "user_id": user_id}
-                    },
-                    upsert=True
-                )
+                # Also record typing status for the polling fallback
+                await presence.set_typing(data.get("chat_type", "direct"), chat_id, user_id, is_typing)
             
             elif event_type == "read":
                 # Mark messages as read
@@ -17061,7 +17423,7 @@ async def websocket_chat_endpoint(
             
             elif event_type == "ping":
                 # Keep-alive ping
-                await websocket.send_json({"type": "pong"})
+                await chat_manager.send(websocket, {"type": "pong"})
     
     except WebSocketDisconnect:
         pass
@@ -17071,11 +17433,9 @@ async def websocket_chat_endpoint(
         # Disconnect and cleanup
         await chat_manager.disconnect(websocket, user_id, chat_id)
         
-        # Update user offline status
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"is_online": False, "last_seen": datetime.now(timezone.utc)}}
-        )
+        # Update user offline status (other tabs / devices may still be connected)
+        if not await chat_manager.is_user_online(user_id):
+            await presence.set_offline(user_id)
         
         # Notify others that user is offline
         await chat_manager.broadcast_to_chat(chat_id, {
@@ -17133,6 +17493,7 @@ async def send_friend_request(
     )
     
     await db.friend_requests.insert_one(friend_request.model_dump())
+    await social_graph.add_friend_request(current_user.id, receiver_id)
     
     return {
         "message": "Friend request sent",
@@ -17174,6 +17535,10 @@ async def accept_friend_request(
     )
     
     await db.user_friendships.insert_one(friendship.model_dump())
+    await social_graph.remove_friend_request(friend_request["sender_id"], current_user.id)
+    await social_graph.add_friendship(user1_id, user2_id)
+    await feed_timelines.backfill_author(user1_id, user2_id, friend=True)
+    await feed_timelines.backfill_author(user2_id, user1_id, friend=True)
     
     return {
         "message": "Friend request accepted",
@@ -17186,7 +17551,7 @@ async def reject_friend_request(
     current_user: User = Depends(get_current_user)
 ):
     """Reject a friend request"""
-    result = await db.friend_requests.update_one(
+    friend_request = await db.friend_requests.find_one_and_update(
         {"id": request_id, "receiver_id": current_user.id, "status": "PENDING"},
         {"$set": {
             "status": "REJECTED",
@@ -17194,9 +17559,11 @@ async def reject_friend_request(
         }}
     )
     
-    if result.modified_count == 0:
+    if friend_request is None:
         raise HTTPException(status_code=404, detail="Friend request not found")
     
+    await social_graph.remove_friend_request(friend_request["sender_id"], current_user.id)
+    
     return {"message": "Friend request rejected"}
 
 @api_router.post("/friends/request/{request_id}/cancel")
@@ -17205,7 +17572,7 @@ async def cancel_friend_request(
     current_user: User = Depends(get_current_user)
 ):
     """Cancel a sent friend request"""
-    result = await db.friend_requests.update_one(
+    friend_request = await db.friend_requests.find_one_and_update(
         {"id": request_id, "sender_id": current_user.id, "status": "PENDING"},
         {"$set": {
             "status": "CANCELLED",
@@ -17213,9 +17580,11 @@ async def cancel_friend_request(
         }}
     )
     
-    if result.modified_count == 0:
+    if friend_request is None:
         raise HTTPException(status_code=404, detail="Friend request not found")
     
+    await social_graph.remove_friend_request(current_user.id, friend_request["receiver_id"])
+    
     return {"message": "Friend request cancelled"}
 
 @api_router.delete("/friends/{friend_id}")
@@ -17235,6 +17604,8 @@ async def remove_friend(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Friendship not found")
     
+    await social_graph.remove_friendship(current_user.id, friend_id)
+    
     return {"message": "Friend removed"}
 
 @api_router.get("/friends")
@@ -17265,8 +17636,10 @@ async def get_friends(
             {"id": {"$in": friend_ids}},
             {"_id": 0, "password_hash": 0}
         ).to_list(1000)
+        online = await presence.online_many(friend_ids)
         
         for friend in friends_data:
+            friend["is_online"] = online.get(friend["id"], False)
             # Find the friendship record for created_at
             friendship = next(
                 (f for f in friendships if f["user1_id"] == friend["id"] or f["user2_id"] == friend["id"]),
@@ -17371,6 +17744,8 @@ async def follow_user(
     )
     
     await db.user_follows.insert_one(follow.model_dump())
+    await social_graph.add_follow(current_user.id, user_id)
+    await feed_timelines.backfill_author(current_user.id, user_id, friend=False)
     
     return {
         "message": "Now following user",
@@ -17391,6 +17766,8 @@ async def unfollow_user(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not following this user")
     
+    await social_graph.remove_follow(current_user.id, user_id)
+    
     return {"message": "Unfollowed user"}
 
 @api_router.get("/users/{user_id}/follow/status")
@@ -17438,8 +17815,10 @@ async def get_my_followers(
             {"id": {"$in": follower_ids}},
             {"_id": 0, "password_hash": 0}
         ).to_list(1000)
+        online = await presence.online_many(follower_ids)
         
         for follower in followers_data:
+            follower["is_online"] = online.get(follower["id"], False)
             follow_record = next((f for f in follows if f["follower_id"] == follower["id"]), None)
             followers.append({
                 **follower,
@@ -17468,8 +17847,10 @@ async def get_my_following(
             {"id": {"$in": target_ids}},
             {"_id": 0, "password_hash": 0}
         ).to_list(1000)
+        online = await presence.online_many(target_ids)
         
         for user in following_data:
+            user["is_online"] = online.get(user["id"], False)
             follow_record = next((f for f in follows if f["target_id"] == user["id"]), None)
             following.append({
                 **user,
@@ -17528,39 +17909,12 @@ async def get_user_suggestions(
     user_city = current_user.address_city
     user_country = current_user.address_country
     
-    # ========== BATCH QUERY 1: Get exclusion sets ==========
-    friendships, following, pending_requests = await asyncio.gather(
-        db.user_friendships.find({
-            "$or": [
-                {"user1_id": current_user.id},
-                {"user2_id": current_user.id}
-            ]
-        }, {"_id": 0, "user1_id": 1, "user2_id": 1}).to_list(1000),
-        
-        db.user_follows.find({
-            "follower_id": current_user.id
-        }, {"_id": 0, "target_id": 1}).to_list(1000),
-        
-        db.friend_requests.find({
-            "$or": [
-                {"sender_id": current_user.id, "status": "pending"},
-                {"receiver_id": current_user.id, "status": "pending"}
-            ]
-        }, {"_id": 0, "sender_id": 1, "receiver_id": 1}).to_list(1000)
-    )
-    
-    friend_ids = set()
-    for f in friendships:
-        if f["user1_id"] == current_user.id:
-            friend_ids.add(f["user2_id"])
-        else:
-            friend_ids.add(f["user1_id"])
-    
-    following_ids = {f["target_id"] for f in following}
-    pending_ids = {r["sender_id"] for r in pending_requests} | {r["receiver_id"] for r in pending_requests}
+    # ========== Exclusion sets from the social graph ==========
+    adjacency = await social_graph.get(current_user.id)
+    friend_ids = adjacency.friends
     
     # Exclude self, friends, already following, and pending requests
-    exclude_ids = friend_ids | following_ids | pending_ids | {current_user.id}
+    exclude_ids = adjacency.network | adjacency.pending | {current_user.id}
     
     # ========== BATCH QUERY 2: Get user's organization/school context ==========
     user_work_memberships, user_school_memberships, user_children = await asyncio.gather(
@@ -17595,31 +17949,13 @@ async def get_user_suggestions(
     suggestion_ids = [s["id"] for s in suggestions_raw]
     
     # ========== BATCH QUERY 3: Get ALL related data at once ==========
-    # Build queries conditionally to avoid empty $in issues
-    queries = [
-        # All friendships for suggested users (always needed)
-        db.user_friendships.find({
-            "$or": [
-                {"user1_id": {"$in": suggestion_ids}},
-                {"user2_id": {"$in": suggestion_ids}}
-            ]
-        }, {"_id": 0, "user1_id": 1, "user2_id": 1}).to_list(5000),
-        
-        # Users who follow current user (always needed)
-        db.user_follows.find({
-            "follower_id": {"$in": suggestion_ids},
-            "target_id": current_user.id
-        }, {"_id": 0, "follower_id": 1}).to_list(500)
-    ]
+    # Friends of every candidate, loaded in one batch from the social graph
+    candidate_graph = await social_graph.get_many(suggestion_ids)
     
     # Conditionally add work/school queries only if user has relevant memberships
     has_work_orgs = bool(user_org_ids)
     has_schools = bool(all_school_ids)
     
-    results = await asyncio.gather(*queries)
-    all_friendships = results[0]
-    follows_me_list = results[1]
-    
     # Run work/school queries only if needed
     all_work_memberships = []
     all_school_memberships = []
@@ -17661,17 +17997,7 @@ async def get_user_suggestions(
     
     # Build lookup maps for O(1) access
     # Map: user_id -> set of their friend_ids
-    user_friends_map = {}
-    for f in all_friendships:
-        u1, u2 = f["user1_id"], f["user2_id"]
-        if u1 in suggestion_ids:
-            if u1 not in user_friends_map:
-                user_friends_map[u1] = set()
-            user_friends_map[u1].add(u2)
-        if u2 in suggestion_ids:
-            if u2 not in user_friends_map:
-                user_friends_map[u2] = set()
-            user_friends_map[u2].add(u1)
+    user_friends_map = {uid: adj.friends for uid, adj in candidate_graph.items()}
     
     # Set of users who are colleagues
     colleague_user_ids = {m["user_id"] for m in all_work_memberships}
@@ -17684,7 +18010,7 @@ async def get_user_suggestions(
                 school_connected_ids.add(parent_id)
     
     # Set of users who follow me
-    follows_me_ids = {f["follower_id"] for f in follows_me_list}
+    follows_me_ids = adjacency.followers
     
     # ========== Score each suggestion using cached data ==========
     scored_suggestions = []
@@ -17745,58 +18071,17 @@ async def get_user_suggestions(
 async def search_users(
     query: str,
     limit: int = 20,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    """Search users by name"""
+    """Search users by name or email (typeahead: people the user knows come first)"""
     if len(query) < 2:
         return {"users": []}
     
-    # Search by first_name or last_name (case-insensitive)
-    search_regex = {"$regex": query, "$options": "i"}
-    
-    users = await db.users.find(
-        {
-            "$and": [
-                {"id": {"$ne": current_user.id}},  # Exclude self
-                {
-                    "$or": [
-                        {"first_name": search_regex},
-                        {"last_name": search_regex},
-                        {"email": search_regex}
-                    ]
-                }
-            ]
-        },
-        {"_id": 0, "password_hash": 0}
-    ).limit(limit).to_list(limit)
-    
-    # Add relationship info to each user
-    for user in users:
-        # Check if friend
-        is_friend = await db.user_friendships.find_one({
-            "$or": [
-                {"user1_id": min(current_user.id, user["id"]), "user2_id": max(current_user.id, user["id"])}
-            ]
-        }) is not None
-        
-        # Check if following
-        is_following = await db.user_follows.find_one({
-            "follower_id": current_user.id,
-            "target_id": user["id"]
-        }) is not None
-        
-        # Check for pending request
-        pending_request = await db.friend_requests.find_one({
-            "sender_id": current_user.id,
-            "receiver_id": user["id"],
-            "status": "PENDING"
-        })
-        
-        user["is_friend"] = is_friend
-        user["is_following"] = is_following
-        user["request_sent"] = pending_request is not None
+    # One indexed lookup ranks the hits; one batched load returns their public profiles
+    people = await people_typeahead.suggest(current_user.id, query, limit=max(1, min(limit, 50)))
     
-    return {"users": users}
+    return {"users": await hydrate_people(people, loaders)}
 
 @api_router.get("/users/{user_id}/profile")
 async def get_user_public_profile(
@@ -18044,6 +18329,7 @@ async def create_channel(
     )
     
     await db.news_channels.insert_one(channel.model_dump())
+    await search_index.refresh(CHANNELS, channel.id)
     
     return {
         "message": "Channel created successfully",
@@ -18054,14 +18340,18 @@ async def create_channel(
 @api_router.get("/news/channels")
 async def get_channels(
     category: Optional[str] = None,
+    search: Optional[str] = None,
     limit: int = 50,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    """Get all public channels, optionally filtered by category"""
+    """Get all public channels, optionally filtered by category or a name / description search"""
     query = {"is_active": True}
     
     if category:
         query["categories"] = category
+    if search:
+        query["id"] = {"$in": await search_index.search(CHANNELS, search, where=query)}
     
     channels = await db.news_channels.find(
         query,
@@ -18069,11 +18359,10 @@ async def get_channels(
     ).sort("subscribers_count", -1).limit(limit).to_list(limit)
     
     # Add owner info and organization info
+    owners = await loaders.users.load_many(c["owner_id"] for c in channels)
+    channel_orgs = await loaders.organizations.load_many(c.get("organization_id") for c in channels)
     for channel in channels:
-        owner = await db.users.find_one(
-            {"id": channel["owner_id"]},
-            {"_id": 0, "password_hash": 0}
-        )
+        owner = owners.get(channel["owner_id"])
         if owner:
             channel["owner"] = {"first_name": owner.get("first_name"), "last_name": owner.get("last_name")}
         else:
@@ -18081,11 +18370,7 @@ async def get_channels(
         
         # Add organization info for official channels
         if channel.get("organization_id"):
-            org = await db.work_organizations.find_one(
-                {"id": channel["organization_id"]},
-                {"_id": 0, "id": 1, "name": 1, "logo_url": 1}
-            )
-            channel["organization"] = org
+            channel["organization"] = _project_doc(channel_orgs.get(channel["organization_id"]), ["id", "name", "logo_url"])
         else:
             channel["organization"] = None
     
@@ -18105,7 +18390,8 @@ async def get_my_channels(
 
 @api_router.get("/news/channels/subscriptions")
 async def get_channel_subscriptions(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get channels the user is subscribed to"""
     subscriptions = await db.channel_subscriptions.find(
@@ -18114,12 +18400,9 @@ async def get_channel_subscriptions(
     ).to_list(100)
     
     # Get channel details
+    channels = await loaders.channels.load_many(sub["channel_id"] for sub in subscriptions)
     for sub in subscriptions:
-        channel = await db.news_channels.find_one(
-            {"id": sub["channel_id"]},
-            {"_id": 0}
-        )
-        sub["channel"] = channel
+        sub["channel"] = channels.get(sub["channel_id"])
     
     return {"subscriptions": subscriptions}
 
@@ -18162,10 +18445,7 @@ async def get_channel(
     # Get organization info if official channel
     organization = None
     if channel.get("organization_id"):
-        org_data = await db.work_organizations.find_one(
-            {"id": channel["organization_id"]},
-            {"_id": 0, "id": 1, "name": 1, "logo_url": 1, "organization_type": 1}
-        )
+        org_data = await get_cached_organization(channel["organization_id"], ["id", "name", "logo_url", "organization_type"])
         organization = org_data
     
     # Get moderators count
@@ -18211,12 +18491,15 @@ async def subscribe_to_channel(
     )
     
     await db.channel_subscriptions.insert_one(subscription.model_dump())
+    await social_graph.add_subscription(current_user.id, channel_id)
+    await feed_timelines.backfill_channel(current_user.id, channel_id)
     
     # Update subscriber count
     await db.news_channels.update_one(
         {"id": channel_id},
         {"$inc": {"subscribers_count": 1}}
     )
+    await invalidate_channel_cache(channel_id)
     
     return {"message": "Subscribed successfully"}
 
@@ -18234,11 +18517,14 @@ async def unsubscribe_from_channel(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not subscribed to this channel")
     
+    await social_graph.remove_subscription(current_user.id, channel_id)
+    
     # Update subscriber count
     await db.news_channels.update_one(
         {"id": channel_id},
         {"$inc": {"subscribers_count": -1}}
     )
+    await invalidate_channel_cache(channel_id)
     
     return {"message": "Unsubscribed successfully"}
 
@@ -18307,6 +18593,8 @@ async def update_channel(
             {"id": channel_id},
             {"$set": update_data}
         )
+        await invalidate_channel_cache(channel_id)
+        await search_index.refresh(CHANNELS, channel_id)
     
     # Return updated channel data
     updated_channel = await db.news_channels.find_one({"id": channel_id}, {"_id": 0})
@@ -18326,8 +18614,13 @@ async def delete_channel(
         raise HTTPException(status_code=403, detail="Not authorized to delete this channel")
     
     # Delete channel and all subscriptions
+    subscriber_ids = await db.channel_subscriptions.distinct("subscriber_id", {"channel_id": channel_id})
     await db.news_channels.delete_one({"id": channel_id})
+    await search_index.remove(CHANNELS, channel_id)
     await db.channel_subscriptions.delete_many({"channel_id": channel_id})
+    await invalidate_channel_cache(channel_id)
+    for subscriber_id in subscriber_ids:
+        await social_graph.remove_subscription(subscriber_id, channel_id)
     
     return {"message": "Channel deleted successfully"}
 
@@ -18378,7 +18671,8 @@ async def get_news_events(
     event_type: Optional[str] = None,
     upcoming_only: bool = True,
     limit: int = 20,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get news events - personal feed or channel-specific"""
     query = {"is_active": True}
@@ -18425,21 +18719,17 @@ async def get_news_events(
     events = await db.news_events.find(query, {"_id": 0}).sort("event_date", 1).limit(limit).to_list(limit)
     
     # Enrich events with creator and channel info
+    creators = await loaders.users.load_many(e["creator_id"] for e in events)
+    channels = await loaders.channels.load_many(e.get("channel_id") for e in events)
     enriched_events = []
     for event in events:
         # Get creator info
-        creator = await db.users.find_one(
-            {"id": event["creator_id"]},
-            {"_id": 0, "id": 1, "first_name": 1, "last_name": 1, "profile_picture": 1}
-        )
+        creator = user_summary(creators.get(event["creator_id"]))
         
         # Get channel info if applicable
         channel = None
         if event.get("channel_id"):
-            channel = await db.news_channels.find_one(
-                {"id": event["channel_id"]},
-                {"_id": 0, "id": 1, "name": 1, "avatar_url": 1}
-            )
+            channel = _project_doc(channels.get(event["channel_id"]), ["id", "name", "avatar_url"])
         
         enriched_events.append({
             **event,
@@ -18471,10 +18761,7 @@ async def get_news_event(
     # Get channel info if applicable
     channel = None
     if event.get("channel_id"):
-        channel = await db.news_channels.find_one(
-            {"id": event["channel_id"]},
-            {"_id": 0, "id": 1, "name": 1, "avatar_url": 1}
-        )
+        channel = await get_cached_channel(event["channel_id"], ["id", "name", "avatar_url"])
     
     # Get attendees list
     attendee_ids = event.get("attendees", [])[:10]  # First 10
@@ -18571,6 +18858,40 @@ async def delete_news_event(
 
 # ===== NEWS POSTS ENDPOINTS =====
 
+async def enrich_news_posts(
+    posts: List[dict],
+    current_user_id: str,
+    loaders: Loaders,
+    with_author: bool = True,
+    with_channel: bool = True
+):
+    """Attach author, channel and is_liked to news posts (one query per collection)"""
+    if not posts:
+        return posts
+    authors = await loaders.users.load_many(p["user_id"] for p in posts) if with_author else {}
+    channels = await loaders.channels.load_many(p.get("channel_id") for p in posts) if with_channel else {}
+    liked_ids = set(await db.news_post_likes.distinct(
+        "post_id",
+        {"post_id": {"$in": [p["id"] for p in posts]}, "user_id": current_user_id}
+    ))
+    for post in posts:
+        if with_author:
+            author = authors.get(post["user_id"])
+            post["author"] = user_summary(author) or {
+                "id": None, "first_name": None, "last_name": None, "profile_picture": None
+            }
+        if with_channel and post.get("channel_id"):
+            post["channel"] = _project_doc(channels.get(post["channel_id"]), ["name", "avatar_url", "is_verified"])
+        post["is_liked"] = post["id"] in liked_ids
+    return posts
+
+async def grant_news_post_media(post: dict):
+    """Index the author's own media of a news post, public while the post is"""
+    media_ids = [m for m in post.get("media_files") or [] if isinstance(m, str)]
+    if media_ids:
+        owned = await db.media_files.distinct("id", {"id": {"$in": media_ids}, "uploaded_by": post["user_id"]})
+        await media_acl.grant(owned, NEWS_POST, post["id"], public=post.get("visibility") == "PUBLIC")
+
 @api_router.post("/news/posts")
 async def create_news_post(
     post_data: NewsPostCreate,
@@ -18594,7 +18915,12 @@ async def create_news_post(
         youtube_urls=post_data.youtube_urls
     )
     
-    await db.news_posts.insert_one(post.model_dump())
+    post_doc = post.model_dump()
+    await db.news_posts.insert_one(post_doc)
+    await grant_news_post_media(post_doc)
+    
+    # Author's timeline is written inline, followers' in the background
+    await feed_timelines.fan_out(post_doc, background=True)
     
     # Check for @ERIC mention or ERIC_AI visibility and trigger AI response
     should_trigger_eric = '@eric' in post_data.content.lower() or '@ERIC' in post_data.content or post_data.visibility == 'ERIC_AI'
@@ -18612,6 +18938,7 @@ async def create_news_post(
             {"id": post_data.channel_id},
             {"$inc": {"posts_count": 1}}
         )
+        await invalidate_channel_cache(post_data.channel_id)
     
     return {
         "message": "Post created successfully",
@@ -18623,115 +18950,40 @@ async def create_news_post(
 async def get_news_feed(
     limit: int = 20,
     offset: int = 0,
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    """Get personalized news feed - only posts from your network (friends, following, subscribed channels)"""
-    
-    # Get user's friends
-    friendships = await db.user_friendships.find({
-        "$or": [
-            {"user1_id": current_user.id},
-            {"user2_id": current_user.id}
-        ]
-    }).to_list(1000)
-    
-    friend_ids = set()
-    for f in friendships:
-        if f["user1_id"] == current_user.id:
-            friend_ids.add(f["user2_id"])
-        else:
-            friend_ids.add(f["user1_id"])
-    
-    # Get users I'm following
-    following = await db.user_follows.find({
-        "follower_id": current_user.id
-    }).to_list(1000)
-    following_ids = {f["target_id"] for f in following}
-    
-    # Combined network: friends + people I follow
-    network_ids = friend_ids | following_ids
-    
-    # Get subscribed channels
-    subscriptions = await db.channel_subscriptions.find({
-        "subscriber_id": current_user.id
-    }).to_list(1000)
-    subscribed_channel_ids = [s["channel_id"] for s in subscriptions]
-    
-    # Build query for posts from MY NETWORK only
-    # Feed shows:
-    # 1. My own posts (any visibility)
-    # 2. PUBLIC posts from my network (friends + following)
-    # 3. FRIENDS_AND_FOLLOWERS posts from my network
-    # 4. FRIENDS_ONLY posts from friends only
-    # 5. Posts from subscribed channels
-    # 
-    # NOTE: PUBLIC posts from strangers do NOT appear in feed
-    # (they can only be seen when visiting that user's profile directly)
-    
-    query = {
-        "is_active": True,
-        "$or": [
-            # My own posts (all visibilities)
-            {"user_id": current_user.id},
-            # PUBLIC posts from my network only
-            {
-                "visibility": "PUBLIC",
-                "user_id": {"$in": list(network_ids)}
-            },
-            # FRIENDS_AND_FOLLOWERS posts from my network
-            {
-                "visibility": "FRIENDS_AND_FOLLOWERS",
-                "user_id": {"$in": list(network_ids)}
-            },
-            # FRIENDS_ONLY posts from friends only
-            {
-                "visibility": "FRIENDS_ONLY",
-                "user_id": {"$in": list(friend_ids)}
-            },
-            # Posts from subscribed channels
-            {"channel_id": {"$in": subscribed_channel_ids}}
-        ]
-    }
-    
-    posts = await db.news_posts.find(
-        query,
-        {"_id": 0}
-    ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
+    """Get personalized news feed - only posts from your network (friends, following, subscribed channels)
+
+    Feed shows:
+    1. My own posts (any visibility)
+    2. PUBLIC and FRIENDS_AND_FOLLOWERS posts from my network (friends + following)
+    3. FRIENDS_ONLY posts from friends only
+    4. Posts from subscribed channels
+
+    PUBLIC posts from strangers do NOT appear in feed (they can only be seen
+    when visiting that user's profile directly).
+
+    Served from the per-user timeline (core/timelines.py). Pass the returned
+    `next_cursor` as `cursor` for the next page; `offset` is kept for older
+    clients.
+    """
+    limit = max(1, min(limit, 100))
     
-    # Enrich posts with author info
-    for post in posts:
-        author = await db.users.find_one(
-            {"id": post["user_id"]},
-            {"_id": 0, "password_hash": 0}
-        )
-        post["author"] = {
-            "id": author["id"] if author else None,
-            "first_name": author.get("first_name") if author else None,
-            "last_name": author.get("last_name") if author else None,
-            "profile_picture": author.get("profile_picture") if author else None
-        }
-        
-        # Add channel info if applicable
-        if post.get("channel_id"):
-            channel = await db.news_channels.find_one(
-                {"id": post["channel_id"]},
-                {"_id": 0, "name": 1, "avatar_url": 1, "is_verified": 1}
-            )
-            post["channel"] = channel
-        
-        # Check if current user liked this post
-        liked = await db.news_post_likes.find_one({
-            "post_id": post["id"],
-            "user_id": current_user.id
-        })
-        post["is_liked"] = liked is not None
+    # Friends, people I follow and subscribed channels from the social graph
+    adjacency = await social_graph.get(current_user.id)
     
-    total = await db.news_posts.count_documents(query)
+    try:
+        page = await feed_timelines.read(adjacency, limit=limit, cursor=cursor, offset=max(0, offset))
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    posts = await enrich_news_posts(page.posts, current_user.id, loaders)
     
     return {
         "posts": posts,
-        "total": total,
-        "has_more": offset + limit < total
+        "next_cursor": page.next_cursor,
+        "has_more": page.has_more
     }
 
 @api_router.get("/news/posts/channel/{channel_id}")
@@ -18739,7 +18991,8 @@ async def get_channel_posts(
     channel_id: str,
     limit: int = 20,
     offset: int = 0,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get posts from a specific channel"""
     channel = await db.news_channels.find_one({"id": channel_id}, {"_id": 0})
@@ -18752,23 +19005,7 @@ async def get_channel_posts(
     ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
     
     # Enrich posts with author info
-    for post in posts:
-        author = await db.users.find_one(
-            {"id": post["user_id"]},
-            {"_id": 0, "password_hash": 0}
-        )
-        post["author"] = {
-            "id": author["id"] if author else None,
-            "first_name": author.get("first_name") if author else None,
-            "last_name": author.get("last_name") if author else None,
-            "profile_picture": author.get("profile_picture") if author else None
-        }
-        
-        liked = await db.news_post_likes.find_one({
-            "post_id": post["id"],
-            "user_id": current_user.id
-        })
-        post["is_liked"] = liked is not None
+    await enrich_news_posts(posts, current_user.id, loaders, with_channel=False)
     
     total = await db.news_posts.count_documents({"channel_id": channel_id, "is_active": True})
     
@@ -18784,7 +19021,8 @@ async def get_user_news_posts(
     user_id: str,
     limit: int = 20,
     offset: int = 0,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get posts from a specific user (respecting visibility)"""
     
@@ -18827,12 +19065,7 @@ async def get_user_news_posts(
     ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
     
     # Enrich posts
-    for post in posts:
-        liked = await db.news_post_likes.find_one({
-            "post_id": post["id"],
-            "user_id": current_user.id
-        })
-        post["is_liked"] = liked is not None
+    await enrich_news_posts(posts, current_user.id, loaders, with_author=False, with_channel=False)
     
     return {"posts": posts}
 
@@ -18926,6 +19159,11 @@ async def update_news_post(
     # Get updated post
     updated_post = await db.news_posts.find_one({"id": post_id}, {"_id": 0})
     
+    # A wider audience needs delivery; a narrower one is filtered on read
+    if update_data.visibility is not None and update_data.visibility != post.get("visibility"):
+        await feed_timelines.fan_out(updated_post, background=True)
+        await grant_news_post_media(updated_post)
+    
     return updated_post
 
 @api_router.delete("/news/posts/{post_id}")
@@ -18946,6 +19184,8 @@ async def delete_news_post(
         {"id": post_id},
         {"$set": {"is_active": False}}
     )
+    await feed_timelines.remove_post(post_id)
+    await media_acl.revoke_contexts(NEWS_POST, [post_id])
     
     # Update channel post count if applicable
     if post.get("channel_id"):
@@ -18953,6 +19193,7 @@ async def delete_news_post(
             {"id": post["channel_id"]},
             {"$inc": {"posts_count": -1}}
         )
+        await invalidate_channel_cache(post["channel_id"])
     
     return {"message": "Post deleted"}
 
@@ -18965,7 +19206,8 @@ class NewsCommentCreate(BaseModel):
 @api_router.get("/news/posts/{post_id}/comments")
 async def get_news_post_comments(
     post_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get comments for a news post"""
     post = await db.news_posts.find_one({"id": post_id})
@@ -18982,6 +19224,12 @@ async def get_news_post_comments(
     comments_dict = {}
     top_level_comments = []
     
+    authors = await loaders.users.load_many(c["user_id"] for c in comments if c["user_id"] != "eric-ai")
+    liked_ids = set(await db.news_comment_likes.distinct(
+        "comment_id",
+        {"comment_id": {"$in": [c["id"] for c in comments]}, "user_id": current_user.id}
+    ))
+    
     for comment in comments:
         comment.pop("_id", None)
         
@@ -18994,20 +19242,16 @@ async def get_news_post_comments(
                 "profile_picture": "/eric-avatar.jpg"
             }
         else:
-            author = await get_user_by_id(comment["user_id"])
+            author = authors.get(comment["user_id"])
             comment["author"] = {
-                "id": author.id if author else "",
-                "first_name": author.first_name if author else "Deleted",
-                "last_name": author.last_name if author else "User",
-                "profile_picture": author.profile_picture if author else None
+                "id": author["id"] if author else "",
+                "first_name": author.get("first_name") if author else "Deleted",
+                "last_name": author.get("last_name") if author else "User",
+                "profile_picture": author.get("profile_picture") if author else None
             }
         
         # Check if current user liked this comment
-        liked = await db.news_comment_likes.find_one({
-            "comment_id": comment["id"],
-            "user_id": current_user.id
-        })
-        comment["user_liked"] = liked is not None
+        comment["user_liked"] = comment["id"] in liked_ids
         
         comment["replies"] = []
         comments_dict[comment["id"]] = comment
@@ -19246,6 +19490,7 @@ async def link_channel_to_organization(
             "is_official": True
         }}
     )
+    await invalidate_channel_cache(channel_id)
     
     return {"message": "Channel linked to organization and verified"}
 
@@ -19260,7 +19505,8 @@ class AddModeratorRequest(BaseModel):
 @api_router.get("/news/channels/{channel_id}/moderators")
 async def get_channel_moderators(
     channel_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all moderators for a channel"""
     channel = await db.news_channels.find_one({"id": channel_id})
@@ -19273,11 +19519,9 @@ async def get_channel_moderators(
     ).to_list(100)
     
     # Enrich with user info
+    users = await loaders.users.load_many(m["user_id"] for m in moderators)
     for mod in moderators:
-        user = await db.users.find_one(
-            {"id": mod["user_id"]},
-            {"_id": 0, "password_hash": 0}
-        )
+        user = users.get(mod["user_id"])
         if user:
             mod["user"] = {
                 "id": user.get("id"),
@@ -19778,7 +20022,7 @@ async def create_service_listing(
             raise HTTPException(status_code=403, detail="You must be a member of the organization to create listings")
         
         # Verify organization exists
-        organization = await db.work_organizations.find_one({"id": listing_data.organization_id}, {"_id": 0, "id": 1, "name": 1})
+        organization = await get_cached_organization(listing_data.organization_id, ["id", "name"])
         if not organization:
             raise HTTPException(status_code=404, detail="Organization not found")
         
@@ -19793,6 +20037,7 @@ async def create_service_listing(
         listing_dict["updated_at"] = listing_dict["updated_at"].isoformat()
         
         await db.service_listings.insert_one(listing_dict)
+        await search_index.refresh(SERVICES, listing.id)
         
         # Return without _id
         if "_id" in listing_dict:
@@ -19816,7 +20061,8 @@ async def get_service_listings(
     price_max: Optional[float] = None,
     skip: int = 0,
     limit: int = 20,
-    sort_by: str = "rating"  # "rating", "price", "newest", "popular"
+    sort_by: str = "rating",  # "rating", "price", "newest", "popular"
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Search and filter service listings"""
     try:
@@ -19827,7 +20073,7 @@ async def get_service_listings(
         if subcategory_id:
             query["subcategory_id"] = subcategory_id
         if city:
-            query["city"] = {"$regex": city, "$options": "i"}
+            query["city"] = {"$regex": re.escape(city), "$options": "i"}
         if min_rating:
             query["rating"] = {"$gte": min_rating}
         if price_min is not None:
@@ -19838,11 +20084,7 @@ async def get_service_listings(
                 {"price_from": {"$lte": price_max}}
             ]
         if search:
-            query["$or"] = [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}},
-                {"tags": {"$in": [search.lower()]}}
-            ]
+            query["id"] = {"$in": await search_index.search(SERVICES, search, where=query)}
         
         # Sorting
         sort_options = {
@@ -19857,8 +20099,9 @@ async def get_service_listings(
         total = await db.service_listings.count_documents(query)
         
         # Enrich with organization info
+        orgs = await loaders.organizations.load_many(l.get("organization_id") for l in listings)
         for listing in listings:
-            org = await db.work_organizations.find_one({"id": listing["organization_id"]}, {"_id": 0, "name": 1, "logo": 1})
+            org = orgs.get(listing.get("organization_id"))
             if org:
                 listing["organization_name"] = org.get("name")
                 listing["organization_logo"] = org.get("logo")
@@ -19875,7 +20118,7 @@ async def get_service_listings(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @api_router.get("/services/listings/{listing_id}")
-async def get_service_listing(listing_id: str):
+async def get_service_listing(listing_id: str, loaders: Loaders = Depends(get_loaders)):
     """Get a single service listing with full details"""
     try:
         listing = await db.service_listings.find_one({"id": listing_id}, {"_id": 0})
@@ -19900,10 +20143,11 @@ async def get_service_listing(listing_id: str):
         ).sort("created_at", -1).limit(5).to_list(5)
         
         # Enrich reviews with user info
+        reviewers = await loaders.users.load_many(r["user_id"] for r in reviews)
         for review in reviews:
-            user = await db.users.find_one({"id": review["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "profile_picture": 1})
+            user = reviewers.get(review["user_id"])
             if user:
-                review["user"] = user
+                review["user"] = user_summary(user, ("first_name", "last_name", "profile_picture"))
         
         listing["recent_reviews"] = reviews
         
@@ -19949,6 +20193,7 @@ async def update_service_listing(
             {"id": listing_id},
             {"$set": update_dict}
         )
+        await search_index.refresh(SERVICES, listing_id)
         
         updated = await db.service_listings.find_one({"id": listing_id}, {"_id": 0})
         return {"success": True, "listing": updated}
@@ -19960,7 +20205,8 @@ async def update_service_listing(
 
 @api_router.get("/services/my-listings")
 async def get_my_service_listings(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all service listings owned by the current user or their organizations"""
     try:
@@ -19982,8 +20228,9 @@ async def get_my_service_listings(
         ).sort("created_at", -1).to_list(100)
         
         # Enrich with org info
+        orgs = await loaders.organizations.load_many(l["organization_id"] for l in listings)
         for listing in listings:
-            org = await db.work_organizations.find_one({"id": listing["organization_id"]}, {"_id": 0, "name": 1})
+            org = orgs.get(listing["organization_id"])
             if org:
                 listing["organization_name"] = org.get("name")
         
@@ -20090,7 +20337,8 @@ async def create_service_booking(
 async def get_my_bookings(
     status: Optional[str] = None,
     as_provider: bool = False,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get bookings - either as client or as provider"""
     try:
@@ -20109,11 +20357,13 @@ async def get_my_bookings(
         bookings = await db.service_bookings.find(query, {"_id": 0}).sort("booking_date", -1).to_list(100)
         
         # Enrich with service info
+        listings = await loaders.collection("service_listings").load_many(b["service_id"] for b in bookings)
+        orgs = await loaders.organizations.load_many(l.get("organization_id") for l in listings.values())
         for booking in bookings:
-            listing = await db.service_listings.find_one({"id": booking["service_id"]}, {"_id": 0, "name": 1, "organization_id": 1})
+            listing = listings.get(booking["service_id"])
             if listing:
                 booking["service_name"] = listing.get("name")
-                org = await db.work_organizations.find_one({"id": listing["organization_id"]}, {"_id": 0, "name": 1})
+                org = orgs.get(listing["organization_id"])
                 if org:
                     booking["organization_name"] = org.get("name")
         
@@ -20318,7 +20568,8 @@ async def create_service_review(
 async def get_service_reviews(
     service_id: str,
     skip: int = 0,
-    limit: int = 20
+    limit: int = 20,
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get reviews for a service"""
     try:
@@ -20328,13 +20579,11 @@ async def get_service_reviews(
         ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
         
         # Enrich with user info
+        reviewers = await loaders.users.load_many(r["user_id"] for r in reviews)
         for review in reviews:
-            user = await db.users.find_one(
-                {"id": review["user_id"]},
-                {"_id": 0, "first_name": 1, "last_name": 1, "profile_picture": 1}
-            )
+            user = reviewers.get(review["user_id"])
             if user:
-                review["user"] = user
+                review["user"] = user_summary(user, ("first_name", "last_name", "profile_picture"))
         
         total = await db.service_reviews.count_documents({"service_id": service_id})
         
@@ -20821,6 +21070,7 @@ async def create_marketplace_product(
         )
         
         await db.marketplace_products.insert_one(product.dict())
+        await search_index.refresh(PRODUCTS, product.id)
         
         return {"success": True, "product": product.dict()}
         
@@ -20846,25 +21096,19 @@ async def get_marketplace_products(
     seller_type: Optional[SellerType] = None,
     sort_by: str = "newest",  # newest, price_asc, price_desc, popular
     skip: int = 0,
-    limit: int = 20
+    limit: int = 20,
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get marketplace products with filters"""
     try:
         query = {"status": ProductStatus.ACTIVE}
         
-        if search:
-            query["$or"] = [
-                {"title": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}},
-                {"tags": {"$in": [search.lower()]}}
-            ]
-        
         if category:
             query["category"] = category
         if subcategory:
             query["subcategory"] = subcategory
         if city:
-            query["city"] = {"$regex": city, "$options": "i"}
+            query["city"] = {"$regex": re.escape(city), "$options": "i"}
         if condition:
             query["condition"] = condition
         if seller_type:
@@ -20875,6 +21119,8 @@ async def get_marketplace_products(
         if max_price is not None:
             query["price"] = query.get("price", {})
             query["price"]["$lte"] = max_price
+        if search:
+            query["id"] = {"$in": await search_index.search(PRODUCTS, search, where=query)}
         
         # Sorting
         sort = [("created_at", -1)]  # Default: newest
@@ -20889,14 +21135,16 @@ async def get_marketplace_products(
         total = await db.marketplace_products.count_documents(query)
         
         # Enrich with seller info
+        sellers = await loaders.users.load_many(p["seller_id"] for p in products)
+        orgs = await loaders.collection("organizations").load_many(p.get("organization_id") for p in products)
         for product in products:
-            seller = await db.users.find_one({"id": product["seller_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "profile_picture": 1})
+            seller = sellers.get(product["seller_id"])
             if seller:
                 product["seller_name"] = f"{seller.get('first_name', '')} {seller.get('last_name', '')}".strip()
                 product["seller_avatar"] = seller.get("profile_picture")
             
             if product.get("organization_id"):
-                org = await db.organizations.find_one({"id": product["organization_id"]}, {"_id": 0, "name": 1, "logo": 1})
+                org = orgs.get(product["organization_id"])
                 if org:
                     product["organization_name"] = org.get("name")
                     product["organization_logo"] = org.get("logo")
@@ -20966,6 +21214,7 @@ async def update_marketplace_product(
             {"id": product_id},
             {"$set": update_dict}
         )
+        await search_index.refresh(PRODUCTS, product_id)
         
         updated = await db.marketplace_products.find_one({"id": product_id}, {"_id": 0})
         return {"success": True, "product": updated}
@@ -20998,6 +21247,7 @@ async def delete_marketplace_product(
             raise HTTPException(status_code=403, detail="Not authorized to delete this product")
         
         await db.marketplace_products.delete_one({"id": product_id})
+        await search_index.remove(PRODUCTS, product_id)
         
         # Also remove from favorites
         await db.marketplace_favorites.delete_many({"product_id": product_id})
@@ -21156,11 +21406,13 @@ async def get_inventory_items(
             query["category"] = category
         
         if search:
+            # Scoped to one user's items (indexed on user_id); input matched literally
+            search_regex = {"$regex": re.escape(search), "$options": "i"}
             query["$or"] = [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}},
-                {"brand": {"$regex": search, "$options": "i"}},
-                {"model": {"$regex": search, "$options": "i"}}
+                {"name": search_regex},
+                {"description": search_regex},
+                {"brand": search_regex},
+                {"model": search_regex}
             ]
         
         items = await db.inventory_items.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
@@ -21322,6 +21574,7 @@ async def list_item_for_sale(
         )
         
         await db.marketplace_products.insert_one(product.dict())
+        await search_index.refresh(PRODUCTS, product.id)
         
         # Update inventory item
         await db.inventory_items.update_one(
@@ -21745,7 +21998,8 @@ async def get_transactions(
     limit: int = 50,
     offset: int = 0,
     asset_type: Optional[str] = None,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get user's transaction history"""
     try:
@@ -21761,9 +22015,12 @@ async def get_transactions(
         
         # Enrich with user names
         enriched = []
+        tx_users = await loaders.users.load_many(
+            uid for tx in transactions for uid in (tx["from_user_id"], tx["to_user_id"])
+        )
         for tx in transactions:
-            from_user = await db.users.find_one({"id": tx["from_user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1})
-            to_user = await db.users.find_one({"id": tx["to_user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1})
+            from_user = tx_users.get(tx["from_user_id"])
+            to_user = tx_users.get(tx["to_user_id"])
             
             tx["from_user_name"] = f"{from_user['first_name']} {from_user['last_name']}" if from_user else "System"
             tx["to_user_name"] = f"{to_user['first_name']} {to_user['last_name']}" if to_user else "Treasury"
@@ -21810,7 +22067,8 @@ async def get_exchange_rates():
 @api_router.get("/finance/token-holders")
 async def get_token_holders(
     limit: int = 20,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get list of TOKEN holders with their percentages"""
     try:
@@ -21827,8 +22085,9 @@ async def get_token_holders(
         
         # Enrich with user names and percentages
         enriched = []
+        holder_users = await loaders.users.load_many(h["user_id"] for h in holders)
         for holder in holders:
-            user = await db.users.find_one({"id": holder["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
+            user = holder_users.get(holder["user_id"])
             enriched.append({
                 "user_id": holder["user_id"],
                 "user_name": f"{user['first_name']} {user['last_name']}" if user else "Unknown",
@@ -22476,7 +22735,7 @@ async def create_corporate_wallet(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @api_router.get("/finance/corporate/wallets")
-async def get_user_corporate_wallets(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_user_corporate_wallets(credentials: HTTPAuthorizationCredentials = Depends(security), loaders: Loaders = Depends(get_loaders)):
     """Get all corporate wallets for organizations user is admin of"""
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
@@ -22489,9 +22748,10 @@ async def get_user_corporate_wallets(credentials: HTTPAuthorizationCredentials =
         ).to_list(100)
         
         corporate_wallets = []
+        orgs = await loaders.organizations.load_many(m.get("organization_id") for m in memberships)
         for membership in memberships:
             org_id = membership.get("organization_id")
-            org = await db.work_organizations.find_one({"id": org_id}, {"_id": 0})
+            org = orgs.get(org_id)
             if not org:
                 continue
                 
@@ -22717,7 +22977,8 @@ async def get_corporate_transactions(
     organization_id: str,
     skip: int = 0,
     limit: int = 50,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get transaction history for corporate wallet"""
     try:
@@ -22751,6 +23012,17 @@ async def get_corporate_transactions(
         }, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
         
         # Enrich transaction data
+        counterparty_ids = [
+            tx.get("to_user_id", "") if tx.get("from_wallet_id") == wallet["id"] else tx.get("from_user_id", "")
+            for tx in transactions
+        ]
+        counterparty_orgs = await loaders.organizations.load_many(
+            cid.replace("ORG_", "") for cid in counterparty_ids if cid.startswith("ORG_")
+        )
+        counterparty_users = await loaders.users.load_many(
+            cid for cid in counterparty_ids if cid and not cid.startswith("ORG_") and cid != TREASURY_USER_ID
+        )
+        
         enriched_transactions = []
         for tx in transactions:
             is_outgoing = tx.get("from_wallet_id") == wallet["id"]
@@ -22763,14 +23035,14 @@ async def get_corporate_transactions(
             
             if counterparty_id.startswith("ORG_"):
                 org_id = counterparty_id.replace("ORG_", "")
-                org = await db.work_organizations.find_one({"id": org_id}, {"_id": 0, "name": 1})
+                org = counterparty_orgs.get(org_id)
                 counterparty_name = org.get("name", "Unknown Organization") if org else "Unknown Organization"
                 counterparty_type = "organization"
             elif counterparty_id == TREASURY_USER_ID:
                 counterparty_name = "Казначейство платформы"
                 counterparty_type = "treasury"
             else:
-                user = await db.users.find_one({"id": counterparty_id}, {"_id": 0, "first_name": 1, "last_name": 1})
+                user = counterparty_users.get(counterparty_id)
                 counterparty_name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() if user else "Unknown User"
                 counterparty_type = "user"
             
@@ -22896,10 +23168,20 @@ async def detailed_health_check():
         health_status["checks"]["database"] = {"status": "unhealthy", "error": str(e)}
     
     # Check cache
-    health_status["checks"]["cache"] = {"status": "healthy", "entries": len(cache._cache)}
+    cache_stats = cache.stats()
+    health_status["checks"]["cache"] = {
+        "status": "degraded" if cache_stats["remote"]["errors"] else "healthy",
+        "entries": cache_stats["local"]["entries"],
+        "redis_enabled": cache_stats["remote"]["enabled"]
+    }
     
     # Check rate limiter
-    health_status["checks"]["rate_limiter"] = {"status": "healthy", "tracked_keys": len(rate_limiter._requests)}
+    limiter_stats = rate_limiter.stats()
+    health_status["checks"]["rate_limiter"] = {
+        "status": "degraded" if limiter_stats["remote_errors"] else "healthy",
+        "backend": limiter_stats["backend"],
+        "tracked_keys": limiter_stats["tracked_local_keys"]
+    }
     
     return health_status
 
@@ -22918,12 +23200,24 @@ async def get_metrics():
                 "index_mb": round(db_stats.get("indexSize", 0) / (1024 * 1024), 2)
             },
             "cache": {
-                "entries": len(cache._cache),
+                **cache.stats(),
                 "ttl_seconds": cache.default_ttl
             },
-            "rate_limiter": {
-                "tracked_users": len(rate_limiter._requests)
-            },
+            "rate_limiter": rate_limiter.stats(),
+            "social_graph": social_graph.stats(),
+            "feed_timelines": feed_timelines.stats(),
+            "conversations": conversations.stats(),
+            "websockets": chat_manager.stats(),
+            "presence": presence.stats(),
+            "backups": backup_jobs.stats(),
+            "media": media_store.stats(),
+            "images": image_derivatives.stats(),
+            "media_acl": media_acl.stats(),
+            "search": search_index.stats(),
+            "typeahead": people_typeahead.stats(),
+            "message_search": message_search.stats(),
+            "workers": worker_pools.stats(),
+            "event_loop": loop_monitor.stats(),
             "timestamp": datetime.now(timezone.utc)
         }
     except Exception as e:
@@ -23323,6 +23617,7 @@ async def create_interest_group(
         group_dict["created_at"] = group_dict["created_at"].isoformat()
         
         await db.interest_groups.insert_one(group_dict)
+        await search_index.refresh(INTEREST_GROUPS, group.id)
         
         # Add creator as member
         await db.group_members.insert_one({
@@ -23351,10 +23646,7 @@ async def list_interest_groups(
     if category_id:
         query["category_id"] = category_id
     if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
+        query["id"] = {"$in": await search_index.search(INTEREST_GROUPS, search, where=query)}
     
     groups = await db.interest_groups.find(query, {"_id": 0}).sort("members_count", -1).skip(offset).limit(limit).to_list(limit)
     total = await db.interest_groups.count_documents(query)
@@ -23500,6 +23792,7 @@ async def create_event(
         event_dict["updated_at"] = event_dict["updated_at"].isoformat()
         
         await db.goodwill_events.insert_one(event_dict)
+        await search_index.refresh(EVENTS, event_dict["id"])
         
         # Update organizer profile events count
         await db.event_organizer_profiles.update_one(
@@ -23561,12 +23854,7 @@ async def list_events(
     if category_id:
         query["category_id"] = category_id
     if city:
-        query["city"] = {"$regex": city, "$options": "i"}
-    if search:
-        query["$and"] = query.get("$and", []) + [{"$or": [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]}]
+        query["city"] = {"$regex": re.escape(city), "$options": "i"}
     if status:
         query["status"] = status
     else:
@@ -23579,6 +23867,8 @@ async def list_events(
         query["start_date"] = {"$gte": start_from}
     if start_to:
         query.setdefault("start_date", {})["$lte"] = start_to
+    if search:
+        query["id"] = {"$in": await search_index.search(EVENTS, search, where=query)}
     
     events = await db.goodwill_events.find(query, {"_id": 0}).sort("start_date", 1).skip(offset).limit(limit).to_list(limit)
     total = await db.goodwill_events.count_documents(query)
@@ -23607,7 +23897,8 @@ async def get_user_organizer_ids(user_id: str) -> List[str]:
 async def get_event(
     event_id: str,
     request: Request,
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get event details"""
     event = await db.goodwill_events.find_one({"id": event_id}, {"_id": 0})
@@ -23648,9 +23939,9 @@ async def get_event(
         {"_id": 0}
     ).limit(10).to_list(10)
     
+    attendee_users = await loaders.users.load_many(a["user_id"] for a in attendees)
     for att in attendees:
-        user = await db.users.find_one({"id": att["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "profile_picture": 1})
-        att["user"] = user
+        att["user"] = user_summary(attendee_users.get(att["user_id"]), ("first_name", "last_name", "profile_picture"))
     
     event["attendees_preview"] = attendees
     
@@ -24018,7 +24309,8 @@ async def invite_to_event(
 
 @api_router.get("/goodwill/my-invitations")
 async def get_my_invitations(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get invitations sent to the user"""
     try:
@@ -24031,15 +24323,16 @@ async def get_my_invitations(
         ).sort("created_at", -1).to_list(50)
         
         # Enrich with event and inviter info
+        events = await loaders.collection("goodwill_events").load_many(i["event_id"] for i in invitations)
+        inviters = await loaders.users.load_many(i["inviter_id"] for i in invitations)
         for inv in invitations:
-            event = await db.goodwill_events.find_one({"id": inv["event_id"]}, {"_id": 0, "title": 1, "start_date": 1, "city": 1, "category_id": 1})
+            event = _project_doc(events.get(inv["event_id"]), ["title", "start_date", "city", "category_id"])
             if event:
                 category = next((c for c in INTEREST_CATEGORIES if c["id"] == event.get("category_id")), None)
                 event["category"] = category
             inv["event"] = event
             
-            inviter = await db.users.find_one({"id": inv["inviter_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "profile_picture": 1})
-            inv["inviter"] = inviter
+            inv["inviter"] = user_summary(inviters.get(inv["inviter_id"]), ("first_name", "last_name", "profile_picture"))
         
         return {"invitations": invitations}
     except jwt.ExpiredSignatureError:
@@ -24190,16 +24483,16 @@ async def add_event_review(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @api_router.get("/goodwill/events/{event_id}/reviews")
-async def get_event_reviews(event_id: str, limit: int = 20, offset: int = 0):
+async def get_event_reviews(event_id: str, limit: int = 20, offset: int = 0, loaders: Loaders = Depends(get_loaders)):
     """Get reviews for an event"""
     reviews = await db.event_reviews.find(
         {"event_id": event_id}, {"_id": 0}
     ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
     
     # Enrich with user info
+    reviewers = await loaders.users.load_many(r["user_id"] for r in reviews)
     for review in reviews:
-        user = await db.users.find_one({"id": review["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "profile_picture": 1})
-        review["user"] = user
+        review["user"] = user_summary(reviewers.get(review["user_id"]), ("first_name", "last_name", "profile_picture"))
     
     return {"reviews": reviews}
 
@@ -24248,15 +24541,15 @@ async def add_event_photo(
         raise HTTPException(status_code=401, detail="Token expired")
 
 @api_router.get("/goodwill/events/{event_id}/photos")
-async def get_event_photos(event_id: str, limit: int = 50, offset: int = 0):
+async def get_event_photos(event_id: str, limit: int = 50, offset: int = 0, loaders: Loaders = Depends(get_loaders)):
     """Get photos from event gallery"""
     photos = await db.event_photos.find(
         {"event_id": event_id}, {"_id": 0}
     ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
     
+    photo_users = await loaders.users.load_many(p["user_id"] for p in photos)
     for photo in photos:
-        user = await db.users.find_one({"id": photo["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "profile_picture": 1})
-        photo["user"] = user
+        photo["user"] = user_summary(photo_users.get(photo["user_id"]), ("first_name", "last_name", "profile_picture"))
     
     return {"photos": photos}
 
@@ -24313,7 +24606,8 @@ async def get_chat_messages(
     event_id: str,
     limit: int = 50,
     offset: int = 0,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get chat messages for an event"""
     try:
@@ -24324,9 +24618,9 @@ async def get_chat_messages(
             {"event_id": event_id}, {"_id": 0}
         ).sort("created_at", 1).skip(offset).limit(limit).to_list(limit)
         
+        users = await loaders.users.load_many(m["user_id"] for m in messages)
         for msg in messages:
-            user = await db.users.find_one({"id": msg["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "profile_picture": 1})
-            msg["user"] = user
+            msg["user"] = user_summary(users.get(msg["user_id"]), ("first_name", "last_name", "profile_picture"))
         
         return {"messages": messages}
     except jwt.ExpiredSignatureError:
@@ -24451,15 +24745,10 @@ async def get_event_qr_code(
         
         # Generate QR code image
         qr_data = f"goodwill://checkin/{event_id}/{checkin_code}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=4)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white")
+        qr_png = await worker_pools.cpu(QR_CODES, qr_code_png, qr_data)
         
         # Convert to base64
-        buffer = BytesIO()
-        qr_img.save(buffer, format="PNG")
-        qr_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        qr_base64 = base64.b64encode(qr_png).decode('utf-8')
         
         return {
             "success": True,
@@ -24574,7 +24863,7 @@ async def remove_co_organizer(
 from eric_agent import ERICAgent, ChatRequest, ChatResponse, AgentSettings, AgentConversation
 
 # Initialize ERIC agent
-eric_agent = ERICAgent(db)
+eric_agent = ERICAgent(db, search_index, worker_pools)
 
 # Helper function to process @ERIC mentions in posts
 async def process_eric_mention_for_post(post_id: str, post_content: str, author_name: str, user_id: str):
@@ -24616,7 +24905,7 @@ async def process_eric_mention_for_post(post_id: str, post_content: str, author_
         # Update post's comment count
         await db.posts.update_one(
             {"id": post_id},
-            {"$inc": {"comments_count": 1}}
+            {"$inc": {"comments_count": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}}
         )
         
         logging.info(f"ERIC commented on post {post_id}")
@@ -24674,12 +24963,7 @@ async def agent_chat(
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         
-        # Rate limiting for AI requests
-        if not await check_rate_limit(user_id, "ai_chat"):
-            raise HTTPException(
-                status_code=429, 
-                detail="Слишком много запросов. Пожалуйста, подождите минуту."
-            )
+        # Rate limiting for AI requests is applied by RateLimitMiddleware
         
         response = await eric_agent.chat(user_id, request)
         return response.dict()
@@ -25028,12 +25312,7 @@ async def chat_with_search(
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         
-        # Rate limiting for AI search requests
-        if not await check_rate_limit(user_id, "ai_chat"):
-            raise HTTPException(
-                status_code=429, 
-                detail="Слишком много запросов. Пожалуйста, подождите минуту."
-            )
+        # Rate limiting for AI search requests is applied by RateLimitMiddleware
         
         result = await eric_agent.chat_with_search(
             user_id=user_id,
@@ -25617,22 +25896,18 @@ async def get_admin_users(
     try:
         query = {}
         
-        # Search filter
-        if search:
-            search_regex = {"$regex": search, "$options": "i"}
-            query["$or"] = [
-                {"email": search_regex},
-                {"first_name": search_regex},
-                {"last_name": search_regex},
-                {"phone": search_regex}
-            ]
-        
         # Status filter
         if status_filter == "active":
             query["is_active"] = True
         elif status_filter == "inactive":
             query["is_active"] = False
         
+        # Search filter (name, email or phone through the search index; phones are admin only)
+        if search:
+            ids = await search_index.search(USERS, search, where=query)
+            ids += [i for i in await search_index.search(USER_PHONES, search, where=query) if i not in ids]
+            query["id"] = {"$in": ids}
+        
         # Get total count
         total = await db.users.count_documents(query)
         
@@ -25753,6 +26028,8 @@ async def update_admin_user(
                 {"id": user_id},
                 {"$set": update_data}
             )
+            await invalidate_user_cache(user_id)
+            await reindex_user(user_id)
         
         # Fetch updated user
         updated_user = await db.users.find_one(
@@ -25787,6 +26064,7 @@ async def toggle_user_status(
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        await invalidate_user_cache(user_id)
         
         status_text = "активирован" if new_status else "деактивирован"
         return {"message": f"Пользователь {status_text}", "is_active": new_status}
@@ -25809,9 +26087,13 @@ async def delete_admin_user(
         
         # Hard delete the user
         await db.users.delete_one({"id": user_id})
+        await unindex_user(user_id)
+        await invalidate_user_cache(user_id)
         
         # Also clean up related data
+        post_ids = await db.posts.distinct("id", {"user_id": user_id})
         await db.posts.delete_many({"user_id": user_id})
+        await media_acl.revoke_contexts(POST, post_ids)
         await db.comments.delete_many({"user_id": user_id})
         await db.notifications.delete_many({"user_id": user_id})
         await db.agent_conversations.delete_many({"user_id": user_id})
@@ -25839,7 +26121,7 @@ async def reset_user_password(
         if not new_password or len(new_password) < 6:
             raise HTTPException(status_code=400, detail="Пароль должен быть не менее 6 символов")
         
-        hashed_password = get_password_hash(new_password)
+        hashed_password = await get_password_hash(new_password)
         
         await db.users.update_one(
             {"id": user_id},
@@ -25848,6 +26130,7 @@ async def reset_user_password(
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        await invalidate_user_cache(user_id)
         
         return {"message": "Пароль сброшен"}
     except HTTPException:
@@ -25901,7 +26184,8 @@ async def get_admin_treasury_stats(admin: str = Depends(get_current_admin)):
 @api_router.get("/admin/finance/token-holders")
 async def get_admin_token_holders(
     admin: str = Depends(get_current_admin),
-    limit: int = Query(50, ge=1, le=200)
+    limit: int = Query(50, ge=1, le=200),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get list of TOKEN holders for admin panel"""
     try:
@@ -25916,8 +26200,9 @@ async def get_admin_token_holders(
         
         # Enrich with user names and percentages
         enriched = []
+        holder_users = await loaders.users.load_many(h["user_id"] for h in holders)
         for holder in holders:
-            user = await db.users.find_one({"id": holder["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
+            user = holder_users.get(holder["user_id"])
             enriched.append({
                 "user_id": holder["user_id"],
                 "user_name": f"{user['first_name']} {user['last_name']}" if user else "Unknown",
@@ -26140,7 +26425,7 @@ class SystemSettings(BaseModel):
     transaction_fee_rate: float = TRANSACTION_FEE_RATE
 
 @api_router.get("/admin/finance/master-wallet")
-async def get_master_wallet(admin: str = Depends(get_current_admin)):
+async def get_master_wallet(admin: str = Depends(get_current_admin), loaders: Loaders = Depends(get_loaders)):
     """Get master wallet (treasury) details"""
     try:
         treasury = await get_or_create_treasury()
@@ -26152,15 +26437,18 @@ async def get_master_wallet(admin: str = Depends(get_current_admin)):
         ).sort("created_at", -1).limit(20).to_list(20)
         
         # Enrich with user names
+        tx_users = await loaders.users.load_many(
+            uid for tx in recent_tx for uid in (tx.get("from_user_id"), tx.get("to_user_id")) if uid != TREASURY_USER_ID
+        )
         for tx in recent_tx:
             if tx.get("from_user_id") != TREASURY_USER_ID:
-                user = await db.users.find_one({"id": tx["from_user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1})
+                user = tx_users.get(tx["from_user_id"])
                 tx["from_user_name"] = f"{user['first_name']} {user['last_name']}" if user else "Unknown"
             else:
                 tx["from_user_name"] = "Treasury"
             
             if tx.get("to_user_id") != TREASURY_USER_ID:
-                user = await db.users.find_one({"id": tx["to_user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1})
+                user = tx_users.get(tx["to_user_id"])
                 tx["to_user_name"] = f"{user['first_name']} {user['last_name']}" if user else "Unknown"
             else:
                 tx["to_user_name"] = "Treasury"
@@ -26325,7 +26613,8 @@ async def get_all_transactions(
     tx_type: Optional[str] = None,
     status: Optional[str] = None,
     date_from: Optional[str] = None,
-    date_to: Optional[str] = None
+    date_to: Optional[str] = None,
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get all transactions with filtering"""
     try:
@@ -26333,10 +26622,11 @@ async def get_all_transactions(
         
         # Search by transaction code or user
         if search:
+            search_regex = {"$regex": re.escape(search), "$options": "i"}
             query["$or"] = [
-                {"code": {"$regex": search, "$options": "i"}},
-                {"id": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}}
+                {"code": search_regex},
+                {"id": search_regex},
+                {"description": search_regex}
             ]
         
         # Filter by type
@@ -26366,18 +26656,21 @@ async def get_all_transactions(
         ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
         
         # Enrich with user names
+        tx_users = await loaders.users.load_many(
+            uid for tx in transactions for uid in (tx.get("from_user_id"), tx.get("to_user_id")) if uid != TREASURY_USER_ID
+        )
         for tx in transactions:
             if tx.get("from_user_id") == TREASURY_USER_ID:
                 tx["from_user_name"] = "Treasury"
             else:
-                user = await db.users.find_one({"id": tx.get("from_user_id")}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
+                user = tx_users.get(tx.get("from_user_id"))
                 tx["from_user_name"] = f"{user['first_name']} {user['last_name']}" if user else "Unknown"
                 tx["from_user_email"] = user.get("email") if user else None
             
             if tx.get("to_user_id") == TREASURY_USER_ID:
                 tx["to_user_name"] = "Treasury"
             else:
-                user = await db.users.find_one({"id": tx.get("to_user_id")}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1})
+                user = tx_users.get(tx.get("to_user_id"))
                 tx["to_user_name"] = f"{user['first_name']} {user['last_name']}" if user else "Unknown"
                 tx["to_user_email"] = user.get("email") if user else None
         
@@ -26604,6 +26897,21 @@ async def get_finance_stats(admin: str = Depends(get_current_admin)):
 # ADMIN DATABASE MANAGEMENT ENDPOINTS
 # ============================================================
 
+@api_router.get("/admin/event-loop")
+async def get_event_loop_report(
+    samples: int = 20,
+    admin: str = Depends(get_current_admin)
+):
+    """Event loop lag of this worker: heartbeat histogram, stalls and the stacks
+    captured while the loop was blocked, grouped by the server code that blocked it"""
+    return loop_monitor.report(samples=max(0, min(samples, 50)))
+
+@api_router.delete("/admin/event-loop")
+async def reset_event_loop_report(admin: str = Depends(get_current_admin)):
+    """Clear the lag histogram and captured stacks (e.g. after deploying a fix)"""
+    loop_monitor.reset()
+    return {"message": "Event loop report reset"}
+
 @api_router.get("/admin/database/status")
 async def get_database_status(admin: str = Depends(get_current_admin)):
     """Get database status and statistics"""
@@ -26661,83 +26969,50 @@ async def get_database_status(admin: str = Depends(get_current_admin)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @api_router.get("/admin/database/backup")
-async def create_database_backup(admin: str = Depends(get_current_admin)):
-    """Create a database backup as JSON"""
+async def create_database_backup(
+    format: str = Query("ndjson", description="ndjson or bson"),
+    compression: str = Query("gzip", description="gzip, zstd or none"),
+    incremental: bool = Query(False, description="Only documents changed since the parent backup"),
+    parent_id: Optional[str] = Query(None, description="Parent backup for an increment (default: latest)"),
+    admin: str = Depends(get_current_admin)
+):
+    """Stream a full or incremental database backup as compressed NDJSON or BSON"""
+    from fastapi.responses import StreamingResponse
+
     try:
-        backup_data = {
-            "metadata": {
-                "version": "1.0",
-                "database_name": db.name,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "created_by": admin
-            },
-            "collections": {}
-        }
-        
-        # Get all collection names (exclude system collections)
-        collection_names = await db.list_collection_names()
-        excluded_collections = ["admin_backups", "chunked_upload_sessions"]  # Don't backup backups
-        
-        for coll_name in collection_names:
-            if coll_name.startswith("system.") or coll_name in excluded_collections:
-                continue
-                
-            try:
-                # Fetch all documents from collection
-                cursor = db[coll_name].find({})
-                documents = await cursor.to_list(length=None)
-                
-                # Convert ObjectId and datetime to strings
-                serialized_docs = []
-                for doc in documents:
-                    serialized_doc = {}
-                    for key, value in doc.items():
-                        if key == "_id":
-                            continue  # Skip MongoDB _id
-                        elif isinstance(value, datetime):
-                            serialized_doc[key] = value.isoformat()
-                        elif hasattr(value, '__str__'):
-                            serialized_doc[key] = str(value) if not isinstance(value, (str, int, float, bool, list, dict, type(None))) else value
-                        else:
-                            serialized_doc[key] = value
-                    serialized_docs.append(serialized_doc)
-                
-                backup_data["collections"][coll_name] = {
-                    "document_count": len(serialized_docs),
-                    "documents": serialized_docs
-                }
-            except Exception as e:
-                logger.error(f"Error backing up collection {coll_name}: {e}")
-                backup_data["collections"][coll_name] = {
-                    "error": str(e),
-                    "documents": []
-                }
-        
-        # Calculate backup size
-        backup_json = json.dumps(backup_data, ensure_ascii=False, default=str)
-        backup_size = len(backup_json.encode('utf-8'))
-        
-        # Store backup metadata
+        chain = await incremental_from_last(db, parent_id) if incremental else {"metadata": {}}
+        exporter = BackupExporter(
+            db, fmt=format, compression=compression,
+            since=chain.get("since"),
+            metadata={"created_by": admin, **chain["metadata"]}
+        )
+    except BackupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    collections_count = len(await exporter.collection_names())
+
+    async def stream():
+        async for data in exporter.stream():
+            yield data
+        # Only completed streams are recorded, with the manifest of counts and checksums
         await db.admin_backups.insert_one({
             "id": str(uuid.uuid4()),
+            "type": "backup",
             "created_at": datetime.now(timezone.utc),
             "created_by": admin,
-            "size_bytes": backup_size,
-            "collections_count": len(backup_data["collections"]),
-            "document_count": sum(c.get("document_count", 0) for c in backup_data["collections"].values())
+            **exporter.summary()
         })
-        
-        # Return backup data
-        return {
-            "success": True,
-            "backup": backup_data,
-            "size_bytes": backup_size,
-            "collections_count": len(backup_data["collections"]),
-            "filename": f"zion_city_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    return StreamingResponse(
+        stream(),
+        media_type=exporter.media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{exporter.filename}"',
+            "X-Backup-Filename": exporter.filename,
+            "X-Backup-Collections": str(collections_count),
+            "X-Backup-Id": exporter.backup_id
         }
-    except Exception as e:
-        logger.error(f"Database backup error: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+    )
 
 @api_router.post("/admin/database/restore")
 async def restore_database_backup(
@@ -26745,92 +27020,14 @@ async def restore_database_backup(
     mode: str = Query("merge", description="Restore mode: 'replace' or 'merge'"),
     admin: str = Depends(get_current_admin)
 ):
-    """Restore database from backup"""
+    """Restore database from a version 1.0 JSON backup posted as the request body"""
     try:
-        # Validate backup structure
-        if "metadata" not in backup_data or "collections" not in backup_data:
+        try:
+            restorer = BackupRestorer(db, mode=mode)
+            restore_results = await restorer.run(legacy_records(backup_data))
+        except BackupError:
             raise HTTPException(status_code=400, detail="Неверный формат резервной копии")
-        
-        metadata = backup_data["metadata"]
-        collections = backup_data["collections"]
-        
-        restore_results = {
-            "mode": mode,
-            "backup_date": metadata.get("created_at"),
-            "backup_version": metadata.get("version"),
-            "collections_restored": [],
-            "errors": [],
-            "total_documents_restored": 0
-        }
-        
-        # Protected collections that should not be fully replaced
-        protected_collections = ["admin_backups", "chunked_upload_sessions"]
-        
-        for coll_name, coll_data in collections.items():
-            if coll_name in protected_collections:
-                continue
-                
-            try:
-                documents = coll_data.get("documents", [])
-                if not documents:
-                    continue
-                
-                # Convert ISO datetime strings back to datetime objects
-                for doc in documents:
-                    for key, value in doc.items():
-                        if isinstance(value, str) and len(value) > 18:
-                            try:
-                                # Try to parse ISO datetime
-                                if 'T' in value and ('+' in value or 'Z' in value or value.count(':') >= 2):
-                                    doc[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                            except ValueError:
-                                # Not a valid datetime string, keep original value
-                                pass
-                
-                if mode == "replace":
-                    # Delete existing documents and insert new ones
-                    await db[coll_name].delete_many({})
-                    if documents:
-                        await db[coll_name].insert_many(documents)
-                    restore_results["collections_restored"].append({
-                        "name": coll_name,
-                        "documents_restored": len(documents),
-                        "mode": "replaced"
-                    })
-                else:
-                    # Merge mode - upsert based on 'id' field
-                    inserted_count = 0
-                    updated_count = 0
-                    for doc in documents:
-                        if "id" in doc:
-                            result = await db[coll_name].update_one(
-                                {"id": doc["id"]},
-                                {"$set": doc},
-                                upsert=True
-                            )
-                            if result.upserted_id:
-                                inserted_count += 1
-                            elif result.modified_count:
-                                updated_count += 1
-                        else:
-                            await db[coll_name].insert_one(doc)
-                            inserted_count += 1
-                    
-                    restore_results["collections_restored"].append({
-                        "name": coll_name,
-                        "documents_inserted": inserted_count,
-                        "documents_updated": updated_count,
-                        "mode": "merged"
-                    })
-                
-                restore_results["total_documents_restored"] += len(documents)
-                
-            except Exception as e:
-                logger.error(f"Error restoring collection {coll_name}: {e}")
-                restore_results["errors"].append({
-                    "collection": coll_name,
-                    "error": str(e)
-                })
+        await after_restore()
         
         # Log the restore operation
         await db.admin_backups.insert_one({
@@ -26839,7 +27036,7 @@ async def restore_database_backup(
             "created_at": datetime.now(timezone.utc),
             "created_by": admin,
             "mode": mode,
-            "backup_date": metadata.get("created_at"),
+            "backup_date": restore_results["backup_date"],
             "collections_count": len(restore_results["collections_restored"]),
             "document_count": restore_results["total_documents_restored"]
         })
@@ -26869,8 +27066,28 @@ async def get_backup_history(
         for item in history:
             item.pop("_id", None)
         
+        # Backup chains (full base + increments) for the backups listed
+        base_ids = list({
+            item.get("base_id") or item["backup_id"]
+            for item in history
+            if item.get("type") in BACKUP_TYPES and item.get("backup_id")
+        })
+        chains = {base_id: {"base_id": base_id, "backups": []} for base_id in base_ids}
+        if base_ids:
+            members = await db.admin_backups.find(
+                {
+                    "type": {"$in": list(BACKUP_TYPES)},
+                    "$or": [{"backup_id": {"$in": base_ids}}, {"base_id": {"$in": base_ids}}]
+                },
+                {"_id": 0, "backup_id": 1, "kind": 1, "parent_id": 1, "base_id": 1, "created_at": 1,
+                 "size_bytes": 1, "document_count": 1, "filename": 1}
+            ).sort("created_at", 1).to_list(length=500)
+            for member in members:
+                chains[member.get("base_id") or member["backup_id"]]["backups"].append(member)
+        
         return {
             "history": history,
+            "chains": list(chains.values()),
             "total": len(history)
         }
     except Exception as e:
@@ -26964,8 +27181,7 @@ async def upload_chunk(
         chunk_path = os.path.join(chunks_dir, f"chunk_{chunk_index:06d}")
         content = await chunk.read()
 
-        with open(chunk_path, "wb") as f:
-            f.write(content)
+        await worker_pools.io(FILES, Path(chunk_path).write_bytes, content)
 
         # Track received chunk in MongoDB
         received_chunks = upload_info.get("received_chunks", [])
@@ -26991,16 +27207,124 @@ async def upload_chunk(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+# Restores running on this worker, so a cancel can stop them
+restore_tasks: Dict[str, asyncio.Task] = {}
+
+
+async def after_restore():
+    """Rebuild derived collections and drop every cached copy of restored data, on all workers: restores bypass the write hooks"""
+    await cache.clear()  # users, organizations, channels, media, media ACLs, typeahead circles
+    await social_graph.clear()
+    # Backups leave derived collections out (core/backup.py DERIVED_COLLECTIONS)
+    try:
+        await message_search.rebuild()
+        await feed_timelines.rebuild()
+        await conversations.rebuild()
+        await search_index.rebuild()
+        await people_typeahead.rebuild()
+        await media_acl.rebuild()
+    except Exception as e:
+        logger.error(f"Rebuilding derived collections after restore failed: {e}")
+    # Media ACL entries were recreated: drop copies cached while they were missing
+    await cache.clear()
+
+
+async def _check_restore_chain(restore_results: dict):
+    """Flag an increment that is not restored right after its parent"""
+    if restore_results.get("backup_kind") != INCREMENTAL:
+        return
+    last = await db.admin_backups.find_one(
+        {"type": {"$in": ["restore", "restore_chunked"]}, "backup_id": {"$exists": True}},
+        sort=[("created_at", -1)]
+    )
+    last_id = last.get("backup_id") if last else None
+    if last_id != restore_results.get("parent_id"):
+        restore_results["errors"].append({
+            "collection": None,
+            "error": f"increment applied out of order: parent {restore_results.get('parent_id')}, last restored {last_id}"
+        })
+
+
+async def run_chunked_restore(upload_info: dict, mode: str, admin: str):
+    """Restore an uploaded archive straight from its chunk files, recording progress on the session"""
+    upload_id = upload_info["upload_id"]
+    last_report = 0.0
+
+    async def report(progress: dict):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report < 1.0:
+            return
+        last_report = now
+        await db.chunked_upload_sessions.update_one(
+            {"upload_id": upload_id},
+            {"$set": {"progress": progress}}
+        )
+
+    restorer = BackupRestorer(db, mode=mode, on_progress=report)
+    heartbeat = asyncio.create_task(backup_jobs.restore_heartbeat(upload_id))
+    try:
+        chunk_paths = [
+            os.path.join(upload_info["chunks_dir"], f"chunk_{i:06d}")
+            for i in range(upload_info["total_chunks"])
+        ]
+        reader = ArchiveReader(read_files(chunk_paths), total_bytes=upload_info["total_size"])
+        try:
+            restore_results = await restorer.run(reader)
+        finally:
+            # Even a failed restore may have written part of the archive
+            await after_restore()
+        await _check_restore_chain(restore_results)
+
+        # Log the restore operation
+        await db.admin_backups.insert_one({
+            "id": str(uuid.uuid4()),
+            "type": "restore_chunked",
+            "created_at": datetime.now(timezone.utc),
+            "admin": admin,
+            "mode": restorer.mode,
+            "backup_id": restore_results["backup_id"],
+            "backup_kind": restore_results["backup_kind"],
+            "base_id": restore_results["base_id"],
+            "original_backup_date": restore_results["backup_date"],
+            "collections_count": len(restore_results["collections_restored"]),
+            "document_count": restore_results["total_documents_restored"],
+            "file_size": upload_info["total_size"]
+        })
+
+        await db.chunked_upload_sessions.update_one(
+            {"upload_id": upload_id},
+            {"$set": {"status": "completed", "progress": restorer.progress(), "results": restore_results}}
+        )
+        logger.info(f"Chunked restore completed for upload {upload_id}: {restore_results['total_documents_restored']} documents restored")
+    except Exception as e:
+        logger.error(f"Chunked restore error for upload {upload_id}: {e}")
+        await db.chunked_upload_sessions.update_one(
+            {"upload_id": upload_id},
+            {"$set": {"status": "failed", "progress": restorer.progress(), "error": str(e), "results": restorer.results()}}
+        )
+    finally:
+        heartbeat.cancel()
+        restore_tasks.pop(upload_id, None)
+        try:
+            await worker_pools.io(FILES, shutil.rmtree, upload_info["chunks_dir"])
+        except OSError as e:
+            logger.warning(f"Failed to cleanup chunks directory: {e}")
+
+
 @api_router.post("/admin/database/restore/chunked/complete")
 async def complete_chunked_restore(
     data: ChunkUploadComplete,
     admin: str = Depends(get_current_admin)
 ):
-    """Complete the chunked upload and perform database restore"""
+    """Complete the chunked upload and start the restore; poll the status endpoint for progress"""
     try:
         upload_id = data.upload_id
         mode = data.mode
 
+        if mode not in ("merge", "replace"):
+            raise HTTPException(status_code=400, detail="Неверный режим восстановления")
+
         # Verify upload exists in MongoDB
         upload_info = await db.chunked_upload_sessions.find_one({"upload_id": upload_id})
         if not upload_info:
@@ -27019,142 +27343,30 @@ async def complete_chunked_restore(
                 detail=f"Отсутствуют чанки: {list(missing)[:10]}... (всего {len(missing)})"
             )
 
-        chunks_dir = upload_info["chunks_dir"]
-
-        # Combine chunks into single file
-        combined_path = os.path.join(chunks_dir, "combined.json")
-        with open(combined_path, "wb") as outfile:
-            for i in range(upload_info["total_chunks"]):
-                chunk_path = os.path.join(chunks_dir, f"chunk_{i:06d}")
-                with open(chunk_path, "rb") as chunk_file:
-                    outfile.write(chunk_file.read())
-        
-        logger.info(f"Combined {upload_info['total_chunks']} chunks for upload {upload_id}")
-        
-        # Parse the combined JSON
-        with open(combined_path, "r", encoding="utf-8") as f:
-            backup_data = json.load(f)
-        
-        # Validate backup structure
-        if "metadata" not in backup_data or "collections" not in backup_data:
-            raise HTTPException(status_code=400, detail="Неверный формат резервной копии")
-        
-        metadata = backup_data["metadata"]
-        collections = backup_data["collections"]
-        
-        restore_results = {
-            "mode": mode,
-            "backup_date": metadata.get("created_at"),
-            "backup_version": metadata.get("version"),
-            "collections_restored": [],
-            "errors": [],
-            "total_documents_restored": 0
-        }
-        
-        # Protected collections that should not be fully replaced
-        protected_collections = ["admin_backups", "chunked_upload_sessions"]
-        
-        for coll_name, coll_data in collections.items():
-            if coll_name in protected_collections:
-                continue
-                
-            try:
-                documents = coll_data.get("documents", [])
-                if not documents:
-                    continue
-                
-                # Convert ISO datetime strings back to datetime objects
-                for doc in documents:
-                    for key, value in doc.items():
-                        if isinstance(value, str) and len(value) > 18:
-                            try:
-                                # Try to parse ISO datetime
-                                if 'T' in value and ('+' in value or 'Z' in value or value.count(':') >= 2):
-                                    doc[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                            except ValueError:
-                                # Not a valid datetime string, keep original value
-                                pass
-                
-                if mode == "replace":
-                    # Delete existing documents and insert new ones
-                    await db[coll_name].delete_many({})
-                    if documents:
-                        await db[coll_name].insert_many(documents)
-                    restore_results["collections_restored"].append({
-                        "name": coll_name,
-                        "documents_restored": len(documents),
-                        "mode": "replaced"
-                    })
-                else:
-                    # Merge mode - upsert based on 'id' field
-                    inserted_count = 0
-                    updated_count = 0
-                    for doc in documents:
-                        if "id" in doc:
-                            result = await db[coll_name].update_one(
-                                {"id": doc["id"]},
-                                {"$set": doc},
-                                upsert=True
-                            )
-                            if result.upserted_id:
-                                inserted_count += 1
-                            elif result.modified_count:
-                                updated_count += 1
-                        else:
-                            await db[coll_name].insert_one(doc)
-                            inserted_count += 1
-                    
-                    restore_results["collections_restored"].append({
-                        "name": coll_name,
-                        "documents_inserted": inserted_count,
-                        "documents_updated": updated_count,
-                        "mode": "merged"
-                    })
-                
-                restore_results["total_documents_restored"] += len(documents)
-                
-            except Exception as e:
-                logger.error(f"Error restoring collection {coll_name}: {e}")
-                restore_results["errors"].append({
-                    "collection": coll_name,
-                    "error": str(e)
-                })
-        
-        # Log the restore operation
-        await db.admin_backups.insert_one({
-            "id": str(uuid.uuid4()),
-            "type": "restore_chunked",
-            "created_at": datetime.now(timezone.utc),
-            "admin": admin,
-            "mode": mode,
-            "original_backup_date": metadata.get("created_at"),
-            "collections_count": len(restore_results["collections_restored"]),
-            "document_count": restore_results["total_documents_restored"],
-            "file_size": upload_info["total_size"]
-        })
-        
-        # Cleanup temp files
-        import shutil
-        try:
-            shutil.rmtree(upload_info["chunks_dir"])
-        except OSError as e:
-            logger.warning(f"Failed to cleanup chunks directory: {e}")
+        # Claim the session so a repeated request does not start a second restore
+        claimed = await db.chunked_upload_sessions.update_one(
+            {"upload_id": upload_id, "status": "uploading"},
+            {"$set": {
+                "status": RESTORING,
+                "mode": mode,
+                "restore_started_at": datetime.now(timezone.utc),
+                "restore_heartbeat_at": datetime.now(timezone.utc)
+            }}
+        )
+        if not claimed.modified_count:
+            raise HTTPException(status_code=409, detail="Восстановление уже запущено")
 
-        # Remove from MongoDB tracking
-        await db.chunked_upload_sessions.delete_one({"upload_id": upload_id})
+        restore_tasks[upload_id] = asyncio.create_task(run_chunked_restore(upload_info, mode, admin))
+        logger.info(f"Chunked restore started for upload {upload_id} ({upload_info['total_chunks']} chunks)")
 
-        logger.info(f"Chunked restore completed for upload {upload_id}: {restore_results['total_documents_restored']} documents restored")
-        
         return {
             "success": True,
-            "message": "База данных восстановлена" if not restore_results["errors"] else "База данных частично восстановлена",
-            "results": restore_results
+            "upload_id": upload_id,
+            "status": "restoring",
+            "message": "Восстановление запущено"
         }
     except HTTPException:
         raise
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parse error during chunked restore: {e}")
-        raise HTTPException(status_code=400, detail=f"Ошибка парсинга JSON: {str(e)}")
     except Exception as e:
         logger.error(f"Chunked restore complete error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -27172,10 +27384,14 @@ async def cancel_chunked_restore(
         if not upload_info:
             raise HTTPException(status_code=404, detail="Загрузка не найдена")
 
+        # Stop a restore still running on this worker
+        task = restore_tasks.pop(upload_id, None)
+        if task is not None:
+            task.cancel()
+
         # Cleanup temp files
-        import shutil
         try:
-            shutil.rmtree(upload_info["chunks_dir"])
+            await worker_pools.io(FILES, shutil.rmtree, upload_info["chunks_dir"])
         except OSError as e:
             logger.warning(f"Failed to cleanup chunks directory on cancel: {e}")
 
@@ -27212,6 +27428,10 @@ async def get_chunked_restore_status(
             "total_chunks": total_chunks,
             "received_chunks": len(received_chunks),
             "progress": round(len(received_chunks) / total_chunks * 100, 1) if total_chunks > 0 else 0,
+            "status": upload_info.get("status", "uploading"),
+            "restore_progress": upload_info.get("progress"),
+            "results": upload_info.get("results"),
+            "error": upload_info.get("error"),
             "created_at": upload_info["created_at"].isoformat() if hasattr(upload_info["created_at"], 'isoformat') else upload_info["created_at"]
         }
     except HTTPException:
@@ -27224,129 +27444,70 @@ async def get_chunked_restore_status(
 
 
 # ===== CHUNKED DATABASE BACKUP/DOWNLOAD ENDPOINTS =====
-# These endpoints handle large database backups by downloading in chunks
-
-# Store for tracking chunked backups (in-memory)
-chunked_backups = {}
+# These endpoints handle large database backups by downloading in chunks.
+# Backups are built as background jobs; job state and the per-chunk SHA-256
+# manifest live in MongoDB, so every worker can report status and serve chunks.
 
 class ChunkBackupInit(BaseModel):
     chunk_size_mb: int = 5  # Chunk size in MB (default 5MB)
+    format: str = "ndjson"
+    compression: str = "gzip"
+    incremental: bool = False  # Only documents changed since the parent backup
+    parent_id: Optional[str] = None  # Parent backup for an increment (default: latest)
+
+def _backup_job_response(job: dict) -> dict:
+    return {
+        "backup_id": job["backup_id"],
+        "kind": job.get("kind"),
+        "status": job["status"],
+        "progress": job.get("progress"),
+        "error": job.get("error"),
+        "total_size": job.get("total_size", 0),
+        "total_chunks": job.get("total_chunks", 0),
+        "chunk_size": job["chunk_size"],
+        "chunks": job.get("chunks", []),
+        "sha256": job.get("sha256"),
+        "collections_count": job.get("collections_count"),
+        "document_count": job.get("document_count"),
+        "filename": job["filename"],
+        "created_at": job["created_at"].isoformat() if hasattr(job["created_at"], 'isoformat') else job["created_at"]
+    }
+
+async def _get_backup_job(backup_id: str, admin: str) -> dict:
+    job = await backup_jobs.get(backup_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Резервная копия не найдена")
+    if job["admin"] != admin:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return job
 
 @api_router.post("/admin/database/backup/chunked/init")
 async def init_chunked_backup(
     data: ChunkBackupInit = ChunkBackupInit(),
     admin: str = Depends(get_current_admin)
 ):
-    """Initialize a chunked database backup - creates the backup and splits into chunks"""
+    """Start a chunked database backup job; poll the status endpoint until it is ready"""
+    if not 1 <= data.chunk_size_mb <= 100:
+        raise HTTPException(status_code=400, detail="Неверный размер чанка")
     try:
-        backup_id = str(uuid.uuid4())
-        chunk_size = data.chunk_size_mb * 1024 * 1024  # Convert to bytes
-        
-        logger.info(f"Starting chunked backup {backup_id} with chunk size {data.chunk_size_mb}MB")
-        
-        # Create the backup data
-        backup_data = {
-            "metadata": {
-                "version": "1.0",
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "database_name": db.name,
-                "backup_type": "chunked"
-            },
-            "collections": {}
-        }
-        
-        excluded_collections = ["admin_backups", "chunked_upload_sessions"]
-        collection_names = await db.list_collection_names()
-        
-        for coll_name in collection_names:
-            if coll_name in excluded_collections:
-                continue
-            try:
-                cursor = db[coll_name].find({})
-                documents = await cursor.to_list(length=None)
-                
-                # Convert ObjectId and datetime to strings
-                for doc in documents:
-                    doc.pop("_id", None)
-                    for key, value in doc.items():
-                        if hasattr(value, 'isoformat'):
-                            doc[key] = value.isoformat()
-                
-                backup_data["collections"][coll_name] = {
-                    "document_count": len(documents),
-                    "documents": documents
-                }
-            except Exception as e:
-                logger.error(f"Error backing up collection {coll_name}: {e}")
-                backup_data["collections"][coll_name] = {
-                    "document_count": 0,
-                    "documents": [],
-                    "error": str(e)
-                }
-        
-        # Serialize to JSON
-        backup_json = json.dumps(backup_data, ensure_ascii=False, default=str)
-        backup_bytes = backup_json.encode('utf-8')
-        total_size = len(backup_bytes)
-        
-        # Calculate number of chunks
-        total_chunks = (total_size + chunk_size - 1) // chunk_size
-        
-        # Create temp directory and save chunks
-        chunks_dir = f"/tmp/db_backup_{backup_id}"
-        os.makedirs(chunks_dir, exist_ok=True)
-        
-        # Split into chunks and save to files
-        for i in range(total_chunks):
-            start = i * chunk_size
-            end = min(start + chunk_size, total_size)
-            chunk_data = backup_bytes[start:end]
-            
-            chunk_path = os.path.join(chunks_dir, f"chunk_{i:06d}")
-            with open(chunk_path, "wb") as f:
-                f.write(chunk_data)
-        
-        # Store backup metadata
-        chunked_backups[backup_id] = {
-            "admin": admin,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "total_size": total_size,
-            "total_chunks": total_chunks,
-            "chunk_size": chunk_size,
-            "chunks_dir": chunks_dir,
-            "collections_count": len(backup_data["collections"]),
-            "document_count": sum(c.get("document_count", 0) for c in backup_data["collections"].values()),
-            "filename": f"zion_city_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        }
-        
-        # Log the backup operation
-        await db.admin_backups.insert_one({
-            "id": str(uuid.uuid4()),
-            "type": "backup_chunked",
-            "created_at": datetime.now(timezone.utc),
-            "admin": admin,
-            "size_bytes": total_size,
-            "collections_count": len(backup_data["collections"]),
-            "document_count": sum(c.get("document_count", 0) for c in backup_data["collections"].values())
-        })
-        
-        logger.info(f"Chunked backup {backup_id} created: {total_size} bytes, {total_chunks} chunks")
-        
-        return {
-            "success": True,
-            "backup_id": backup_id,
-            "total_size": total_size,
-            "total_chunks": total_chunks,
-            "chunk_size": chunk_size,
-            "collections_count": len(backup_data["collections"]),
-            "document_count": sum(c.get("document_count", 0) for c in backup_data["collections"].values()),
-            "filename": chunked_backups[backup_id]["filename"],
-            "message": "Резервная копия создана и готова к скачиванию"
-        }
+        job = await backup_jobs.create(
+            admin, data.chunk_size_mb * 1024 * 1024, data.format, data.compression,
+            incremental=data.incremental, parent_id=data.parent_id
+        )
+    except BackupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Chunked backup init error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    logger.info(f"Started chunked backup {job['backup_id']} with chunk size {data.chunk_size_mb}MB")
+
+    return {
+        "success": True,
+        **_backup_job_response(job),
+        "message": "Резервная копия создается"
+    }
+
 
 @api_router.get("/admin/database/backup/chunked/{backup_id}/chunk/{chunk_index}")
 async def download_backup_chunk(
@@ -27354,40 +27515,32 @@ async def download_backup_chunk(
     chunk_index: int,
     admin: str = Depends(get_current_admin)
 ):
-    """Download a single chunk of the backup"""
+    """Download a single chunk of the backup (any worker, any order, repeatable)"""
     try:
-        if backup_id not in chunked_backups:
-            raise HTTPException(status_code=404, detail="Резервная копия не найдена")
+        job = await _get_backup_job(backup_id, admin)
         
-        backup_info = chunked_backups[backup_id]
-        
-        # Verify admin matches
-        if backup_info["admin"] != admin:
-            raise HTTPException(status_code=403, detail="Доступ запрещен")
+        if job["status"] != READY:
+            raise HTTPException(status_code=409, detail="Резервная копия еще не готова")
         
         # Validate chunk index
-        if chunk_index < 0 or chunk_index >= backup_info["total_chunks"]:
+        if chunk_index < 0 or chunk_index >= job["total_chunks"]:
             raise HTTPException(status_code=400, detail="Неверный индекс чанка")
         
-        # Read chunk from file
-        chunk_path = os.path.join(backup_info["chunks_dir"], f"chunk_{chunk_index:06d}")
-        
+        chunk_path = backup_jobs.chunk_path(job, chunk_index)
         if not os.path.exists(chunk_path):
             raise HTTPException(status_code=404, detail="Чанк не найден")
         
-        with open(chunk_path, "rb") as f:
-            chunk_data = f.read()
-        
-        # Return chunk as binary response
-        from fastapi.responses import Response
-        return Response(
-            content=chunk_data,
+        # Streamed from disk in small blocks instead of read into memory
+        from fastapi.responses import FileResponse
+        return FileResponse(
+            chunk_path,
             media_type="application/octet-stream",
+            filename=f"chunk_{chunk_index:06d}",
             headers={
-                "Content-Disposition": f'attachment; filename="chunk_{chunk_index:06d}"',
                 "X-Chunk-Index": str(chunk_index),
-                "X-Total-Chunks": str(backup_info["total_chunks"]),
-                "X-Chunk-Size": str(len(chunk_data))
+                "X-Total-Chunks": str(job["total_chunks"]),
+                "X-Chunk-Size": str(job["chunks"][chunk_index]["size"]),
+                "X-Chunk-Sha256": job["chunks"][chunk_index]["sha256"]
             }
         )
     except HTTPException:
@@ -27402,23 +27555,10 @@ async def get_chunked_backup_status(
     backup_id: str,
     admin: str = Depends(get_current_admin)
 ):
-    """Get status of a chunked backup"""
+    """Get status, progress and chunk manifest of a chunked backup"""
     try:
-        if backup_id not in chunked_backups:
-            raise HTTPException(status_code=404, detail="Резервная копия не найдена")
-        
-        backup_info = chunked_backups[backup_id]
-        
-        return {
-            "backup_id": backup_id,
-            "total_size": backup_info["total_size"],
-            "total_chunks": backup_info["total_chunks"],
-            "chunk_size": backup_info["chunk_size"],
-            "collections_count": backup_info["collections_count"],
-            "document_count": backup_info["document_count"],
-            "filename": backup_info["filename"],
-            "created_at": backup_info["created_at"]
-        }
+        job = await _get_backup_job(backup_id, admin)
+        return _backup_job_response(job)
     except HTTPException:
         raise
     except Exception as e:
@@ -27433,20 +27573,8 @@ async def cleanup_chunked_backup(
 ):
     """Cleanup a chunked backup after download is complete"""
     try:
-        if backup_id not in chunked_backups:
-            raise HTTPException(status_code=404, detail="Резервная копия не найдена")
-        
-        backup_info = chunked_backups[backup_id]
-        
-        # Cleanup temp files
-        import shutil
-        try:
-            shutil.rmtree(backup_info["chunks_dir"])
-        except OSError as e:
-            logger.warning(f"Failed to cleanup backup chunks directory: {e}")
-
-        # Remove from tracking
-        del chunked_backups[backup_id]
+        await _get_backup_job(backup_id, admin)
+        await backup_jobs.delete(backup_id)
 
         logger.info(f"Chunked backup {backup_id} cleaned up")
         
@@ -27464,16 +27592,17 @@ async def list_chunked_backups(
 ):
     """List all available chunked backups for the admin"""
     try:
-        admin_backups_list = []
-        for backup_id, info in chunked_backups.items():
-            if info["admin"] == admin:
-                admin_backups_list.append({
-                    "backup_id": backup_id,
-                    "total_size": info["total_size"],
-                    "total_chunks": info["total_chunks"],
-                    "filename": info["filename"],
-                    "created_at": info["created_at"]
-                })
+        admin_backups_list = [
+            {
+                "backup_id": job["backup_id"],
+                "status": job["status"],
+                "total_size": job.get("total_size", 0),
+                "total_chunks": job.get("total_chunks", 0),
+                "filename": job["filename"],
+                "created_at": job["created_at"]
+            }
+            for job in await backup_jobs.list(admin)
+        ]
         
         return {
             "backups": admin_backups_list,
@@ -27515,12 +27644,24 @@ else:
     cors_origins = []
     logger.warning("CORS_ORIGINS not configured. CORS will reject cross-origin requests.")
 
+# Rate limiting per route group (see RATE_LIMIT_RULES). Added before CORS so
+# that CORS stays outermost and 429 responses still carry CORS headers.
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=rate_limiter,
+    rules=RATE_LIMIT_RULES,
+    limits=RATE_LIMITS,
+    key_func=rate_limit_key,
+    detail="Слишком много запросов. Пожалуйста, подождите минуту."
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=cors_origins if cors_origins else [],
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type", "Accept", "Origin", "X-Requested-With"],
+    expose_headers=["X-Backup-Filename", "X-Backup-Collections", "X-Backup-Id", "X-Chunk-Sha256"],
     max_age=86400,  # Cache preflight requests for 24 hours
 )
 
@@ -0,0 +1,94 @@
+"""
+Shared fixtures for the backend unit tests.
+
+`db` is an in-memory database with the Motor calls the core modules use
+(awaitable collection methods, async cursors), backed by mongomock.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self._items = None
+
+    def __aiter__(self):
+        self._items = iter(self.cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def skip(self, n):
+        self.cursor = self.cursor.skip(n)
+        return self
+
+    def limit(self, n):
+        self.cursor = self.cursor.limit(n)
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.cursor)
+
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    def with_options(self, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self.sync = database
+        self.name = database.name
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.sync[name])
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return AsyncCollection(self.sync[name])
+
+    async def list_collection_names(self):
+        return self.sync.list_collection_names()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    mongomock = pytest.importorskip("mongomock")
+    return AsyncDatabase(mongomock.MongoClient().zion_city_test)
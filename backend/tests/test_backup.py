@@ -0,0 +1,254 @@
+"""
+Streaming export and restore of core/backup.py: archive layout, checksums,
+round-trips, merge restores and incremental chains.
+"""
+
+import gzip
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core.backup import (
+    ArchiveReader,
+    BackupError,
+    BackupExporter,
+    BackupRestorer,
+    _json_options,
+    decode_json_record,
+    incremental_from_last,
+    read_files,
+)
+
+pytestmark = pytest.mark.anyio
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+async def seed(db):
+    await db.users.insert_many([
+        {"id": f"u{i}", "email": f"user{i}@example.com", "created_at": T0 + timedelta(days=i)} for i in range(5)
+    ])
+    await db.posts.insert_many([
+        {"id": f"p{i}", "user_id": f"u{i % 5}", "content": f"пост {i}", "created_at": T0 + timedelta(hours=i)}
+        for i in range(30)
+    ])
+    await db.admin_backups.insert_one({"id": "b0", "type": "backup"})
+
+
+async def archive(exporter):
+    return b"".join([data async for data in exporter.stream()])
+
+
+def documents(db, name):
+    return sorted(db.sync[name].find({}, {"_id": 0}), key=lambda d: d["id"])
+
+
+async def export(exporter, directory):
+    directory.mkdir(exist_ok=True)
+    path = directory / exporter.filename
+    await exporter.to_file(str(path))
+    return [str(path)]
+
+
+async def restore(db, paths, **kwargs):
+    return await BackupRestorer(db, batch_size=7, **kwargs).run(ArchiveReader(read_files(paths, block_size=100)))
+
+
+@pytest.fixture
+def target(db):
+    """A second, empty database to restore into."""
+    import mongomock
+
+    return type(db)(mongomock.MongoClient().zion_city_restore)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+async def test_export_layout_and_checksums(db, compression):
+    await seed(db)
+    exporter = BackupExporter(db, compression=compression, batch_size=4)
+    data = await archive(exporter)
+
+    assert exporter.size_bytes == len(data)
+    assert exporter.sha256 == hashlib.sha256(data).hexdigest()
+    if compression == "gzip":
+        data = gzip.decompress(data)
+    lines = data.splitlines(keepends=True)
+    records = [decode_json_record(line, _json_options()) for line in lines]
+
+    header = records[0]["$backup"]
+    assert header["kind"] == "full"
+    assert header["collections"] == ["posts", "users"]
+    assert records[-1]["$manifest"]["document_count"] == 35
+
+    # Every collection is framed by $collection / $end, and $end hashes the record lines between them
+    for name, count in (("posts", 30), ("users", 5)):
+        start = records.index({"$collection": name})
+        end = next(i for i, r in enumerate(records) if r.get("$end") == name)
+        body = lines[start + 1:end]
+        assert len(body) == count
+        assert records[end]["count"] == count
+        assert records[end]["sha256"] == hashlib.sha256(b"".join(body)).hexdigest()
+
+    # Extended JSON keeps dates as dates
+    posts = [r for r in records if str(r.get("id", "")).startswith("p")]
+    assert posts[0]["created_at"].replace(tzinfo=timezone.utc) == T0
+
+
+async def test_export_skips_excluded_and_unselected_collections(db):
+    await seed(db)
+    exporter = BackupExporter(db, collections=["users", "admin_backups"], compression="none")
+    await archive(exporter)
+
+    assert set(exporter.manifest["collections"]) == {"users"}
+    assert exporter.summary()["document_count"] == 5
+    assert exporter.filename.endswith(".ndjson")
+
+
+async def test_derived_collections_are_left_out(db, target, tmp_path):
+    await seed(db)
+    await db.search_index.insert_one({"kind": "users", "entity_id": "u0", "terms": ["user0@example.com"]})
+    await db.news_timelines.insert_one({"owner_id": "u0", "post_id": "p0"})
+    exporter = BackupExporter(db, compression="none")
+    await archive(exporter)
+
+    assert set(exporter.manifest["collections"]) == {"posts", "users"}
+
+    # Older archives that still carry them are restored without them
+    paths = await export(BackupExporter(db, exclude=("admin_backups",)), tmp_path / "old")
+    results = await restore(target, paths, mode="replace")
+    assert results["errors"] == []
+    assert set(target.sync.list_collection_names()) == {"posts", "users"}
+
+
+def test_unknown_options_fail_before_streaming(db):
+    with pytest.raises(BackupError):
+        BackupExporter(db, fmt="xml")
+    with pytest.raises(BackupError):
+        BackupExporter(db, compression="rar")
+
+
+# ---- restore ----
+
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+async def test_full_round_trip(db, target, tmp_path, compression):
+    await seed(db)
+    exporter = BackupExporter(db, compression=compression, batch_size=4)
+    paths = await export(exporter, tmp_path / "full")
+
+    await target.users.insert_one({"id": "stale", "email": "stale@example.com"})
+    results = await restore(target, paths, mode="replace")
+
+    assert results["errors"] == []
+    assert results["total_documents_restored"] == 35
+    assert results["backup_id"] == exporter.backup_id
+    assert documents(target, "users") == documents(db, "users")
+    assert documents(target, "posts") == documents(db, "posts")
+    assert "admin_backups" not in target.sync.list_collection_names()
+
+
+async def test_corrupted_collection_is_reported(db, target, tmp_path):
+    await seed(db)
+    exporter = BackupExporter(db, compression="none")
+    records = [record async for record in exporter.records()]
+    # Drop one document from the middle of the posts section
+    archive = b"".join(records).split(b"\n")
+    tampered = [line for line in archive if b'"id":"p3"' not in line]
+    (tmp_path / "archive").write_bytes(b"\n".join(tampered))
+
+    results = await restore(target, [str(tmp_path / "archive")], mode="replace")
+
+    assert [e["collection"] for e in results["errors"]] == ["posts"]
+    assert "integrity check failed" in results["errors"][0]["error"]
+
+
+async def test_merge_updates_by_id_and_keeps_other_documents(db, target, tmp_path):
+    await seed(db)
+    paths = await export(BackupExporter(db, collections=["users"]), tmp_path / "users")
+
+    await target.users.insert_many([
+        {"id": "u0", "email": "old@example.com", "role": "admin"},
+        {"id": "local", "email": "local@example.com"},
+    ])
+    results = await restore(target, paths, mode="merge")
+    users = {u["id"]: u for u in documents(target, "users")}
+    stats = results["collections_restored"][0]
+
+    assert results["errors"] == []
+    assert stats["mode"] == "merged"
+    assert stats["documents_inserted"] == 4
+    assert stats["documents_updated"] == 1
+    assert stats["write_errors"] == 0
+    # Fields from the archive win, fields it does not carry are kept
+    assert users["u0"]["email"] == "user0@example.com"
+    assert users["u0"]["role"] == "admin"
+    assert "local" in users
+    assert len(users) == 6
+
+    # Restoring the same archive again changes nothing
+    again = await restore(target, paths, mode="merge")
+    assert again["collections_restored"][0]["documents_inserted"] == 0
+    assert len(documents(target, "users")) == 6
+
+
+async def test_merge_upserts_documents_without_id_on_their_object_id(db, target, tmp_path):
+    await db.maintenance_runs.insert_many([
+        {"_id": "search_index", "state": "done"},
+        {"_id": "media_acl_backfill", "state": "done"},
+    ])
+    paths = await export(BackupExporter(db, collections=["maintenance_runs"]), tmp_path / "runs")
+
+    await target.maintenance_runs.insert_one({"_id": "search_index", "state": "running", "owner": "w1"})
+    results = await restore(target, paths, mode="merge")
+    runs = {r["_id"]: r for r in target.sync.maintenance_runs.find()}
+
+    assert results["errors"] == []
+    assert results["collections_restored"][0]["write_errors"] == 0
+    assert runs["search_index"] == {"_id": "search_index", "state": "done", "owner": "w1"}
+    assert runs["media_acl_backfill"]["state"] == "done"
+
+    await restore(target, paths, mode="merge")
+    assert target.sync.maintenance_runs.count_documents({}) == 2
+
+
+# ---- increments ----
+
+async def test_incremental_chain(db, target, tmp_path):
+    await seed(db)
+    base = BackupExporter(db, compression="gzip")
+    base_paths = await export(base, tmp_path / "base")
+    await db.admin_backups.insert_one({**base.summary(), "type": "backup_chunked"})
+
+    later = base.created_at + timedelta(seconds=1)
+    await db.posts.insert_many([
+        {"id": f"n{i}", "user_id": "u0", "content": f"новый {i}", "created_at": later} for i in range(3)
+    ])
+    await db.posts.update_one({"id": "p0"}, {"$set": {"content": "изменён", "updated_at": later}})
+    await db.users.update_one({"id": "u1"}, {"$set": {"email": "changed@example.com"}})
+
+    options = await incremental_from_last(db)
+    assert options["metadata"] == {"base_id": base.backup_id, "parent_id": base.backup_id}
+    assert abs(options["since"] - base.created_at) < timedelta(milliseconds=1)
+
+    increment = BackupExporter(db, incremental_collections={"posts"}, **options)
+    increment_paths = await export(increment, tmp_path / "increment")
+    collections = increment.manifest["collections"]
+
+    # posts holds only what changed; users has no reliable watermark and is copied in full
+    assert collections["posts"] == {**collections["posts"], "count": 4, "incremental": True}
+    assert collections["users"] == {**collections["users"], "count": 5, "incremental": False}
+    assert increment.summary()["kind"] == "incremental"
+    assert increment.summary()["base_id"] == base.backup_id
+
+    await restore(target, base_paths, mode="replace")
+    await target.posts.insert_one({"id": "restored-only", "created_at": T0})
+    results = await restore(target, increment_paths, mode="replace")
+
+    # An increment is always merged, whatever mode was asked for
+    assert results["mode"] == "merge"
+    assert results["backup_kind"] == "incremental"
+    assert results["errors"] == []
+    assert documents(target, "users") == documents(db, "users")
+    restored = documents(target, "posts")
+    assert [p for p in restored if p["id"] != "restored-only"] == documents(db, "posts")
+    assert any(p["id"] == "restored-only" for p in restored)
@@ -0,0 +1,83 @@
+"""
+Background chunked backups of core/backup_jobs.py: lifecycle and cleanup of
+jobs and restores whose worker stopped.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core.backup_jobs import FAILED, READY, RUNNING, BackupJobs
+from core.workers import WorkerPools
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def jobs(db, tmp_path):
+    pools = WorkerPools(processes=1, threads=2)
+    jobs = BackupJobs(db, pools, directory=str(tmp_path / "backups"), heartbeat_interval=0.01, stale_after=60)
+    yield jobs
+    await jobs.stop()
+    await pools.stop()
+
+
+async def wait_for(jobs, backup_id):
+    for _ in range(200):
+        job = await jobs.get(backup_id)
+        if job["status"] != RUNNING:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("backup did not finish")
+
+
+async def test_job_writes_chunks_and_records_the_backup(db, jobs):
+    await db.users.insert_many([{"id": f"u{i}", "created_at": datetime.now(timezone.utc)} for i in range(20)])
+
+    job = await jobs.create("admin", chunk_size=256, compression="none")
+    job = await wait_for(jobs, job["backup_id"])
+
+    assert job["status"] == READY
+    assert job["total_chunks"] == len(job["chunks"]) > 1
+    assert job["document_count"] == 20
+    assert await db.admin_backups.count_documents({"backup_id": job["backup_id"]}) == 1
+
+
+async def test_job_failed_by_cleanup_is_not_marked_ready(db, jobs, monkeypatch):
+    release = asyncio.Event()
+    original = jobs._run
+
+    async def slow_run(job, exporter):
+        await release.wait()
+        await original(job, exporter)
+
+    monkeypatch.setattr(jobs, "_run", slow_run)
+    job = await jobs.create("admin", chunk_size=1024)
+    await db.backup_jobs.update_one(
+        {"backup_id": job["backup_id"]}, {"$set": {"updated_at": datetime.now(timezone.utc) - timedelta(hours=1)}}
+    )
+    await jobs.cleanup()
+    release.set()
+    await asyncio.gather(*jobs._tasks.values())
+
+    job = await jobs.get(job["backup_id"])
+    assert job["status"] == FAILED and job["error"] == "worker stopped"
+    assert await db.admin_backups.count_documents({}) == 0
+
+
+async def test_restores_without_a_recent_heartbeat_are_failed(db, jobs):
+    now = datetime.now(timezone.utc)
+    await db.chunked_upload_sessions.insert_many([
+        {"upload_id": "live", "status": "restoring", "restore_heartbeat_at": now, "created_at": now},
+        {"upload_id": "dead", "status": "restoring", "restore_heartbeat_at": now - timedelta(hours=1), "created_at": now},
+        {"upload_id": "legacy", "status": "restoring", "created_at": now},
+    ])
+
+    heartbeat = asyncio.create_task(jobs.restore_heartbeat("live"))
+    await asyncio.sleep(0.05)
+    await jobs.cleanup()
+    heartbeat.cancel()
+
+    status = {s["upload_id"]: s["status"] for s in db.sync.chunked_upload_sessions.find()}
+    assert status == {"live": "restoring", "dead": FAILED, "legacy": FAILED}
@@ -0,0 +1,134 @@
+"""
+Two-tier cache of core/cache.py: local LRU behaviour and the cross-worker
+invalidation listener.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from core.cache import Cache, LRUCache
+
+pytestmark = pytest.mark.anyio
+
+# The reconnect test speeds up the listener's back-off; the fakes keep real sleeps
+sleep = asyncio.sleep
+
+
+class FakePubSub:
+    """Replays a script of get_message results; an exception instance is raised."""
+
+    def __init__(self, script):
+        self.script = script
+        self.closed = False
+
+    async def subscribe(self, *channels):
+        pass
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        await sleep(0)
+        if not self.script:
+            await sleep(3600)
+        item = self.script.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeRedis:
+    def __init__(self, *scripts):
+        self.pubsubs = [FakePubSub(list(s)) for s in scripts]
+        self.published = []
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return self.pubsubs.pop(0)
+
+    async def publish(self, channel, data):
+        self.published.append((channel, json.loads(data)))
+
+
+def invalidation(**message):
+    return {"type": "message", "data": json.dumps({"node": "other", **message})}
+
+
+async def run_listener(cache, seconds=0.05):
+    await cache.start()
+    await sleep(seconds)
+    await cache.stop()
+
+
+async def test_get_or_load_shares_one_load_per_key():
+    cache = Cache(LRUCache())
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": "org-1"}
+
+    results = await asyncio.gather(*[cache.get_or_load("org:1", load, tags=["org:1"]) for _ in range(5)])
+
+    assert results == [{"id": "org-1"}] * 5
+    assert len(calls) == 1
+    # Every read is a private copy
+    results[0]["id"] = "changed"
+    assert await cache.get("org:1") == {"id": "org-1"}
+
+    assert await cache.invalidate_tag("org:1") == 1
+    assert await cache.get("org:1") is None
+
+
+def test_lru_evicts_by_entries_and_expires_by_ttl(monkeypatch):
+    lru = LRUCache(max_entries=2)
+    lru.set("a", b"1")
+    lru.set("b", b"2")
+    lru.get("a")
+    lru.set("c", b"3")
+
+    assert lru.get("b") is None
+    assert lru.get("a") == b"1" and lru.get("c") == b"3"
+
+    lru.set("short", b"x", ttl=-1)
+    assert lru.get("short") is None
+
+
+async def test_idle_channel_keeps_the_local_tier(monkeypatch):
+    redis = FakeRedis([None, None, None, invalidation(tags=["org:1"]), None])
+    cache = Cache(LRUCache(), redis)
+    monkeypatch.setattr(cache, "remote", None)
+    await cache.set("org:1", 1, tags=["org:1"])
+    await cache.set("org:2", 2, tags=["org:2"])
+
+    await run_listener(cache)
+
+    assert await cache.get("org:1") is None
+    assert await cache.get("org:2") == 2
+
+
+async def test_disconnect_clears_the_local_tier_and_resubscribes(monkeypatch):
+    redis = FakeRedis([ConnectionError("connection reset")], [invalidation(keys=["b"])])
+    cache = Cache(LRUCache(), redis)
+    monkeypatch.setattr(cache, "remote", None)
+    monkeypatch.setattr(asyncio, "sleep", lambda delay: sleep(min(delay, 0.001)))
+    await cache.set("a", 1)
+
+    await run_listener(cache)
+
+    assert await cache.get("a") is None
+    assert redis.pubsubs == []
+
+
+async def test_clear_message_empties_the_local_tier(monkeypatch):
+    redis = FakeRedis([invalidation(clear=True)])
+    cache = Cache(LRUCache(), redis)
+    monkeypatch.setattr(cache, "remote", None)
+    await cache.set("a", 1, tags=["org:1"])
+    await cache.set("b", 2)
+
+    await run_listener(cache)
+
+    assert len(cache.local) == 0
@@ -0,0 +1,87 @@
+"""
+Context lists and the derived public flag of core/media_acl.py.
+"""
+
+import pytest
+
+from core.cache import Cache, LRUCache
+from core.media_acl import CHAT, NEWS_POST, ORG_LOGO, POST, PROFILE, MediaACL, media_ids_in
+
+pytestmark = pytest.mark.anyio
+
+A = "11111111-1111-1111-1111-111111111111"
+B = "22222222-2222-2222-2222-222222222222"
+
+
+@pytest.fixture
+def acl(db):
+    return MediaACL(db, Cache(LRUCache()))
+
+
+def test_media_ids_in_urls():
+    assert media_ids_in(f"https://zioncity.app/api/media/{A}", f"/api/media/{B}?w=64", None, f"/api/media/{A}") == [A, B]
+    assert media_ids_in("/uploads/logo.png") == []
+
+
+async def test_public_while_any_public_context_holds_the_file(acl):
+    await acl.grant([A, B], POST, "p1", public=True)
+    await acl.grant([A], CHAT, "c1")
+    assert await acl.is_public(A) and await acl.is_public(B)
+
+    await acl.revoke([A], POST, "p1")
+
+    assert not await acl.is_public(A)
+    assert (await acl.get(A))["contexts"] == [{"kind": CHAT, "id": "c1", "public": False}]
+    assert await acl.is_public(B)
+
+
+async def test_regrant_with_a_new_visibility_replaces_the_context(acl):
+    await acl.grant([A], NEWS_POST, "n1", public=True)
+    await acl.grant([A], ORG_LOGO, "o1", public=True)
+
+    # The news post is made private; the organization logo still makes the file public
+    await acl.grant([A], NEWS_POST, "n1", public=False)
+    entry = await acl.get(A)
+    assert entry["public"] is True
+    assert len(entry["contexts"]) == 2
+
+    await acl.replace([A], [B], ORG_LOGO, "o1", public=True)
+    assert not await acl.is_public(A)
+    assert await acl.is_public(B)
+
+
+async def test_revoke_contexts_of_deleted_posts(acl):
+    await acl.grant([A], POST, "p1", public=True)
+    await acl.grant([B], POST, "p2", public=True)
+    await acl.grant([B], POST, "p3")
+
+    assert await acl.revoke_contexts(POST, ["p1", "p2", "missing"]) == 2
+
+    assert not await acl.is_public(A)
+    assert not await acl.is_public(B)
+    assert (await acl.get(B))["contexts"] == [{"kind": POST, "id": "p3", "public": False}]
+
+
+async def test_reads_are_cached_and_writes_invalidate(db, acl):
+    await acl.grant([A], POST, "p1", public=True)
+    assert await acl.is_public(A)
+
+    # A write that bypasses MediaACL is not seen until the entry is invalidated
+    await db.media_acl.update_one({"media_id": A}, {"$set": {"public": False}})
+    assert await acl.is_public(A)
+    await acl.revoke([A], POST, "p1")
+    assert not await acl.is_public(A)
+
+    # Files without an entry are private, and the miss is cached too
+    assert await acl.get(B) == {"public": False, "contexts": []}
+
+
+async def test_rebuild_indexes_references_from_scratch(db, acl):
+    await db.users.insert_one({"id": "u1", "profile_picture_media_id": A})
+    await db.posts.insert_one({"id": "p1", "media_files": [B], "visibility": "FRIENDS"})
+    await acl.grant([B], POST, "deleted-post", public=True)
+
+    assert await acl.rebuild() == 2
+
+    assert (await db.media_acl.find_one({"media_id": A}))["contexts"] == [{"kind": PROFILE, "id": "u1", "public": True}]
+    assert (await db.media_acl.find_one({"media_id": B}))["public"] is False
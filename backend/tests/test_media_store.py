@@ -0,0 +1,135 @@
+"""
+Reference counting of content-addressed blobs in core/media.py.
+"""
+
+import asyncio
+import hashlib
+
+import pytest
+
+from core.media import MediaStore
+from core.storage import LocalStorage, blob_key, migrate_legacy_files, variant_prefix
+
+pytestmark = pytest.mark.anyio
+
+DATA = b"zion" * 1000
+SHA = hashlib.sha256(DATA).hexdigest()
+
+
+class SlowDeleteStorage(LocalStorage):
+    """Deletes take a while, so a save can arrive in the middle of a release."""
+
+    async def delete(self, key):
+        await asyncio.sleep(0.1)
+        return await super().delete(key)
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    return MediaStore(db, tmp_path)
+
+
+def stored(store, sha256=SHA):
+    return (store.root / blob_key(sha256)).exists()
+
+
+def blob(db, sha256=SHA):
+    return db.sync.media_blobs.find_one({"sha256": sha256})
+
+
+async def test_identical_uploads_share_one_blob(db, store):
+    first = await store.save(DATA)
+    second = await store.save(DATA)
+
+    assert first.sha256 == second.sha256 == SHA
+    assert (first.deduplicated, second.deduplicated) == (False, True)
+    assert blob(db)["ref_count"] == 2
+    assert blob(db)["_id"] == SHA
+    assert stored(store)
+    assert store.stats()["deduplicated"] == 1
+
+
+async def test_concurrent_uploads_count_every_reference(db, store):
+    results = await asyncio.gather(*[store.save(DATA) for _ in range(5)])
+
+    assert db.sync.media_blobs.count_documents({}) == 1
+    assert blob(db)["ref_count"] == 5
+    assert sum(not r.deduplicated for r in results) >= 1
+    assert stored(store)
+
+
+async def test_release_deletes_with_the_last_reference(db, store):
+    await store.save(DATA)
+    await store.save(DATA)
+    variants = store.root / variant_prefix(SHA)
+    variants.mkdir(parents=True)
+    (variants / "thumb.webp").write_bytes(b"thumb")
+
+    assert await store.release(SHA) is False
+    assert blob(db)["ref_count"] == 1
+    assert stored(store)
+
+    assert await store.release(SHA) is True
+    assert blob(db) is None
+    assert not stored(store)
+    assert not variants.exists()
+
+
+async def test_release_of_unknown_blob_is_a_no_op(db, store):
+    assert await store.release(None) is False
+    assert await store.release("0" * 64) is False
+    assert db.sync.media_blobs.count_documents({}) == 0
+
+
+async def test_save_during_the_last_release_rewrites_the_blob(db, tmp_path):
+    store = MediaStore(db, tmp_path, storage=SlowDeleteStorage(tmp_path))
+    await store.save(DATA)
+
+    release = asyncio.create_task(store.release(SHA))
+    await asyncio.sleep(0.05)
+    assert blob(db)["deleting"]
+    again = await store.save(DATA)
+
+    # The release gives up the row to the new reference and the bytes are written again
+    assert await release is False
+    assert again.deduplicated is False
+    assert stored(store)
+    row = blob(db)
+    assert row["ref_count"] == 1
+    assert "deleting" not in row
+
+    assert await store.release(SHA) is True
+    assert not stored(store)
+
+
+async def test_stuck_deletion_mark_is_taken_over(db, tmp_path):
+    store = MediaStore(db, tmp_path, release_wait=0.1)
+    await store.save(DATA)
+    # A worker died after claiming the deletion
+    await db.media_blobs.update_one({"sha256": SHA}, {"$set": {"ref_count": 0, "deleting": True}})
+
+    again = await store.save(DATA)
+
+    assert again.deduplicated is False
+    assert "deleting" not in blob(db)
+    assert blob(db)["ref_count"] == 1
+
+
+async def test_legacy_files_are_migrated_through_the_reference_path(db, store, tmp_path):
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+    for name in ("a.bin", "b.bin"):
+        (legacy / name).write_bytes(DATA)
+    await db.media_files.insert_many([
+        {"id": name, "sha256": None, "file_path": str(legacy / name), "mime_type": "application/octet-stream"}
+        for name in ("a.bin", "b.bin")
+    ])
+
+    report = await migrate_legacy_files(db, store, delete_source=True)
+
+    assert report == {"migrated": 2, "missing": 0, "bytes": 2 * len(DATA)}
+    row = blob(db)
+    assert row["_id"] == SHA and row["ref_count"] == 2
+    assert stored(store)
+    assert list(legacy.iterdir()) == []
+    assert {m["storage_key"] for m in db.sync.media_files.find()} == {blob_key(SHA)}
@@ -0,0 +1,118 @@
+"""
+Cursor encoding (core/timelines.py) and chat message search with snippets
+(core/message_search.py).
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core.message_search import MessageSearchIndex, snippet, split_query
+from core.timelines import InvalidCursor, decode_cursor, encode_cursor
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+# ---- cursors ----
+
+def test_cursor_round_trip():
+    created_at = T0 + timedelta(microseconds=123456)
+    cursor = encode_cursor(created_at, "post-1")
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "post-1")
+
+
+@pytest.mark.parametrize("cursor", ["", "zzz", "not a cursor!", encode_cursor(T0, "x")[:-3]])
+def test_malformed_cursor_raises(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+# ---- snippets ----
+
+def test_split_query_keeps_the_last_word_as_prefix():
+    assert split_query("как дела") == (["как"], "дел")
+    # A one-letter last word is matched whole, not as a prefix
+    assert split_query("встреча в") == (["встреч", "в"], None)
+    assert split_query("   ") == ([], None)
+
+
+def test_snippet_highlights_stemmed_and_prefix_matches():
+    text = "Встреча завтра, встречаемся у входа"
+    result = snippet(text, *split_query("встреча вход"))
+
+    assert result["text"] == text
+    assert [text[s:e] for s, e in result["highlights"]] == ["Встреча", "входа"]
+
+
+def test_long_snippet_is_cut_around_the_first_match():
+    text = "слово " * 60 + "важная встреча " + "текст " * 60
+    result = snippet(text, *split_query("встреча"), width=80)
+    body = result["text"]
+
+    assert body.startswith("…") and body.endswith("…")
+    assert len(body) <= 82
+    assert [body[s:e] for s, e in result["highlights"]] == ["встреча"]
+
+
+# ---- search ----
+
+def message(i, content, **extra):
+    return {
+        "id": f"m{i}", "direct_chat_id": "c1", "user_id": "u1", "content": content,
+        "created_at": T0 + timedelta(minutes=i), "is_deleted": False, **extra,
+    }
+
+
+@pytest.fixture
+def index(db):
+    db.sync.chat_messages.insert_many([
+        message(0, "Привет, как дела?"),
+        message(1, "Приветствую всех"),
+        message(2, "Встреча завтра в 10"),
+        message(3, "привет ещё раз .*"),
+        message(4, "", attachment={"filename": "отчёт_2025.pdf"}),
+        message(5, "Дела отлично, приветы"),
+        {**message(6, "привет группе"), "direct_chat_id": None, "group_id": "g1"},
+    ])
+    return MessageSearchIndex(db, count_limit=3)
+
+
+@pytest.mark.anyio
+async def test_search_pages_newest_first_with_a_cursor(index):
+    first = await index.search("direct", "c1", "прив", limit=2)
+
+    assert [m["id"] for m in first.messages] == ["m5", "m3"]
+    assert first.has_more and first.next_cursor
+    assert first.total == 3 and first.total_is_estimate
+    assert all(m["snippet"]["highlights"] for m in first.messages)
+
+    second = await index.search("direct", "c1", "прив", limit=2, cursor=first.next_cursor)
+    assert [m["id"] for m in second.messages] == ["m1", "m0"]
+    assert not second.has_more and second.next_cursor is None
+
+    with pytest.raises(InvalidCursor):
+        await index.search("direct", "c1", "прив", cursor="zzz")
+
+
+@pytest.mark.anyio
+async def test_search_matches_file_names_and_never_runs_regexes(index):
+    assert [m["id"] for m in (await index.search("direct", "c1", "отчет")).messages] == ["m4"]
+    assert (await index.search("direct", "c1", ".*")).messages == []
+    assert [m["id"] for m in (await index.search("group", "g1", "привет")).messages] == ["m6"]
+
+
+@pytest.mark.anyio
+async def test_edit_and_delete_hooks_update_the_index(db, index):
+    await index.search("direct", "c1", "привет")
+
+    db.sync.chat_messages.update_one({"id": "m0"}, {"$set": {"is_deleted": True}})
+    await index.on_delete({"id": "m0"})
+    edited = message(2, "привет вместо встречи")
+    db.sync.chat_messages.update_one({"id": "m2"}, {"$set": {"content": edited["content"]}})
+    await index.on_edit(edited)
+
+    page = await index.search("direct", "c1", "привет", limit=10)
+    assert [m["id"] for m in page.messages] == ["m5", "m3", "m2", "m1"]
+    assert index.stats()["errors"] == 0
@@ -0,0 +1,113 @@
+"""
+GCRA limiter, middleware and client identification of core/rate_limit.py.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from core import rate_limit
+from core.rate_limit import LocalGCRABackend, RateLimiter, RateLimitMiddleware, client_ip
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_burst_then_one_request_per_interval(clock):
+    backend = LocalGCRABackend()
+    # 5 requests per 10 s: a burst of 5, then one every 2 s
+    results = [backend.hit("k", 2.0, 10.0) for _ in range(6)]
+
+    assert [r.allowed for r in results] == [True] * 5 + [False]
+    assert results[-1].retry_after == pytest.approx(2.0)
+
+    clock.now += 1.9
+    assert not backend.hit("k", 2.0, 10.0).allowed
+    clock.now += 0.1
+    assert backend.hit("k", 2.0, 10.0).allowed
+    assert not backend.hit("k", 2.0, 10.0).allowed
+
+
+def test_keys_are_independent_and_drained_keys_are_cleaned_up(clock):
+    backend = LocalGCRABackend()
+    for _ in range(3):
+        backend.hit("a", 1.0, 3.0)
+    assert not backend.hit("a", 1.0, 3.0).allowed
+    assert backend.hit("b", 1.0, 3.0).allowed
+
+    clock.now += 1.5
+    assert backend.cleanup() == 1
+    assert len(backend) == 1
+    clock.now += 2
+    assert backend.cleanup() == 1
+    assert len(backend) == 0
+
+
+class BrokenRedis:
+    def register_script(self, script):
+        async def run(keys, args):
+            raise ConnectionError("redis is down")
+
+        return run
+
+
+@pytest.mark.anyio
+async def test_redis_errors_fall_back_to_local_limits(clock):
+    limiter = RateLimiter(BrokenRedis())
+
+    allowed = [await limiter.is_allowed("login:1.2.3.4", 2, 60) for _ in range(3)]
+
+    assert allowed == [True, True, False]
+    assert limiter.stats() == {
+        "backend": "redis", "tracked_local_keys": 1, "allowed": 2, "limited": 1, "remote_errors": 3,
+    }
+
+
+def scope(path="/api/auth/login", method="POST", peer="10.0.0.1", headers=()):
+    return {"type": "http", "method": method, "path": path, "client": (peer, 5000), "headers": list(headers)}
+
+
+@pytest.mark.anyio
+async def test_middleware_limits_matching_routes_only(clock):
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = RateLimitMiddleware(
+        app, RateLimiter(), rules=[("POST", r"^/api/auth/login$", "auth")],
+        limits={"auth": {"max_requests": 1, "window_seconds": 30}, "default": {"max_requests": 100, "window_seconds": 60}},
+    )
+    await middleware(scope(), None, send)
+    await middleware(scope(), None, send)
+    for _ in range(3):
+        await middleware(scope("/api/posts", "GET"), None, send)
+
+    assert calls == ["/api/auth/login"] + ["/api/posts"] * 3
+    assert sent[0]["status"] == 429
+    assert dict(sent[0]["headers"])[b"retry-after"] == b"30"
+
+
+def test_x_real_ip_is_trusted_only_from_the_proxy():
+    header = [(b"x-real-ip", b"203.0.113.7")]
+
+    assert client_ip(scope(peer="127.0.0.1", headers=header)) == "203.0.113.7"
+    assert client_ip(scope(peer="198.51.100.2", headers=header)) == "198.51.100.2"
+    assert client_ip(scope(peer="127.0.0.1")) == "127.0.0.1"
@@ -0,0 +1,32 @@
+"""
+Index entries of core/search.py (the ranked queries need a real MongoDB).
+"""
+
+import pytest
+
+from core.search import USER_PHONES, USERS, SearchIndex
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_phone_numbers_are_indexed_only_under_the_admin_kind(db):
+    await db.users.insert_many([
+        {"id": "a", "first_name": "Анна", "last_name": "Петрова", "email": "anna@example.com", "phone": "+79001234567"},
+        {"id": "b", "first_name": "Борис", "last_name": "Иванов", "email": "boris@example.com"},
+    ])
+    index = SearchIndex(db)
+
+    counts = await index.rebuild()
+
+    assert counts[USERS] == 2 and counts[USER_PHONES] == 1
+    entries = {(e["kind"], e["entity_id"]): e for e in db.sync.search_index.find({}, {"_id": 0})}
+    assert set(entries) == {(USERS, "a"), (USERS, "b"), (USER_PHONES, "a")}
+    assert not any(t.startswith("+") or t.isdigit() for t in entries[(USERS, "a")]["terms"])
+    assert "anna@example.com" in entries[(USERS, "a")]["terms"]
+
+    # Removing the number drops the phone entry, not the user
+    await db.users.update_one({"id": "a"}, {"$unset": {"phone": ""}})
+    await index.refresh(USER_PHONES, "a")
+    await index.refresh(USERS, "a")
+    kinds = {(e["kind"], e["entity_id"]) for e in db.sync.search_index.find()}
+    assert kinds == {(USERS, "a"), (USERS, "b")}
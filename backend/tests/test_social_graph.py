@@ -0,0 +1,54 @@
+"""
+Read-through adjacency of core/social_graph.py with the per-process store.
+"""
+
+import pytest
+
+from core.social_graph import Adjacency, LocalGraphStore, SocialGraph
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_updates_apply_to_loaded_users_only(db):
+    await db.user_follows.insert_one({"follower_id": "a", "target_id": "b"})
+    graph = SocialGraph(db)
+
+    assert (await graph.get("a")).following == {"b"}
+    await db.user_follows.insert_one({"follower_id": "a", "target_id": "c"})
+    await graph.add_follow("a", "c")
+
+    assert (await graph.get("a")).following == {"b", "c"}
+    assert (await graph.get("c")).followers == {"a"}
+    assert graph.loads == 2
+
+
+async def test_write_during_a_load_is_not_lost(db, monkeypatch):
+    graph = SocialGraph(db)
+    load = graph._load
+
+    async def racing_load(user_ids):
+        loaded = await load(user_ids)
+        # Committed after the load read MongoDB, before it is stored
+        await db.user_friendships.insert_one({"user1_id": "a", "user2_id": "b"})
+        await graph.add_friendship("a", "b")
+        return loaded
+
+    monkeypatch.setattr(graph, "_load", racing_load)
+    assert (await graph.get("a")).friends == set()
+    monkeypatch.setattr(graph, "_load", load)
+
+    # The stale load was not stored: the next read sees the friendship
+    assert (await graph.get("a")).friends == {"b"}
+
+
+async def test_forgotten_writes_still_block_older_loads():
+    store = LocalGraphStore(max_users=2)
+    before = await store.versions(["a"])
+    for user_id in ("a", "b", "c"):
+        await store.update(user_id, "friends", "x", add=True)
+
+    await store.put_many([Adjacency("a"), Adjacency("z")], before)
+    assert await store.get_many(["a", "z"]) == {}
+
+    await store.put_many([Adjacency("z")], await store.versions(["z"]))
+    assert list(await store.get_many(["z"])) == ["z"]
@@ -0,0 +1,96 @@
+"""
+Prefix matching and relationship ranking of core/typeahead.py.
+"""
+
+import pytest
+
+from core.cache import Cache, LRUCache
+from core.social_graph import SocialGraph
+from core.typeahead import PeopleTypeahead, edge_ngrams, query_keys
+
+pytestmark = pytest.mark.anyio
+
+
+def user(user_id, first_name, last_name, email=None):
+    return {"id": user_id, "first_name": first_name, "last_name": last_name,
+            "email": email or f"{user_id}@example.com", "password_hash": "x"}
+
+
+@pytest.fixture
+async def typeahead(db):
+    await db.users.insert_many([
+        user("me", "Иван", "Иванов"),
+        user("stranger", "Иван", "Абрамов"),
+        user("follower", "Иван", "Борисов"),
+        user("followed", "Иван", "Васильев"),
+        user("colleague", "Иван", "Гусев"),
+        user("friend", "Иван", "Жуков"),
+        user("cousin", "Иван", "Зуев"),
+        user("other", "Пётр", "Петров", "petr.petrov@example.com"),
+        user("long", "Константинопольский", "Иван"),
+    ])
+    await db.user_friendships.insert_one({"user1_id": "friend", "user2_id": "me"})
+    await db.user_follows.insert_many([
+        {"follower_id": "me", "target_id": "followed"},
+        {"follower_id": "follower", "target_id": "me"},
+    ])
+    await db.friend_requests.insert_one({"sender_id": "me", "receiver_id": "stranger", "status": "PENDING"})
+    await db.family_members.insert_many([
+        {"family_id": "f1", "user_id": u, "is_active": True, "invitation_accepted": True} for u in ("me", "cousin")
+    ])
+    await db.work_members.insert_many([
+        {"organization_id": "o1", "user_id": u, "status": "ACTIVE"} for u in ("me", "colleague")
+    ])
+    typeahead = PeopleTypeahead(db, SocialGraph(db), Cache(LRUCache()))
+    assert await typeahead.rebuild() == 9
+    return typeahead
+
+
+def test_keys_and_prefixes():
+    assert query_keys("  Пётр  пет ") == ["петр", "пет"]
+    assert query_keys("Petr.Petrov@Example.com") == ["petr.petrov@example.com"]
+    assert edge_ngrams(["ива"]) == ["и", "ив", "ива"]
+
+
+async def test_circle_ranks_before_the_rest_of_the_directory(typeahead):
+    people = await typeahead.suggest("me", "ив", limit=10)
+    ids = [p["id"] for p in people]
+
+    # Friends and family, then colleagues, people followed, followers, everyone else by name
+    assert ids[:2] == ["friend", "cousin"]
+    assert ids[2:5] == ["colleague", "followed", "follower"]
+    assert set(ids[5:]) == {"stranger", "long"}
+    assert "me" not in ids
+
+    flags = {p["id"]: p for p in people}
+    assert flags["friend"]["is_friend"] and not flags["friend"]["is_family"]
+    assert flags["cousin"]["is_family"]
+    assert flags["colleague"]["is_colleague"]
+    assert flags["followed"]["is_following"]
+    assert flags["stranger"]["request_sent"]
+    assert "password_hash" not in flags["friend"]
+
+
+async def test_every_word_must_prefix_a_name_word(typeahead):
+    assert [p["id"] for p in await typeahead.suggest("me", "ив жук")] == ["friend"]
+    assert [p["id"] for p in await typeahead.suggest("me", "пет пет")] == ["other"]
+    assert [p["id"] for p in await typeahead.suggest("me", "petr.petrov@example.com")] == ["other"]
+    # Longer than the indexed prefixes: checked in full
+    assert [p["id"] for p in await typeahead.suggest("me", "константинопольск")] == ["long"]
+    assert await typeahead.suggest("me", "константинопольх") == []
+    assert await typeahead.suggest("me", "  ") == []
+
+
+async def test_limit_keeps_the_closest_people(typeahead):
+    assert [p["id"] for p in await typeahead.suggest("me", "иван", limit=3)] == ["friend", "cousin", "colleague"]
+
+
+async def test_refresh_and_circle_invalidation(db, typeahead):
+    await db.users.update_one({"id": "stranger"}, {"$set": {"first_name": "Олег"}})
+    await typeahead.refresh("stranger")
+    assert [p["id"] for p in await typeahead.suggest("me", "олег")] == ["stranger"]
+
+    await typeahead.suggest("me", "ив")
+    await db.work_members.insert_one({"organization_id": "o1", "user_id": "other", "status": "ACTIVE"})
+    await typeahead.invalidate_circles(organization_ids=["o1"])
+    assert (await typeahead.suggest("me", "пет"))[0]["is_colleague"]
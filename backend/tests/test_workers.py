@@ -0,0 +1,107 @@
+"""
+Per-kind concurrency limits and counters of core/workers.py.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.workers import DEFAULT_LIMITS, FILES, IMAGES, PASSWORD, WorkerPools
+
+pytestmark = pytest.mark.anyio
+
+
+class Tracker:
+    """Blocking task that records how many copies run at the same time."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def __call__(self, value, delay=0.05):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(delay)
+        with self.lock:
+            self.running -= 1
+        return value
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+@pytest.fixture
+async def pools():
+    pools = WorkerPools(processes=1, threads=8, limits={PASSWORD: 2, FILES: 1})
+    yield pools
+    await pools.stop()
+
+
+async def test_limit_caps_concurrency_of_a_kind(pools):
+    task = Tracker()
+
+    results = await asyncio.gather(*[pools.io(PASSWORD, task, i) for i in range(6)])
+
+    assert results == list(range(6))
+    assert task.peak == 2
+    stats = pools.stats()["kinds"][PASSWORD]
+    assert stats["limit"] == 2
+    assert stats["completed"] == 6
+    assert (stats["running"], stats["waiting"], stats["failed"]) == (0, 0, 0)
+    # The later tasks waited for a slot
+    assert stats["queue_ms_max"] >= 50
+
+
+async def test_kinds_do_not_share_a_limit(pools):
+    password, files = Tracker(), Tracker()
+
+    await asyncio.gather(
+        *[pools.io(PASSWORD, password, i) for i in range(4)],
+        *[pools.io(FILES, files, i) for i in range(4)],
+    )
+
+    assert password.peak == 2
+    assert files.peak == 1
+    assert set(pools.stats()["kinds"]) == {PASSWORD, FILES}
+
+
+async def test_waiting_tasks_are_counted(pools):
+    gate = threading.Event()
+    first = asyncio.ensure_future(pools.io(FILES, gate.wait, 5))
+    second = asyncio.ensure_future(pools.io(FILES, gate.wait, 5))
+    await asyncio.sleep(0.05)
+
+    stats = pools.stats()["kinds"][FILES]
+    assert (stats["running"], stats["waiting"]) == (1, 1)
+
+    gate.set()
+    assert await asyncio.gather(first, second) == [True, True]
+
+
+async def test_failures_release_the_slot(pools):
+    with pytest.raises(RuntimeError):
+        await pools.io(FILES, fail)
+
+    assert await pools.io(FILES, Tracker(), "ok") == "ok"
+    stats = pools.stats()["kinds"][FILES]
+    assert (stats["failed"], stats["completed"], stats["running"]) == (1, 1, 0)
+
+
+def test_limits_from_env(monkeypatch):
+    monkeypatch.setenv("CPU_WORKERS", "3")
+    monkeypatch.setenv("IO_WORKERS", "16")
+    monkeypatch.setenv("WORKER_LIMIT_PASSWORD", "6")
+    monkeypatch.delenv("WORKER_LIMIT_IMAGES", raising=False)
+    monkeypatch.setenv("IMAGE_WORKERS", "5")
+
+    pools = WorkerPools.from_env()
+
+    assert (pools.processes, pools.threads) == (3, 16)
+    assert pools.limits[PASSWORD] == 6
+    assert pools.limits[IMAGES] == 5
+    assert pools.limits[FILES] == DEFAULT_LIMITS[FILES]
@@ -11,6 +11,7 @@
 #   logs     - View application logs
 #   status   - Check service status
 #   backup   - Backup database
+#   indexes  - Build missing MongoDB indexes from the manifest
 #   ssl      - Setup SSL with Let's Encrypt
 
 set -e
@@ -114,6 +115,7 @@ deploy() {
     # Build and start containers
     docker compose down --remove-orphans || true
     docker compose build --no-cache
+    indexes
     docker compose up -d
     
     # Wait for services to be healthy
@@ -141,9 +143,10 @@ update() {
         git pull origin main
     fi
     
-    # Rebuild and restart
-    docker compose down
+    # Rebuild, build any new indexes, then restart
     docker compose build
+    indexes
+    docker compose down
     docker compose up -d
     
     log_info "Update complete!"
@@ -218,6 +221,20 @@ backup() {
     log_info "Backup complete!"
 }
 
+# =============================================================================
+# INDEXES: Build missing MongoDB indexes (see backend/core/indexes.py)
+# =============================================================================
+indexes() {
+    cd $APP_DIR
+    log_info "Applying MongoDB index manifest..."
+    docker compose up -d mongodb
+    if docker compose run --rm --no-deps app sh -c "cd /app/backend && python -m core.indexes apply"; then
+        log_info "Indexes up to date"
+    else
+        log_warn "Some indexes failed to build; run 'python -m core.indexes plan' for details"
+    fi
+}
+
 # =============================================================================
 # RESTART: Restart all services
 # =============================================================================
@@ -238,11 +255,12 @@ case "$1" in
     logs)    logs ;;
     status)  status ;;
     backup)  backup ;;
+    indexes) indexes ;;
     restart) restart ;;
     *)
         echo "ZION.CITY Deployment Script"
         echo ""
-        echo "Usage: $0 {setup|deploy|update|ssl|logs|status|backup|restart}"
+        echo "Usage: $0 {setup|deploy|update|ssl|logs|status|backup|indexes|restart}"
         echo ""
         echo "Commands:"
         echo "  setup    - Initial server setup (run once)"
@@ -252,6 +270,7 @@ case "$1" in
         echo "  logs     - View application logs"
         echo "  status   - Check service status"
         echo "  backup   - Backup database"
+        echo "  indexes  - Build missing MongoDB indexes"
         echo "  restart  - Restart all services"
         exit 1
         ;;
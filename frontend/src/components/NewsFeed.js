@@ -47,6 +47,7 @@ const NewsFeed = ({
   const [loading, setLoading] = useState(true);
   const [hasMore, setHasMore] = useState(true);
   const [offset, setOffset] = useState(0);
+  const [cursor, setCursor] = useState(null);
   
   // Composer state
   const [newPostContent, setNewPostContent] = useState('');
@@ -80,10 +81,11 @@ const NewsFeed = ({
     try {
       const token = localStorage.getItem('zion_token');
       const currentOffset = reset ? 0 : offset;
+      const currentCursor = reset ? null : cursor;
       
       const endpoint = channelId 
         ? `${BACKEND_URL}/api/news/posts/channel/${channelId}?limit=${LIMIT}&offset=${currentOffset}`
-        : `${BACKEND_URL}/api/news/posts/feed?limit=${LIMIT}&offset=${currentOffset}`;
+        : `${BACKEND_URL}/api/news/posts/feed?limit=${LIMIT}${currentCursor ? `&cursor=${encodeURIComponent(currentCursor)}` : ''}`;
       
       const response = await fetch(endpoint, {
         headers: { 'Authorization': `Bearer ${token}` }
@@ -98,6 +100,7 @@ const NewsFeed = ({
           setPosts(prev => [...prev, ...(data.posts || [])]);
           setOffset(prev => prev + LIMIT);
         }
+        setCursor(data.next_cursor || null);
         setHasMore(data.has_more || false);
       }
     } catch (error) {
@@ -105,7 +108,7 @@ const NewsFeed = ({
     } finally {
       setLoading(false);
     }
-  }, [BACKEND_URL, channelId, offset]);
+  }, [BACKEND_URL, channelId, offset, cursor]);
 
   // Load posts on mount and channel change
   useEffect(() => {
@@ -100,6 +100,38 @@ const CollectionRow = ({ collection, expanded, onToggle }) => (
   </div>
 );
 
+// Streamed backups (.ndjson, .bson, optionally .gz / .zst) are always restored via chunked upload
+const isArchiveFile = (file) => !file.name.toLowerCase().endsWith('.json');
+
+// Read the {"$backup": ...} header line of an NDJSON backup
+const readArchiveHeader = async (file) => {
+  const name = file.name.toLowerCase();
+  if (!name.endsWith('.ndjson') && !name.endsWith('.ndjson.gz')) return null;
+  let stream = file.slice(0, 256 * 1024).stream();
+  if (name.endsWith('.gz')) {
+    if (typeof DecompressionStream === 'undefined') return null;
+    stream = stream.pipeThrough(new DecompressionStream('gzip'));
+  }
+  const reader = stream.pipeThrough(new TextDecoderStream()).getReader();
+  let text = '';
+  try {
+    while (!text.includes('\n')) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      text += value;
+    }
+  } catch {
+    // The slice cuts the compressed stream short; the first line is all we need
+  } finally {
+    reader.cancel().catch(() => {});
+  }
+  try {
+    return JSON.parse(text.split('\n')[0]).$backup || null;
+  } catch {
+    return null;
+  }
+};
+
 const RestoreModal = ({ onClose, onRestore }) => {
   const [file, setFile] = useState(null);
   const [mode, setMode] = useState('merge');
@@ -125,7 +157,18 @@ const RestoreModal = ({ onClose, onRestore }) => {
       // For large files, only read the beginning to get metadata
       const isLargeFile = selectedFile.size > 50 * 1024 * 1024; // 50MB threshold
       
-      if (isLargeFile) {
+      if (isArchiveFile(selectedFile)) {
+        const header = await readArchiveHeader(selectedFile);
+        setPreview({
+          date: header ? header.created_at : 'Резервная копия',
+          version: header ? header.version : '-',
+          database: header ? header.database_name : '-',
+          collections: header && header.collections ? header.collections.length : '(архив)',
+          documents: '(будет определено)',
+          isLargeFile: true,
+          fileSize: selectedFile.size
+        });
+      } else if (isLargeFile) {
         // For large files, read just enough to parse metadata
         const reader = new FileReader();
         const slice = selectedFile.slice(0, 1024 * 1024); // Read first 1MB for metadata
@@ -289,8 +332,44 @@ const RestoreModal = ({ onClose, onRestore }) => {
       throw new Error(errorData.detail || 'Ошибка завершения восстановления');
     }
 
+    // The restore runs in the background - poll its progress
+    let statusData;
+    for (;;) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const statusResponse = await fetch(
+        `${BACKEND_URL}/admin/database/restore/chunked/${upload_id}/status`,
+        { headers: { 'Authorization': `Bearer ${token}` } }
+      );
+      if (!statusResponse.ok) {
+        throw new Error('Не удалось получить статус восстановления');
+      }
+      statusData = await statusResponse.json();
+      if (statusData.status === 'completed' || statusData.status === 'failed') break;
+
+      const restoreProgress = statusData.restore_progress;
+      if (restoreProgress) {
+        if (restoreProgress.total_bytes) {
+          setProgress(85 + Math.round((restoreProgress.bytes_read / restoreProgress.total_bytes) * 14));
+        }
+        setUploadStatus(`Восстановлено документов: ${restoreProgress.documents_restored.toLocaleString()}`);
+      }
+    }
+
+    // Remove the finished session
+    await fetch(`${BACKEND_URL}/admin/database/restore/chunked/${upload_id}`, {
+      method: 'DELETE',
+      headers: { 'Authorization': `Bearer ${token}` }
+    });
+
+    if (statusData.status === 'failed') {
+      throw new Error(statusData.error || 'Ошибка восстановления');
+    }
+
     setProgress(100);
-    return await completeResponse.json();
+    return {
+      message: statusData.results.errors.length ? 'База данных частично восстановлена' : 'База данных восстановлена',
+      results: statusData.results
+    };
   };
 
   const handleRestore = async () => {
@@ -303,8 +382,8 @@ const RestoreModal = ({ onClose, onRestore }) => {
     try {
       const token = localStorage.getItem('admin_token');
       
-      // Use chunked upload for files > 50MB
-      const useChunkedUpload = file.size > 50 * 1024 * 1024;
+      // Use chunked upload for archives and files > 50MB
+      const useChunkedUpload = isArchiveFile(file) || file.size > 50 * 1024 * 1024;
       
       if (useChunkedUpload) {
         const result = await uploadChunked(file, mode, token);
@@ -348,11 +427,11 @@ const RestoreModal = ({ onClose, onRestore }) => {
         <div className="p-6 space-y-6">
           {/* File Upload */}
           <div>
-            <label className="block text-sm text-slate-400 mb-2">Файл резервной копии (.json)</label>
+            <label className="block text-sm text-slate-400 mb-2">Файл резервной копии (.ndjson.gz, .bson, .json)</label>
             <div className="border-2 border-dashed border-slate-600 rounded-xl p-6 text-center hover:border-purple-500/50 transition-colors">
               <input
                 type="file"
-                accept=".json"
+                accept=".json,.ndjson,.bson,.gz,.zst"
                 onChange={handleFileChange}
                 className="hidden"
                 id="backup-file"
@@ -366,7 +445,7 @@ const RestoreModal = ({ onClose, onRestore }) => {
                 <p className="text-slate-500 text-sm mt-1">
                   {file ? formatBytes(file.size) : 'или перетащите сюда'}
                 </p>
-                {file && file.size > 50 * 1024 * 1024 && (
+                {file && (isArchiveFile(file) || file.size > 50 * 1024 * 1024) && (
                   <p className="text-amber-400 text-xs mt-2">
                     ⚡ Большой файл - будет загружен по частям
                   </p>
@@ -521,7 +600,9 @@ const AdminDatabaseManagement = () => {
   const [expandedCollection, setExpandedCollection] = useState(null);
   const [showRestoreModal, setShowRestoreModal] = useState(false);
   const [history, setHistory] = useState([]);
+  const [chains, setChains] = useState([]);
   const [showHistory, setShowHistory] = useState(false);
+  const [incrementalBackup, setIncrementalBackup] = useState(false);
 
   const fetchStatus = useCallback(async () => {
     try {
@@ -551,6 +632,7 @@ const AdminDatabaseManagement = () => {
       if (!response.ok) throw new Error('Ошибка загрузки истории');
       const data = await response.json();
       setHistory(data.history);
+      setChains(data.chains || []);
     } catch (err) {
       console.error('History fetch error:', err);
     }
@@ -568,7 +650,7 @@ const AdminDatabaseManagement = () => {
   // Chunked download threshold (50MB in bytes)
   const CHUNKED_DOWNLOAD_THRESHOLD = 50 * 1024 * 1024;
 
-  const downloadChunked = async (token) => {
+  const downloadChunked = async (token, incremental) => {
     setBackupStatus('Создание резервной копии...');
     setBackupProgress(5);
 
@@ -579,7 +661,7 @@ const AdminDatabaseManagement = () => {
         'Content-Type': 'application/json',
         'Authorization': `Bearer ${token}`
       },
-      body: JSON.stringify({ chunk_size_mb: 5 })
+      body: JSON.stringify({ chunk_size_mb: 5, incremental })
     });
 
     if (!initResponse.ok) {
@@ -587,52 +669,73 @@ const AdminDatabaseManagement = () => {
       throw new Error(errorData.detail || 'Ошибка создания резервной копии');
     }
 
-    const initData = await initResponse.json();
-    const { backup_id, total_chunks, total_size, filename } = initData;
+    const { backup_id } = await initResponse.json();
+
+    // The backup is built in the background - poll until it is ready
+    let job;
+    for (;;) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const statusResponse = await fetch(`${BACKEND_URL}/admin/database/backup/chunked/${backup_id}/status`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      if (!statusResponse.ok) {
+        throw new Error('Не удалось получить статус резервной копии');
+      }
+      job = await statusResponse.json();
+      if (job.status === 'ready') break;
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Ошибка создания резервной копии');
+      }
+      if (job.progress) {
+        setBackupStatus(`Создание резервной копии... ${job.progress.documents.toLocaleString()} документов (${formatBytes(job.progress.bytes)})`);
+      }
+    }
 
+    const { total_chunks, total_size, filename } = job;
     setBackupStatus(`Скачивание ${total_chunks} частей...`);
     setBackupProgress(10);
 
-    // Download all chunks
+    // Download all chunks; each is verified against the manifest and retried on failure
     const chunks = [];
+    let downloaded = 0;
     for (let i = 0; i < total_chunks; i++) {
-      const chunkResponse = await fetch(
-        `${BACKEND_URL}/admin/database/backup/chunked/${backup_id}/chunk/${i}`,
-        {
-          headers: { 'Authorization': `Bearer ${token}` }
+      let chunkData = null;
+      for (let attempt = 1; attempt <= 3 && !chunkData; attempt++) {
+        try {
+          const chunkResponse = await fetch(
+            `${BACKEND_URL}/admin/database/backup/chunked/${backup_id}/chunk/${i}`,
+            {
+              headers: { 'Authorization': `Bearer ${token}` }
+            }
+          );
+          if (!chunkResponse.ok) {
+            throw new Error(`Ошибка скачивания части ${i + 1}`);
+          }
+          const data = await chunkResponse.arrayBuffer();
+          if (window.crypto && window.crypto.subtle) {
+            const digest = await window.crypto.subtle.digest('SHA-256', data);
+            const hex = Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+            if (hex !== job.chunks[i].sha256) {
+              throw new Error(`Контрольная сумма части ${i + 1} не совпадает`);
+            }
+          }
+          chunkData = data;
+        } catch (err) {
+          if (attempt === 3) {
+            throw err;
+          }
         }
-      );
-
-      if (!chunkResponse.ok) {
-        // Cleanup on error
-        await fetch(`${BACKEND_URL}/admin/database/backup/chunked/${backup_id}`, {
-          method: 'DELETE',
-          headers: { 'Authorization': `Bearer ${token}` }
-        });
-        throw new Error(`Ошибка скачивания части ${i + 1}`);
       }
-
-      const chunkData = await chunkResponse.arrayBuffer();
       chunks.push(chunkData);
+      downloaded += chunkData.byteLength;
 
       const progressPercent = 10 + Math.round(((i + 1) / total_chunks) * 80);
       setBackupProgress(progressPercent);
-      setBackupStatus(`Скачано ${i + 1} из ${total_chunks} частей (${formatBytes((i + 1) * 5 * 1024 * 1024)} / ${formatBytes(total_size)})`);
-    }
-
-    setBackupStatus('Сборка файла...');
-    setBackupProgress(92);
-
-    // Combine chunks
-    const combinedArray = new Uint8Array(chunks.reduce((acc, chunk) => acc + chunk.byteLength, 0));
-    let offset = 0;
-    for (const chunk of chunks) {
-      combinedArray.set(new Uint8Array(chunk), offset);
-      offset += chunk.byteLength;
+      setBackupStatus(`Скачано ${i + 1} из ${total_chunks} частей (${formatBytes(downloaded)} / ${formatBytes(total_size)})`);
     }
 
-    // Create downloadable file
-    const blob = new Blob([combinedArray], { type: 'application/json' });
+    // Create downloadable file from the chunks
+    const blob = new Blob(chunks, { type: 'application/octet-stream' });
     const url = window.URL.createObjectURL(blob);
     const a = document.createElement('a');
     a.href = url;
@@ -654,7 +757,7 @@ const AdminDatabaseManagement = () => {
     setBackupProgress(100);
     setBackupStatus('Резервная копия создана!');
 
-    return { size_bytes: total_size, collections_count: initData.collections_count, filename };
+    return { size_bytes: total_size, collections_count: job.collections_count, filename };
   };
 
   const handleBackup = async () => {
@@ -684,7 +787,7 @@ const AdminDatabaseManagement = () => {
       
       if (useChunkedDownload) {
         setBackupStatus('База данных большая - используется загрузка по частям...');
-        result = await downloadChunked(token);
+        result = await downloadChunked(token, incrementalBackup);
       } else {
         // Original method for smaller databases
         setBackupStatus('Создание резервной копии...');
@@ -694,7 +797,7 @@ const AdminDatabaseManagement = () => {
         const controller = new AbortController();
         const timeoutId = setTimeout(() => controller.abort(), 120000);
         
-        const response = await fetch(`${BACKEND_URL}/admin/database/backup`, {
+        const response = await fetch(`${BACKEND_URL}/admin/database/backup${incrementalBackup ? '?incremental=true' : ''}`, {
           headers: { 'Authorization': `Bearer ${token}` },
           signal: controller.signal
         });
@@ -707,19 +810,20 @@ const AdminDatabaseManagement = () => {
         }
         
         setBackupProgress(60);
-        setBackupStatus('Обработка данных...');
+        setBackupStatus('Получение данных...');
         
-        const data = await response.json();
+        // The backup is streamed as a compressed archive
+        const blob = await response.blob();
+        const filename = response.headers.get('X-Backup-Filename') || 'zion_city_backup.ndjson.gz';
         
         setBackupProgress(80);
         setBackupStatus('Создание файла...');
         
         // Create downloadable file
-        const blob = new Blob([JSON.stringify(data.backup, null, 2)], { type: 'application/json' });
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
-        a.download = data.filename;
+        a.download = filename;
         document.body.appendChild(a);
         a.click();
         window.URL.revokeObjectURL(url);
@@ -728,7 +832,7 @@ const AdminDatabaseManagement = () => {
         setBackupProgress(100);
         setBackupStatus('Резервная копия создана!');
         
-        result = { size_bytes: data.size_bytes, collections_count: data.collections_count };
+        result = { size_bytes: blob.size, collections_count: Number(response.headers.get('X-Backup-Collections')) || 0 };
       }
 
       // Refresh status and history
@@ -885,9 +989,13 @@ const AdminDatabaseManagement = () => {
             <Download className="w-8 h-8 text-green-400 group-hover:scale-110 transition-transform" />
           )}
           <div className="text-left">
-            <p className="text-white font-semibold text-lg">Создать резервную копию</p>
+            <p className="text-white font-semibold text-lg">
+              {incrementalBackup ? 'Создать инкрементальную копию' : 'Создать резервную копию'}
+            </p>
             <p className="text-slate-400 text-sm">
-              {backupLoading ? backupStatus || 'Загрузка...' : 'Скачать JSON-файл со всеми данными'}
+              {backupLoading
+                ? backupStatus || 'Загрузка...'
+                : incrementalBackup ? 'Только изменения с последней копии' : 'Скачать архив со всеми данными'}
             </p>
           </div>
         </button>
@@ -900,11 +1008,23 @@ const AdminDatabaseManagement = () => {
           <Upload className="w-8 h-8 text-cyan-400 group-hover:scale-110 transition-transform" />
           <div className="text-left">
             <p className="text-white font-semibold text-lg">Восстановить из копии</p>
-            <p className="text-slate-400 text-sm">Загрузить данные из JSON-файла</p>
+            <p className="text-slate-400 text-sm">Загрузить данные из файла резервной копии</p>
           </div>
         </button>
       </div>
 
+      <label className="flex items-center gap-3 text-sm text-slate-400 cursor-pointer">
+        <input
+          type="checkbox"
+          checked={incrementalBackup}
+          onChange={(e) => setIncrementalBackup(e.target.checked)}
+          disabled={backupLoading}
+          className="w-4 h-4"
+        />
+        Инкрементальная копия: только документы, изменённые после последней резервной копии.
+        Восстанавливается после базовой копии и предыдущих инкрементов по порядку.
+      </label>
+
       {/* Last Backup Info */}
       {status.last_backup && (
         <div className="bg-slate-800/50 rounded-xl p-4 border border-slate-700/50 flex items-center justify-between">
@@ -942,15 +1062,20 @@ const AdminDatabaseManagement = () => {
             {history.map((item, index) => (
               <div key={index} className="p-4 flex items-center justify-between">
                 <div className="flex items-center gap-3">
-                  {item.type === 'restore' ? (
+                  {item.type?.startsWith('restore') ? (
                     <Upload className="w-5 h-5 text-cyan-400" />
                   ) : (
                     <Download className="w-5 h-5 text-green-400" />
                   )}
                   <div>
-                    <p className="text-white">{item.type === 'restore' ? 'Восстановление' : 'Резервная копия'}</p>
+                    <p className="text-white">
+                      {item.type?.startsWith('restore')
+                        ? 'Восстановление'
+                        : item.kind === 'incremental' ? 'Инкрементальная копия' : 'Резервная копия'}
+                    </p>
                     <p className="text-slate-500 text-sm">
-                      {new Date(item.created_at).toLocaleString('ru-RU')} • {item.created_by}
+                      {new Date(item.created_at).toLocaleString('ru-RU')} • {item.created_by || item.admin}
+                      {item.base_id && ` • цепочка ${item.base_id.slice(0, 8)}`}
                     </p>
                   </div>
                 </div>
@@ -961,6 +1086,27 @@ const AdminDatabaseManagement = () => {
               </div>
             ))}
           </div>
+          {chains.length > 0 && (
+            <div className="border-t border-slate-700/50 p-4 space-y-3">
+              <h4 className="text-white text-sm font-medium">Цепочки резервных копий</h4>
+              {chains.map((chain) => (
+                <div key={chain.base_id} className="text-sm">
+                  <p className="text-slate-300">База {chain.base_id.slice(0, 8)}</p>
+                  <div className="flex flex-wrap gap-2 mt-1">
+                    {chain.backups.map((backup) => (
+                      <span
+                        key={backup.backup_id}
+                        className={`px-2 py-1 rounded ${backup.kind === 'incremental' ? 'bg-slate-700 text-slate-300' : 'bg-green-500/20 text-green-400'}`}
+                        title={backup.filename}
+                      >
+                        {new Date(backup.created_at).toLocaleString('ru-RU')} • {backup.document_count?.toLocaleString()}
+                      </span>
+                    ))}
+                  </div>
+                </div>
+              ))}
+            </div>
+          )}
         </div>
       )}
 